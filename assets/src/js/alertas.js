@@ -2,7 +2,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const alertsTbody = document.getElementById('alerts-tbody');
     const alertsFooter = document.getElementById('alerts-footer');
     const refreshAlertsButton = document.getElementById('refreshAlertsButton');
-    // const filterAlertStatusSelect = document.getElementById('filter-alert-status'); // Descomente se for usar
+    const filterAlertStatusSelect = document.getElementById('filter-alert-status');
 
     // Variável para armazenar os dados dos alertas atualmente carregados
     let currentAlertsData = [];
@@ -28,18 +28,68 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    async function fetchAndDisplayAlerts() {
+    // Paginação por cursor: a API devolve `next_cursor` enquanto houver alertas mais antigos.
+    const ALERTS_PAGE_SIZE = 50;
+    const ALERTS_LIST_FIELDS = 'ID_Alerta,DataHoraCriacao,Severidade,TipoAlertaNome,DescricaoCustomizada,StatusAlerta,DataHoraResolucao,DispositivoNomeHost,IPDescobertoEndereco';
+    let nextCursor = null;
+
+    function buildAlertsUrl(cursor) {
+        const params = new URLSearchParams({ limit: ALERTS_PAGE_SIZE, fields: ALERTS_LIST_FIELDS });
+        const statusFilter = filterAlertStatusSelect ? filterAlertStatusSelect.value : '';
+        if (statusFilter) params.set('status', statusFilter);
+        if (cursor) params.set('cursor', cursor);
+        return `http://127.0.0.1:5000/api/alerts?${params.toString()}`;
+    }
+
+    function appendAlertRows(alerts) {
+        alerts.forEach(alert => {
+            const row = alertsTbody.insertRow();
+            
+            const createCell = (content, className = '') => {
+                const cell = row.insertCell();
+                cell.innerHTML = content !== null && content !== undefined ? content : 'N/D';
+                if (className) cell.className = className;
+                return cell;
+            };
+
+            createCell(`<span class="severity-badge ${getSeverityClass(alert.Severidade)}">${alert.Severidade || 'N/D'}</span>`);
+            createCell(alert.TipoAlertaNome);
+            createCell(alert.DescricaoCustomizada);
+            createCell(alert.DispositivoNomeHost || alert.IPDescobertoEndereco || 'N/A');
+            createCell(alert.DataHoraCriacao ? new Date(alert.DataHoraCriacao).toLocaleString('pt-BR', {dateStyle: 'short', timeStyle: 'short'}) : 'N/D');
+            createCell(alert.StatusAlerta);
+
+            const actionsCell = row.insertCell();
+            actionsCell.innerHTML = `
+                <button class="action-link btn-icon" title="Ver Detalhes" data-id="${alert.ID_Alerta}" data-action="view"><i class="fas fa-eye"></i></button>
+                <button class="action-link btn-icon" title="Marcar como Lido" data-id="${alert.ID_Alerta}" data-action="mark-read"><i class="fas fa-check-circle"></i></button>
+                <button class="action-link btn-icon btn-success-icon" title="Resolver Alerta" data-id="${alert.ID_Alerta}" data-action="resolve"><i class="fas fa-check-double"></i></button>
+            `;
+        });
+    }
+
+    function renderAlertsFooter() {
+        if (!alertsFooter) return;
+        alertsFooter.innerHTML = `<span>Exibindo ${currentAlertsData.length} alertas.</span>`;
+        if (nextCursor) {
+            alertsFooter.innerHTML += ' <button class="btn-secondary" id="loadMoreAlertsButton">Carregar mais</button>';
+            document.getElementById('loadMoreAlertsButton').addEventListener('click', () => fetchAndDisplayAlerts(true));
+        }
+    }
+
+    async function fetchAndDisplayAlerts(append = false) {
         if (!alertsTbody) {
             console.error("Elemento tbody com ID 'alerts-tbody' não foi encontrado!");
             return;
         }
-        alertsTbody.innerHTML = loadingMessageRow;
+        if (!append) {
+            alertsTbody.innerHTML = loadingMessageRow;
+            currentAlertsData = [];
+            nextCursor = null;
+        }
         if(alertsFooter) alertsFooter.innerHTML = '<span>Carregando...</span>';
 
-        // TODO: Adicionar filtro de status à URL da API no futuro, se o select de filtro for usado
-        // const statusFilter = filterAlertStatusSelect ? filterAlertStatusSelect.value : '';
-        // let apiUrl = `http://127.0.0.1:5000/api/alerts${statusFilter ? '?status=' + statusFilter : ''}`;
-        let apiUrl = 'http://127.0.0.1:5000/api/alerts';
+        let apiUrl = buildAlertsUrl(append ? nextCursor : null);
 
         console.log("ALERTS_HANDLER: Buscando alertas de:", apiUrl);
 
@@ -53,62 +103,41 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({ message: "Erro desconhecido do servidor." }));
                 console.error("ALERTS_HANDLER: Erro na resposta da API:", response.status, errorData.message);
-                alertsTbody.innerHTML = `<tr><td colspan="7" style="text-align:center;">Falha ao carregar: ${errorData.message || response.statusText}</td></tr>`;
+                if (!append) alertsTbody.innerHTML = `<tr><td colspan="7" style="text-align:center;">Falha ao carregar: ${errorData.message || response.statusText}</td></tr>`;
                 if(alertsFooter) alertsFooter.innerHTML = '<span>Falha ao carregar.</span>';
                 return;
             }
 
-            const alerts = await response.json();
-            currentAlertsData = alerts; // Armazena os dados dos alertas
-            alertsTbody.innerHTML = ''; // Limpa a tabela
+            const page = await response.json();
+            const alerts = page.alerts || [];
+            nextCursor = page.next_cursor;
+            currentAlertsData = currentAlertsData.concat(alerts); // Armazena os dados dos alertas carregados
+            if (!append) alertsTbody.innerHTML = ''; // Limpa a tabela
 
-            if (alerts.length === 0) {
+            if (currentAlertsData.length === 0) {
                 alertsTbody.innerHTML = noAlertsMessageRow;
                 if(alertsFooter) alertsFooter.innerHTML = '<span>Nenhum alerta.</span>';
                 return;
             }
 
-            alerts.forEach(alert => {
-                const row = alertsTbody.insertRow();
-                
-                const createCell = (content, className = '') => {
-                    const cell = row.insertCell();
-                    cell.innerHTML = content !== null && content !== undefined ? content : 'N/D';
-                    if (className) cell.className = className;
-                    return cell;
-                };
-
-                createCell(`<span class="severity-badge ${getSeverityClass(alert.Severidade)}">${alert.Severidade || 'N/D'}</span>`);
-                createCell(alert.TipoAlertaNome);
-                createCell(alert.DescricaoCustomizada);
-                createCell(alert.DispositivoNomeHost || alert.IPDescobertoEndereco || 'N/A');
-                createCell(alert.DataHoraCriacao ? new Date(alert.DataHoraCriacao).toLocaleString('pt-BR', {dateStyle: 'short', timeStyle: 'short'}) : 'N/D');
-                createCell(alert.StatusAlerta);
-
-                const actionsCell = row.insertCell();
-                actionsCell.innerHTML = `
-                    <button class="action-link btn-icon" title="Ver Detalhes" data-id="${alert.ID_Alerta}" data-action="view"><i class="fas fa-eye"></i></button>
-                    <button class="action-link btn-icon" title="Marcar como Lido" data-id="${alert.ID_Alerta}" data-action="mark-read"><i class="fas fa-check-circle"></i></button>
-                    <button class="action-link btn-icon btn-success-icon" title="Resolver Alerta" data-id="${alert.ID_Alerta}" data-action="resolve"><i class="fas fa-check-double"></i></button>
-                `;
-            });
-            if(alertsFooter) alertsFooter.innerHTML = `<span>Exibindo ${alerts.length} alertas.</span>`;
+            appendAlertRows(alerts);
+            renderAlertsFooter();
 
         } catch (error) {
             console.error('ALERTS_HANDLER: Erro ao buscar alertas:', error);
-            alertsTbody.innerHTML = errorMessageRow;
+            if (!append) alertsTbody.innerHTML = errorMessageRow;
             if(alertsFooter) alertsFooter.innerHTML = '<span>Erro ao carregar.</span>';
         }
     }
 
     // Listener para o botão de atualizar alertas
     if (refreshAlertsButton) {
-        refreshAlertsButton.addEventListener('click', fetchAndDisplayAlerts);
+        refreshAlertsButton.addEventListener('click', () => fetchAndDisplayAlerts());
+    }
+    // Listener para o filtro de status (filtrado no servidor)
+    if (filterAlertStatusSelect) {
+        filterAlertStatusSelect.addEventListener('change', () => fetchAndDisplayAlerts());
     }
-    // Listener para o filtro de status (descomente se implementar)
-    // if (filterAlertStatusSelect) {
-    //     filterAlertStatusSelect.addEventListener('change', fetchAndDisplayAlerts);
-    // }
 
     // Listeners para os botões de ação na tabela de alertas
     if(alertsTbody) {
@@ -124,7 +153,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 console.log(`ALERTS_HANDLER: Ação '${action}' clicada para Alerta ID: ${alertId}`);
 
                 if (action === 'view') {
-                    const alertData = currentAlertsData.find(a => a.ID_Alerta == alertId);
+                    // A listagem não traz DetalhesTecnicos; busca o alerta completo ao abrir o modal.
+                    let alertData = currentAlertsData.find(a => a.ID_Alerta == alertId);
+                    try {
+                        const detailResponse = await fetch(`http://127.0.0.1:5000/api/alerts/${alertId}`);
+                        if (detailResponse.ok) alertData = await detailResponse.json();
+                    } catch (error) {
+                        console.error(`ALERTS_HANDLER: Erro ao buscar detalhes do alerta ${alertId}:`, error);
+                    }
 
                     if (alertData && alertDetailsBody && alertDetailsModal) {
                         alertDetailsBody.innerHTML = '<p>Carregando...</p>';
@@ -2,6 +2,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // --- CONSTANTES PARA ELEMENTOS DO DOM ---
     const deviceListTbody = document.getElementById('device-list-tbody');
     const searchInput = document.getElementById('searchInput');
+    const devicesFooter = document.getElementById('devices-footer');
     const loadingMessageRow = '<tr><td colspan="9" style="text-align:center;">Carregando dispositivos...</td></tr>';
     const errorMessageRow = '<tr><td colspan="9" style="text-align:center;">Erro ao carregar dispositivos. Tente novamente mais tarde.</td></tr>';
     const noDevicesMessageRow = '<tr><td colspan="9" style="text-align:center;">Nenhum dispositivo encontrado.</td></tr>';
@@ -75,16 +76,41 @@ document.addEventListener('DOMContentLoaded', function() {
         sessionStorage.removeItem('prefillDeviceData');
     }
     
-    async function fetchAndDisplayDevices(searchTerm = '') {
+    // A busca é paginada pela API: o cabeçalho X-Next-Offset indica que há mais resultados para o termo.
+    let currentSearchTerm = '';
+    let nextOffset = null;
+    let loadedDevicesCount = 0;
+    let devicesRequestSeq = 0;
+
+    function renderDevicesFooter() {
+        if (!devicesFooter) return;
+        devicesFooter.innerHTML = `<span>Exibindo ${loadedDevicesCount} dispositivos${nextOffset !== null ? ' (há mais resultados para a busca)' : ''}.</span>`;
+        if (nextOffset !== null) {
+            devicesFooter.innerHTML += ' <button class="btn-secondary" id="loadMoreDevicesButton">Carregar mais</button>';
+            document.getElementById('loadMoreDevicesButton').addEventListener('click', () => fetchAndDisplayDevices(currentSearchTerm, true));
+        }
+    }
+
+    async function fetchAndDisplayDevices(searchTerm = '', append = false) {
         if (!deviceListTbody) {
             console.error("Elemento tbody com ID 'device-list-tbody' não foi encontrado!");
             return;
         }
-        deviceListTbody.innerHTML = loadingMessageRow;
+        // Uma resposta de busca antiga (termo já alterado) é descartada ao chegar.
+        const requestSeq = ++devicesRequestSeq;
+        const offset = append ? nextOffset : 0;
+        if (!append) {
+            deviceListTbody.innerHTML = loadingMessageRow;
+            currentSearchTerm = searchTerm;
+            loadedDevicesCount = 0;
+            nextOffset = null;
+        }
+        if (devicesFooter) devicesFooter.innerHTML = '<span>Carregando...</span>';
 
         let apiURL = 'http://127.0.0.1:5000/devices';
         if (searchTerm) {
             apiURL += `?search=${encodeURIComponent(searchTerm)}`;
+            if (offset) apiURL += `&offset=${offset}`;
         }
         console.log("API URL para fetch (GET /devices):", apiURL);
 
@@ -96,18 +122,28 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
             });
 
+            if (requestSeq !== devicesRequestSeq) return;
             if (!response.ok) {
                 console.error("Erro na resposta da API ao listar: ", response.status, response.statusText);
                 const errorData = await response.json().catch(() => ({ message: "Erro desconhecido do servidor." }));
-                deviceListTbody.innerHTML = `<tr><td colspan="9" style="text-align:center;">Falha ao carregar: ${errorData.message || response.statusText}</td></tr>`;
+                if (requestSeq !== devicesRequestSeq) return;
+                if (!append) deviceListTbody.innerHTML = `<tr><td colspan="9" style="text-align:center;">Falha ao carregar: ${errorData.message || response.statusText}</td></tr>`;
+                // Ao carregar mais, mantém o botão para uma nova tentativa.
+                if (append) renderDevicesFooter();
+                else if (devicesFooter) devicesFooter.innerHTML = '<span>Falha ao carregar.</span>';
                 return;
             }
 
             const devices = await response.json();
-            deviceListTbody.innerHTML = '';
+            if (requestSeq !== devicesRequestSeq) return;
+            const nextOffsetHeader = response.headers.get('X-Next-Offset');
+            nextOffset = nextOffsetHeader !== null ? parseInt(nextOffsetHeader, 10) : null;
+            loadedDevicesCount += devices.length;
+            if (!append) deviceListTbody.innerHTML = '';
 
-            if (devices.length === 0) {
+            if (loadedDevicesCount === 0) {
                 deviceListTbody.innerHTML = noDevicesMessageRow;
+                if (devicesFooter) devicesFooter.innerHTML = '<span>Nenhum dispositivo.</span>';
                 return;
             }
 
@@ -157,9 +193,13 @@ document.addEventListener('DOMContentLoaded', function() {
                     <a href="#" class="action-link" data-id="${device.ID_Dispositivo}" data-action="delete" style="color:red;">Remover</a>
                 `;
             });
+            renderDevicesFooter();
         } catch (error) {
             console.error('Erro ao buscar dispositivos:', error);
-            deviceListTbody.innerHTML = errorMessageRow;
+            if (requestSeq !== devicesRequestSeq) return;
+            if (!append) deviceListTbody.innerHTML = errorMessageRow;
+            if (append) renderDevicesFooter();
+            else if (devicesFooter) devicesFooter.innerHTML = '<span>Falha ao carregar.</span>';
         }
     }
 
@@ -217,11 +257,16 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     // --- EVENT LISTENER PARA CAMPO DE BUSCA ---
+    // Aguarda uma pausa na digitação antes de consultar a API (uma busca por termo, não por tecla).
+    let searchDebounceTimer = null;
     if (searchInput) {
         searchInput.addEventListener('input', function() {
-            const searchTerm = searchInput.value.trim();
-            console.log("Frontend: Termo de busca digitado:", searchTerm);
-            fetchAndDisplayDevices(searchTerm);
+            clearTimeout(searchDebounceTimer);
+            searchDebounceTimer = setTimeout(() => {
+                const searchTerm = searchInput.value.trim();
+                console.log("Frontend: Termo de busca digitado:", searchTerm);
+                fetchAndDisplayDevices(searchTerm);
+            }, 250);
         });
     }
 
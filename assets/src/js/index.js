@@ -58,26 +58,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Função para buscar dados e renderizar o gráfico de Distribuição de SO
-    async function fetchOsDistributionDataAndRenderChart() {
-        if (!osChartCanvas) {
-            console.warn("Elemento canvas 'osDistributionChart' não encontrado.");
-            return;
-        }
-        try {
-            const response = await fetch('http://127.0.0.1:5000/api/dashboard/os-distribution');
-            if (!response.ok) {
-                console.error("Erro ao buscar dados de distribuição de SO:", response.statusText);
-                // Você pode querer mostrar uma mensagem de erro no lugar do gráfico
-                return;
-            }
-            const data = await response.json();
-            renderOsDistributionChart(data);
-        } catch (error) {
-            console.error('Falha ao buscar dados de distribuição de SO:', error);
-        }
-    }
-
     // Função para renderizar o gráfico de Distribuição de Status
     function renderStatusDistributionChart(data) {
         if (!statusChartCanvas) return;
@@ -126,90 +106,77 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Função para buscar dados e renderizar o gráfico de Distribuição de Status
-    async function fetchStatusDistributionDataAndRenderChart() {
-         if (!statusChartCanvas) {
-            console.warn("Elemento canvas 'statusDistributionChart' não encontrado.");
-            return;
-        }
-        try {
-            const response = await fetch('http://127.0.0.1:5000/api/dashboard/status-distribution');
-            if (!response.ok) {
-                console.error("Erro ao buscar dados de distribuição de status:", response.statusText);
-                return;
-            }
-            const data = await response.json();
-            renderStatusDistributionChart(data);
-        } catch (error) {
-            console.error('Falha ao buscar dados de distribuição de status:', error);
-        }
+    function renderDashboardSummary(summary) {
+        if(totalDevicesEl) totalDevicesEl.textContent = summary.total_devices !== undefined ? summary.total_devices : 'N/A';
+        if(onlineDevicesEl) onlineDevicesEl.textContent = summary.online_devices !== undefined ? summary.online_devices : 'N/A';
+        if(offlineDevicesEl) offlineDevicesEl.textContent = summary.offline_devices !== undefined ? summary.offline_devices : 'N/A';
+        if(newAlertsEl) newAlertsEl.textContent = summary.new_alerts !== undefined ? summary.new_alerts : 'N/A';
     }
 
-    // Função para buscar e exibir o sumário
-    async function fetchDashboardSummary() {
-        try {
-            const response = await fetch('http://127.0.0.1:5000/api/dashboard/summary');
-            if (!response.ok) {
-                console.error("Erro ao buscar sumário do dashboard:", response.statusText);
-                if(totalDevicesEl) totalDevicesEl.textContent = 'Erro';
-                if(onlineDevicesEl) onlineDevicesEl.textContent = 'Erro';
-                if(offlineDevicesEl) offlineDevicesEl.textContent = 'Erro';
-                if(newAlertsEl) newAlertsEl.textContent = 'Erro';
-                return;
-            }
-            const summary = await response.json();
-            if(totalDevicesEl) totalDevicesEl.textContent = summary.total_devices !== undefined ? summary.total_devices : 'N/A';
-            if(onlineDevicesEl) onlineDevicesEl.textContent = summary.online_devices !== undefined ? summary.online_devices : 'N/A';
-            if(offlineDevicesEl) offlineDevicesEl.textContent = summary.offline_devices !== undefined ? summary.offline_devices : 'N/A';
-            if(newAlertsEl) newAlertsEl.textContent = summary.new_alerts !== undefined ? summary.new_alerts : 'N/A';
+    function setSummaryText(text) {
+        if(totalDevicesEl) totalDevicesEl.textContent = text;
+        if(onlineDevicesEl) onlineDevicesEl.textContent = text;
+        if(offlineDevicesEl) offlineDevicesEl.textContent = text;
+        if(newAlertsEl) newAlertsEl.textContent = text;
+    }
 
-        } catch (error) {
-            console.error('Falha ao buscar sumário do dashboard:', error);
-            if(totalDevicesEl) totalDevicesEl.textContent = 'Falha';
-            if(onlineDevicesEl) onlineDevicesEl.textContent = 'Falha';
-            if(offlineDevicesEl) offlineDevicesEl.textContent = 'Falha';
-            if(newAlertsEl) newAlertsEl.textContent = 'Falha';
+    function renderRecentAlerts(alerts) {
+        if (!recentAlertsListEl) return;
+        recentAlertsListEl.innerHTML = ''; // Limpa a lista
+
+        if (alerts.length === 0) {
+            recentAlertsListEl.innerHTML = '<li>Nenhum alerta novo encontrado.</li>';
+            return;
         }
+
+        alerts.forEach(alert => {
+            const listItem = document.createElement('li');
+            const alertDate = alert.DataHoraCriacao ? new Date(alert.DataHoraCriacao).toLocaleTimeString('pt-BR', {hour: '2-digit', minute: '2-digit'}) : '';
+            let subject = alert.DispositivoNomeHost || alert.IPDescobertoEndereco || 'Sistema';
+            
+            listItem.innerHTML = `
+                <span class="severity-badge ${getSeverityClass(alert.Severidade)}">${alert.Severidade || ''}</span>
+                <strong>${alert.TipoAlertaNome || 'Alerta'}:</strong> 
+                ${alert.DescricaoCustomizada} 
+                <em>(${subject})</em> 
+                <small class="text-muted">- ${alertDate}</small>
+            `;
+            recentAlertsListEl.appendChild(listItem);
+        });
     }
 
-    // Função para buscar e exibir alertas recentes
-    async function fetchRecentAlerts() {
-        if (!recentAlertsListEl) return;
-        recentAlertsListEl.innerHTML = '<li>Carregando alertas...</li>';
+    // Busca todos os dados do dashboard numa única chamada. A API responde com ETag e
+    // Cache-Control: no-cache, então o navegador revalida com If-None-Match e recebe 304
+    // enquanto nada mudar; nesse caso o corpo é o mesmo e a tela não é redesenhada.
+    const DASHBOARD_REFRESH_MS = 60000;
+    let lastSnapshotBody = null;
 
+    async function fetchDashboardSnapshot() {
         try {
-            const response = await fetch('http://127.0.0.1:5000/api/dashboard/recent-alerts');
+            const response = await fetch('http://127.0.0.1:5000/api/dashboard/snapshot');
             if (!response.ok) {
-                console.error("Erro ao buscar alertas recentes:", response.statusText);
-                recentAlertsListEl.innerHTML = '<li>Erro ao carregar alertas.</li>';
-                return;
-            }
-            const alerts = await response.json();
-            recentAlertsListEl.innerHTML = ''; // Limpa a lista
-
-            if (alerts.length === 0) {
-                recentAlertsListEl.innerHTML = '<li>Nenhum alerta novo encontrado.</li>';
+                console.error("Erro ao buscar dados do dashboard:", response.statusText);
+                if (lastSnapshotBody === null) {
+                    setSummaryText('Erro');
+                    if (recentAlertsListEl) recentAlertsListEl.innerHTML = '<li>Erro ao carregar alertas.</li>';
+                }
                 return;
             }
-
-            alerts.forEach(alert => {
-                const listItem = document.createElement('li');
-                const alertDate = alert.DataHoraCriacao ? new Date(alert.DataHoraCriacao).toLocaleTimeString('pt-BR', {hour: '2-digit', minute: '2-digit'}) : '';
-                let subject = alert.DispositivoNomeHost || alert.IPDescobertoEndereco || 'Sistema';
-                
-                listItem.innerHTML = `
-                    <span class="severity-badge ${getSeverityClass(alert.Severidade)}">${alert.Severidade || ''}</span>
-                    <strong>${alert.TipoAlertaNome || 'Alerta'}:</strong> 
-                    ${alert.DescricaoCustomizada} 
-                    <em>(${subject})</em> 
-                    <small class="text-muted">- ${alertDate}</small>
-                `;
-                recentAlertsListEl.appendChild(listItem);
-            });
-
+            const body = await response.text();
+            if (body === lastSnapshotBody) return;
+            lastSnapshotBody = body;
+
+            const snapshot = JSON.parse(body);
+            renderDashboardSummary(snapshot.summary || {});
+            renderRecentAlerts(snapshot.recent_alerts || []);
+            renderOsDistributionChart(snapshot.os_distribution || []);
+            renderStatusDistributionChart(snapshot.status_distribution || []);
         } catch (error) {
-            console.error('Falha ao buscar alertas recentes:', error);
-            recentAlertsListEl.innerHTML = '<li>Falha ao carregar alertas.</li>';
+            console.error('Falha ao buscar dados do dashboard:', error);
+            if (lastSnapshotBody === null) {
+                setSummaryText('Falha');
+                if (recentAlertsListEl) recentAlertsListEl.innerHTML = '<li>Falha ao carregar alertas.</li>';
+            }
         }
     }
 
@@ -225,10 +192,8 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Carregar dados ao iniciar
-    fetchDashboardSummary();
-    fetchRecentAlerts();
-    // Chamar as novas funções para carregar e renderizar os gráficos
-    fetchOsDistributionDataAndRenderChart();
-    fetchStatusDistributionDataAndRenderChart();
+    // Carregar dados ao iniciar e manter o dashboard atualizado
+    if (recentAlertsListEl) recentAlertsListEl.innerHTML = '<li>Carregando alertas...</li>';
+    fetchDashboardSnapshot();
+    setInterval(fetchDashboardSnapshot, DASHBOARD_REFRESH_MS);
 });
\ No newline at end of file
@@ -44,6 +44,12 @@ document.addEventListener('DOMContentLoaded', function() {
                     if (!response.ok) throw new Error(`Erro HTTP: ${response.status} ao buscar dispositivos offline.`);
                     data = await response.json();
                     displayFullInventoryReport(data); // Reutiliza a função para listar dispositivos
+                } else if (selectedReportType === 'availability_90d') {
+                    reportTitle.textContent = 'Relatório: Disponibilidade dos Dispositivos (90 dias)';
+                    response = await fetch('http://127.0.0.1:5000/api/availability/overview?days=90');
+                    if (!response.ok) throw new Error(`Erro HTTP: ${response.status} ao buscar histórico de disponibilidade.`);
+                    data = await response.json();
+                    displayAvailabilityReport(data);
                 } else {
                     reportOutputDiv.innerHTML = '<p style="color: red;">Tipo de relatório não implementado.</p>';
                 }
@@ -124,4 +130,71 @@ document.addEventListener('DOMContentLoaded', function() {
         tableHtml += '</tbody></table>';
         reportOutputDiv.innerHTML = tableHtml;
     }
-});
\ No newline at end of file
+
+    function uptimeColor(uptime) {
+        if (uptime === null || uptime === undefined) return '#e0e0e0';
+        if (uptime >= 99.9) return '#2e7d32';
+        if (uptime >= 99) return '#66bb6a';
+        if (uptime >= 95) return '#fbc02d';
+        if (uptime >= 80) return '#f57c00';
+        return '#c62828';
+    }
+
+    function displayAvailabilityReport(overview) {
+        if (!overview || !overview.dispositivos || overview.dispositivos.length === 0) {
+            reportOutputDiv.innerHTML = '<p>Nenhum histórico de disponibilidade registrado ainda.</p>';
+            return;
+        }
+        // Mapa de calor num único canvas (uma linha por dispositivo, uma coluna por dia): escala para milhares de dispositivos.
+        const cell = 6;
+        const days = overview.dias.length;
+        const devices = overview.dispositivos;
+        reportOutputDiv.innerHTML = `
+            <p>De ${overview.dias[0]} a ${overview.dias[days - 1]} — ${devices.length} dispositivos, ordenados do menor para o maior uptime.</p>
+            <div style="max-height: 480px; overflow: auto; margin-bottom: 1em;">
+                <canvas id="availabilityHeatmap" width="${days * cell}" height="${devices.length * cell}"></canvas>
+            </div>
+            <div id="availabilityTable"></div>
+        `;
+        const canvas = document.getElementById('availabilityHeatmap');
+        const ctx = canvas.getContext('2d');
+        devices.forEach((device, row) => {
+            device.uptime.forEach((uptime, col) => {
+                ctx.fillStyle = uptimeColor(uptime);
+                ctx.fillRect(col * cell, row * cell, cell - 1, cell - 1);
+            });
+        });
+        canvas.title = 'Passe o mouse sobre uma célula para ver o dispositivo e o dia';
+        canvas.addEventListener('mousemove', (event) => {
+            const rect = canvas.getBoundingClientRect();
+            const device = devices[Math.floor((event.clientY - rect.top) / cell)];
+            const dayIndex = Math.floor((event.clientX - rect.left) / cell);
+            if (!device || dayIndex < 0 || dayIndex >= days) return;
+            const uptime = device.uptime[dayIndex];
+            canvas.title = `${device.nome || 'N/D'} — ${overview.dias[dayIndex]}: ${uptime === null ? 'sem amostras' : uptime + '%'}`;
+        });
+
+        // A tabela lista só os piores dispositivos; o mapa de calor acima cobre todos.
+        const worst = devices.slice(0, 200);
+        let tableHtml = `
+            <table class="basic-table">
+                <thead>
+                    <tr>
+                        <th>Nome do Host</th>
+                        <th>Uptime (90 dias)</th>
+                    </tr>
+                </thead>
+                <tbody>
+        `;
+        worst.forEach(device => {
+            tableHtml += `
+                <tr>
+                    <td>${device.nome || 'N/D'}</td>
+                    <td>${device.uptime_percent === null ? 'N/D' : device.uptime_percent + '%'}</td>
+                </tr>
+            `;
+        });
+        tableHtml += '</tbody></table>';
+        document.getElementById('availabilityTable').innerHTML = tableHtml;
+    }
+});
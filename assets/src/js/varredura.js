@@ -79,13 +79,77 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Acrescenta no topo da tabela um host ativo recebido pelo stream da varredura em andamento.
+    function prependLiveHostRow(host) {
+        if (discoveredIpsTbody.querySelector('td[colspan]')) {
+            discoveredIpsTbody.innerHTML = ''; // Remove a mensagem de "carregando"/"nenhum IP"
+        }
+        const row = discoveredIpsTbody.insertRow(0);
+        const agora = new Date().toLocaleString('pt-BR');
+        [host.ip, host.hostname, agora, agora, 'Detectado agora'].forEach(value => {
+            const cell = row.insertCell();
+            cell.textContent = value !== null && value !== undefined ? value : 'N/D';
+        });
+        row.insertCell().textContent = host.rtt_ms !== null && host.rtt_ms !== undefined ? `${host.rtt_ms} ms` : '';
+    }
+
+    function formatScanProgress(progress) {
+        let text = `Varrendo... ${progress.percent}% (${progress.processed}/${progress.total}) - ${progress.found} ativos`;
+        if (progress.hosts_per_second) text += ` - ${progress.hosts_per_second} hosts/s`;
+        if (progress.eta_seconds !== null && progress.eta_seconds !== undefined) text += ` - ETA ${Math.ceil(progress.eta_seconds)}s`;
+        return text;
+    }
+
+    function resetScanButton() {
+        startNewScanButton.disabled = false;
+        startNewScanButton.textContent = 'Iniciar Nova Varredura';
+    }
+
+    // Acompanha a varredura em segundo plano pelo stream SSE do backend.
+    function followScanJob(eventsUrl) {
+        const source = new EventSource(`http://127.0.0.1:5000${eventsUrl}`);
+
+        source.addEventListener('host', (event) => {
+            prependLiveHostRow(JSON.parse(event.data));
+        });
+        source.addEventListener('progress', (event) => {
+            discoveredIpsFooter.innerHTML = `<span>${formatScanProgress(JSON.parse(event.data))}</span>`;
+        });
+        source.addEventListener('done', (event) => {
+            source.close();
+            const result = JSON.parse(event.data);
+            resetScanButton();
+            if (result.status === 'falhou') {
+                alert(`Erro durante a varredura: ${result.error || 'falha desconhecida'}`);
+            }
+            fetchAndDisplayDiscoveredIPs(); // Recarrega a lista completa (com as ações de cada IP)
+        });
+        source.onerror = () => {
+            // O EventSource reconecta sozinho (com Last-Event-ID); só desiste se a conexão foi encerrada.
+            if (source.readyState === EventSource.CLOSED) {
+                resetScanButton();
+                discoveredIpsFooter.innerHTML = '<span>Conexão com a varredura perdida. Atualize a página para ver os resultados.</span>';
+            }
+        };
+    }
+
+    // Consulta o status de uma varredura detalhada (Nmap) enfileirada até ela terminar.
+    async function waitForDetailScan(statusUrl) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            const response = await fetch(`http://127.0.0.1:5000${statusUrl}`);
+            if (!response.ok) throw new Error(`Status da varredura detalhada indisponível (${response.status})`);
+            const job = await response.json();
+            if (job.status === 'concluida' || job.status === 'falhou') return job;
+        }
+    }
+
     // Lógica para o botão "Iniciar Nova Varredura"
     if (startNewScanButton) {
         startNewScanButton.addEventListener('click', async function() {
             startNewScanButton.disabled = true;
             startNewScanButton.textContent = 'Varrendo...';
             discoveredIpsFooter.innerHTML = '<span>Iniciando nova varredura de rede...</span>';
-            discoveredIpsTbody.innerHTML = loadingMessageRow;
 
             try {
                 const response = await fetch('http://127.0.0.1:5000/api/discovery/start-scan', {
@@ -96,20 +160,19 @@ document.addEventListener('DOMContentLoaded', function() {
                     }
                 });
                 const result = await response.json();
-                if (response.ok) {
-                    alert(result.message || "Varredura concluída!");
-                    fetchAndDisplayDiscoveredIPs(); // Recarrega a lista de IPs descobertos
+                if (response.ok && result.events_url) {
+                    discoveredIpsFooter.innerHTML = `<span>${result.message}</span>`;
+                    followScanJob(result.events_url);
                 } else {
                     alert(result.message || "Erro ao iniciar varredura.");
                     discoveredIpsFooter.innerHTML = `<span>Erro: ${result.message || "Falha na varredura."}</span>`;
+                    resetScanButton();
                 }
             } catch (error) {
                 console.error("Erro ao iniciar nova varredura:", error);
                 alert("Erro de comunicação ao tentar iniciar a varredura.");
                 discoveredIpsFooter.innerHTML = '<span>Erro de comunicação.</span>';
-            } finally {
-                startNewScanButton.disabled = false;
-                startNewScanButton.textContent = 'Iniciar Nova Varredura';
+                resetScanButton();
             }
         });
     }
@@ -164,7 +227,14 @@ if (discoveredIpsTbody) {
 
                         const result = await response.json();
                         if (response.ok) {
-                            alert(result.message || `Detalhes do IP ${ipAddress} analisados com sucesso.`);
+                            // A varredura roda na fila do backend; acompanha o job até terminar.
+                            const job = await waitForDetailScan(result.status_url);
+                            const target = job.targets.find(t => String(t.id_ip_descoberto) === String(ipId));
+                            if (target && target.status === 'falhou') {
+                                alert(`Erro ao analisar detalhes: ${target.error || 'falha desconhecida'}`);
+                            } else {
+                                alert(`Detalhes do IP ${ipAddress} analisados com sucesso.`);
+                            }
                             fetchAndDisplayDiscoveredIPs(); // Isso vai recriar o botão, então a restauração manual abaixo pode não ser necessária se der sucesso.
                         } else {
                             alert(`Erro ao analisar detalhes: ${result.message || response.statusText}`);
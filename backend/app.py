@@ -1,15 +1,10 @@
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+import click
 from flask_cors import CORS
 from dotenv import load_dotenv
 import mysql.connector
 import bcrypt
-import subprocess
-import platform
-import ipaddress
-import socket
-import nmap
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import traceback
 import logging
@@ -17,7 +12,38 @@ from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 from logging.handlers import RotatingFileHandler
 import json
+import base64
 import jwt
+import threading
+import time
+import signal
+from contextlib import contextmanager
+from db_pool import ConnectionPool
+from audit_writer import AuditLogWriter
+from leader_lock import LeaderLock
+from discovery_pipeline import DiscoveryPipeline
+from discovery_persistence import DiscoveredIpBatchWriter
+from scan_jobs import ScanJobManager
+from job_store import JobStore
+from scan_coordinator import ScanCoordinator
+from target_spec import TargetSpec
+from nmap_detail import DetailScanQueue
+from port_services import build_port_service_query, PROTOCOLOS
+from icmp_sweep import IcmpSweeper, ping_ip
+from rate_control import ProbeRateController
+from arp_discovery import NeighborDiscovery
+from oui_index import (OuiIndex, build_index, backfill_vendors, fabricante_id_for_mac, mac_to_int, DEFAULT_VENDOR_FILES,
+                       DEFAULT_INDEX_PATH)
+from liveness_monitor import LivenessMonitor
+from rdns_cache import ReverseDnsResolver
+from availability import (AvailabilityRecorder, run_rollups, apply_retention, availability_summary, availability_series,
+                          daily_uptime_overview, RESOLUCOES, TIPO_DISPOSITIVO, TIPO_IP_DESCOBERTO)
+from dashboard_snapshot import DashboardSnapshotCache, load_dashboard_snapshot
+from cache_version import bump_cache_version, read_cache_versions, VERSAO_DASHBOARD, VERSAO_FABRICANTE, VERSAO_USUARIO
+from response_cache import ResponseCache
+from json_stream import FastJSONProvider, RowStreamer
+from device_counters import update_device_counters, verify_device_counters, rebuild_device_counters, read_os_distribution
+from device_search import build_search_query, refresh_device_search, rebuild_device_search
 
 # --- INÍCIO DA CONFIGURAÇÃO CENTRALIZADA DE LOGGING ---
 
@@ -65,40 +91,20 @@ setup_structured_logging()
 
 
 def registrar_log_auditoria(id_usuario, nome_usuario, acao, detalhes=None, ip_origem=None):
-    """Registra um evento na tabela de LogAuditoria."""
-    conn = None
-    cursor = None
+    """Registra um evento na tabela de LogAuditoria (gravação assíncrona e em lote pelo audit_writer)."""
     log.info(f"AUDIT_DB_LOG: UserID: {id_usuario or 'Sistema'}, User: {nome_usuario or 'Sistema'}, Action: {acao}, IP: {ip_origem}")
     try:
-        conn = get_db_connection()
-        if not conn:
-            log.error("AUDIT_DB_LOG: Falha ao conectar ao DB para registrar log.")
-            return
-
-        cursor = conn.cursor()
-        query = """
-            INSERT INTO LogAuditoria (ID_Usuario_FK, NomeUsuario, Acao, Detalhes, EnderecoIPOrigem)
-            VALUES (%s, %s, %s, %s, %s)
-        """
-        detalhes_str = str(detalhes) if detalhes is not None else None
-        cursor.execute(query, (id_usuario, nome_usuario, acao, detalhes_str, ip_origem))
-        conn.commit()
+        audit_writer.enqueue(id_usuario, nome_usuario, acao, detalhes=detalhes, ip_origem=ip_origem)
     except Exception as e:
         log.exception("Erro ao registrar log de auditoria no banco de dados.")
-        if conn:
-            conn.rollback()
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
 
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app) #Habilitando o CORS
+app.json = FastJSONProvider(app)
+CORS(app, expose_headers=['X-Next-Offset']) #Habilitando o CORS (e a leitura do cabeçalho de paginação no frontend)
 
 # --- INICIALIZAÇÃO DO AGENDADOR ---
 scheduler = BackgroundScheduler(daemon=True, timezone='America/Sao_Paulo')
@@ -106,9 +112,81 @@ SCAN_JOB_ID = 'scheduled_network_scan_job'
 # --- FIM DA INICIALIZAÇÃO DO AGENDADOR --- 
 from functools import wraps
 
+# --- CACHE DE USUÁRIOS AUTENTICADOS ---
+# Evita um SELECT em Usuario a cada requisição protegida. O cache é do processo; para que uma alteração
+# (ex: usuário desativado) valha em todos os workers, triggers em Usuario incrementam a versão 'Usuario'
+# em VersaoCache (migração 013). Cada worker consulta essa versão no máximo a cada
+# AUTH_USER_VERSION_CHECK_SECONDS e esvazia o cache quando ela muda. Sem a versão (banco indisponível
+# ou migração pendente) as entradas valem por AUTH_USER_CACHE_TTL segundos.
+AUTH_USER_CACHE_TTL = float(os.getenv('AUTH_USER_CACHE_TTL', '30'))
+AUTH_USER_VERSION_CHECK_SECONDS = float(os.getenv('AUTH_USER_VERSION_CHECK_SECONDS', '2'))
+_auth_user_cache = {}
+_auth_user_cache_lock = threading.Lock()
+_auth_user_version = None
+_auth_user_version_checked_at = None
+
+def _check_user_cache_version():
+    """Esvazia o cache de autenticação se a versão 'Usuario' mudou desde a última consulta (com intervalo mínimo)."""
+    global _auth_user_version, _auth_user_version_checked_at
+    now = time.monotonic()
+    with _auth_user_cache_lock:
+        if _auth_user_version_checked_at is not None and now - _auth_user_version_checked_at < AUTH_USER_VERSION_CHECK_SECONDS:
+            return
+        # Marca antes de consultar: as requisições concorrentes seguem com o cache atual.
+        _auth_user_version_checked_at = now
+    try:
+        versions = _read_shared_cache_versions([VERSAO_USUARIO])
+    except Exception as e:
+        log.warning(f"AUTH: Falha ao ler a versão dos usuários ({e}); o cache segue valendo por AUTH_USER_CACHE_TTL.")
+        return
+    if not versions:
+        return
+    with _auth_user_cache_lock:
+        # Sem versão anterior não há como saber se as entradas já em cache são atuais: descarta também.
+        if versions[VERSAO_USUARIO] != _auth_user_version:
+            if _auth_user_version is not None:
+                log.info("AUTH: Usuários alterados (versão em VersaoCache); cache de autenticação esvaziado.")
+            _auth_user_cache.clear()
+        _auth_user_version = versions[VERSAO_USUARIO]
+
+def invalidate_user_cache(id_usuario=None):
+    """Remove um usuário (ou todos, se id_usuario for None) do cache de autenticação deste processo."""
+    with _auth_user_cache_lock:
+        if id_usuario is None:
+            _auth_user_cache.clear()
+        else:
+            _auth_user_cache.pop(id_usuario, None)
+    log.info(f"AUTH: Cache de usuário invalidado ({'todos' if id_usuario is None else f'ID {id_usuario}'}).")
+
+def _cache_user(user):
+    with _auth_user_cache_lock:
+        _auth_user_cache[user['ID_Usuario']] = (time.monotonic() + AUTH_USER_CACHE_TTL, user)
+
+def get_authenticated_user(id_usuario):
+    """
+    Retorna (usuario, cache_hit) para o ID do token, consultando o banco apenas em cache miss.
+    usuario é None se não existir; levanta ConnectionError se o banco estiver indisponível.
+    """
+    _check_user_cache_version()
+    with _auth_user_cache_lock:
+        cached = _auth_user_cache.get(id_usuario)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], True
+
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("Sem conexão com o banco para validar o usuário do token.")
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT ID_Usuario, NomeUsuario, Ativo FROM Usuario WHERE ID_Usuario = %s", (id_usuario,))
+        user = cursor.fetchone()
+    if user:
+        _cache_user(user)
+    return user, False
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
+        auth_started = time.perf_counter()
         token = None
         # Verifica se o token está no cabeçalho 'Authorization'
         if 'Authorization' in request.headers:
@@ -126,13 +204,8 @@ def token_required(f):
             secret_key = os.getenv('SECRET_KEY')
             data = jwt.decode(token, secret_key, algorithms=['HS256'])
             
-            # Para segurança extra, busca o usuário no banco para garantir que ele ainda existe e está ativo
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT ID_Usuario, NomeUsuario, Ativo FROM Usuario WHERE ID_Usuario = %s", (data['id_usuario'],))
-            current_user = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            # Para segurança extra, garante que o usuário ainda existe e está ativo (via cache de curta duração)
+            current_user, cache_hit = get_authenticated_user(data['id_usuario'])
 
             if not current_user or not current_user['Ativo']:
                 log.error(f"AUTH: Usuário do token (ID: {data['id_usuario']}) não encontrado ou inativo.")
@@ -141,103 +214,319 @@ def token_required(f):
         except jwt.ExpiredSignatureError:
             log.warning("AUTH: Token expirado.")
             return jsonify({'message': 'Token expirou!'}), 401
+        except ConnectionError:
+            log.error("AUTH: Banco indisponível para validar o usuário do token.")
+            return jsonify({'message': 'Erro interno no servidor (conexão DB)'}), 500
         except Exception as e:
             log.exception("AUTH: Erro ao decodificar o token.")
             return jsonify({'message': 'Token inválido!'}), 401
+
+        auth_ms = (time.perf_counter() - auth_started) * 1000
+        log.info(f"AUTH: {request.method} {request.path} autenticado para usuário ID {current_user['ID_Usuario']} em {auth_ms:.2f} ms (cache {'HIT' if cache_hit else 'MISS'}).")
         
         # Se tudo deu certo, passa o usuário decodificado para a função da rota
         return f(current_user, *args, **kwargs)
 
     return decorated
 # Configuração do Banco de Dados
+# Pool único de conexões do processo (tamanho, espera e reciclagem configuráveis via DB_POOL_*)
+db_pool = ConnectionPool.from_env()
+# Registrado cedo: como o atexit é LIFO, fecha as conexões depois que os demais componentes terminaram.
+atexit.register(db_pool.close_all)
+
 def get_db_connection():
+    """Empresta uma conexão do pool. `close()` a devolve ao pool. Retorna None em caso de falha."""
     try:
-        conn = mysql.connector.connect(
-            host=os.getenv('DB_HOST'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            database=os.getenv('DB_NAME')
-        )
-        log.debug('Conexão com o MYSQL bem sucedida.')
-        return conn
+        return db_pool.acquire()
     except mysql.connector.Error as err:
-        log.error(f"Erro ao conectar ao MySQL: {err}")
+        log.error(f"Erro ao obter conexão do pool MySQL: {err}")
         return None
 
-#Executar ping e guardar IP´s descobertos
-def ping_ip(ip_str):
-    """Tenta pingar um IP e retorna True se bem-sucedido, False caso contrário."""
+@contextmanager
+def db_connection():
+    """
+    Context manager usado por rotas, scheduler e varreduras para obter uma conexão do pool.
+    Entrega None se não for possível conectar; em caso de exceção faz rollback, e sempre
+    devolve a conexão ao pool ao sair.
+    """
+    conn = get_db_connection()
     try:
-        if platform.system().lower() == 'windows':
-            command = ['ping', '-n', '2', '-w', '500', ip_str] 
-        else:
-            command = ['ping', '-c', '2', '-W', '1', ip_str]
+        yield conn
+    except Exception:
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        raise
+    finally:
+        if conn:
+            conn.close()
 
-        startupinfo = None
-        if platform.system().lower() == 'windows':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-        
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
-        stdout, stderr = process.communicate(timeout=3) 
-
-        stdout_decoded = stdout.decode(errors='ignore').strip()
-        stderr_decoded = stderr.decode(errors='ignore').strip()
-        log.debug(f"Ping para {ip_str}: RC={process.returncode}")
-        if stdout_decoded:
-            log.debug(f"  STDOUT: {stdout_decoded}")
-        if stderr_decoded:
-            log.debug(f"  STDERR: {stderr_decoded}")
-
-        return process.returncode == 0
-    except subprocess.TimeoutExpired:
-        log.warning(f"Timeout GERAL ao executar comando ping para {ip_str}")
-        if 'process' in locals() and process: process.kill() 
-        return False
-    except Exception as e:
-        log.error(f"Exceção ao pingar {ip_str}: {e}")
-        return False
+# Trilha de auditoria gravada em segundo plano, em lotes (AUDIT_*), com spill em arquivo se o DB cair
+audit_writer = AuditLogWriter.from_env(db_connection)
+audit_writer.start()
+# Registrado antes do scheduler: como o atexit é LIFO, roda depois dele e grava também os eventos dos últimos jobs.
+atexit.register(audit_writer.stop)
+
+# Histórico de disponibilidade (amostras online/offline + RTT), gravado em blocos horários compactados
+availability_recorder = AvailabilityRecorder.from_env(db_connection)
+availability_recorder.start()
+atexit.register(availability_recorder.stop)
+AVAILABILITY_ROLLUP_MINUTES = int(os.getenv('AVAILABILITY_ROLLUP_MINUTES', '10'))
+AVAILABILITY_MAX_DAYS = int(os.getenv('AVAILABILITY_MAX_DAYS', '365'))
+
+# Estado dos jobs em segundo plano replicado no banco (JobVarredura), para consulta a partir de qualquer worker
+job_store = JobStore.from_env(db_connection)
+job_store.start()
+atexit.register(job_store.stop)
+
+# Varreduras de descoberta manuais executadas em segundo plano (acompanhadas via SSE)
+scan_job_manager = ScanJobManager(
+    max_concurrent=os.getenv('SCAN_JOBS_MAX_CONCURRENT', '2'),
+    retention_seconds=os.getenv('SCAN_JOBS_RETENTION_SECONDS', '3600'),
+    store=job_store,
+)
+SSE_HEARTBEAT_SECONDS = 15
+# Sonda os alvos numa ordem pseudoaleatória (espalha a carga entre sub-redes) em vez da ordem crescente
+DISCOVERY_RANDOMIZE_TARGETS = os.getenv('DISCOVERY_RANDOMIZE_TARGETS', 'false').lower() in ('1', 'true', 'yes')
+# Limite de alvos de uma varredura não distribuída (uma /64 IPv6 tem 2^64 endereços)
+DISCOVERY_MAX_TARGETS = int(os.getenv('DISCOVERY_MAX_TARGETS', '1048576'))
+# Faixas em redes diretamente conectadas são descobertas por ARP (mais rápido, captura o MAC e acha hosts sem ICMP)
+DISCOVERY_ARP_ENABLED = os.getenv('DISCOVERY_ARP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+neighbor_discovery = NeighborDiscovery.from_env()
+# Ritmo adaptativo (AIMD) das sondas ICMP, com orçamento global do processo e por sub-rede
+RATE_CONTROL_ENABLED = os.getenv('RATE_CONTROL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+probe_rate_controller = ProbeRateController.from_env() if RATE_CONTROL_ENABLED else None
+# Varreduras distribuídas: as faixas viram shards numa fila no banco, consumida pelos workers (scan_worker.py)
+SCAN_DISTRIBUTED = os.getenv('SCAN_DISTRIBUTED', 'false').lower() in ('1', 'true', 'yes')
+scan_coordinator = ScanCoordinator.from_env(db_connection)
+
+# DNS reverso com timeout por consulta e cache (positivo/negativo) persistido em CacheDNSReverso
+rdns_resolver = ReverseDnsResolver.from_env(db_connection)
+rdns_resolver.start()
+atexit.register(rdns_resolver.stop)
+
+# Índice OUI (prefixo do MAC -> fabricante), mapeado em memória a partir do arquivo de fabricantes
+oui_index = OuiIndex.from_env()
+
+def _read_shared_cache_versions(names):
+    """Versões atuais (VersaoCache) dos dados em cache na memória; None sem conexão ou sem a tabela."""
+    with db_connection() as conn:
+        if not conn:
+            return None
+        return read_cache_versions(conn.cursor(), list(names))
+
+# Cache das rotas de dados de referência (fabricantes, SOs, tipos), invalidado pelas escritas nessas tabelas
+# (as de Fabricante, feitas também por outros processos, chegam pela versão em VersaoCache)
+response_cache = ResponseCache.from_env(version_reader=_read_shared_cache_versions)
+REFERENCE_CACHE_TTL_SECONDS = float(os.getenv('REFERENCE_CACHE_TTL_SECONDS', '3600'))
+
+@contextmanager
+def dedicated_db_connection():
+    """Como db_connection, mas com uma conexão própria, fora do pool, fechada ao sair. Entrega None se não conectar."""
+    try:
+        conn = db_pool.connect_dedicated()
+    except mysql.connector.Error as err:
+        log.error(f"Erro ao abrir conexão dedicada com o MySQL: {err}")
+        conn = None
+    try:
+        yield conn
+    except Exception:
+        if conn:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+# Listas grandes (dispositivos, IPs descobertos, relatórios) enviadas em fluxo, em blocos de JSON_STREAM_FETCH_SIZE linhas,
+# cada envio com conexão própria (fora do pool) e até JSON_STREAM_MAX_CONCURRENT envios simultâneos
+row_streamer = RowStreamer.from_env(dedicated_db_connection)
+
+# Varreduras detalhadas (Nmap) enfileiradas e executadas em paralelo, em grupos de IPs por invocação
+detail_scan_queue = DetailScanQueue.from_env(db_connection, oui=oui_index, store=job_store)
+NMAP_DETAIL_MAX_BATCH = int(os.getenv('NMAP_DETAIL_MAX_BATCH', '500'))
+
+# --- LISTAGEM PAGINADA DE ALERTAS ---
+# Colunas que podem ser pedidas em `fields=`; ID_Alerta e DataHoraCriacao sempre vêm (formam o cursor).
+ALERT_FIELDS = {
+    'ID_Alerta': 'a.ID_Alerta',
+    'DataHoraCriacao': 'a.DataHoraCriacao',
+    'DescricaoCustomizada': 'a.DescricaoCustomizada',
+    'StatusAlerta': 'a.StatusAlerta',
+    'Severidade': 'a.Severidade',
+    'DataHoraResolucao': 'a.DataHoraResolucao',
+    'DetalhesTecnicos': 'a.DetalhesTecnicos',
+    'TipoAlertaNome': 'ta.Nome AS TipoAlertaNome',
+    'DispositivoNomeHost': 'd.NomeHost AS DispositivoNomeHost',
+    'IPDescobertoEndereco': 'ipd.EnderecoIP AS IPDescobertoEndereco',
+}
+ALERTS_PAGE_DEFAULT = 50
+ALERTS_PAGE_MAX = 500
+
+def encode_alert_cursor(data_hora_criacao, id_alerta):
+    """Gera o token opaco de paginação a partir da última linha da página."""
+    raw = json.dumps([data_hora_criacao.strftime('%Y-%m-%d %H:%M:%S'), id_alerta])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_alert_cursor(cursor_token):
+    """Decodifica o token de paginação. Levanta ValueError se for inválido."""
+    try:
+        data_hora, id_alerta = json.loads(base64.urlsafe_b64decode(cursor_token.encode('ascii')))
+        return datetime.strptime(data_hora, '%Y-%m-%d %H:%M:%S'), int(id_alerta)
+    except Exception:
+        raise ValueError("Cursor de paginação inválido.")
+
+def _parse_list_arg(name):
+    value = request.args.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def _parse_datetime_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Parâmetro '{name}' deve ser uma data/hora ISO 8601.")
 
 @app.route('/api/alerts', methods=['GET'])
 def get_alerts():
-    conn = None
-    cursor = None
+    """
+    Lista alertas do mais recente para o mais antigo, com paginação por cursor (keyset) em
+    (DataHoraCriacao, ID_Alerta). Parâmetros opcionais:
+    limit, cursor, status, severidade, tipo (ID ou nome; aceitam listas separadas por vírgula),
+    desde/ate (ISO 8601) e fields (colunas a retornar).
+    Resposta: {"alerts": [...], "next_cursor": token ou null, "limit": N}.
+    """
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"message": "Erro de conexão com o banco de dados"}), 500
-
-        cursor = conn.cursor(dictionary=True)
+        try:
+            limit = int(request.args.get('limit', ALERTS_PAGE_DEFAULT))
+        except ValueError:
+            return jsonify({"message": "Parâmetro 'limit' deve ser um inteiro."}), 400
+        limit = max(1, min(limit, ALERTS_PAGE_MAX))
+
+        fields = _parse_list_arg('fields') or list(ALERT_FIELDS)
+        invalid_fields = [f for f in fields if f not in ALERT_FIELDS]
+        if invalid_fields:
+            return jsonify({"message": f"Campos inválidos em 'fields': {', '.join(invalid_fields)}"}), 400
+        for required in ('DataHoraCriacao', 'ID_Alerta'):
+            if required not in fields:
+                fields.insert(0, required)
+
+        where = []
+        params = []
 
-        query = """
-            SELECT 
-                a.ID_Alerta,
-                a.DescricaoCustomizada,
-                a.DataHoraCriacao,
-                a.StatusAlerta,
-                a.Severidade,
-                a.DataHoraResolucao,
-                a.DetalhesTecnicos, 
-                ta.Nome AS TipoAlertaNome,
-                d.NomeHost AS DispositivoNomeHost,
-                ipd.EnderecoIP AS IPDescobertoEndereco
+        try:
+            cursor_token = request.args.get('cursor')
+            if cursor_token:
+                cursor_data_hora, cursor_id = decode_alert_cursor(cursor_token)
+                # Forma expandida da comparação de tupla para o MySQL usar o índice (DataHoraCriacao, ID_Alerta).
+                where.append("(a.DataHoraCriacao < %s OR (a.DataHoraCriacao = %s AND a.ID_Alerta < %s))")
+                params.extend([cursor_data_hora, cursor_data_hora, cursor_id])
+            desde = _parse_datetime_arg('desde')
+            ate = _parse_datetime_arg('ate')
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        if desde:
+            where.append("a.DataHoraCriacao >= %s")
+            params.append(desde)
+        if ate:
+            where.append("a.DataHoraCriacao <= %s")
+            params.append(ate)
+
+        status_list = _parse_list_arg('status')
+        if status_list:
+            where.append(f"a.StatusAlerta IN ({', '.join(['%s'] * len(status_list))})")
+            params.extend(status_list)
+
+        severidades = _parse_list_arg('severidade')
+        if severidades:
+            where.append(f"a.Severidade IN ({', '.join(['%s'] * len(severidades))})")
+            params.extend(severidades)
+
+        tipos = _parse_list_arg('tipo')
+        needs_tipo_join = 'TipoAlertaNome' in fields
+        if tipos:
+            tipo_ids = [int(t) for t in tipos if t.isdigit()]
+            tipo_nomes = [t for t in tipos if not t.isdigit()]
+            tipo_conds = []
+            if tipo_ids:
+                tipo_conds.append(f"a.ID_TipoAlerta IN ({', '.join(['%s'] * len(tipo_ids))})")
+                params.extend(tipo_ids)
+            if tipo_nomes:
+                needs_tipo_join = True
+                tipo_conds.append(f"ta.Nome IN ({', '.join(['%s'] * len(tipo_nomes))})")
+                params.extend(tipo_nomes)
+            where.append(f"({' OR '.join(tipo_conds)})")
+
+        # Só faz os JOINs que as colunas pedidas (ou os filtros) realmente exigem.
+        joins = []
+        if needs_tipo_join:
+            joins.append("JOIN TipoAlerta ta ON a.ID_TipoAlerta = ta.ID_TipoAlerta")
+        if 'DispositivoNomeHost' in fields:
+            joins.append("LEFT JOIN Dispositivo d ON a.ID_Dispositivo = d.ID_Dispositivo")
+        if 'IPDescobertoEndereco' in fields:
+            joins.append("LEFT JOIN IPsDescobertos ipd ON a.ID_IPDescoberto_FK = ipd.ID_IPDescoberto")
+
+        query = f"""
+            SELECT {', '.join(ALERT_FIELDS[f] for f in fields)}
             FROM Alerta a
-            JOIN TipoAlerta ta ON a.ID_TipoAlerta = ta.ID_TipoAlerta
-            LEFT JOIN Dispositivo d ON a.ID_Dispositivo = d.ID_Dispositivo
-            LEFT JOIN IPsDescobertos ipd ON a.ID_IPDescoberto_FK = ipd.ID_IPDescoberto
-            ORDER BY a.DataHoraCriacao DESC
+            {' '.join(joins)}
+            {('WHERE ' + ' AND '.join(where)) if where else ''}
+            ORDER BY a.DataHoraCriacao DESC, a.ID_Alerta DESC
+            LIMIT %s
         """
-        cursor.execute(query)
-        alerts = cursor.fetchall()
-        return jsonify(alerts), 200
+        params.append(limit + 1)
+
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro de conexão com o banco de dados"}), 500
+
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, tuple(params))
+            alerts = cursor.fetchall()
+
+        next_cursor = None
+        if len(alerts) > limit:
+            alerts = alerts[:limit]
+            next_cursor = encode_alert_cursor(alerts[-1]['DataHoraCriacao'], alerts[-1]['ID_Alerta'])
+        return jsonify({"alerts": alerts, "next_cursor": next_cursor, "limit": limit}), 200
 
     except Exception as e:
         log.exception("Erro ao buscar alertas")
         return jsonify({"message": "Erro interno ao buscar alertas"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+
+@app.route('/api/alerts/<int:alert_id>', methods=['GET'])
+def get_alert(alert_id):
+    """Retorna um alerta completo (inclui DetalhesTecnicos, omitido da listagem paginada)."""
+    try:
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro de conexão com o banco de dados"}), 500
+
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"""
+                SELECT {', '.join(ALERT_FIELDS.values())}
+                FROM Alerta a
+                JOIN TipoAlerta ta ON a.ID_TipoAlerta = ta.ID_TipoAlerta
+                LEFT JOIN Dispositivo d ON a.ID_Dispositivo = d.ID_Dispositivo
+                LEFT JOIN IPsDescobertos ipd ON a.ID_IPDescoberto_FK = ipd.ID_IPDescoberto
+                WHERE a.ID_Alerta = %s
+            """, (alert_id,))
+            alert = cursor.fetchone()
+            if not alert:
+                return jsonify({"message": "Alerta não encontrado"}), 404
+            return jsonify(alert), 200
+
+    except Exception as e:
+        log.exception(f"Erro ao buscar alerta ID {alert_id}")
+        return jsonify({"message": "Erro interno ao buscar alerta"}), 500
 
 def get_tipo_alerta_id(conn, nome_tipo_alerta):
     cursor_tipo = None
@@ -271,8 +560,6 @@ def get_tipo_alerta_details_by_name(conn, nome_tipo_alerta):
 
 @app.route('/api/alerts/<int:alert_id>/status', methods=['PUT'])
 def update_alert_status(alert_id):
-    conn = None
-    cursor = None
     ip_origem = request.remote_addr
     data = request.get_json()
     
@@ -292,295 +579,398 @@ def update_alert_status(alert_id):
         if novo_status not in allowed_statuses:
             return jsonify({"message": f"Status '{novo_status}' inválido."}), 400
 
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
         
-        cursor = conn.cursor()
+            cursor = conn.cursor()
 
-        if novo_status == 'Resolvido':
-            query = "UPDATE Alerta SET StatusAlerta = %s, DataHoraResolucao = %s WHERE ID_Alerta = %s"
-            params = (novo_status, datetime.now(), alert_id)
-        else:
-            query = "UPDATE Alerta SET StatusAlerta = %s WHERE ID_Alerta = %s"
-            params = (novo_status, alert_id)
+            if novo_status == 'Resolvido':
+                query = "UPDATE Alerta SET StatusAlerta = %s, DataHoraResolucao = %s WHERE ID_Alerta = %s"
+                params = (novo_status, datetime.now(), alert_id)
+            else:
+                query = "UPDATE Alerta SET StatusAlerta = %s WHERE ID_Alerta = %s"
+                params = (novo_status, alert_id)
         
-        cursor.execute(query, params)
-        conn.commit()
+            cursor.execute(query, params)
+            # Guardado antes do bump: depois dele o rowcount seria o do upsert em VersaoCache.
+            updated = cursor.rowcount
+            if updated > 0:
+                bump_cache_version(cursor, VERSAO_DASHBOARD)
+            conn.commit()
 
-        if cursor.rowcount > 0:
-            # ### AUDITORIA: Registrar a mudança de status ###
-            detalhes_log = {
-                "alerta_id": alert_id,
-                "novo_status": novo_status
-            }
-            registrar_log_auditoria(
-                id_usuario=id_usuario_logado,
-                nome_usuario=nome_usuario_logado,
-                acao='ALERTA_STATUS_ALTERADO',
-                detalhes=json.dumps(detalhes_log),
-                ip_origem=ip_origem
-            )
-            
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({"message": "Alerta não encontrado ou status não alterado"}), 404
+            if updated > 0:
+                invalidate_dashboard('alerta')
+                # ### AUDITORIA: Registrar a mudança de status ###
+                detalhes_log = {
+                    "alerta_id": alert_id,
+                    "novo_status": novo_status
+                }
+                registrar_log_auditoria(
+                    id_usuario=id_usuario_logado,
+                    nome_usuario=nome_usuario_logado,
+                    acao='ALERTA_STATUS_ALTERADO',
+                    detalhes=json.dumps(detalhes_log),
+                    ip_origem=ip_origem
+                )
             
-        cursor.close()
-        conn.close()
+            if updated == 0:
+                return jsonify({"message": "Alerta não encontrado ou status não alterado"}), 404
         
-        return jsonify({"message": f"Status do Alerta ID {alert_id} atualizado para '{novo_status}' com sucesso."}), 200
+            return jsonify({"message": f"Status do Alerta ID {alert_id} atualizado para '{novo_status}' com sucesso."}), 200
 
     except Exception as e:
-        if conn: conn.rollback()
         log.exception(f"Erro ao atualizar status para o alerta ID {alert_id}")
         return jsonify({"message": "Erro ao atualizar status do alerta"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
-
-def process_discovered_ip(ip_str):
-    conn = None
-    cursor = None
-    hostname_resolvido = None
-    id_ip_descoberto_novo = None 
 
-    log.info(f"PROCESS_IP: Iniciando processamento para IP: {ip_str}")
+def scan_local_neighbors(targets, scan_source="Desconhecida"):
+    """
+    Escolhe o método por faixa: os alvos (TargetSpec) em redes locais são varridos por ARP antes do
+    pipeline; os demais seguem pela sondagem ICMP. Retorna o NeighborScanResult ou None.
+    """
+    if not DISCOVERY_ARP_ENABLED:
+        return None
     try:
-        log.debug(f"PROCESS_IP ({ip_str}): Tentando resolver hostname via rDNS...")
-        try:
-            hostname_resolvido, _, _ = socket.gethostbyaddr(ip_str)
-            log.info(f"PROCESS_IP ({ip_str}): Hostname resolvido: {hostname_resolvido}")
-        except socket.herror: 
-            log.warning(f"PROCESS_IP ({ip_str}): Não foi possível resolver hostname (socket.herror).")
-        except Exception as e_dns: 
-            log.error(f"PROCESS_IP ({ip_str}): Erro genérico na resolução DNS: {e_dns}")
-        
-        conn = get_db_connection()
-        if not conn:
-            log.critical(f"PROCESS_IP ({ip_str}): FALHA - Não foi possível conectar ao DB.")
-            return
-
-        cursor = conn.cursor(dictionary=True)
-        
-        log.debug(f"PROCESS_IP ({ip_str}): Verificando se IP já existe em IPsDescobertos...")
-        cursor.execute("SELECT ID_IPDescoberto FROM IPsDescobertos WHERE EnderecoIP = %s", (ip_str,))
-        existing_ip_data = cursor.fetchone()
-
-        if existing_ip_data:
-            ip_id_existente = existing_ip_data['ID_IPDescoberto']
-            log.debug(f"PROCESS_IP ({ip_str}): IP já existe (ID: {ip_id_existente}). Atualizando NomeHostResolvido...")
-            update_query = "UPDATE IPsDescobertos SET NomeHostResolvido = %s WHERE ID_IPDescoberto = %s"
-            cursor.execute(update_query, (hostname_resolvido, ip_id_existente))
-        else:
-            log.info(f"PROCESS_IP ({ip_str}): NOVO IP. Inserindo em IPsDescobertos...")
-            insert_query = "INSERT INTO IPsDescobertos (EnderecoIP, NomeHostResolvido, StatusResolucao) VALUES (%s, %s, %s)"
-            cursor.execute(insert_query, (ip_str, hostname_resolvido, 'Novo'))
-            id_ip_descoberto_novo = cursor.lastrowid 
-            log.info(f"PROCESS_IP ({ip_str}): Inserido em IPsDescobertos com ID: {id_ip_descoberto_novo}")
-
-        conn.commit() 
-        log.debug(f"PROCESS_IP ({ip_str}): Commit realizado para IPsDescobertos.")
-
-        if id_ip_descoberto_novo: 
-            log.info(f"PROCESS_IP ({ip_str}): Tentando gerar alerta para novo ID_IPDescoberto: {id_ip_descoberto_novo}")
-            
-            tipo_alerta_info = get_tipo_alerta_details_by_name(conn, 'Novo IP Descoberto')
-            log.debug(f"PROCESS_IP ({ip_str}): Detalhes do TipoAlerta 'Novo IP Descoberto': {tipo_alerta_info}")
-            
-            if tipo_alerta_info and tipo_alerta_info.get('ID_TipoAlerta'):
-                id_tipo_alerta = tipo_alerta_info['ID_TipoAlerta']
-                severidade_alerta = tipo_alerta_info.get('SeveridadePadrao', 'Media')
-                
-                descricao_alerta = f"Novo IP detectado na rede: {ip_str}"
-                if hostname_resolvido:
-                    descricao_alerta += f" (Hostname provável: {hostname_resolvido})"
-                
-                alert_query_params = (
-                    id_tipo_alerta, 
-                    id_ip_descoberto_novo, 
-                    descricao_alerta, 
-                    'Novo',
-                    severidade_alerta
-                )
-                log.debug(f"PROCESS_IP ({ip_str}): Parâmetros para query de Alerta: {alert_query_params}")
-                
-                alert_query = """
-                INSERT INTO Alerta (ID_TipoAlerta, ID_IPDescoberto_FK, DescricaoCustomizada, StatusAlerta, Severidade)
-                VALUES (%s, %s, %s, %s, %s)
-                """
-                cursor.execute(alert_query, alert_query_params)
-                conn.commit() 
-                log.info(f"PROCESS_IP ({ip_str}): ALERTA GERADO para novo IP com severidade '{severidade_alerta}'")
-            else:
-                log.warning(f"PROCESS_IP ({ip_str}): Tipo de Alerta 'Novo IP Descoberto' não encontrado ou inválido. Alerta não gerado.")
-        else:
-            log.debug(f"PROCESS_IP ({ip_str}): Não é um IP novo, nenhum alerta de 'Novo IP Descoberto' será gerado.")
+        return neighbor_discovery.scan(targets, log_prefix=f"ARP_SCAN ({scan_source})")
+    except Exception:
+        log.exception(f"ARP_SCAN ({scan_source}): Erro na varredura ARP; todas as faixas seguem por ICMP.")
+        return None
 
-    except mysql.connector.Error as db_err:
-        log.exception(f"PROCESS_IP ({ip_str}): Erro de DB.")
-        if conn: conn.rollback()
-    except Exception as e:
-        log.exception(f"PROCESS_IP ({ip_str}): Erro inesperado.")
+def run_discovery_pipeline(ip_targets, scan_source="Desconhecida", on_host=None, on_probed=None, neighbor_scan=None,
+                           on_persist_failed=None):
+    """
+    Executa a descoberta sobre os alvos pelo pipeline asyncio (sondagem ICMP -> rDNS -> DB).
+    Alvos cobertos por `neighbor_scan` (varredura ARP) não são sondados de novo e têm o MAC gravado.
+    Os IPs ativos são gravados em lotes em IPsDescobertos (com alertas para os novos); `on_host` é
+    chamado após o commit do lote de cada IP e, se algum lote não pôde ser gravado,
+    `on_persist_failed(total_perdido)` ao final.
+    Retorna a lista de IPs (str) ativos, na ordem em que foram processados.
+    """
+    def on_batch_written(total, novos):
+        # Novos IPs geram alertas "Novo IP Descoberto", que aparecem no dashboard.
+        if novos:
+            invalidate_dashboard('varredura')
+
+    batch_writer = DiscoveredIpBatchWriter.from_env(db_connection, scan_source=scan_source, on_batch_written=on_batch_written,
+                                                    on_host_written=on_host, oui=oui_index)
+    pipeline = DiscoveryPipeline.from_env(
+        fallback_probe=ping_ip,
+        resolve_hostname=rdns_resolver.resolve,
+        persist_host=batch_writer.add,
+        on_probed=on_probed,
+        on_probe_result=availability_recorder.record_ip,
+        neighbor_scan=neighbor_scan,
+        rate_controller=probe_rate_controller,
+        scan_source=scan_source,
+    )
+    try:
+        return pipeline.run(ip_targets)
     finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
-        log.info(f"PROCESS_IP: Finalizado processamento para IP: {ip_str}")
-
-def scan_ip_range_segment(ip_list_segment):
-    """Recebe uma lista de IPs e pinga cada um, processando os que respondem."""
-    active_ips_in_segment = []
-    for ip_obj in ip_list_segment:
-        ip_str = str(ip_obj)
-        if ping_ip(ip_str):
-            active_ips_in_segment.append(ip_str)
-            process_discovered_ip(ip_str) 
-    return active_ips_in_segment
+        batch_writer.close()
+        rdns_resolver.flush()
+        log.info(f"SCAN_CORE ({scan_source}): {batch_writer.total_written} IPs gravados em IPsDescobertos, {batch_writer.total_new} novos.")
+        if batch_writer.total_lost:
+            log.error(f"SCAN_CORE ({scan_source}): {batch_writer.total_lost} IPs ativos não puderam ser gravados.")
+            if on_persist_failed:
+                on_persist_failed(batch_writer.total_lost)
 
 @app.route('/api/discovery/start-scan', methods=['POST'])
 def start_discovery_scan():
-    ip_ranges_str = os.getenv('DISCOVERY_IP_RANGES', '192.168.1.1-192.168.1.20') 
-    all_ips_to_scan = []
-    range_segments = ip_ranges_str.split(',')
-    
-    for segment in range_segments:
-        segment = segment.strip()
-        if '-' in segment: 
-            try:
-                start_ip_str, end_part_str = segment.split('-')
-                start_ip = ipaddress.ip_address(start_ip_str)
-                
-                if '.' in end_part_str : 
-                    end_ip = ipaddress.ip_address(end_part_str)
-                    if start_ip.version != end_ip.version:
-                        log.warning(f"Faixa inválida: {segment} - IPs de versões diferentes.")
-                        continue
-                    if start_ip > end_ip:
-                        log.warning(f"Faixa inválida: {segment} - IP inicial maior que IP final.")
-                        continue
-                    current_ip = start_ip
-                    while current_ip <= end_ip:
-                        all_ips_to_scan.append(current_ip)
-                        current_ip += 1
-                else: 
-                    end_octet = int(end_part_str)
-                    if not (0 <= end_octet <= 255):
-                         log.warning(f"Faixa inválida: {segment} - Octeto final inválido.")
-                         continue
-                    
-                    start_ip_addr_bytes = bytearray(start_ip.packed)
-                    if start_ip.version == 4 and len(start_ip_addr_bytes) == 4 :
-                        if end_octet < start_ip_addr_bytes[3]:
-                             log.warning(f"Faixa inválida: {segment} - Octeto final menor que octeto inicial.")
-                             continue
-                        end_ip_addr_bytes = start_ip_addr_bytes[:]
-                        end_ip_addr_bytes[3] = end_octet
-                        end_ip = ipaddress.ip_address(bytes(end_ip_addr_bytes))
-
-                        current_ip = start_ip
-                        while current_ip <= end_ip:
-                            all_ips_to_scan.append(current_ip)
-                            if current_ip == end_ip : break 
-                            current_ip += 1
-                    else:
-                        log.warning(f"Formato de faixa X.X.X.X-Z só suportado para IPv4: {segment}")
-                        continue
-            except ValueError as e:
-                log.warning(f"Erro ao processar faixa de IP '{segment}': {e}")
-                continue
-        elif '/' in segment: 
-            try:
-                network = ipaddress.ip_network(segment, strict=False)
-                for ip_obj in network.hosts(): 
-                    all_ips_to_scan.append(ip_obj)
-            except ValueError as e:
-                log.warning(f"Erro ao processar faixa CIDR '{segment}': {e}")
-                continue
-        else: 
-            try:
-                all_ips_to_scan.append(ipaddress.ip_address(segment))
-            except ValueError as e:
-                log.warning(f"Erro ao processar IP único '{segment}': {e}")
-                continue
-    
-    if not all_ips_to_scan:
+    ip_ranges_str = os.getenv('DISCOVERY_IP_RANGES', '192.168.1.1-192.168.1.20')
+    targets = TargetSpec.parse(ip_ranges_str, log_prefix="SCAN_CORE (Manual)")
+    if not targets:
         return jsonify({"message": "Nenhuma faixa de IP válida para escanear configurada ou fornecida."}), 400
+    if targets.total > DISCOVERY_MAX_TARGETS:
+        return jsonify({"message": f"As faixas somam {targets.total} IPs; o máximo por varredura é {DISCOVERY_MAX_TARGETS} "
+                                   f"(DISCOVERY_MAX_TARGETS)."}), 400
 
-    log.info(f"Total de IPs a serem escaneados: {len(all_ips_to_scan)}")
-    
-    active_ips_found = []
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        chunk_size = 50 
-        results_futures = []
-        for i in range(0, len(all_ips_to_scan), chunk_size):
-            ip_chunk = all_ips_to_scan[i:i + chunk_size]
-            future = executor.submit(scan_ip_range_segment, ip_chunk)
-            results_futures.append(future)
-        
-        for future in results_futures:
-            active_ips_found.extend(future.result())
-    
+    log.info(f"Total de IPs a serem escaneados: {targets.total}")
+
+    def run(job):
+        return run_discovery_pipeline(targets.iter_targets(randomize=DISCOVERY_RANDOMIZE_TARGETS),
+                                      scan_source="Manual", on_host=job.add_host, on_probed=job.probe_done,
+                                      on_persist_failed=job.persist_failed,
+                                      neighbor_scan=scan_local_neighbors(targets, "Manual"))
+
+    # A varredura roda em segundo plano; o progresso é acompanhado por SSE em /events.
+    job = scan_job_manager.submit(targets.total, "Manual", run)
+    return jsonify({
+        "message": f"Varredura de descoberta iniciada para {targets.total} IPs.",
+        "job_id": job.id,
+        "status_url": f"/api/discovery/scans/{job.id}",
+        "events_url": f"/api/discovery/scans/{job.id}/events"
+    }), 202
+
+@app.route('/api/discovery/scans/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    """Status atual de uma varredura em segundo plano (progresso e IPs ativos encontrados)."""
+    try:
+        job = scan_job_manager.get(job_id)
+        if not job:
+            return jsonify({"message": "Varredura não encontrada (ou já expirada)."}), 404
+        return jsonify(job.to_dict()), 200
+    except ConnectionError:
+        return jsonify({"message": "Erro de conexão DB"}), 500
+
+@app.route('/api/discovery/scans/<job_id>/events', methods=['GET'])
+def stream_scan_job_events(job_id):
+    """
+    Stream SSE da varredura: eventos 'host' (IP ativo gravado), 'progress' (percentual, hosts/s e ETA)
+    e 'done' ao terminar. Aceita Last-Event-ID para retomar de onde o cliente parou.
+    """
+    try:
+        job = scan_job_manager.get(job_id)
+    except ConnectionError:
+        return jsonify({"message": "Erro de conexão DB"}), 500
+    if not job:
+        return jsonify({"message": "Varredura não encontrada (ou já expirada)."}), 404
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_seq = 0
+
+    def generate(after_seq):
+        yield "retry: 3000\n\n"
+        while True:
+            events, finished = job.wait_events(after_seq, timeout=SSE_HEARTBEAT_SECONDS)
+            if not events and not finished:
+                # Comentário SSE mantém a conexão viva através de proxies.
+                yield ": keep-alive\n\n"
+            for seq, event_type, data in events:
+                after_seq = max(after_seq, seq)
+                yield f"id: {seq}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+            if finished:
+                return
+
+    return Response(stream_with_context(generate(last_seq)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/discovery/distributed-scans', methods=['POST'])
+def start_distributed_scan():
+    """
+    Cria uma rodada de varredura distribuída: as faixas (do corpo, da configuração ou de
+    DISCOVERY_IP_RANGES) são divididas em shards que os workers (scan_worker.py) executam.
+    """
+    data = request.get_json(silent=True) or {}
+    faixas_ip = data.get('FaixasIP')
+    if not faixas_ip:
+        settings = get_current_scan_settings()
+        faixas_ip = (settings or {}).get('FaixasIP') or os.getenv('DISCOVERY_IP_RANGES')
+    try:
+        scan = scan_coordinator.create_scan(faixas_ip, scan_source="Manual")
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except ConnectionError:
+        return jsonify({"message": "Erro de conexão DB"}), 500
+    if not scan:
+        return jsonify({"message": "Nenhuma faixa de IP válida para escanear configurada ou fornecida."}), 400
     return jsonify({
-        "message": f"Varredura de descoberta concluída. {len(active_ips_found)} IPs ativos encontrados e processados.",
-        "active_ips": active_ips_found 
-    }), 200
+        "message": f"Varredura distribuída criada com {scan['shards']} shards para {scan['alvos']} IPs.",
+        **scan,
+        "status_url": f"/api/discovery/distributed-scans/{scan['id_varredura']}"
+    }), 202
+
+@app.route('/api/discovery/distributed-scans/<int:id_varredura>', methods=['GET'])
+def get_distributed_scan(id_varredura):
+    """Progresso de uma varredura distribuída: shards por status, alvos varridos, hosts ativos e erros."""
+    try:
+        scan = scan_coordinator.scan_status(id_varredura)
+    except ConnectionError:
+        return jsonify({"message": "Erro de conexão DB"}), 500
+    if not scan:
+        return jsonify({"message": "Varredura distribuída não encontrada."}), 404
+    return jsonify(scan), 200
 
 @app.route('/api/discovery/discovered-ips', methods=['GET'])
 def get_discovered_ips():
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
-        cursor = conn.cursor(dictionary=True)
         query = """
         SELECT ID_IPDescoberto, EnderecoIP, DataPrimeiraDeteccao, DataUltimaDeteccao, 
                StatusResolucao, NomeHostResolvido
         FROM IPsDescobertos ORDER BY DataUltimaDeteccao DESC
         """
-        cursor.execute(query)
-        discovered_ips = cursor.fetchall()
-        return jsonify(discovered_ips), 200
+        # A tabela cresce a cada varredura: a lista é enviada em fluxo, direto do cursor.
+        response = row_streamer.response(query, log_label="DISCOVERED_IPS")
+        if response is None:
+            return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+        return response
     except Exception as e:
         log.exception("Erro em /api/discovery/discovered-ips")
         return jsonify({"message": "Erro ao buscar IPs descobertos"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
     
+def _parse_availability_window():
+    """Lê `desde`/`ate` (ISO 8601) da query string; padrão: últimas 24 horas. Levanta ValueError se inválidos."""
+    def parse(value):
+        dt = datetime.fromisoformat(value)
+        # Horários com fuso são convertidos para o horário local (as colunas TIMESTAMP são lidas sem fuso).
+        return dt.astimezone().replace(tzinfo=None) if dt.tzinfo else dt
+
+    ate_str = request.args.get('ate')
+    desde_str = request.args.get('desde')
+    ate = parse(ate_str) if ate_str else datetime.now()
+    desde = parse(desde_str) if desde_str else ate - timedelta(days=1)
+    if desde >= ate:
+        raise ValueError("'desde' deve ser anterior a 'ate'.")
+    if ate - desde > timedelta(days=AVAILABILITY_MAX_DAYS):
+        raise ValueError(f"A janela máxima é de {AVAILABILITY_MAX_DAYS} dias.")
+    return desde, ate
+
+def _availability_response(tipo, id_entidade):
+    try:
+        desde, ate = _parse_availability_window()
+    except ValueError as e:
+        return jsonify({"message": f"Parâmetros de período inválidos: {e}"}), 400
+    resolucao = request.args.get('resolucao')
+    if resolucao and resolucao not in RESOLUCOES:
+        return jsonify({"message": f"'resolucao' deve ser um de: {', '.join(RESOLUCOES)}."}), 400
+    try:
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+            cursor = conn.cursor(dictionary=True)
+            result = {"desde": desde, "ate": ate, "resumo": availability_summary(cursor, tipo, id_entidade, desde, ate)}
+            if resolucao:
+                result["resolucao"] = resolucao
+                result["serie"] = availability_series(cursor, tipo, id_entidade, desde, ate, RESOLUCOES[resolucao])
+            return jsonify(result), 200
+    except Exception as e:
+        log.exception("Erro em /api/availability")
+        return jsonify({"message": "Erro ao buscar histórico de disponibilidade"}), 500
+
+@app.route('/api/availability/devices/<int:id_dispositivo>', methods=['GET'])
+def get_device_availability(id_dispositivo):
+    """Uptime e percentis de RTT de um dispositivo no período (`desde`/`ate`); `resolucao=1m|1h|1d` inclui a série."""
+    return _availability_response(TIPO_DISPOSITIVO, id_dispositivo)
+
+@app.route('/api/availability/ips/<int:id_ip_descoberto>', methods=['GET'])
+def get_discovered_ip_availability(id_ip_descoberto):
+    """Uptime e percentis de RTT de um IP descoberto no período (`desde`/`ate`)."""
+    return _availability_response(TIPO_IP_DESCOBERTO, id_ip_descoberto)
+
+@app.route('/api/availability/overview', methods=['GET'])
+def get_availability_overview():
+    """Uptime diário de todos os dispositivos nos últimos `days` dias (padrão 90), para o relatório."""
+    try:
+        days = int(request.args.get('days', '90'))
+    except ValueError:
+        return jsonify({"message": "'days' deve ser um número inteiro."}), 400
+    if days < 1 or days > AVAILABILITY_MAX_DAYS:
+        return jsonify({"message": f"'days' deve estar entre 1 e {AVAILABILITY_MAX_DAYS}."}), 400
+    try:
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+            return jsonify(daily_uptime_overview(conn.cursor(dictionary=True), days)), 200
+    except Exception as e:
+        log.exception("Erro em /api/availability/overview")
+        return jsonify({"message": "Erro ao buscar visão geral de disponibilidade"}), 500
+
+@app.route('/api/admin/db-pool', methods=['GET'])
+@token_required
+def get_db_pool_stats(current_user):
+    """Estatísticas do pool de conexões (em uso, aguardando, criadas etc.)."""
+    return jsonify(db_pool.stats()), 200
+
+@app.route('/api/admin/liveness', methods=['GET'])
+@token_required
+def get_liveness_stats(current_user):
+    """Estado do monitor de disponibilidade (dispositivos monitorados, vencidos, último ciclo)."""
+    return jsonify(liveness_monitor.snapshot()), 200
+
+@app.route('/api/admin/probe-rate', methods=['GET'])
+@token_required
+def get_probe_rate_stats(current_user):
+    """Ritmo atual das sondas (global e por sub-rede), perda estimada e ajustes do controle AIMD."""
+    if not probe_rate_controller:
+        return jsonify({"message": "Controle de taxa adaptativo desativado (RATE_CONTROL_ENABLED=false)."}), 404
+    return jsonify(probe_rate_controller.snapshot(limit=request.args.get('limit', 50, type=int))), 200
+
+@app.route('/api/admin/response-cache', methods=['GET'])
+@token_required
+def get_response_cache_stats(current_user):
+    """Métricas do cache das rotas de dados de referência (hits, misses, 304, invalidações)."""
+    return jsonify(response_cache.stats()), 200
+
+@app.route('/api/admin/response-cache/invalidate', methods=['POST'])
+@token_required
+def invalidate_response_cache(current_user):
+    """Invalida as respostas em cache de uma tabela (ex: após editar Fabricante direto no banco) ou todas."""
+    data = request.get_json(silent=True) or {}
+    tabelas = data.get('tabelas') or []
+    if not isinstance(tabelas, list):
+        return jsonify({"message": "'tabelas' deve ser uma lista de nomes de tabela."}), 400
+    response_cache.invalidate(*tabelas)
+    return jsonify({"message": "Cache de respostas invalidado.", "tabelas": tabelas or "todas"}), 200
+
+@app.route('/api/admin/rdns-cache', methods=['GET'])
+@token_required
+def get_rdns_cache_stats(current_user):
+    """Métricas do cache de DNS reverso (hits, misses, timeouts, taxa de acerto, entradas)."""
+    return jsonify(rdns_resolver.stats()), 200
+
+@app.route('/api/admin/rdns-cache/invalidate', methods=['POST'])
+@token_required
+def invalidate_rdns_cache(current_user):
+    """Invalida o cache de DNS reverso (de um IP, via JSON {"ip": "..."}, ou de todos)."""
+    data = request.get_json(silent=True) or {}
+    ip_str = data.get('ip')
+    if ip_str is not None and not isinstance(ip_str, str):
+        return jsonify({"message": "ip deve ser uma string"}), 400
+    rdns_resolver.invalidate(ip_str)
+    registrar_log_auditoria(current_user['ID_Usuario'], current_user['NomeUsuario'], 'RDNS_CACHE_INVALIDADO',
+                            detalhes=f"Cache de DNS reverso invalidado ({'todos' if ip_str is None else ip_str}).",
+                            ip_origem=request.remote_addr)
+    return jsonify({"message": "Cache de DNS reverso invalidado."}), 200
+
+@app.route('/api/admin/auth-cache/invalidate', methods=['POST'])
+@token_required
+def invalidate_auth_cache(current_user):
+    """
+    Invalida o cache de autenticação (de um usuário, via JSON {"id_usuario": N}, ou de todos). Neste worker
+    a invalidação é imediata; nos demais, a versão 'Usuario' incrementada esvazia o cache inteiro na
+    próxima checagem (em até AUTH_USER_VERSION_CHECK_SECONDS).
+    """
+    data = request.get_json(silent=True) or {}
+    id_usuario = data.get('id_usuario')
+    if id_usuario is not None and not isinstance(id_usuario, int):
+        return jsonify({"message": "id_usuario deve ser um inteiro"}), 400
+    invalidate_user_cache(id_usuario)
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"message": "Cache invalidado só neste worker: sem conexão com o banco para avisar os demais."}), 500
+        bump_cache_version(conn.cursor(), VERSAO_USUARIO)
+        conn.commit()
+    registrar_log_auditoria(current_user['ID_Usuario'], current_user['NomeUsuario'], 'AUTH_CACHE_INVALIDADO',
+                            detalhes=f"Cache de autenticação invalidado ({'todos' if id_usuario is None else f'ID {id_usuario}'}).",
+                            ip_origem=request.remote_addr)
+    return jsonify({"message": "Cache de autenticação invalidado."}), 200
+
 @app.route('/')
 def home():
     return "Bem-vindo ao Backend!"
 
 @app.route('/api/discovery/discovered-ips/<int:id_ip_descoberto>', methods=['GET'])
 def get_single_discovered_ip(id_ip_descoberto):
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
-        cursor = conn.cursor(dictionary=True)
-        query = """
-        SELECT ID_IPDescoberto, EnderecoIP, DataPrimeiraDeteccao, DataUltimaDeteccao, 
-               StatusResolucao, NomeHostResolvido, MAC_Address_Estimado, OS_Estimado, 
-               Portas_Abertas, DetalhesVarreduraExtra
-        FROM IPsDescobertos WHERE ID_IPDescoberto = %s
-        """
-        cursor.execute(query, (id_ip_descoberto,))
-        discovered_ip = cursor.fetchone()
-        if discovered_ip:
-            return jsonify(discovered_ip), 200
-        else:
-            return jsonify({"message": "IP Descoberto não encontrado"}), 404
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+            cursor = conn.cursor(dictionary=True)
+            query = """
+            SELECT ID_IPDescoberto, EnderecoIP, DataPrimeiraDeteccao, DataUltimaDeteccao, 
+                   StatusResolucao, NomeHostResolvido, MAC_Address_Estimado, OS_Estimado, 
+                   Portas_Abertas, DetalhesVarreduraExtra
+            FROM IPsDescobertos WHERE ID_IPDescoberto = %s
+            """
+            cursor.execute(query, (id_ip_descoberto,))
+            discovered_ip = cursor.fetchone()
+            if discovered_ip:
+                return jsonify(discovered_ip), 200
+            else:
+                return jsonify({"message": "IP Descoberto não encontrado"}), 404
     except Exception as e:
         log.exception(f"Erro ao buscar IP descoberto específico ID: {id_ip_descoberto}")
         return jsonify({"message": "Erro ao buscar IP descoberto específico"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -593,115 +983,186 @@ def login():
             return jsonify({"message": "Dados de login ausentes ou inválidos"}), 400
         
         password_digitada = data['password']
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
         
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT ID_Usuario, NomeUsuario, SenhaHash, Ativo FROM Usuario WHERE NomeUsuario = %s OR Email = %s"
-        cursor.execute(query, (username_or_email, username_or_email))
-        user = cursor.fetchone()
+            cursor = conn.cursor(dictionary=True)
+            query = "SELECT ID_Usuario, NomeUsuario, SenhaHash, Ativo FROM Usuario WHERE NomeUsuario = %s OR Email = %s"
+            cursor.execute(query, (username_or_email, username_or_email))
+            user = cursor.fetchone()
         
-        if user and user['Ativo']:
-            senha_hash_bd = user['SenhaHash'].encode('utf-8')
-            password_digitada_bytes = password_digitada.encode('utf-8')
-            if bcrypt.checkpw(password_digitada_bytes, senha_hash_bd):
-                registrar_log_auditoria(
-                    user['ID_Usuario'], 
-                    user['NomeUsuario'], 
-                    'LOGIN_SUCESSO', 
-                    detalhes=f"Usuário '{user['NomeUsuario']}' logado.",
-                    ip_origem=ip_origem
-                )
-                log.info(f"Login bem-sucedido para usuário '{user['NomeUsuario']}' do IP {ip_origem}.")
-                # ### ALTERAÇÃO: GERAR O TOKEN JWT ###
-                token_payload = {
-                    'id_usuario': user['ID_Usuario'],
-                    'nome_usuario': user['NomeUsuario'],
-                    'exp': datetime.utcnow() + timedelta(hours=8) # Token expira em 8 horas
-                }
-                secret_key = os.getenv('SECRET_KEY')
-                token = jwt.encode(token_payload, secret_key, algorithm='HS256')
-                
-                cursor.close()
-                conn.close()
-                return jsonify({
-                                    "message": "Login bem-sucedido!",
-                                    "token": token, 
-                                    "user": {"id": user['ID_Usuario'], "username": user['NomeUsuario']}
-                                }), 200
+            if user and user['Ativo']:
+                senha_hash_bd = user['SenhaHash'].encode('utf-8')
+                password_digitada_bytes = password_digitada.encode('utf-8')
+                if bcrypt.checkpw(password_digitada_bytes, senha_hash_bd):
+                    registrar_log_auditoria(
+                        user['ID_Usuario'], 
+                        user['NomeUsuario'], 
+                        'LOGIN_SUCESSO', 
+                        detalhes=f"Usuário '{user['NomeUsuario']}' logado.",
+                        ip_origem=ip_origem
+                    )
+                    log.info(f"Login bem-sucedido para usuário '{user['NomeUsuario']}' do IP {ip_origem}.")
+                    _cache_user({'ID_Usuario': user['ID_Usuario'], 'NomeUsuario': user['NomeUsuario'], 'Ativo': user['Ativo']})
+                    # ### ALTERAÇÃO: GERAR O TOKEN JWT ###
+                    token_payload = {
+                        'id_usuario': user['ID_Usuario'],
+                        'nome_usuario': user['NomeUsuario'],
+                        'exp': datetime.utcnow() + timedelta(hours=8) # Token expira em 8 horas
+                    }
+                    secret_key = os.getenv('SECRET_KEY')
+                    token = jwt.encode(token_payload, secret_key, algorithm='HS256')
+                    return jsonify({
+                                        "message": "Login bem-sucedido!",
+                                        "token": token, 
+                                        "user": {"id": user['ID_Usuario'], "username": user['NomeUsuario']}
+                                    }), 200
+                else:
+                    registrar_log_auditoria(None, username_or_email, 'LOGIN_FALHA', detalhes=f"Senha incorreta para '{username_or_email}'.", ip_origem=ip_origem)
+                    log.warning(f"Tentativa de login falhou (senha incorreta) para usuário '{username_or_email}' do IP {ip_origem}.")
+                    return jsonify({"message": "Usuário ou senha inválidos"}), 401
             else:
-                registrar_log_auditoria(None, username_or_email, 'LOGIN_FALHA', detalhes=f"Senha incorreta para '{username_or_email}'.", ip_origem=ip_origem)
-                log.warning(f"Tentativa de login falhou (senha incorreta) para usuário '{username_or_email}' do IP {ip_origem}.")
-                cursor.close()
-                conn.close()
+                registrar_log_auditoria(None, username_or_email, 'LOGIN_FALHA', detalhes=f"Usuário '{username_or_email}' não encontrado ou inativo.", ip_origem=ip_origem)
+                log.warning(f"Tentativa de login falhou (usuário não existe/inativo) para '{username_or_email}' do IP {ip_origem}.")
                 return jsonify({"message": "Usuário ou senha inválidos"}), 401
-        else:
-            registrar_log_auditoria(None, username_or_email, 'LOGIN_FALHA', detalhes=f"Usuário '{username_or_email}' não encontrado ou inativo.", ip_origem=ip_origem)
-            log.warning(f"Tentativa de login falhou (usuário não existe/inativo) para '{username_or_email}' do IP {ip_origem}.")
-            cursor.close()
-            conn.close()
-            return jsonify({"message": "Usuário ou senha inválidos"}), 401
             
     except Exception as e:
         log.exception(f"Erro inesperado no endpoint /login para o usuário '{username_or_email}'")
         return jsonify({"message": "Erro interno no servidor"}), 500
-    finally:
-        if 'conn' in locals() and conn and conn.is_connected():
-            if 'cursor' in locals() and cursor: cursor.close()
-            conn.close()
     
+DEVICE_SEARCH_PAGE_DEFAULT = 100
+DEVICE_SEARCH_PAGE_MAX = 500
+
+# Lista de dispositivos com IP/MAC principais e nomes de SO, fabricante e tipo (também usada pelos relatórios por status)
+DEVICE_LIST_QUERY = """
+SELECT d.ID_Dispositivo, d.NomeHost, d.StatusAtual, d.DataUltimaVarredura,
+       ip.EnderecoIPValor as IPPrincipal, ifr.EnderecoMAC as MACPrincipal,
+       so.Nome as SistemaOperacionalNome, fab.Nome as FabricanteNome,
+       td.Nome as TipoDispositivoNome
+FROM Dispositivo d
+LEFT JOIN InterfaceRede ifr ON d.ID_Dispositivo = ifr.ID_Dispositivo 
+LEFT JOIN EnderecoIP ip ON ifr.ID_Interface = ip.ID_Interface AND ip.Principal = TRUE
+LEFT JOIN SistemaOperacional so ON d.ID_SistemaOperacional = so.ID_SistemaOperacional
+LEFT JOIN Fabricante fab ON d.ID_Fabricante = fab.ID_Fabricante
+LEFT JOIN TipoDispositivo td ON d.ID_TipoDispositivo = td.ID_TipoDispositivo
+{where}
+ORDER BY d.NomeHost ASC
+"""
+
 @app.route('/devices', methods=['GET'])
 def get_devices():
-    conn = None
-    cursor = None
+    """
+    Lista os dispositivos. Com `search`, consulta o índice DispositivoBusca (FULLTEXT por prefixo,
+    IPv4/prefixo/CIDR, prefixo de MAC) e devolve os resultados ranqueados e paginados por
+    `limit`/`offset`; o cabeçalho X-Next-Offset indica a próxima página, se houver.
+    """
     try:
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
-        cursor = conn.cursor(dictionary=True)
-        search_term = request.args.get('search', None)
-        base_query = """
-        SELECT d.ID_Dispositivo, d.NomeHost, d.StatusAtual, d.DataUltimaVarredura,
-               ip.EnderecoIPValor as IPPrincipal, ifr.EnderecoMAC as MACPrincipal,
-               so.Nome as SistemaOperacionalNome, fab.Nome as FabricanteNome,
-               td.Nome as TipoDispositivoNome
-        FROM Dispositivo d
-        LEFT JOIN InterfaceRede ifr ON d.ID_Dispositivo = ifr.ID_Dispositivo 
-        LEFT JOIN EnderecoIP ip ON ifr.ID_Interface = ip.ID_Interface AND ip.Principal = TRUE
-        LEFT JOIN SistemaOperacional so ON d.ID_SistemaOperacional = so.ID_SistemaOperacional
-        LEFT JOIN Fabricante fab ON d.ID_Fabricante = fab.ID_Fabricante
-        LEFT JOIN TipoDispositivo td ON d.ID_TipoDispositivo = td.ID_TipoDispositivo
-        """
-        params = []
-        where_clauses = []
+        search_term = (request.args.get('search') or '').strip()
+        try:
+            limit = max(1, min(int(request.args.get('limit', DEVICE_SEARCH_PAGE_DEFAULT)), DEVICE_SEARCH_PAGE_MAX))
+            offset = max(0, int(request.args.get('offset', 0)))
+        except ValueError:
+            return jsonify({"message": "Parâmetros 'limit' e 'offset' devem ser inteiros."}), 400
+
         if search_term:
-            like_search_term = f"%{search_term}%"
-            where_clauses.append("""
-            (d.NomeHost LIKE %s OR ip.EnderecoIPValor LIKE %s OR ifr.EnderecoMAC LIKE %s OR
-             so.Nome LIKE %s OR fab.Nome LIKE %s OR td.Nome LIKE %s OR
-             d.Descricao LIKE %s OR d.Modelo LIKE %s OR d.LocalizacaoFisica LIKE %s)
-            """)
-            params.extend([like_search_term] * 9)
-        
-        query = base_query
-        if where_clauses:
-            query += " WHERE " + " AND ".join(where_clauses)
-        
-        query += " ORDER BY d.NomeHost ASC"
-        cursor.execute(query, tuple(params))
-        devices = cursor.fetchall()
-        return jsonify(devices), 200
+            with db_connection() as conn:
+                if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+                cursor = conn.cursor(dictionary=True)
+                started = time.perf_counter()
+                query, params = build_search_query(search_term, limit + 1, offset)
+                cursor.execute(query, params)
+                devices = cursor.fetchall()
+                log.debug(f"DEVICE_SEARCH: '{search_term}' -> {len(devices)} resultados em {(time.perf_counter() - started) * 1000:.1f} ms.")
+                response = jsonify(devices[:limit])
+                if len(devices) > limit:
+                    response.headers['X-Next-Offset'] = str(offset + limit)
+                return response, 200
+
+        # Sem busca, a lista completa é enviada em fluxo, direto do cursor.
+        response = row_streamer.response(DEVICE_LIST_QUERY.format(where=''), log_label="DEVICES")
+        if response is None:
+            return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+        return response
     except Exception as e:
         log.exception("Erro em /devices (GET com busca)")
         return jsonify({"message": "Erro ao buscar dispositivos"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+
+@app.cli.command('verify-device-counters')
+@click.option('--fix', is_flag=True, help='Reconstrói os contadores se houver divergência.')
+def verify_device_counters_command(fix):
+    """Confere os contadores de status/SO contra a tabela Dispositivo."""
+    with db_connection() as conn:
+        if not conn:
+            print("Erro: não foi possível conectar ao banco de dados.")
+            return
+        divergences = verify_device_counters(conn)
+        if not divergences:
+            print("Contadores de dispositivos consistentes.")
+            return
+        for div in divergences:
+            print(f"Divergência em {div['contador']} '{div['chave']}': esperado {div['esperado']}, armazenado {div['armazenado']}")
+        if fix:
+            rebuild_device_counters(conn)
+            invalidate_dashboard('contadores')
+            print("Contadores reconstruídos.")
+
+@app.cli.command('rebuild-device-counters')
+def rebuild_device_counters_command():
+    """Recalcula os contadores de status/SO a partir da tabela Dispositivo."""
+    with db_connection() as conn:
+        if not conn:
+            print("Erro: não foi possível conectar ao banco de dados.")
+            return
+        rebuild_device_counters(conn)
+        invalidate_dashboard('contadores')
+        print("Contadores de dispositivos reconstruídos.")
+
+@app.cli.command('availability-rollup')
+def availability_rollup_command():
+    """Consolida agora as amostras de disponibilidade pendentes e aplica a retenção."""
+    availability_recorder.flush()
+    availability_rollup_job()
+    print("Histórico de disponibilidade consolidado.")
+
+@app.cli.command('build-oui-index')
+@click.option('--source', default=None, help='Arquivo de fabricantes (IEEE oui.csv/oui.txt, manuf ou nmap-mac-prefixes).')
+def build_oui_index_command(source):
+    """Gera o índice OUI a partir do arquivo de fabricantes (padrão: OUI_VENDOR_FILE ou o primeiro encontrado)."""
+    source = source or os.getenv('OUI_VENDOR_FILE') or next((path for path in DEFAULT_VENDOR_FILES if os.path.isfile(path)), None)
+    if not source or not os.path.isfile(source):
+        print("Erro: arquivo de fabricantes não encontrado. Informe --source ou OUI_VENDOR_FILE.")
+        return
+    total = build_index(source, os.getenv('OUI_INDEX_PATH', DEFAULT_INDEX_PATH))
+    print(f"Índice OUI gerado com {total} prefixos a partir de {source}. Reinicie o servidor para carregá-lo.")
+
+@app.cli.command('backfill-oui')
+@click.option('--overwrite', is_flag=True, help='Recalcula também interfaces/IPs que já têm fabricante.')
+def backfill_oui_command(overwrite):
+    """Preenche o fabricante de InterfaceRede e IPsDescobertos a partir do OUI dos MACs, num único job em lotes."""
+    if not len(oui_index):
+        print("Erro: índice OUI vazio. Gere-o com 'flask build-oui-index'.")
+        return
+    with db_connection() as conn:
+        if not conn:
+            print("Erro: não foi possível conectar ao banco de dados.")
+            return
+        updated = backfill_vendors(conn, oui_index, overwrite=overwrite)
+    for table, total in updated.items():
+        print(f"{table}: {total} linhas com fabricante preenchido.")
+
+@app.cli.command('rebuild-device-search')
+def rebuild_device_search_command():
+    """Reconstrói a tabela DispositivoBusca (use após carga direta no banco ou renomear SO/fabricante/tipo)."""
+    with db_connection() as conn:
+        if not conn:
+            print("Erro: não foi possível conectar ao banco de dados.")
+            return
+        total = rebuild_device_search(conn)
+        print(f"Índice de busca reconstruído: {total} dispositivos.")
     
 @app.route('/devices', methods=['POST'])
 @token_required  # MUDANÇA 1: Proteger a rota com o decorator de token
 def add_device(current_user):  # MUDANÇA 2: Receber o 'current_user' do decorator
-    conn = None 
-    cursor = None
     ip_origem = request.remote_addr
     data = request.get_json()
     
@@ -719,61 +1180,68 @@ def add_device(current_user):  # MUDANÇA 2: Receber o 'current_user' do decorat
         if not data or not all(field in data for field in required_fields):
             return jsonify({"message": "Dados incompletos (NomeHost e StatusAtual obrigatórios)"}), 400
         
-        conn = get_db_connection()
-        if not conn: 
-            return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
-        
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            if not conn: 
+                return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
         
-        # A lógica de inserção no banco de dados permanece a mesma
-        device_query = """
-        INSERT INTO Dispositivo (NomeHost, Descricao, Modelo, ID_Fabricante, ID_SistemaOperacional, 
-                                 ID_TipoDispositivo, StatusAtual, LocalizacaoFisica, Observacoes) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        cursor.execute(device_query, (
-            data.get('NomeHost'), data.get('Descricao'), data.get('Modelo'), data.get('ID_Fabricante'),
-            data.get('ID_SistemaOperacional'), data.get('ID_TipoDispositivo'), data.get('StatusAtual'),
-            data.get('LocalizacaoFisica'), data.get('Observacoes')
-        ))
-        id_dispositivo_novo = cursor.lastrowid
+            cursor = conn.cursor()
         
-        if id_dispositivo_novo and data.get('EnderecoMAC') and data.get('EnderecoIP'):
-            interface_query = """
-            INSERT INTO InterfaceRede (ID_Dispositivo, EnderecoMAC, ID_Fabricante_MAC, Ativa)
-            VALUES (%s, %s, %s, %s)
+            # A lógica de inserção no banco de dados permanece a mesma
+            device_query = """
+            INSERT INTO Dispositivo (NomeHost, Descricao, Modelo, ID_Fabricante, ID_SistemaOperacional, 
+                                     ID_TipoDispositivo, StatusAtual, LocalizacaoFisica, Observacoes) 
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
-            cursor.execute(interface_query, (id_dispositivo_novo, data.get('EnderecoMAC'), data.get('ID_Fabricante_MAC'), True))
-            id_interface_nova = cursor.lastrowid
-            
-            ip_query = """
-            INSERT INTO EnderecoIP (ID_Interface, EnderecoIPValor, TipoIP, ID_Rede, Principal, TipoAtribuicao)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(ip_query, (
-                id_interface_nova, data.get('EnderecoIP'), data.get('TipoIP', 'IPv4'),
-                data.get('ID_Rede'), True, data.get('TipoAtribuicao', 'Descoberto')
+            cursor.execute(device_query, (
+                data.get('NomeHost'), data.get('Descricao'), data.get('Modelo'), data.get('ID_Fabricante'),
+                data.get('ID_SistemaOperacional'), data.get('ID_TipoDispositivo'), data.get('StatusAtual'),
+                data.get('LocalizacaoFisica'), data.get('Observacoes')
             ))
+            id_dispositivo_novo = cursor.lastrowid
+        
+            if id_dispositivo_novo and data.get('EnderecoMAC') and data.get('EnderecoIP'):
+                interface_query = """
+                INSERT INTO InterfaceRede (ID_Dispositivo, EnderecoMAC, ID_Fabricante_MAC, Ativa)
+                VALUES (%s, %s, %s, %s)
+                """
+                # Sem fabricante informado, usa o identificado pelo OUI do MAC.
+                id_fabricante_mac = data.get('ID_Fabricante_MAC') or fabricante_id_for_mac(cursor, oui_index, data.get('EnderecoMAC'))
+                cursor.execute(interface_query, (id_dispositivo_novo, data.get('EnderecoMAC'), id_fabricante_mac, True))
+                id_interface_nova = cursor.lastrowid
             
-        conn.commit()
+                ip_query = """
+                INSERT INTO EnderecoIP (ID_Interface, EnderecoIPValor, TipoIP, ID_Rede, Principal, TipoAtribuicao)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """
+                cursor.execute(ip_query, (
+                    id_interface_nova, data.get('EnderecoIP'), data.get('TipoIP', 'IPv4'),
+                    data.get('ID_Rede'), True, data.get('TipoAtribuicao', 'Descoberto')
+                ))
+            
+            update_device_counters(cursor, new={
+                'StatusAtual': data.get('StatusAtual'), 'ID_SistemaOperacional': data.get('ID_SistemaOperacional')
+            })
+            refresh_device_search(cursor, id_dispositivo_novo)
+            bump_cache_version(cursor, VERSAO_DASHBOARD)
+            conn.commit()
+            invalidate_dashboard('dispositivo')
 
-        # MUDANÇA 4: A chamada de auditoria agora usa os dados seguros do token
-        detalhes_log = {
-            "dispositivo_id": id_dispositivo_novo,
-            "nome_host": data.get('NomeHost'),
-            "dados_enviados": data 
-        }
-        registrar_log_auditoria(
-            id_usuario=id_usuario_logado,
-            nome_usuario=nome_usuario_logado,
-            acao='DISPOSITIVO_ADICIONADO',
-            detalhes=json.dumps(detalhes_log),
-            ip_origem=ip_origem
-        )
-        return jsonify({"message": "Dispositivo adicionado com sucesso!", "ID_Dispositivo": id_dispositivo_novo}), 201
+            # MUDANÇA 4: A chamada de auditoria agora usa os dados seguros do token
+            detalhes_log = {
+                "dispositivo_id": id_dispositivo_novo,
+                "nome_host": data.get('NomeHost'),
+                "dados_enviados": data 
+            }
+            registrar_log_auditoria(
+                id_usuario=id_usuario_logado,
+                nome_usuario=nome_usuario_logado,
+                acao='DISPOSITIVO_ADICIONADO',
+                detalhes=json.dumps(detalhes_log),
+                ip_origem=ip_origem
+            )
+            return jsonify({"message": "Dispositivo adicionado com sucesso!", "ID_Dispositivo": id_dispositivo_novo}), 201
         
     except mysql.connector.Error as db_err:
-        if conn: conn.rollback()
         # O tratamento de erros de banco de dados continua o mesmo
         logging.error(f"Erro de banco de dados em POST /devices: {db_err}") # Usando logging
         if db_err.errno == 1062: # Erro de entrada duplicada
@@ -787,71 +1255,60 @@ def add_device(current_user):  # MUDANÇA 2: Receber o 'current_user' do decorat
         return jsonify({"message": f"Erro de banco de dados: {db_err.msg}"}), 500
     
     except Exception as e:
-        if conn: conn.rollback()
         logging.exception("Erro inesperado em POST /devices") # Usando logging
         return jsonify({"message": "Erro interno ao adicionar dispositivo"}), 500
     
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
 
 @app.route('/devices/<int:device_id>', methods=['GET'])
 def get_device_by_id(device_id): 
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
         
-        cursor = conn.cursor(dictionary=True)
-        main_device_query = """
-        SELECT d.ID_Dispositivo, d.NomeHost, d.Descricao, d.Modelo, 
-               d.ID_Fabricante, fab.Nome as FabricanteNome,
-               d.ID_SistemaOperacional, so.Nome as SistemaOperacionalNome, so.Versao as SistemaOperacionalVersao, so.Familia as SistemaOperacionalFamilia,
-               d.ID_TipoDispositivo, td.Nome as TipoDispositivoNome, 
-               d.DataDescoberta, d.DataUltimaModificacao, d.DataUltimaVarredura,
-               d.StatusAtual, d.LocalizacaoFisica, d.Observacoes,
-               u.NomeUsuario as GerenciadoPorNomeUsuario
-        FROM Dispositivo d
-        LEFT JOIN Fabricante fab ON d.ID_Fabricante = fab.ID_Fabricante
-        LEFT JOIN SistemaOperacional so ON d.ID_SistemaOperacional = so.ID_SistemaOperacional
-        LEFT JOIN TipoDispositivo td ON d.ID_TipoDispositivo = td.ID_TipoDispositivo
-        LEFT JOIN Usuario u ON d.GerenciadoPor = u.ID_Usuario
-        WHERE d.ID_Dispositivo = %s
-        """
-        cursor.execute(main_device_query, (device_id,))
-        device = cursor.fetchone()
-        
-        if device:
-            interfaces_query = """
-            SELECT ifr.ID_Interface, ifr.NomeInterface, ifr.EnderecoMAC, fab_mac.Nome as FabricanteMAC,
-                   ip.EnderecoIPValor, ip.TipoIP, ip.TipoAtribuicao, r.NomeRede, ip.Principal as IPPrincipal
-            FROM InterfaceRede ifr
-            LEFT JOIN Fabricante fab_mac ON ifr.ID_Fabricante_MAC = fab_mac.ID_Fabricante
-            LEFT JOIN EnderecoIP ip ON ifr.ID_Interface = ip.ID_Interface
-            LEFT JOIN Rede r ON ip.ID_Rede = r.ID_Rede
-            WHERE ifr.ID_Dispositivo = %s
-            ORDER BY ifr.ID_Interface ASC, ip.Principal DESC
+            cursor = conn.cursor(dictionary=True)
+            main_device_query = """
+            SELECT d.ID_Dispositivo, d.NomeHost, d.Descricao, d.Modelo, 
+                   d.ID_Fabricante, fab.Nome as FabricanteNome,
+                   d.ID_SistemaOperacional, so.Nome as SistemaOperacionalNome, so.Versao as SistemaOperacionalVersao, so.Familia as SistemaOperacionalFamilia,
+                   d.ID_TipoDispositivo, td.Nome as TipoDispositivoNome, 
+                   d.DataDescoberta, d.DataUltimaModificacao, d.DataUltimaVarredura,
+                   d.StatusAtual, d.LocalizacaoFisica, d.Observacoes,
+                   u.NomeUsuario as GerenciadoPorNomeUsuario
+            FROM Dispositivo d
+            LEFT JOIN Fabricante fab ON d.ID_Fabricante = fab.ID_Fabricante
+            LEFT JOIN SistemaOperacional so ON d.ID_SistemaOperacional = so.ID_SistemaOperacional
+            LEFT JOIN TipoDispositivo td ON d.ID_TipoDispositivo = td.ID_TipoDispositivo
+            LEFT JOIN Usuario u ON d.GerenciadoPor = u.ID_Usuario
+            WHERE d.ID_Dispositivo = %s
             """
-            cursor.execute(interfaces_query, (device_id,))
-            device['interfaces'] = cursor.fetchall()
-            log.debug(f"BACKEND /devices/<id> - Enviando dispositivo: {device}")
-            return jsonify(device), 200
-        else:
-            return jsonify({"message": "Dispositivo não encontrado"}), 404
+            cursor.execute(main_device_query, (device_id,))
+            device = cursor.fetchone()
+        
+            if device:
+                interfaces_query = """
+                SELECT ifr.ID_Interface, ifr.NomeInterface, ifr.EnderecoMAC, fab_mac.Nome as FabricanteMAC,
+                       ip.EnderecoIPValor, ip.TipoIP, ip.TipoAtribuicao, r.NomeRede, ip.Principal as IPPrincipal
+                FROM InterfaceRede ifr
+                LEFT JOIN Fabricante fab_mac ON ifr.ID_Fabricante_MAC = fab_mac.ID_Fabricante
+                LEFT JOIN EnderecoIP ip ON ifr.ID_Interface = ip.ID_Interface
+                LEFT JOIN Rede r ON ip.ID_Rede = r.ID_Rede
+                WHERE ifr.ID_Dispositivo = %s
+                ORDER BY ifr.ID_Interface ASC, ip.Principal DESC
+                """
+                cursor.execute(interfaces_query, (device_id,))
+                device['interfaces'] = cursor.fetchall()
+                log.debug(f"BACKEND /devices/<id> - Enviando dispositivo: {device}")
+                return jsonify(device), 200
+            else:
+                return jsonify({"message": "Dispositivo não encontrado"}), 404
             
     except Exception as e:
         log.exception(f"Erro em /devices/<id> (GET) para device_id: {device_id}")
         return jsonify({"message": "Erro ao buscar detalhes do dispositivo"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
 
 @app.route('/devices/<int:device_id>', methods=['PUT'])
 @token_required
 def update_device(current_user, device_id):
-    conn = None
-    cursor = None
     data = request.get_json()
     ip_origem = request.remote_addr
     
@@ -862,493 +1319,407 @@ def update_device(current_user, device_id):
         
         if not data: return jsonify({"message": "Nenhum dado fornecido para atualização"}), 400
         
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
         
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM Dispositivo WHERE ID_Dispositivo = %s", (device_id,))
-        device = cursor.fetchone()
-        if not device:
-            cursor.close()
-            conn.close()
-            return jsonify({"message": "Dispositivo não encontrado para atualização"}), 404
+            cursor = conn.cursor(dictionary=True)
+            # FOR UPDATE: o status/SO anterior precisa estar travado para ajustar os contadores.
+            cursor.execute("SELECT * FROM Dispositivo WHERE ID_Dispositivo = %s FOR UPDATE", (device_id,))
+            device = cursor.fetchone()
+            if not device:
+                return jsonify({"message": "Dispositivo não encontrado para atualização"}), 404
             
-        allowed_fields = [
-            'NomeHost', 'Descricao', 'Modelo', 'ID_Fabricante', 'ID_SistemaOperacional', 
-            'ID_TipoDispositivo', 'StatusAtual', 'LocalizacaoFisica', 'Observacoes', 
-            'GerenciadoPor', 'DataUltimaVarredura'
-        ]
-        update_fields = []
-        update_values = []
+            allowed_fields = [
+                'NomeHost', 'Descricao', 'Modelo', 'ID_Fabricante', 'ID_SistemaOperacional', 
+                'ID_TipoDispositivo', 'StatusAtual', 'LocalizacaoFisica', 'Observacoes', 
+                'GerenciadoPor', 'DataUltimaVarredura'
+            ]
+            update_fields = []
+            update_values = []
         
-        for field in allowed_fields:
-            if field in data:
-                update_fields.append(f"`{field}` = %s")
-                update_values.append(data[field])
+            for field in allowed_fields:
+                if field in data:
+                    update_fields.append(f"`{field}` = %s")
+                    update_values.append(data[field])
                 
-        if not update_fields:
-            cursor.close()
-            conn.close()
-            return jsonify({"message": "Nenhum campo válido fornecido para atualização"}), 400
+            if not update_fields:
+                return jsonify({"message": "Nenhum campo válido fornecido para atualização"}), 400
             
-        update_values.append(device_id)
-        update_query = f"UPDATE Dispositivo SET {', '.join(update_fields)} WHERE ID_Dispositivo = %s"
+            update_values.append(device_id)
+            update_query = f"UPDATE Dispositivo SET {', '.join(update_fields)} WHERE ID_Dispositivo = %s"
         
-        cursor.close() 
-        cursor = conn.cursor()
-        cursor.execute(update_query, tuple(update_values))
-        conn.commit()
+            cursor.close() 
+            cursor = conn.cursor()
+            cursor.execute(update_query, tuple(update_values))
+            update_device_counters(cursor, old=device, new={**device, **{f: data[f] for f in allowed_fields if f in data}})
+            refresh_device_search(cursor, device_id)
+            bump_cache_version(cursor, VERSAO_DASHBOARD)
+            conn.commit()
+            invalidate_dashboard('dispositivo')
         
-        # ### AUDITORIA: Registrar a edição ###
-        detalhes_log = {
-            "dispositivo_id": device_id,
-            "dados_atualizados": {k: v for k, v in data.items() if k not in ['token']} # Não logar o token
-        }
-        registrar_log_auditoria(
-            id_usuario=id_usuario_logado,
-            nome_usuario=nome_usuario_logado,
-            acao='DISPOSITIVO_EDITADO',
-            detalhes=json.dumps(detalhes_log),
-            ip_origem=ip_origem
-        )
+            # ### AUDITORIA: Registrar a edição ###
+            detalhes_log = {
+                "dispositivo_id": device_id,
+                "dados_atualizados": {k: v for k, v in data.items() if k not in ['token']} # Não logar o token
+            }
+            registrar_log_auditoria(
+                id_usuario=id_usuario_logado,
+                nome_usuario=nome_usuario_logado,
+                acao='DISPOSITIVO_EDITADO',
+                detalhes=json.dumps(detalhes_log),
+                ip_origem=ip_origem
+            )
         
-        cursor.close()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM Dispositivo WHERE ID_Dispositivo = %s", (device_id,))
-        updated_device = cursor.fetchone()
+            cursor.close()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM Dispositivo WHERE ID_Dispositivo = %s", (device_id,))
+            updated_device = cursor.fetchone()
         
-        return jsonify({"message": "Dispositivo atualizado com sucesso!", "device": updated_device}), 200
+            return jsonify({"message": "Dispositivo atualizado com sucesso!", "device": updated_device}), 200
         
     except mysql.connector.Error as db_err:
-        if conn: conn.rollback()
         log.error(f"Erro de banco de dados em PUT /devices/<id>: {db_err}")
         if db_err.errno == 1062:
             return jsonify({"message": f"Erro: Conflito de dados. O NomeHost '{data.get('NomeHost')}' já pode existir."}), 409
         return jsonify({"message": f"Erro de banco de dados: {db_err.msg}"}), 500
     except Exception as e:
-        if conn: conn.rollback()
         log.exception(f"Erro ao atualizar dispositivo ID: {device_id}")
         return jsonify({"message": "Erro ao atualizar dispositivo"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
 
 @app.route('/devices/<int:device_id>', methods=['DELETE'])
 @token_required
 def delete_device(current_user, device_id):
     """Remove um dispositivo do banco de dados."""
-    conn = get_db_connection()
-    if not conn: return jsonify({"message": "Erro interno no servidor"}), 500
+    with db_connection() as conn:
+        if not conn: return jsonify({"message": "Erro interno no servidor"}), 500
 
-    try:
-        with conn.cursor(dictionary=True) as cursor:
-            cursor.execute("SELECT NomeHost FROM Dispositivo WHERE ID_Dispositivo = %s", (device_id,))
-            device_to_delete = cursor.fetchone()
+        try:
+            with conn.cursor(dictionary=True) as cursor:
+                cursor.execute("SELECT NomeHost, StatusAtual, ID_SistemaOperacional FROM Dispositivo WHERE ID_Dispositivo = %s FOR UPDATE", (device_id,))
+                device_to_delete = cursor.fetchone()
 
-            if not device_to_delete:
-                return jsonify({"message": "Dispositivo não encontrado"}), 404
+                if not device_to_delete:
+                    return jsonify({"message": "Dispositivo não encontrado"}), 404
             
-            cursor.execute("DELETE FROM Dispositivo WHERE ID_Dispositivo = %s", (device_id,))
+                cursor.execute("DELETE FROM Dispositivo WHERE ID_Dispositivo = %s", (device_id,))
 
-            if cursor.rowcount == 0:
-                conn.rollback()
-                return jsonify({"message": "Dispositivo não pôde ser removido (talvez já tenha sido deletado)."}), 404
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return jsonify({"message": "Dispositivo não pôde ser removido (talvez já tenha sido deletado)."}), 404
+                update_device_counters(cursor, old=device_to_delete)
+                bump_cache_version(cursor, VERSAO_DASHBOARD)
             
-            # Auditoria
-            detalhes_log = {"dispositivo_id": device_id, "nome_host_removido": device_to_delete['NomeHost']}
-            registrar_log_auditoria(
-                id_usuario=current_user['ID_Usuario'], nome_usuario=current_user['NomeUsuario'],
-                acao='DISPOSITIVO_REMOVIDO', detalhes=json.dumps(detalhes_log), ip_origem=request.remote_addr
-            )
-            conn.commit()
-            return jsonify({"message": "Dispositivo removido com sucesso!"}), 200
+                # Auditoria
+                detalhes_log = {"dispositivo_id": device_id, "nome_host_removido": device_to_delete['NomeHost']}
+                registrar_log_auditoria(
+                    id_usuario=current_user['ID_Usuario'], nome_usuario=current_user['NomeUsuario'],
+                    acao='DISPOSITIVO_REMOVIDO', detalhes=json.dumps(detalhes_log), ip_origem=request.remote_addr
+                )
+                conn.commit()
+                invalidate_dashboard('dispositivo')
+                return jsonify({"message": "Dispositivo removido com sucesso!"}), 200
     
-    except Exception as e:
-        conn.rollback()
-        if e.errno == 1451:
-             return jsonify({"message": "Erro: Este dispositivo não pode ser removido pois está em uso em outros registros."}), 400
-        else:
-             logging.error(f"Erro de integridade do DB: {e}")
-             return jsonify({"message": f"Erro de banco de dados: {e}"}), 500
-    finally:
-        if conn.is_connected(): conn.close()
+        except Exception as e:
+            conn.rollback()
+            if getattr(e, 'errno', None) == 1451:
+                 return jsonify({"message": "Erro: Este dispositivo não pode ser removido pois está em uso em outros registros."}), 400
+            else:
+                 logging.error(f"Erro de integridade do DB: {e}")
+                 return jsonify({"message": f"Erro de banco de dados: {e}"}), 500
     
 @app.route('/fabricantes', methods=['GET'])
+@response_cache.cached(ttl=REFERENCE_CACHE_TTL_SECONDS, tables=('Fabricante',), versions=(VERSAO_FABRICANTE,))
 def get_fabricantes():
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT ID_Fabricante, Nome FROM Fabricante ORDER BY Nome ASC")
-        fabricantes = cursor.fetchall()
-        return jsonify(fabricantes), 200
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT ID_Fabricante, Nome FROM Fabricante ORDER BY Nome ASC")
+            fabricantes = cursor.fetchall()
+            return jsonify(fabricantes), 200
     except Exception as e:
         log.exception("Erro em /fabricantes")
         return jsonify({"message": "Erro ao buscar fabricantes"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+
+@app.route('/fabricantes/oui/<mac>', methods=['GET'])
+def get_fabricante_por_mac(mac):
+    """Fabricante identificado pelo OUI do MAC (para pré-preencher o formulário de dispositivo)."""
+    if mac_to_int(mac) is None:
+        return jsonify({"message": "Endereço MAC inválido."}), 400
+    vendor = oui_index.lookup(mac)
+    if not vendor:
+        return jsonify({"message": "Fabricante não identificado para este MAC."}), 404
+    try:
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT ID_Fabricante FROM Fabricante WHERE Nome = %s", (vendor[:100],))
+            row = cursor.fetchone()
+            return jsonify({"Nome": vendor, "ID_Fabricante": row['ID_Fabricante'] if row else None}), 200
+    except Exception as e:
+        log.exception("Erro em /fabricantes/oui")
+        return jsonify({"message": "Erro ao buscar fabricante"}), 500
 
 @app.route('/sistemasoperacionais', methods=['GET'])
+@response_cache.cached(ttl=REFERENCE_CACHE_TTL_SECONDS, tables=('SistemaOperacional',))
 def get_sistemas_operacionais():
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT ID_SistemaOperacional, Nome, Versao FROM SistemaOperacional ORDER BY Nome ASC, Versao ASC")
-        sistemas = cursor.fetchall()
-        for so in sistemas:
-            so['NomeCompleto'] = f"{so['Nome']} {so['Versao']}" if so['Versao'] else so['Nome']
-        return jsonify(sistemas), 200
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT ID_SistemaOperacional, Nome, Versao FROM SistemaOperacional ORDER BY Nome ASC, Versao ASC")
+            sistemas = cursor.fetchall()
+            for so in sistemas:
+                so['NomeCompleto'] = f"{so['Nome']} {so['Versao']}" if so['Versao'] else so['Nome']
+            return jsonify(sistemas), 200
     except Exception as e:
         log.exception("Erro em /sistemasoperacionais")
         return jsonify({"message": "Erro ao buscar sistemas operacionais"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
 
 @app.route('/tiposdispositivo', methods=['GET'])
+@response_cache.cached(ttl=REFERENCE_CACHE_TTL_SECONDS, tables=('TipoDispositivo',))
 def get_tipos_dispositivo():
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT ID_TipoDispositivo, Nome FROM TipoDispositivo ORDER BY Nome ASC")
-        tipos = cursor.fetchall()
-        return jsonify(tipos), 200
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT ID_TipoDispositivo, Nome FROM TipoDispositivo ORDER BY Nome ASC")
+            tipos = cursor.fetchall()
+            return jsonify(tipos), 200
     except Exception as e:
         log.exception("Erro em /tiposdispositivo")
         return jsonify({"message": "Erro ao buscar tipos de dispositivo"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
     
 @app.route('/api/discovery/discovered-ips/<int:id_ip_descoberto>/status', methods=['PUT'])
 def update_discovered_ip_status(id_ip_descoberto):
-    conn = None
-    cursor = None
     try:
         data = request.get_json()
         novo_status = data.get('status')
         if not novo_status: return jsonify({"message": "Novo status não fornecido"}), 400
         
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro interno no servidor (conexão DB)"}), 500
         
-        cursor = conn.cursor()
-        query = "UPDATE IPsDescobertos SET StatusResolucao = %s WHERE ID_IPDescoberto = %s"
-        cursor.execute(query, (novo_status, id_ip_descoberto))
-        conn.commit()
+            cursor = conn.cursor()
+            query = "UPDATE IPsDescobertos SET StatusResolucao = %s WHERE ID_IPDescoberto = %s"
+            cursor.execute(query, (novo_status, id_ip_descoberto))
+            conn.commit()
         
-        if cursor.rowcount == 0:
-            cursor.close()
-            conn.close()
-            return jsonify({"message": "IP Descoberto não encontrado ou status já era o mesmo"}), 404
-            
-        cursor.close()
-        conn.close()
-        return jsonify({"message": f"Status do IP Descoberto ID {id_ip_descoberto} atualizado para '{novo_status}'"}), 200
+            if cursor.rowcount == 0:
+                return jsonify({"message": "IP Descoberto não encontrado ou status já era o mesmo"}), 404
+            return jsonify({"message": f"Status do IP Descoberto ID {id_ip_descoberto} atualizado para '{novo_status}'"}), 200
     except Exception as e:
         log.exception(f"Erro em /api/discovery/discovered-ips/<id>/status para id: {id_ip_descoberto}")
         return jsonify({"message": "Erro ao atualizar status do IP descoberto"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
     
 @app.route('/api/discovery/scan-ip-details', methods=['POST'])
 def scan_ip_details():
-    data = request.get_json()
-    ip_address = data.get('ip_address')
-    id_ip_descoberto = data.get('id_ip_descoberto')
-
-    if not ip_address or not id_ip_descoberto:
+    """
+    Enfileira a varredura detalhada (Nmap) de um ou vários IPs descobertos: aceita
+    `id_ip_descoberto` (um IP) ou `ids` (lista). Com `differential: true`, os hosts cuja impressão
+    digital de portas não mudou desde a última análise completa não são reanalisados.
+    Responde 202 com o ID do job; o andamento e o resultado de cada IP ficam em
+    GET /api/discovery/detail-scans/<job_id>.
+    """
+    data = request.get_json() or {}
+    ids = data.get('ids')
+    if ids is None and data.get('id_ip_descoberto'):
+        ids = [data.get('id_ip_descoberto')]
+    try:
+        ids = list(dict.fromkeys(int(id_ip) for id_ip in (ids or [])))
+    except (TypeError, ValueError):
+        return jsonify({"message": "IDs de IP Descoberto inválidos"}), 400
+    if not ids:
         return jsonify({"message": "Endereço IP ou ID do IP Descoberto não fornecido"}), 400
+    if len(ids) > NMAP_DETAIL_MAX_BATCH:
+        return jsonify({"message": f"Máximo de {NMAP_DETAIL_MAX_BATCH} IPs por requisição"}), 400
 
-    log.info(f"NMAP_SCAN: Iniciando varredura detalhada para o IP: {ip_address} (ID DB: {id_ip_descoberto})")
-    nm = None
     try:
-        nm = nmap.PortScanner()
-        nmap_args = '-sV -T4 -Pn' 
-        if os.getenv('NMAP_USE_OS_DETECTION', 'false').lower() == 'true':
-            nmap_args += ' -O --version-intensity 5'
-
-        log.info(f"NMAP_SCAN: Executando Nmap com argumentos: '{nmap_args}' no IP: {ip_address}")
-        nm.scan(ip_address, arguments=nmap_args)
-
-        hostname_nmap = ip_address 
-        mac_address = None
-        os_details_str = None 
-        open_ports_list = []
-        raw_nmap_output = "Nenhum host encontrado por Nmap ou IP não respondeu à varredura detalhada."
-        
-        scanned_hosts = nm.all_hosts() 
-        log.debug(f"NMAP_SCAN: Hosts escaneados por Nmap: {scanned_hosts}")
-
-        if scanned_hosts: 
-            host_key = scanned_hosts[0] 
-            
-            if host_key in nm: 
-                host_data = nm[host_key]
-                raw_nmap_output = nm.csv() 
-                log.debug(f"NMAP_SCAN: Resultado Nmap para {host_key}: {host_data.state()}")
-
-                if host_data.hostnames():
-                    for h_entry in host_data.hostnames():
-                        if h_entry.get('name') and h_entry.get('type') in ['PTR', 'user']:
-                            hostname_nmap = h_entry['name']
-                            break
-                    if hostname_nmap == ip_address and host_data.hostnames() and host_data.hostnames()[0].get('name'):
-                        hostname_nmap = host_data.hostnames()[0]['name']
-                
-                if 'mac' in host_data.get('addresses', {}): 
-                    mac_address = host_data['addresses']['mac'].upper()
-                
-                if 'osmatch' in host_data and host_data['osmatch']:
-                    best_os_match = sorted(host_data['osmatch'], key=lambda x: int(x['accuracy']), reverse=True)[0]
-                    os_details_str = best_os_match.get('name', 'N/D')
-                
-                for proto in host_data.all_protocols():
-                    if proto in ['tcp', 'udp']:
-                        lport = sorted(list(host_data[proto].keys()), key=int)
-                        for port in lport:
-                            port_info = host_data[proto][port]
-                            if port_info['state'] == 'open':
-                                service_name = port_info.get('name', '')
-                                product = port_info.get('product', '')
-                                version = port_info.get('version', '')
-                                service_details = f"{service_name} ({product} {version})".replace("()","").replace("( )","").strip()
-                                open_ports_list.append(f"{port}/{proto} - {service_details if service_details else 'Serviço Desconhecido'}")
-            else:
-                log.warning(f"NMAP_SCAN: Chave do host '{host_key}' (de nm.all_hosts()) não encontrada nos resultados do Nmap.")
-        else:
-            log.warning(f"NMAP_SCAN: Nenhum host retornado por nm.all_hosts() para o IP {ip_address}.")
-        
-        conn_db = get_db_connection()
-        if not conn_db: 
-            log.critical(f"NMAP_SCAN: Erro de conexão DB ao salvar detalhes Nmap para {ip_address}")
-            return jsonify({"message": "Erro de conexão DB ao salvar detalhes Nmap"}), 500
-        cursor_db = conn_db.cursor()
-        
-        update_query = """
-        UPDATE IPsDescobertos 
-        SET NomeHostResolvido = COALESCE(%s, NomeHostResolvido), 
-            MAC_Address_Estimado = %s, 
-            OS_Estimado = %s, 
-            Portas_Abertas = %s,
-            DetalhesVarreduraExtra = %s, 
-            StatusResolucao = %s,
-            DataUltimaDeteccao = CURRENT_TIMESTAMP 
-        WHERE ID_IPDescoberto = %s
-        """
-        ports_str = "\n".join(open_ports_list) if open_ports_list else None
-        final_hostname_to_save = hostname_nmap if hostname_nmap and hostname_nmap != ip_address else None
-
-        cursor_db.execute(update_query, (
-            final_hostname_to_save,
-            mac_address, 
-            os_details_str if os_details_str and os_details_str != 'N/D' else None,
-            ports_str, 
-            raw_nmap_output,
-            'Analisado', 
-            id_ip_descoberto
-        ))
-        conn_db.commit()
-        cursor_db.close()
-        conn_db.close()
-
-        log.info(f"NMAP_SCAN: Varredura detalhada para {ip_address} concluída e salva.")
-        return jsonify({
-            "message": f"Varredura detalhada para {ip_address} concluída.",
-            "data": { 
-                "id_ip_descoberto": id_ip_descoberto, "ip_address": ip_address,
-                "hostname_nmap": hostname_nmap, "mac_address_estimado": mac_address,
-                "os_estimado": os_details_str, "portas_abertas": open_ports_list,
-                "status_resolucao": "Analisado"
-            }
-        }), 200
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro de conexão com o banco de dados"}), 500
+            cursor = conn.cursor()
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"SELECT ID_IPDescoberto, EnderecoIP FROM IPsDescobertos WHERE ID_IPDescoberto IN ({placeholders})", tuple(ids))
+            found = dict(cursor.fetchall())
+    except Exception as e:
+        log.exception("Erro ao buscar IPs descobertos para varredura detalhada")
+        return jsonify({"message": "Erro interno ao enfileirar a varredura detalhada."}), 500
+
+    missing = [id_ip for id_ip in ids if id_ip not in found]
+    differential = data.get('differential')
+    job, skipped = detail_scan_queue.submit([(id_ip, found[id_ip]) for id_ip in ids if id_ip in found],
+                                            differential=bool(differential) if differential is not None else None)
+    if not job:
+        return jsonify({"message": "Nenhum IP enfileirado (não encontrados ou já em análise).",
+                        "not_found": missing, "already_queued": skipped}), 404 if not skipped else 409
+
+    log.info(f"NMAP_SCAN: {len(job.targets)} IPs enfileirados para varredura detalhada (job {job.id}).")
+    return jsonify({
+        "message": f"Varredura detalhada enfileirada para {len(job.targets)} IP(s).",
+        "job_id": job.id,
+        "status_url": f"/api/discovery/detail-scans/{job.id}",
+        "not_found": missing,
+        "already_queued": skipped,
+    }), 202
+
+@app.route('/api/discovery/detail-scans/<job_id>', methods=['GET'])
+def get_detail_scan_job(job_id):
+    """Status de um lote de varreduras detalhadas e o resultado de cada IP já analisado."""
+    try:
+        job = detail_scan_queue.get(job_id)
+    except ConnectionError:
+        return jsonify({"message": "Erro de conexão DB"}), 500
+    if not job:
+        return jsonify({"message": "Varredura detalhada não encontrada (ou já expirada)."}), 404
+    return jsonify(job.to_dict()), 200
+
+SERVICES_PAGE_DEFAULT = 100
+SERVICES_PAGE_MAX = 1000
+
+@app.route('/api/services', methods=['GET'])
+def get_port_services():
+    """
+    Consulta os serviços expostos (tabela ServicoPorta) por `port`, `protocol`, `service` e `product`
+    (os dois últimos por prefixo). Por padrão só portas abertas na última varredura; `include_closed=true`
+    inclui as demais. Paginado por `limit`/`offset`, com o cabeçalho X-Next-Offset.
+    """
+    try:
+        port = request.args.get('port', type=int)
+        limit = max(1, min(int(request.args.get('limit', SERVICES_PAGE_DEFAULT)), SERVICES_PAGE_MAX))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({"message": "Parâmetros 'limit' e 'offset' devem ser inteiros."}), 400
+    if 'port' in request.args and (port is None or not 0 <= port <= 65535):
+        return jsonify({"message": "Parâmetro 'port' deve ser um número de porta válido."}), 400
+    protocol = (request.args.get('protocol') or '').strip().lower() or None
+    if protocol and protocol not in PROTOCOLOS:
+        return jsonify({"message": f"Parâmetro 'protocol' deve ser um de: {', '.join(PROTOCOLOS)}."}), 400
+    service = (request.args.get('service') or '').strip() or None
+    product = (request.args.get('product') or '').strip() or None
+    include_closed = request.args.get('include_closed', 'false').lower() == 'true'
 
-    except nmap.PortScannerError as e_nmap:
-        log.exception(f"Erro do Nmap ao escanear {ip_address}. Verifique a instalação e permissões.")
-        return jsonify({"message": f"Erro ao executar Nmap: {str(e_nmap)}. Verifique se Nmap está instalado e no PATH, e se o script tem permissões (para -O)."}), 500
+    try:
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro de conexão com o banco de dados"}), 500
+            cursor = conn.cursor(dictionary=True)
+            query, params = build_port_service_query(port, protocol, service, product, include_closed, limit + 1, offset)
+            cursor.execute(query, params)
+            services = cursor.fetchall()
+            response = jsonify(services[:limit])
+            if len(services) > limit:
+                response.headers['X-Next-Offset'] = str(offset + limit)
+            return response, 200
     except Exception as e:
-        log.exception(f"Erro ao escanear detalhes do IP {ip_address}")
-        return jsonify({"message": "Erro interno ao escanear detalhes do IP."}), 500
-    
+        log.exception("Erro em /api/services")
+        return jsonify({"message": "Erro ao consultar serviços expostos"}), 500
+
 @app.route('/api/reports/os-summary', methods=['GET'])
 def report_os_summary():
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"message": "Erro de conexão com o banco de dados"}), 500
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"message": "Erro de conexão com o banco de dados"}), 500
 
-        cursor = conn.cursor(dictionary=True)
-        query = """
-            SELECT 
-                COALESCE(so.Nome, 'Não Especificado') as SistemaOperacionalNome, 
-                COALESCE(so.Familia, 'Desconhecida') as SistemaOperacionalFamilia,
-                COUNT(d.ID_Dispositivo) as TotalDispositivos
-            FROM Dispositivo d
-            LEFT JOIN SistemaOperacional so ON d.ID_SistemaOperacional = so.ID_SistemaOperacional
-            GROUP BY so.Nome, so.Familia
-            ORDER BY TotalDispositivos DESC, SistemaOperacionalNome ASC;
-        """
-        cursor.execute(query)
-        os_summary = cursor.fetchall()
-        return jsonify(os_summary), 200
+            cursor = conn.cursor(dictionary=True)
+            # Lido dos contadores materializados (ContadorSODispositivo), não de um GROUP BY em Dispositivo.
+            os_summary = read_os_distribution(cursor, with_family=True)
+            return jsonify(os_summary), 200
 
     except Exception as e:
         log.exception("Erro ao gerar relatório de sumário por SO")
         return jsonify({"message": "Erro ao gerar relatório de sumário por SO"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
 
 
-def get_device_list_by_status(status_filter):
-    """Função auxiliar para buscar dispositivos por um status específico."""
-    conn = None
-    cursor = None
+def stream_device_list_by_status(status_filter):
+    """Função auxiliar: lista (em fluxo) os dispositivos com um status específico."""
     try:
-        conn = get_db_connection()
-        if not conn:
+        response = row_streamer.response(DEVICE_LIST_QUERY.format(where="WHERE d.StatusAtual = %s"), (status_filter,),
+                                         log_label=f"REPORT_{status_filter.upper()}")
+        if response is None:
             log.error(f"DB_HELPER: Erro de conexão ao buscar dispositivos com status {status_filter}")
-            return None, "Erro de conexão com o banco de dados"
-        
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-        SELECT 
-            d.ID_Dispositivo, d.NomeHost, d.StatusAtual, d.DataUltimaVarredura,
-            ip.EnderecoIPValor as IPPrincipal, 
-            ifr.EnderecoMAC as MACPrincipal,
-            so.Nome as SistemaOperacionalNome,
-            fab.Nome as FabricanteNome,
-            td.Nome as TipoDispositivoNome
-        FROM Dispositivo d
-        LEFT JOIN InterfaceRede ifr ON d.ID_Dispositivo = ifr.ID_Dispositivo 
-        LEFT JOIN EnderecoIP ip ON ifr.ID_Interface = ip.ID_Interface AND ip.Principal = TRUE
-        LEFT JOIN SistemaOperacional so ON d.ID_SistemaOperacional = so.ID_SistemaOperacional
-        LEFT JOIN Fabricante fab ON d.ID_Fabricante = fab.ID_Fabricante
-        LEFT JOIN TipoDispositivo td ON d.ID_TipoDispositivo = td.ID_TipoDispositivo
-        WHERE d.StatusAtual = %s
-        ORDER BY d.NomeHost ASC
-        """
-        cursor.execute(query, (status_filter,))
-        devices = cursor.fetchall()
-        return devices, None
+            return jsonify({"message": "Erro de conexão com o banco de dados"}), 500
+        return response
     except Exception as e:
         log.exception(f"Erro ao buscar dispositivos por status '{status_filter}'")
-        return None, f"Erro ao gerar relatório de dispositivos {status_filter.lower()}"
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+        return jsonify({"message": f"Erro ao gerar relatório de dispositivos {status_filter.lower()}"}), 500
 
 @app.route('/api/reports/devices-online', methods=['GET'])
 def report_devices_online():
-    devices, error_message = get_device_list_by_status('Online')
-    if error_message:
-        return jsonify({"message": error_message}), 500
-    return jsonify(devices), 200
+    return stream_device_list_by_status('Online')
 
 @app.route('/api/reports/devices-offline', methods=['GET'])
 def report_devices_offline():
-    devices, error_message = get_device_list_by_status('Offline')
-    if error_message:
-        return jsonify({"message": error_message}), 500
-    return jsonify(devices), 200
-
-@app.route('/api/dashboard/summary', methods=['GET'])
-def dashboard_summary():
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
+    return stream_device_list_by_status('Offline')
+
+# --- DASHBOARD ---
+# Snapshot único com todos os agregados do dashboard, servido da memória até a versão 'dashboard' em
+# VersaoCache mudar (escritas em dispositivos e alertas de qualquer processo a incrementam) ou o snapshot
+# expirar em DASHBOARD_SNAPSHOT_MAX_AGE.
+def _load_dashboard_snapshot():
+    with db_connection() as conn:
         if not conn:
-            return jsonify({"message": "Erro de conexão DB"}), 500
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("SELECT COUNT(*) as total_devices FROM Dispositivo")
-        total_devices = cursor.fetchone()['total_devices']
+            raise ConnectionError("Sem conexão com o banco para calcular o snapshot do dashboard.")
+        return load_dashboard_snapshot(conn)
 
-        cursor.execute("SELECT COUNT(*) as online_devices FROM Dispositivo WHERE StatusAtual = 'Online'")
-        online_devices = cursor.fetchone()['online_devices']
+def _read_dashboard_version():
+    versions = _read_shared_cache_versions([VERSAO_DASHBOARD])
+    return versions[VERSAO_DASHBOARD] if versions else None
 
-        cursor.execute("SELECT COUNT(*) as offline_devices FROM Dispositivo WHERE StatusAtual = 'Offline'")
-        offline_devices = cursor.fetchone()['offline_devices']
+dashboard_cache = DashboardSnapshotCache(_load_dashboard_snapshot, max_age=float(os.getenv('DASHBOARD_SNAPSHOT_MAX_AGE', '300')),
+                                         version_reader=_read_dashboard_version,
+                                         version_check_seconds=os.getenv('DASHBOARD_VERSION_CHECK_SECONDS', '3'))
 
-        cursor.execute("SELECT COUNT(*) as new_alerts FROM Alerta WHERE StatusAlerta = 'Novo'")
-        new_alerts = cursor.fetchone()['new_alerts']
+def invalidate_dashboard(reason=None):
+    """
+    Invalida o snapshot do dashboard neste processo; chamada após escritas em dispositivos, alertas e varreduras.
+    Os outros processos percebem a mudança pela versão incrementada na transação (bump_cache_version).
+    """
+    dashboard_cache.invalidate(reason)
 
-        summary = {
-            "total_devices": total_devices,
-            "online_devices": online_devices,
-            "offline_devices": offline_devices,
-            "new_alerts": new_alerts
-        }
-        return jsonify(summary), 200
+def _dashboard_response(section=None):
+    try:
+        snapshot, etag = dashboard_cache.get()
+    except ConnectionError:
+        return jsonify({"message": "Erro de conexão DB"}), 500
     except Exception as e:
-        log.exception("Erro ao buscar sumário do dashboard")
-        return jsonify({"message": "Erro ao buscar sumário do dashboard"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+        log.exception("Erro ao calcular o snapshot do dashboard")
+        return jsonify({"message": "Erro ao buscar dados do dashboard"}), 500
+    response = jsonify(snapshot[section] if section else snapshot)
+    response.set_etag(etag if not section else f"{etag}-{section}")
+    # O navegador sempre revalida; com If-None-Match igual a resposta é 304 sem corpo.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/dashboard/snapshot', methods=['GET'])
+def dashboard_snapshot():
+    """Sumário, distribuição por SO e por status e alertas recentes numa única resposta (com ETag)."""
+    return _dashboard_response()
+
+@app.route('/api/dashboard/summary', methods=['GET'])
+def dashboard_summary():
+    return _dashboard_response('summary')
 
 @app.route('/api/dashboard/os-distribution', methods=['GET'])
 def dashboard_os_distribution():
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"message": "Erro de conexão DB"}), 500
-        cursor = conn.cursor(dictionary=True)
-        query = """
-            SELECT 
-                COALESCE(so.Nome, 'Não Especificado') as os_name,
-                COUNT(d.ID_Dispositivo) as device_count
-            FROM Dispositivo d
-            LEFT JOIN SistemaOperacional so ON d.ID_SistemaOperacional = so.ID_SistemaOperacional
-            GROUP BY so.Nome
-            ORDER BY device_count DESC;
-        """
-        cursor.execute(query)
-        os_distribution = cursor.fetchall()
-        return jsonify(os_distribution), 200
-    except Exception as e:
-        log.exception("Erro ao buscar distribuição de SO para dashboard")
-        return jsonify({"message": "Erro ao buscar distribuição de SO"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+    return _dashboard_response('os_distribution')
 
 def get_current_scan_settings():
     """Busca as configurações de varredura atuais do banco de dados."""
-    conn = None
-    cursor = None
     try:
-        conn = get_db_connection()
-        if not conn:
-            log.error("SCHEDULER_SETTINGS: Erro de conexão DB ao buscar configurações.")
-            return None 
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT FaixasIP, FrequenciaMinutos, VarreduraAtivada FROM ConfiguracaoVarredura WHERE ID_ConfigVarredura = 1")
-        config = cursor.fetchone()
-        log.debug(f"SCHEDULER_SETTINGS: Configurações lidas do DB: {config}")
-        return config
+        with db_connection() as conn:
+            if not conn:
+                log.error("SCHEDULER_SETTINGS: Erro de conexão DB ao buscar configurações.")
+                return None 
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT FaixasIP, FrequenciaMinutos, VarreduraAtivada FROM ConfiguracaoVarredura WHERE ID_ConfigVarredura = 1")
+            config = cursor.fetchone()
+            log.debug(f"SCHEDULER_SETTINGS: Configurações lidas do DB: {config}")
+            return config
     except Exception as e:
         log.exception("SCHEDULER_SETTINGS: Erro ao buscar configurações de varredura")
         return None
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
 
 
 def _execute_actual_network_scan(ip_ranges_list_str, scan_source="Desconhecida"):
@@ -1360,102 +1731,38 @@ def _execute_actual_network_scan(ip_ranges_list_str, scan_source="Desconhecida")
         log.warning(f"SCAN_CORE ({scan_source}): Nenhuma faixa de IP fornecida para a varredura.")
         return []
 
-    all_ips_to_scan_obj_list = []
-    range_segments = ip_ranges_list_str.split(',')
-    
-    for segment in range_segments:
-        segment = segment.strip()
-        if not segment: continue
-
-        if '-' in segment: 
-            try:
-                start_ip_str, end_part_str = segment.split('-', 1)
-                start_ip = ipaddress.ip_address(start_ip_str.strip())
-                end_part_str = end_part_str.strip()
-                
-                if '.' in end_part_str : 
-                    end_ip = ipaddress.ip_address(end_part_str)
-                    if start_ip.version != end_ip.version:
-                        log.warning(f"SCAN_CORE ({scan_source}): Faixa inválida: {segment} - IPs de versões diferentes.")
-                        continue
-                    if start_ip > end_ip:
-                        log.warning(f"SCAN_CORE ({scan_source}): Faixa inválida: {segment} - IP inicial maior que IP final.")
-                        continue
-                    current_ip = start_ip
-                    while current_ip <= end_ip:
-                        all_ips_to_scan_obj_list.append(current_ip)
-                        current_ip += 1
-                else: 
-                    end_octet = int(end_part_str)
-                    if not (0 <= end_octet <= 255):
-                        log.warning(f"SCAN_CORE ({scan_source}): Faixa inválida: {segment} - Octeto final inválido.")
-                        continue
-                    
-                    start_ip_addr_bytes = bytearray(start_ip.packed)
-                    if start_ip.version == 4 and len(start_ip_addr_bytes) == 4 :
-                        if start_ip_addr_bytes[3] > end_octet :
-                            log.warning(f"SCAN_CORE ({scan_source}): Faixa inválida: {segment} - Octeto final menor que octeto inicial.")
-                            continue
-                        
-                        temp_ip_parts = list(start_ip.packed)
-                        temp_ip_parts[3] = end_octet
-                        end_ip = ipaddress.ip_address(bytes(temp_ip_parts))
-
-                        current_ip = start_ip
-                        while current_ip <= end_ip:
-                            all_ips_to_scan_obj_list.append(current_ip)
-                            if current_ip == end_ip : break 
-                            current_ip += 1
-                    else:
-                        log.warning(f"SCAN_CORE ({scan_source}): Formato de faixa X.X.X.X-Z só suportado para IPv4: {segment}")
-                        continue
-            except ValueError as e:
-                log.warning(f"SCAN_CORE ({scan_source}): Erro ao processar faixa de IP '{segment}': {e}")
-                continue
-        elif '/' in segment: 
-            try:
-                network = ipaddress.ip_network(segment, strict=False)
-                for ip_obj in network.hosts(): 
-                    all_ips_to_scan_obj_list.append(ip_obj)
-            except ValueError as e:
-                log.warning(f"SCAN_CORE ({scan_source}): Erro ao processar faixa CIDR '{segment}': {e}")
-                continue
-        else: # IP único
-            try:
-                all_ips_to_scan_obj_list.append(ipaddress.ip_address(segment))
-            except ValueError as e:
-                log.warning(f"SCAN_CORE ({scan_source}): Erro ao processar IP único '{segment}': {e}")
-                continue
-    
-    if not all_ips_to_scan_obj_list:
+    # Faixas sobrepostas são mescladas e as exclusões ('!') aplicadas sobre intervalos inteiros;
+    # os IPs são gerados sob demanda pelo pipeline, sem materializar a lista.
+    targets = TargetSpec.parse(ip_ranges_list_str, log_prefix=f"SCAN_CORE ({scan_source})")
+    if not targets:
         log.warning(f"SCAN_CORE ({scan_source}): Nenhuma faixa de IP válida resultou em IPs para escanear.")
         return []
+    if targets.total > DISCOVERY_MAX_TARGETS:
+        log.error(f"SCAN_CORE ({scan_source}): As faixas somam {targets.total} IPs, acima de DISCOVERY_MAX_TARGETS "
+                  f"({DISCOVERY_MAX_TARGETS}); varredura não executada.")
+        return []
 
-    unique_ips_to_scan_str = sorted(list(set(str(ip) for ip in all_ips_to_scan_obj_list)), key=ipaddress.ip_address)
-    final_ips_to_scan_list = [ipaddress.ip_address(ip_str) for ip_str in unique_ips_to_scan_str]
+    log.info(f"SCAN_CORE ({scan_source}): Total de IPs únicos a serem escaneados: {targets.total}")
 
-    log.info(f"SCAN_CORE ({scan_source}): Total de IPs únicos a serem escaneados: {len(final_ips_to_scan_list)}")
-    
-    active_ips_found = []
-    with ThreadPoolExecutor(max_workers=os.cpu_count() * 5 or 20) as executor: 
-        chunk_size = 50 
-        futures = [] 
-        for i in range(0, len(final_ips_to_scan_list), chunk_size):
-            ip_chunk = final_ips_to_scan_list[i:i + chunk_size]
-            future = executor.submit(scan_ip_range_segment, ip_chunk) 
-            futures.append(future)
-        
-        for future in futures:
-            try:
-                active_ips_found.extend(future.result()) 
-            except Exception as e_future:
-                log.exception(f"SCAN_CORE ({scan_source}): Erro em uma thread de varredura")
+    active_ips_found = run_discovery_pipeline(targets.iter_targets(randomize=DISCOVERY_RANDOMIZE_TARGETS),
+                                              scan_source=scan_source,
+                                              neighbor_scan=scan_local_neighbors(targets, scan_source))
 
     log.info(f"SCAN_CORE ({scan_source}): Varredura de descoberta concluída. {len(active_ips_found)} IPs ativos encontrados e processados.")
     return active_ips_found
 
+def _enqueue_distributed_scan(ip_ranges_list_str, scan_source="Agendada"):
+    """Enfileira a rodada para os workers; não cria outra enquanto a anterior da mesma origem não terminar."""
+    if scan_coordinator.has_active_scan(scan_source):
+        log.warning(f"SCHEDULER_JOB: Varredura distribuída ({scan_source}) anterior ainda em andamento; rodada ignorada.")
+        return None
+    return scan_coordinator.create_scan(ip_ranges_list_str, scan_source=scan_source)
+
 def scheduled_scan_job():
     """A tarefa que o scheduler irá executar."""
+    if not scheduler_leader.is_leader:
+        log.warning("SCHEDULER_JOB: Esta instância não detém o lock do agendador; varredura ignorada.")
+        return
     log.info(f"SCHEDULER_JOB: Verificando se a varredura automática deve ser executada...")
     with app.app_context():
         settings = get_current_scan_settings()
@@ -1465,7 +1772,10 @@ def scheduled_scan_job():
             if faixas_ip:
                 log.info(f"SCHEDULER_JOB: Varredura automática ATIVADA. Iniciando varredura para faixas: {faixas_ip}")
                 try:
-                    _execute_actual_network_scan(faixas_ip, scan_source="Agendada") 
+                    if SCAN_DISTRIBUTED:
+                        _enqueue_distributed_scan(faixas_ip, scan_source="Agendada")
+                    else:
+                        _execute_actual_network_scan(faixas_ip, scan_source="Agendada")
                 except Exception as e:
                     log.exception("SCHEDULER_JOB: Erro durante a execução da varredura automática agendada.")
             else:
@@ -1473,12 +1783,27 @@ def scheduled_scan_job():
         else:
             log.info("SCHEDULER_JOB: Varredura automática DESATIVADA ou configurações não encontradas.")
 
+def _scan_schedule_signature(settings):
+    return (bool(settings.get('VarreduraAtivada')), settings.get('FrequenciaMinutos')) if settings else None
+
+def sync_scheduled_scan_job():
+    """
+    Reaplica o agendamento da varredura se as configurações mudaram no banco. Cobre as alterações
+    salvas pelos processos web, que não executam o agendador.
+    """
+    settings = get_current_scan_settings()
+    if settings is not None and _scan_schedule_signature(settings) != _scheduled_scan_signature:
+        log.info("SCHEDULER_UPDATE: Configurações de varredura alteradas no banco; reagendando.")
+        update_scheduled_scan()
+
 def update_scheduled_scan():
     """Remove o job de varredura existente e agenda um novo com base nas configurações atuais do DB."""
     log.info("SCHEDULER_UPDATE: Tentando atualizar tarefa de varredura agendada...")
     
+    global _scheduled_scan_signature
     with app.app_context():
         settings = get_current_scan_settings()
+    _scheduled_scan_signature = _scan_schedule_signature(settings)
 
     try:
         if scheduler.get_job(SCAN_JOB_ID):
@@ -1511,67 +1836,11 @@ def update_scheduled_scan():
 
 @app.route('/api/dashboard/status-distribution', methods=['GET'])
 def dashboard_status_distribution():
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"message": "Erro de conexão DB"}), 500
-        cursor = conn.cursor(dictionary=True)
-        query = """
-            SELECT 
-                StatusAtual as status_name,
-                COUNT(ID_Dispositivo) as device_count
-            FROM Dispositivo
-            GROUP BY StatusAtual
-            ORDER BY device_count DESC;
-        """
-        cursor.execute(query)
-        status_distribution = cursor.fetchall()
-        return jsonify(status_distribution), 200
-    except Exception as e:
-        log.exception("Erro ao buscar distribuição de status para dashboard")
-        return jsonify({"message": "Erro ao buscar distribuição de status"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+    return _dashboard_response('status_distribution')
 
 @app.route('/api/dashboard/recent-alerts', methods=['GET'])
 def dashboard_recent_alerts():
-    conn = None
-    cursor = None
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"message": "Erro de conexão DB"}), 500
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-            SELECT 
-                a.ID_Alerta,
-                a.DescricaoCustomizada,
-                a.DataHoraCriacao,
-                a.Severidade,
-                ta.Nome AS TipoAlertaNome,
-                d.NomeHost AS DispositivoNomeHost,
-                ipd.EnderecoIP AS IPDescobertoEndereco
-            FROM Alerta a
-            JOIN TipoAlerta ta ON a.ID_TipoAlerta = ta.ID_TipoAlerta
-            LEFT JOIN Dispositivo d ON a.ID_Dispositivo = d.ID_Dispositivo
-            LEFT JOIN IPsDescobertos ipd ON a.ID_IPDescoberto_FK = ipd.ID_IPDescoberto
-            WHERE a.StatusAlerta = 'Novo'
-            ORDER BY a.DataHoraCriacao DESC
-            LIMIT 5 
-        """
-        cursor.execute(query)
-        recent_alerts = cursor.fetchall()
-        return jsonify(recent_alerts), 200
-    except Exception as e:
-        log.exception("Erro ao buscar alertas recentes para dashboard")
-        return jsonify({"message": "Erro ao buscar alertas recentes"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+    return _dashboard_response('recent_alerts')
 
 @app.route('/api/settings/scan-config', methods=['GET'])
 def get_scan_config_route():
@@ -1587,8 +1856,6 @@ def get_scan_config_route():
 
 @app.route('/api/settings/scan-config', methods=['PUT'])
 def update_scan_config_route():
-    conn = None
-    cursor = None
     try:
         data = request.get_json()
         if not data: return jsonify({"message": "Dados não fornecidos"}), 400
@@ -1609,45 +1876,131 @@ def update_scan_config_route():
         if not isinstance(varredura_ativada, bool):
             return jsonify({"message": "VarreduraAtivada deve ser true ou false."}), 400
 
-        conn = get_db_connection()
-        if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
-        cursor = conn.cursor()
-        query = """
-        UPDATE ConfiguracaoVarredura SET FaixasIP = %s, FrequenciaMinutos = %s, VarreduraAtivada = %s
-        WHERE ID_ConfigVarredura = 1 
-        """
-        cursor.execute(query, (faixas_ip, frequencia_minutos, varredura_ativada))
-        conn.commit()
+        with db_connection() as conn:
+            if not conn: return jsonify({"message": "Erro de conexão DB"}), 500
+            cursor = conn.cursor()
+            query = """
+            UPDATE ConfiguracaoVarredura SET FaixasIP = %s, FrequenciaMinutos = %s, VarreduraAtivada = %s
+            WHERE ID_ConfigVarredura = 1 
+            """
+            cursor.execute(query, (faixas_ip, frequencia_minutos, varredura_ativada))
+            conn.commit()
               
-        if scheduler.running:
-            log.info("API_SETTINGS_SCAN: Configs salvas. Solicitando atualização do agendador...")
-            update_scheduled_scan() 
-        else:
-            log.warning("API_SETTINGS_SCAN: Configs salvas, mas o agendador não está rodando.")
+            if scheduler.running and scheduler_leader.is_leader:
+                log.info("API_SETTINGS_SCAN: Configs salvas. Solicitando atualização do agendador...")
+                update_scheduled_scan() 
+            else:
+                log.info(f"API_SETTINGS_SCAN: Configs salvas; o agendador líder as aplica em até {SCHEDULER_SETTINGS_POLL_SECONDS}s.")
             
-        return jsonify({"message": "Configurações de varredura salvas com sucesso!"}), 200
+            return jsonify({"message": "Configurações de varredura salvas com sucesso!"}), 200
     except Exception as e:
-        if conn: conn.rollback()
         log.exception("Erro ao salvar configuração de varredura")
         return jsonify({"message": "Erro ao salvar configuração de varredura"}), 500
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
-
-try:
-    if not scheduler.running:
-        log.info("MAIN_APP: Agendador não está rodando. Iniciando...")
-        with app.app_context():
-            update_scheduled_scan() 
-        scheduler.start()
-        log.info("MAIN_APP: Agendador iniciado com sucesso.")
-        atexit.register(lambda: scheduler.shutdown(wait=False))
-    else:
+
+AVAILABILITY_ROLLUP_JOB_ID = 'availability_rollup_job'
+
+def availability_rollup_job():
+    """Consolida as amostras de disponibilidade das horas encerradas (1m/1h/1d) e aplica a retenção."""
+    try:
+        with db_connection() as conn:
+            if not conn:
+                log.error("AVAILABILITY: Sem conexão com o banco; consolidação adiada.")
+                return
+            run_rollups(conn)
+            apply_retention(
+                conn,
+                raw_days=int(os.getenv('AVAILABILITY_RAW_RETENTION_DAYS', '2')),
+                minute_days=int(os.getenv('AVAILABILITY_1M_RETENTION_DAYS', '7')),
+                hour_days=int(os.getenv('AVAILABILITY_1H_RETENTION_DAYS', '90')),
+                day_days=int(os.getenv('AVAILABILITY_1D_RETENTION_DAYS', '730')),
+            )
+    except Exception:
+        log.exception("AVAILABILITY: Erro na consolidação do histórico de disponibilidade.")
+
+# Monitor de disponibilidade: mantém Dispositivo.StatusAtual a partir de sondas ICMP periódicas
+liveness_monitor = LivenessMonitor.from_env(
+    db_connection, IcmpSweeper.from_env(rate_controller=probe_rate_controller), ping_ip,
+    on_status_changed=lambda total: invalidate_dashboard('monitor de disponibilidade'),
+    recorder=availability_recorder,
+)
+LIVENESS_ENABLED = os.getenv('LIVENESS_ENABLED', 'true').lower() == 'true'
+
+# --- AGENDADOR COM LÍDER ÚNICO ---
+# O agendador e o monitor de disponibilidade rodam num único processo: `flask run-scheduler` (ou `python app.py`
+# em desenvolvimento). Com SCHEDULER_EMBEDDED=true os workers web também disputam a liderança; em qualquer
+# caso, só a instância que detém o lock nomeado no MySQL executa os jobs.
+SCHEDULER_EMBEDDED = os.getenv('SCHEDULER_EMBEDDED', 'false').lower() in ('1', 'true', 'yes')
+SCHEDULER_SETTINGS_POLL_SECONDS = int(os.getenv('SCHEDULER_SETTINGS_POLL_SECONDS', '60'))
+SETTINGS_SYNC_JOB_ID = 'scan_settings_sync_job'
+_scheduled_scan_signature = None
+
+def _on_scheduler_leader():
+    """Ao assumir a liderança: agenda os jobs a partir do banco, retoma o agendador e inicia o monitor."""
+    with app.app_context():
+        update_scheduled_scan()
+    scheduler.add_job(
+        func=availability_rollup_job,
+        trigger='interval',
+        minutes=AVAILABILITY_ROLLUP_MINUTES,
+        id=AVAILABILITY_ROLLUP_JOB_ID,
+        replace_existing=True,
+        next_run_time=datetime.now() + timedelta(minutes=1)
+    )
+    scheduler.add_job(
+        func=sync_scheduled_scan_job,
+        trigger='interval',
+        seconds=SCHEDULER_SETTINGS_POLL_SECONDS,
+        id=SETTINGS_SYNC_JOB_ID,
+        replace_existing=True
+    )
+    scheduler.resume()
+    if LIVENESS_ENABLED:
+        liveness_monitor.start()
+    log.info("MAIN_APP: Liderança do agendador obtida; jobs agendados.")
+
+def _on_scheduler_standby():
+    """Ao perder a liderança (conexão do lock caiu): pausa os jobs até obtê-la de novo."""
+    scheduler.pause()
+    liveness_monitor.stop()
+    log.warning("MAIN_APP: Liderança do agendador perdida; jobs pausados.")
+
+scheduler_leader = LeaderLock.from_env(db_pool.connect_kwargs, on_acquired=_on_scheduler_leader,
+                                       on_lost=_on_scheduler_standby)
+
+def start_scheduler():
+    """Inicia o agendador pausado e a disputa pelo lock; os jobs só rodam enquanto esta instância for a líder."""
+    if scheduler.running:
         log.warning("MAIN_APP: Agendador já estava rodando.")
-except Exception as e:
-    log.critical("MAIN_APP: Erro fatal durante a inicialização do agendador.", exc_info=True)
+        return
+    try:
+        scheduler.start(paused=True)
+        atexit.register(lambda: scheduler.shutdown(wait=False))
+        # Roda antes do shutdown (atexit é LIFO): libera o lock e para o monitor.
+        atexit.register(scheduler_leader.stop)
+        scheduler_leader.start()
+        log.info("MAIN_APP: Agendador iniciado; aguardando liderança.")
+    except Exception:
+        log.critical("MAIN_APP: Erro fatal durante a inicialização do agendador.", exc_info=True)
+
+@app.cli.command('run-scheduler')
+def run_scheduler_command():
+    """Executa o agendador (varreduras, consolidações e monitor de disponibilidade) fora do servidor web."""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    start_scheduler()
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    log.info("MAIN_APP: Encerrando o processo do agendador.")
+
+if SCHEDULER_EMBEDDED:
+    start_scheduler()
 
 if __name__ == '__main__':
     is_debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     log.info(f"Iniciando servidor Flask em modo {'DEBUG' if is_debug_mode else 'PRODUÇÃO'}.")
+    # Servidor de desenvolvimento: processo único, então o agendador roda junto (o lock evita duplicidade).
+    start_scheduler()
     app.run(debug=is_debug_mode)
\ No newline at end of file
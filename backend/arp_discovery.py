@@ -0,0 +1,287 @@
+import ipaddress
+import os
+import select
+import socket
+import struct
+import subprocess
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem ioctl; a descoberta ARP fica desativada
+    fcntl = None
+
+SIOCGIFADDR = 0x8915
+SIOCGIFHWADDR = 0x8927
+ETH_P_ARP = 0x0806
+ARP_REQUEST = 1
+ARP_REPLY = 2
+ATF_COM = 0x02   # entrada completa em /proc/net/arp
+RTF_UP = 0x0001
+
+PROC_ROUTE = '/proc/net/route'
+PROC_ARP = '/proc/net/arp'
+_EMPTY_MAC = '00:00:00:00:00:00'
+# O kernel limita a tabela de vizinhos (gc_thresh3, 1024 por padrão); sem socket RAW, a resolução
+# é provocada em blocos para não transbordá-la.
+_UDP_CHUNK = 512
+
+
+def format_mac(raw):
+    return ':'.join(f'{b:02X}' for b in raw)
+
+
+def _interface_info(iface):
+    """Retorna (ip_str, mac_bytes) da interface via ioctl, ou (None, None) se indisponível."""
+    if fcntl is None:
+        return None, None
+    ifreq = struct.pack('256s', iface[:15].encode())
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        ip_str = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, ifreq)[20:24])
+        mac = fcntl.ioctl(sock.fileno(), SIOCGIFHWADDR, ifreq)[18:24]
+        return ip_str, mac
+    except OSError:
+        return None, None
+    finally:
+        sock.close()
+
+
+def local_ipv4_networks(route_path=PROC_ROUTE):
+    """
+    Redes IPv4 diretamente conectadas (rotas sem gateway, exceto a padrão), lidas de /proc/net/route.
+    Retorna [(ipaddress.IPv4Network, interface, ip_local, mac_local)]; lista vazia fora do Linux.
+    """
+    networks = []
+    try:
+        with open(route_path) as f:
+            lines = f.read().splitlines()[1:]
+    except OSError:
+        return networks
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 8:
+            continue
+        iface, destination, gateway, flags, mask = fields[0], int(fields[1], 16), int(fields[2], 16), int(fields[3], 16), int(fields[7], 16)
+        if iface == 'lo' or gateway != 0 or mask == 0 or not flags & RTF_UP:
+            continue
+        # Os campos vêm em hexadecimal na ordem de bytes do host (little-endian).
+        network = ipaddress.IPv4Network((socket.inet_ntoa(struct.pack('<I', destination)),
+                                         socket.inet_ntoa(struct.pack('<I', mask))), strict=False)
+        src_ip, src_mac = _interface_info(iface)
+        if src_ip and src_mac and ipaddress.IPv4Address(src_ip) in network:
+            networks.append((network, iface, src_ip, src_mac))
+    return networks
+
+
+def read_neighbor_table(arp_path=PROC_ARP):
+    """Entradas completas da tabela de vizinhos do kernel: {ip_str: 'AA:BB:CC:DD:EE:FF'}."""
+    neighbors = {}
+    try:
+        with open(arp_path) as f:
+            lines = f.read().splitlines()[1:]
+    except OSError:
+        return neighbors
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 6:
+            continue
+        ip_str, flags, mac = fields[0], int(fields[2], 16), fields[3].upper()
+        if flags & ATF_COM and mac != _EMPTY_MAC:
+            neighbors[ip_str] = mac
+    return neighbors
+
+
+def read_neighbor_states():
+    """
+    Tabela de vizinhos IPv4 com o estado NUD de cada entrada, via `ip neigh` (iproute2):
+    {ip_str: ('AA:BB:CC:DD:EE:FF', 'REACHABLE')}. Só entradas com MAC. None se o comando não existir.
+    """
+    try:
+        output = subprocess.run(['ip', '-4', 'neigh', 'show'], capture_output=True, text=True,
+                                timeout=5, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    neighbors = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if 'lladdr' not in fields:
+            continue
+        index = fields.index('lladdr')
+        if index + 1 < len(fields):
+            neighbors[fields[0]] = (fields[index + 1].upper(), fields[-1])
+    return neighbors
+
+
+def _build_arp_request(src_mac, src_ip, target_ip):
+    arp = struct.pack('!HHBBH6s4s6s4s', 1, 0x0800, 6, 4, ARP_REQUEST, src_mac, socket.inet_aton(src_ip),
+                      b'\x00' * 6, socket.inet_aton(target_ip))
+    return b'\xff' * 6 + src_mac + struct.pack('!H', ETH_P_ARP) + arp
+
+
+def parse_arp_reply(frame):
+    """Extrai (ip_str, mac) de um quadro Ethernet com ARP reply; None para qualquer outro quadro."""
+    if len(frame) < 42 or struct.unpack('!H', frame[12:14])[0] != ETH_P_ARP:
+        return None
+    if struct.unpack('!H', frame[20:22])[0] != ARP_REPLY:
+        return None
+    return socket.inet_ntoa(frame[28:32]), format_mac(frame[22:28])
+
+
+class NeighborScanResult:
+    """
+    Resultado da varredura ARP: alvos cobertos (TargetSpec on-link) e MACs dos que responderam.
+    Os IPs em `uncertain` (o kernel tem um MAC antigo, mas a resposta não foi confirmada) não contam
+    como cobertos e seguem para a sondagem ICMP.
+    """
+
+    def __init__(self, covered, macs, uncertain=()):
+        self.covered = covered
+        self.macs = macs
+        self.uncertain = set(uncertain)
+
+    def covers(self, ip_str):
+        return ':' not in ip_str and ip_str not in self.uncertain and ip_str in self.covered
+
+
+class NeighborDiscovery:
+    """
+    Descoberta por ARP para as faixas diretamente conectadas. Com socket AF_PACKET (root/CAP_NET_RAW)
+    envia ARP requests em broadcast e coleta os replies; sem permissão, provoca a resolução ARP do
+    kernel com datagramas UDP vazios e lê a tabela de vizinhos. Em ambos os casos o MAC de cada host
+    ativo é capturado e hosts que bloqueiam ICMP também são encontrados.
+
+    O kernel mantém por minutos entradas STALE/DELAY de hosts que já saíram da rede, então sem socket RAW
+    só contam como ativos os vizinhos REACHABLE após o envio (`ip neigh`) ou, sem o iproute2, as entradas
+    de /proc/net/arp que surgiram ou mudaram de MAC depois dele. Os demais com MAC na tabela ficam
+    incertos e passam pela sondagem ICMP.
+    Só funciona no Linux; nos demais sistemas `scan` retorna None e a descoberta segue por ICMP.
+    """
+
+    def __init__(self, timeout=0.3, retries=1, max_pps=5000):
+        self.timeout = float(timeout)
+        self.retries = max(0, int(retries))
+        self.max_pps = max(1, int(max_pps))
+
+    @classmethod
+    def from_env(cls):
+        """Cria o motor a partir das variáveis ARP_TIMEOUT, ARP_RETRIES e ARP_MAX_PPS."""
+        return cls(
+            timeout=os.getenv('ARP_TIMEOUT', '0.3'),
+            retries=os.getenv('ARP_RETRIES', '1'),
+            max_pps=os.getenv('ARP_MAX_PPS', '5000'),
+        )
+
+    def scan(self, targets, log_prefix="ARP_SCAN"):
+        """
+        Varre por ARP os alvos (TargetSpec) que estão em redes locais. Retorna NeighborScanResult,
+        ou None se nenhum alvo for on-link (ou o sistema não expuser as rotas/vizinhos do kernel).
+        """
+        started = time.perf_counter()
+        covered_intervals = []
+        macs = {}
+        uncertain = set()
+        for network, iface, src_ip, src_mac in local_ipv4_networks():
+            on_link = targets.restrict(4, [(int(network.network_address), int(network.broadcast_address))])
+            if not on_link:
+                continue
+            covered_intervals.extend(on_link.intervals[4])
+            if src_ip in on_link:
+                macs[src_ip] = format_mac(src_mac)
+            found, network_uncertain = self._sweep_network(iface, src_ip, src_mac, list(on_link))
+            uncertain.update(ip for ip in network_uncertain if ip != src_ip)
+            macs.update({ip: mac for ip, mac in found.items() if ip in on_link})
+            log.info(f"{log_prefix}: {len(found)} de {on_link.total} alvos responderam ARP em {network} ({iface}).")
+        if not covered_intervals:
+            return None
+        covered = targets.restrict(4, covered_intervals)
+        log.info(f"{log_prefix}: Varredura ARP de {covered.total} alvos locais concluída em "
+                 f"{(time.perf_counter() - started) * 1000:.0f} ms ({len(macs)} ativos"
+                 f"{f', {len(uncertain)} incertos seguem para ICMP' if uncertain else ''}).")
+        return NeighborScanResult(covered, macs, uncertain)
+
+    def _sweep_network(self, iface, src_ip, src_mac, ips):
+        """Retorna ({ip: mac} dos que responderam, IPs incertos)."""
+        try:
+            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        except (PermissionError, OSError, AttributeError) as e_raw:
+            log.debug(f"ARP_SCAN: Socket AF_PACKET indisponível ({e_raw}); usando a tabela de vizinhos do kernel.")
+            return self._sweep_kernel(ips)
+        try:
+            sock.bind((iface, 0))
+            sock.setblocking(False)
+            return self._sweep_raw(sock, src_ip, src_mac, ips), set()
+        finally:
+            sock.close()
+
+    def _sweep_raw(self, sock, src_ip, src_mac, ips):
+        found = {}
+        expected = len(ips) - (src_ip in ips)
+        send_interval = 1.0 / self.max_pps
+        for _attempt in range(self.retries + 1):
+            pending = [ip for ip in ips if ip not in found and ip != src_ip]
+            if not pending:
+                break
+            next_send = time.monotonic()
+            for ip in pending:
+                try:
+                    sock.send(_build_arp_request(src_mac, src_ip, ip))
+                except OSError as e_send:
+                    log.debug(f"ARP_SCAN: Falha ao enviar ARP para {ip}: {e_send}")
+                self._drain(sock, found, 0)
+                next_send += send_interval
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline and len(found) < expected:
+                self._drain(sock, found, deadline - time.monotonic())
+        return found
+
+    @staticmethod
+    def _drain(sock, found, wait):
+        ready, _, _ = select.select([sock], [], [], max(0.0, wait))
+        while ready:
+            try:
+                reply = parse_arp_reply(sock.recv(2048))
+            except BlockingIOError:
+                return
+            if reply:
+                found[reply[0]] = reply[1]
+
+    def _sweep_kernel(self, ips):
+        found = {}
+        # Sem o iproute2 não há o estado das entradas: vale a diferença em relação à tabela de antes do envio.
+        use_states = read_neighbor_states() is not None
+        before = {} if use_states else read_neighbor_table()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        try:
+            for _attempt in range(self.retries + 1):
+                pending = [ip for ip in ips if ip not in found]
+                for start in range(0, len(pending), _UDP_CHUNK):
+                    for ip in pending[start:start + _UDP_CHUNK]:
+                        try:
+                            # Porta discard: o conteúdo não importa, só a resolução ARP que o envio provoca.
+                            sock.sendto(b'', (ip, 9))
+                        except OSError:
+                            pass
+                    time.sleep(self.timeout)
+                    chunk = pending[start:start + _UDP_CHUNK]
+                    if use_states:
+                        states = read_neighbor_states() or {}
+                        found.update({ip: states[ip][0] for ip in chunk if ip in states and states[ip][1] == 'REACHABLE'})
+                    else:
+                        neighbors = read_neighbor_table()
+                        found.update({ip: neighbors[ip] for ip in chunk if ip in neighbors and before.get(ip) != neighbors[ip]})
+                if len(found) == len(ips):
+                    break
+        finally:
+            sock.close()
+        # Com MAC na tabela mas sem confirmação: pode ser uma entrada antiga de um host que já saiu.
+        known = read_neighbor_states() if use_states else read_neighbor_table()
+        uncertain = {ip for ip in ips if ip not in found and ip in (known or {})}
+        return found, uncertain
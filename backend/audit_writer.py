@@ -0,0 +1,310 @@
+import os
+import glob
+import json
+import queue
+import threading
+import time
+import logging
+from datetime import datetime
+
+from db_pool import is_transient_db_error
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock; o spill fica seguro apenas dentro de um processo
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AuditLogWriter:
+    """
+    Gravador assíncrono da trilha de auditoria. As rotas apenas enfileiram os eventos em memória;
+    uma thread de fundo os grava em LogAuditoria com INSERTs de várias linhas, quando o lote
+    atinge `batch_size` eventos ou `flush_seconds` segundos.
+
+    Se o banco estiver indisponível, o lote é anexado ao arquivo `spill_path` (uma linha JSON por
+    evento) e reenviado assim que uma gravação voltar a funcionar. Eventos que o banco recusa pelos
+    próprios dados (FK inválida, texto longo demais) não voltam ao spill: são registrados no log e
+    movidos para o arquivo de rejeitados (`<spill>.rejeitados.jsonl`). `stop()` grava tudo o que estiver
+    pendente antes de encerrar.
+
+    O spill pode ser compartilhado pelos workers do mesmo host: as escritas usam `flock` e o reenvio
+    primeiro renomeia o arquivo (reivindicação atômica), de modo que cada evento é reenviado por um
+    único processo.
+
+    `connection_factory()` deve ser um context manager que entrega uma conexão do pool
+    (ou None em caso de falha) e a devolve ao sair.
+    """
+
+    def __init__(self, connection_factory, spill_path, batch_size=200, flush_seconds=1.0, queue_size=10000):
+        self.connection_factory = connection_factory
+        self.spill_path = spill_path
+        root, ext = os.path.splitext(spill_path)
+        self.rejected_path = f"{root}.rejeitados{ext or '.jsonl'}"
+        self.batch_size = max(1, int(batch_size))
+        self.flush_seconds = float(flush_seconds)
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        self.total_written = 0
+        self.total_spilled = 0
+        self.total_rejected = 0
+
+    @classmethod
+    def from_env(cls, connection_factory):
+        """Cria o writer lendo AUDIT_BATCH_SIZE, AUDIT_FLUSH_SECONDS, AUDIT_QUEUE_SIZE e AUDIT_SPILL_PATH."""
+        default_spill = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audit_spill.jsonl')
+        return cls(
+            connection_factory,
+            spill_path=os.getenv('AUDIT_SPILL_PATH', default_spill),
+            batch_size=os.getenv('AUDIT_BATCH_SIZE', '200'),
+            flush_seconds=os.getenv('AUDIT_FLUSH_SECONDS', '1'),
+            queue_size=os.getenv('AUDIT_QUEUE_SIZE', '10000'),
+        )
+
+    def start(self):
+        """Inicia a thread de gravação (idempotente)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, id_usuario, nome_usuario, acao, detalhes=None, ip_origem=None):
+        """Registra um evento para gravação posterior. Nunca bloqueia a requisição."""
+        event = {
+            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "id_usuario": id_usuario,
+            "nome_usuario": nome_usuario,
+            "acao": acao,
+            "detalhes": str(detalhes) if detalhes is not None else None,
+            "ip_origem": ip_origem,
+        }
+        if self._thread is None or not self._thread.is_alive():
+            # Sem worker (ex.: durante o encerramento): grava direto para não perder o evento.
+            self._write_or_spill([event])
+            return
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            log.warning("AUDIT_WRITER: Fila cheia; evento enviado direto para o arquivo de spill.")
+            self._spill([event])
+
+    def stop(self, timeout=10.0):
+        """Sinaliza o encerramento e aguarda a gravação de todos os eventos pendentes."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.error("AUDIT_WRITER: Worker não terminou a tempo; eventos restantes podem ficar só no spill.")
+        self._thread = None
+        # Eventos que chegaram depois do sinal de parada.
+        leftovers = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _STOP:
+                leftovers.append(event)
+        if leftovers:
+            self._write_or_spill(leftovers)
+
+    def _run(self):
+        # Eventos que ficaram no spill de uma execução anterior.
+        self._replay_spill()
+        batch = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                event = self._queue.get(timeout=timeout)
+                if event is _STOP:
+                    stopping = True
+                else:
+                    batch.append(event)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_seconds
+            except queue.Empty:
+                pass
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write_or_spill(batch)
+                batch = []
+                deadline = None
+
+    def _write_or_spill(self, batch):
+        unsent = self._write(batch)
+        if unsent:
+            self._spill(unsent)
+        else:
+            self._replay_spill()
+
+    def _write(self, events):
+        """
+        Grava os eventos e retorna os que ficaram pendentes por indisponibilidade do banco (para o spill).
+        Se o lote é recusado por erro nos dados, os eventos são gravados um a um para isolar os rejeitados.
+        """
+        try:
+            self._insert(events)
+            return []
+        except Exception as e_insert:
+            if isinstance(e_insert, ConnectionError) or is_transient_db_error(e_insert):
+                log.error(f"AUDIT_WRITER: Banco indisponível para gravar {len(events)} eventos: {e_insert}")
+                return events
+            if len(events) > 1:
+                log.warning(f"AUDIT_WRITER: Lote de {len(events)} eventos recusado ({e_insert}); gravando um a um.")
+                unsent = []
+                for ev in events:
+                    unsent.extend(self._write([ev]))
+                return unsent
+            log.error(f"AUDIT_WRITER: Evento de auditoria rejeitado pelo banco ({e_insert}): {events[0]}")
+            self._reject(events[0])
+            return []
+
+    def _insert(self, events):
+        """Grava os eventos com um único INSERT de várias linhas. Levanta ConnectionError sem conexão com o banco."""
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o DB.")
+            cursor = conn.cursor()
+            values_sql = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(events))
+            params = []
+            for ev in events:
+                params.extend((ev["timestamp"], ev["id_usuario"], ev["nome_usuario"], ev["acao"], ev["detalhes"], ev["ip_origem"]))
+            cursor.execute(f"""
+                INSERT INTO LogAuditoria (Timestamp, ID_Usuario_FK, NomeUsuario, Acao, Detalhes, EnderecoIPOrigem)
+                VALUES {values_sql}
+            """, tuple(params))
+            conn.commit()
+        self.total_written += len(events)
+        log.debug(f"AUDIT_WRITER: {len(events)} eventos gravados em LogAuditoria.")
+
+    def _append_lines(self, path, events):
+        """Anexa os eventos ao arquivo sob `flock`, reabrindo-o se ele foi reivindicado para reenvio nesse meio tempo."""
+        data = "".join(json.dumps(ev, ensure_ascii=False) + "\n" for ev in events)
+        while True:
+            with open(path, 'a', encoding='utf-8') as target:
+                if fcntl:
+                    fcntl.flock(target.fileno(), fcntl.LOCK_EX)
+                    if not _same_file(target, path):
+                        continue
+                target.write(data)
+                target.flush()
+                os.fsync(target.fileno())
+                return
+
+    def _spill(self, events):
+        with self._spill_lock:
+            try:
+                self._append_lines(self.spill_path, events)
+                self.total_spilled += len(events)
+                log.warning(f"AUDIT_WRITER: {len(events)} eventos salvos em '{self.spill_path}' para reenvio posterior.")
+            except OSError:
+                log.critical(f"AUDIT_WRITER: Falha ao salvar {len(events)} eventos no arquivo de spill.", exc_info=True)
+
+    def _reject(self, event):
+        try:
+            self._append_lines(self.rejected_path, [event])
+            self.total_rejected += 1
+        except OSError:
+            log.critical(f"AUDIT_WRITER: Falha ao salvar evento rejeitado em '{self.rejected_path}'.", exc_info=True)
+
+    def _claim_spill_files(self):
+        """
+        Reivindica, renomeando para `<spill>.replay-<pid>-<n>`, o spill atual e os arquivos reivindicados
+        por processos que já terminaram. Retorna os caminhos reivindicados por este processo.
+        """
+        pid = os.getpid()
+        candidates = []
+        for path in glob.glob(glob.escape(self.spill_path) + '.replay-*'):
+            owner = path.rsplit('.replay-', 1)[1].split('-', 1)[0]
+            if owner.isdigit() and int(owner) != pid and not _pid_alive(int(owner)):
+                candidates.append(path)
+        if os.path.exists(self.spill_path):
+            candidates.append(self.spill_path)
+        claimed = []
+        for path in candidates:
+            target = f"{self.spill_path}.replay-{pid}-{time.time_ns()}"
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue   # outro processo reivindicou antes
+            except OSError:
+                log.exception(f"AUDIT_WRITER: Erro ao reivindicar o arquivo de spill '{path}'.")
+                continue
+            claimed.append(target)
+        return claimed
+
+    def _replay_spill(self):
+        """Reenvia ao banco os eventos do spill, em lotes; o que não puder ser enviado volta para o spill."""
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path) and not glob.glob(glob.escape(self.spill_path) + '.replay-*'):
+                return
+            for claimed_path in self._claim_spill_files():
+                self._replay_file(claimed_path)
+
+    def _replay_file(self, claimed_path):
+        try:
+            with open(claimed_path, 'r', encoding='utf-8') as spill_file:
+                if fcntl:
+                    # Espera uma escrita que tenha aberto o arquivo antes da reivindicação.
+                    fcntl.flock(spill_file.fileno(), fcntl.LOCK_EX)
+                lines = spill_file.readlines()
+        except OSError:
+            log.exception(f"AUDIT_WRITER: Erro ao ler o arquivo de spill '{claimed_path}'.")
+            return
+
+        events = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                log.error(f"AUDIT_WRITER: Linha inválida ignorada no spill: {line[:200]}")
+
+        sent = 0
+        unsent = []
+        while sent < len(events):
+            chunk = events[sent:sent + self.batch_size]
+            sent += len(chunk)
+            unsent = self._write(chunk)
+            if unsent:
+                unsent += events[sent:]
+                break
+
+        try:
+            if unsent:
+                self._append_lines(self.spill_path, unsent)
+            os.remove(claimed_path)
+        except OSError:
+            log.exception(f"AUDIT_WRITER: Erro ao atualizar o spill após o reenvio de '{claimed_path}'.")
+            return
+        log.info(f"AUDIT_WRITER: {len(events) - len(unsent)} eventos do spill reenviados ao banco ({len(unsent)} pendentes).")
+
+
+def _same_file(handle, path):
+    try:
+        current = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(handle.fileno())
+    return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # No Windows os.kill encerraria o processo; lá a aplicação roda num processo só.
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True   # existe, mas pertence a outro usuário
+    return True
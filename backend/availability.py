@@ -0,0 +1,440 @@
+import math
+import os
+import struct
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+log = logging.getLogger(__name__)
+
+TIPO_DISPOSITIVO = 'D'
+TIPO_IP_DESCOBERTO = 'I'
+
+# Resoluções dos rollups, em segundos.
+RES_MINUTO = 60
+RES_HORA = 3600
+RES_DIA = 86400
+RESOLUCOES = {'1m': RES_MINUTO, '1h': RES_HORA, '1d': RES_DIA}
+
+# Amostra bruta: deslocamento em segundos dentro da hora (uint16) e RTT em ms (float32).
+# RTT -1 = sem resposta; NaN = respondeu, mas sem RTT medido (sonda via subprocess).
+_SAMPLE = struct.Struct('<Hf')
+_DOWN = -1.0
+
+# Histograma de RTT em buckets logarítmicos (0,1 ms a ~30 s); guardado esparso como pares (bucket, contagem).
+_HIST_BOUNDS = [0.1 * 1.5 ** k for k in range(32)]
+_HIST_ENTRY = struct.Struct('<BI')
+PERCENTIS = (50, 90, 95, 99)
+
+
+def _bucket(rtt_ms):
+    for index, bound in enumerate(_HIST_BOUNDS):
+        if rtt_ms <= bound:
+            return index
+    return len(_HIST_BOUNDS)
+
+
+def pack_histogram(hist):
+    return b''.join(_HIST_ENTRY.pack(bucket, count) for bucket, count in sorted(hist.items()))
+
+
+def unpack_histogram(data):
+    hist = {}
+    for bucket, count in _HIST_ENTRY.iter_unpack(data or b''):
+        hist[bucket] = hist.get(bucket, 0) + count
+    return hist
+
+
+def histogram_percentiles(hist, rtt_min=None, rtt_max=None, percentis=PERCENTIS):
+    """Estima os percentis de RTT a partir do histograma (ponto médio geométrico do bucket)."""
+    total = sum(hist.values())
+    result = {f"p{p}": None for p in percentis}
+    if not total:
+        return result
+    ordered = sorted(hist.items())
+    for p in percentis:
+        rank = math.ceil(total * p / 100.0)
+        seen = 0
+        for bucket, count in ordered:
+            seen += count
+            if seen >= rank:
+                upper = _HIST_BOUNDS[bucket] if bucket < len(_HIST_BOUNDS) else _HIST_BOUNDS[-1] * 1.5
+                lower = _HIST_BOUNDS[bucket - 1] if bucket > 0 else 0.0
+                value = math.sqrt(lower * upper) if lower else upper / 2
+                if rtt_min is not None:
+                    value = max(value, rtt_min)
+                if rtt_max is not None:
+                    value = min(value, rtt_max)
+                result[f"p{p}"] = round(value, 3)
+                break
+    return result
+
+
+class _Aggregate:
+    __slots__ = ('total', 'online', 'rtt_count', 'rtt_sum', 'rtt_min', 'rtt_max', 'hist')
+
+    def __init__(self):
+        self.total = 0
+        self.online = 0
+        self.rtt_count = 0
+        self.rtt_sum = 0.0
+        self.rtt_min = None
+        self.rtt_max = None
+        self.hist = {}
+
+    def add_sample(self, rtt_ms):
+        self.total += 1
+        if rtt_ms == _DOWN:
+            return
+        self.online += 1
+        if math.isnan(rtt_ms):
+            return
+        self.rtt_count += 1
+        self.rtt_sum += rtt_ms
+        self.rtt_min = rtt_ms if self.rtt_min is None else min(self.rtt_min, rtt_ms)
+        self.rtt_max = rtt_ms if self.rtt_max is None else max(self.rtt_max, rtt_ms)
+        bucket = _bucket(rtt_ms)
+        self.hist[bucket] = self.hist.get(bucket, 0) + 1
+
+    def merge_row(self, row):
+        self.total += int(row['Total'])
+        self.online += int(row['Online'])
+        self.rtt_count += int(row['RTTContagem'])
+        self.rtt_sum += float(row['RTTSoma'] or 0.0)
+        for attr, column, pick in (('rtt_min', 'RTTMin', min), ('rtt_max', 'RTTMax', max)):
+            value = row[column]
+            if value is not None:
+                current = getattr(self, attr)
+                setattr(self, attr, float(value) if current is None else pick(current, float(value)))
+        for bucket, count in unpack_histogram(row['Histograma']).items():
+            self.hist[bucket] = self.hist.get(bucket, 0) + count
+
+    def row_values(self):
+        return (self.total, self.online, self.rtt_count, self.rtt_sum, self.rtt_min, self.rtt_max, pack_histogram(self.hist))
+
+    def summary(self):
+        data = {
+            "amostras": self.total,
+            "amostras_online": self.online,
+            "uptime_percent": round(100.0 * self.online / self.total, 3) if self.total else None,
+            "rtt_medio_ms": round(self.rtt_sum / self.rtt_count, 3) if self.rtt_count else None,
+            "rtt_min_ms": round(self.rtt_min, 3) if self.rtt_min is not None else None,
+            "rtt_max_ms": round(self.rtt_max, 3) if self.rtt_max is not None else None,
+        }
+        data.update({f"rtt_{k}_ms": v for k, v in histogram_percentiles(self.hist, self.rtt_min, self.rtt_max).items()})
+        return data
+
+
+def _floor(dt, resolution):
+    if resolution == RES_DIA:
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == RES_HORA:
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(second=0, microsecond=0)
+
+
+def _ceil(dt, resolution):
+    floored = _floor(dt, resolution)
+    return floored if floored == dt else floored + timedelta(seconds=resolution)
+
+
+class AvailabilityRecorder:
+    """
+    Acumula amostras de disponibilidade (online/offline e RTT) de dispositivos e IPs descobertos e as
+    grava a cada `flush_seconds` como arrays compactados (6 bytes por amostra) anexados ao bloco da
+    hora em AmostraDisponibilidade — um único INSERT ... ON DUPLICATE KEY UPDATE por lote.
+    Amostras de IPs descobertos chegam pelo endereço e são associadas ao ID_IPDescoberto na gravação
+    (IPs ainda não gravados em IPsDescobertos são descartados).
+    """
+
+    def __init__(self, connection_factory, flush_seconds=10.0, max_buffer=200000):
+        self.connection_factory = connection_factory
+        self.flush_seconds = float(flush_seconds)
+        self.max_buffer = int(max_buffer)
+        self._blocks = {}      # (tipo, id, inicio_bloco) -> bytearray
+        self._ip_samples = {}  # (ip, inicio_bloco) -> bytearray
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.total_written = 0
+        self.total_dropped = 0
+
+    @classmethod
+    def from_env(cls, connection_factory):
+        return cls(connection_factory, flush_seconds=os.getenv('AVAILABILITY_FLUSH_SECONDS', '10'))
+
+    def _append(self, buffer, key, up, rtt_ms, ts):
+        ts = ts or datetime.now()
+        block_start = _floor(ts, RES_HORA)
+        value = _DOWN if not up else (float(rtt_ms) if rtt_ms is not None else float('nan'))
+        with self._lock:
+            if self._pending >= self.max_buffer:
+                self.total_dropped += 1
+                return
+            buffer.setdefault(key + (block_start,), bytearray()).extend(
+                _SAMPLE.pack(int((ts - block_start).total_seconds()), value))
+            self._pending += 1
+
+    def record(self, tipo, id_entidade, up, rtt_ms=None, ts=None):
+        """Registra uma amostra de um dispositivo (TIPO_DISPOSITIVO) ou IP descoberto (TIPO_IP_DESCOBERTO)."""
+        self._append(self._blocks, (tipo, id_entidade), up, rtt_ms, ts)
+
+    def record_ip(self, ip_str, up, rtt_ms=None, ts=None):
+        """Registra uma amostra de um IP descoberto pelo endereço (callback do pipeline de descoberta)."""
+        self._append(self._ip_samples, (ip_str,), up, rtt_ms, ts)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='availability-recorder', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception:
+                log.exception("AVAILABILITY: Erro ao gravar amostras de disponibilidade.")
+
+    def flush(self):
+        with self._lock:
+            blocks, self._blocks = self._blocks, {}
+            ip_samples, self._ip_samples = self._ip_samples, {}
+            self._pending = 0
+        if not blocks and not ip_samples:
+            return
+        with self.connection_factory() as conn:
+            if not conn:
+                log.error(f"AVAILABILITY: Sem conexão com o banco; {len(blocks) + len(ip_samples)} blocos de amostras descartados.")
+                return
+            cursor = conn.cursor()
+            if ip_samples:
+                self._resolve_ips(cursor, ip_samples, blocks)
+            items = list(blocks.items())
+            for start in range(0, len(items), 1000):
+                chunk = items[start:start + 1000]
+                cursor.execute(f"""
+                    INSERT INTO AmostraDisponibilidade (TipoEntidade, ID_Entidade, InicioBloco, Amostras)
+                    VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))}
+                    ON DUPLICATE KEY UPDATE Amostras = CONCAT(Amostras, VALUES(Amostras)), Consolidado = FALSE
+                """, tuple(v for (tipo, id_entidade, block_start), data in chunk
+                           for v in (tipo, id_entidade, block_start, bytes(data))))
+            conn.commit()
+        written = sum(len(data) // _SAMPLE.size for data in blocks.values())
+        self.total_written += written
+        log.debug(f"AVAILABILITY: {written} amostras gravadas em {len(blocks)} blocos.")
+
+    def _resolve_ips(self, cursor, ip_samples, blocks):
+        ips = list({ip for ip, _block_start in ip_samples})
+        ids = {}
+        for start in range(0, len(ips), 1000):
+            chunk = ips[start:start + 1000]
+            cursor.execute(f"SELECT EnderecoIP, ID_IPDescoberto FROM IPsDescobertos WHERE EnderecoIP IN ({', '.join(['%s'] * len(chunk))})",
+                           tuple(chunk))
+            ids.update(dict(cursor.fetchall()))
+        for (ip, block_start), data in ip_samples.items():
+            if ip in ids:
+                blocks.setdefault((TIPO_IP_DESCOBERTO, ids[ip], block_start), bytearray()).extend(data)
+
+
+_ROLLUP_UPSERT = """
+    INSERT INTO DisponibilidadeRollup (TipoEntidade, ID_Entidade, Resolucao, InicioPeriodo,
+                                       Total, Online, RTTContagem, RTTSoma, RTTMin, RTTMax, Histograma)
+    VALUES {values}
+    ON DUPLICATE KEY UPDATE Total = VALUES(Total), Online = VALUES(Online), RTTContagem = VALUES(RTTContagem),
+        RTTSoma = VALUES(RTTSoma), RTTMin = VALUES(RTTMin), RTTMax = VALUES(RTTMax), Histograma = VALUES(Histograma)
+"""
+
+
+def _upsert_rollups(cursor, rows):
+    for start in range(0, len(rows), 1000):
+        chunk = rows[start:start + 1000]
+        cursor.execute(_ROLLUP_UPSERT.format(values=', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(chunk))),
+                       tuple(v for row in chunk for v in row))
+
+
+def run_rollups(conn, now=None, grace_seconds=120, batch_size=2000):
+    """
+    Consolida os blocos de horas já encerradas (1m e 1h a partir das amostras brutas; 1d a partir
+    dos rollups de 1h dos dias afetados). Os blocos ficam travados (FOR UPDATE) até o commit, para que
+    nenhuma amostra atrasada se perca; blocos que a recebem depois voltam a ser consolidados.
+    Retorna o número de blocos processados.
+    """
+    now = now or datetime.now()
+    closed_before = _floor(now - timedelta(seconds=grace_seconds), RES_HORA)
+    cursor = conn.cursor(dictionary=True)
+    processed = 0
+    while True:
+        cursor.execute("""
+            SELECT TipoEntidade, ID_Entidade, InicioBloco, Amostras FROM AmostraDisponibilidade
+            WHERE Consolidado = FALSE AND InicioBloco < %s
+            ORDER BY InicioBloco LIMIT %s
+            FOR UPDATE
+        """, (closed_before, batch_size))
+        blocks = cursor.fetchall()
+        if not blocks:
+            break
+        rows = []
+        days = {}
+        for block in blocks:
+            minutes = {}
+            hour = _Aggregate()
+            for offset, rtt_ms in _SAMPLE.iter_unpack(bytes(block['Amostras'])):
+                minute = block['InicioBloco'] + timedelta(seconds=offset - offset % 60)
+                minutes.setdefault(minute, _Aggregate()).add_sample(rtt_ms)
+                hour.add_sample(rtt_ms)
+            key = (block['TipoEntidade'], block['ID_Entidade'])
+            for minute, agg in minutes.items():
+                rows.append(key + (RES_MINUTO, minute) + agg.row_values())
+            rows.append(key + (RES_HORA, block['InicioBloco']) + hour.row_values())
+            days.setdefault(_floor(block['InicioBloco'], RES_DIA), set()).add(key)
+        _upsert_rollups(cursor, rows)
+        for day, keys in days.items():
+            _rollup_days(cursor, day, keys)
+        cursor.execute(f"""
+            UPDATE AmostraDisponibilidade SET Consolidado = TRUE
+            WHERE (TipoEntidade, ID_Entidade, InicioBloco) IN ({', '.join(['(%s, %s, %s)'] * len(blocks))})
+        """, tuple(v for b in blocks for v in (b['TipoEntidade'], b['ID_Entidade'], b['InicioBloco'])))
+        conn.commit()
+        processed += len(blocks)
+        if len(blocks) < batch_size:
+            break
+    if processed:
+        log.info(f"AVAILABILITY: {processed} blocos horários consolidados em rollups.")
+    return processed
+
+
+def _rollup_days(cursor, day, keys):
+    """Recalcula o rollup diário das entidades a partir dos rollups de 1h do dia."""
+    keys = list(keys)
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        cursor.execute(f"""
+            SELECT TipoEntidade, ID_Entidade, Total, Online, RTTContagem, RTTSoma, RTTMin, RTTMax, Histograma
+            FROM DisponibilidadeRollup
+            WHERE Resolucao = %s AND InicioPeriodo >= %s AND InicioPeriodo < %s
+              AND (TipoEntidade, ID_Entidade) IN ({', '.join(['(%s, %s)'] * len(chunk))})
+        """, (RES_HORA, day, day + timedelta(days=1), *[v for key in chunk for v in key]))
+        daily = {}
+        for row in cursor.fetchall():
+            daily.setdefault((row['TipoEntidade'], row['ID_Entidade']), _Aggregate()).merge_row(row)
+        _upsert_rollups(cursor, [key + (RES_DIA, day) + agg.row_values() for key, agg in daily.items()])
+
+
+def apply_retention(conn, raw_days=2, minute_days=7, hour_days=90, day_days=730, now=None, batch_size=10000):
+    """Remove amostras brutas já consolidadas e rollups mais antigos que a retenção de cada resolução."""
+    now = now or datetime.now()
+    cursor = conn.cursor()
+    removed = 0
+    policies = [
+        ("DELETE FROM AmostraDisponibilidade WHERE Consolidado = TRUE AND InicioBloco < %s LIMIT %s",
+         (now - timedelta(days=raw_days),)),
+    ]
+    for resolution, days in ((RES_MINUTO, minute_days), (RES_HORA, hour_days), (RES_DIA, day_days)):
+        policies.append(("DELETE FROM DisponibilidadeRollup WHERE Resolucao = %s AND InicioPeriodo < %s LIMIT %s",
+                         (resolution, now - timedelta(days=days))))
+    for sql, params in policies:
+        while True:
+            cursor.execute(sql, params + (batch_size,))
+            conn.commit()
+            removed += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+    if removed:
+        log.info(f"AVAILABILITY: {removed} linhas removidas pela política de retenção.")
+    return removed
+
+
+def split_window(start, end):
+    """
+    Divide [start, end) em segmentos (resolução, início, fim) usando a resolução mais grossa
+    possível: dias inteiros em 1d, horas inteiras em 1h e o restante em 1m.
+    """
+    segments = []
+
+    def split(seg_start, seg_end, levels):
+        if seg_start >= seg_end:
+            return
+        resolution = levels[0]
+        if len(levels) == 1:
+            segments.append((resolution, _floor(seg_start, resolution), seg_end))
+            return
+        inner_start, inner_end = _ceil(seg_start, resolution), _floor(seg_end, resolution)
+        if inner_start >= inner_end:
+            split(seg_start, seg_end, levels[1:])
+            return
+        split(seg_start, inner_start, levels[1:])
+        segments.append((resolution, inner_start, inner_end))
+        split(inner_end, seg_end, levels[1:])
+
+    split(start, end, (RES_DIA, RES_HORA, RES_MINUTO))
+    return segments
+
+
+def availability_summary(cursor, tipo, id_entidade, start, end):
+    """Uptime e percentis de RTT de uma entidade em [start, end), lidos apenas dos rollups."""
+    segments = split_window(start, end)
+    conditions = ' OR '.join(['(Resolucao = %s AND InicioPeriodo >= %s AND InicioPeriodo < %s)'] * len(segments))
+    cursor.execute(f"""
+        SELECT Resolucao, Total, Online, RTTContagem, RTTSoma, RTTMin, RTTMax, Histograma
+        FROM DisponibilidadeRollup
+        WHERE TipoEntidade = %s AND ID_Entidade = %s AND ({conditions})
+    """, (tipo, id_entidade, *[v for segment in segments for v in segment]))
+    agg = _Aggregate()
+    for row in cursor.fetchall():
+        agg.merge_row(row)
+    return agg.summary()
+
+
+def availability_series(cursor, tipo, id_entidade, start, end, resolution):
+    """Série de uptime/RTT médio por período de uma entidade, na resolução pedida."""
+    cursor.execute("""
+        SELECT InicioPeriodo, Total, Online, RTTContagem, RTTSoma
+        FROM DisponibilidadeRollup
+        WHERE TipoEntidade = %s AND ID_Entidade = %s AND Resolucao = %s AND InicioPeriodo >= %s AND InicioPeriodo < %s
+        ORDER BY InicioPeriodo
+    """, (tipo, id_entidade, resolution, _floor(start, resolution), end))
+    return [{
+        "inicio": row['InicioPeriodo'],
+        "uptime_percent": round(100.0 * int(row['Online']) / int(row['Total']), 3) if row['Total'] else None,
+        "rtt_medio_ms": round(float(row['RTTSoma']) / int(row['RTTContagem']), 3) if row['RTTContagem'] else None,
+    } for row in cursor.fetchall()]
+
+
+def daily_uptime_overview(cursor, days):
+    """
+    Uptime diário de todos os dispositivos nos últimos `days` dias (rollups de 1d), no formato compacto
+    usado pelo relatório: lista de dias e, por dispositivo, um array de percentuais (None sem amostras).
+    """
+    today = _floor(datetime.now(), RES_DIA)
+    first_day = today - timedelta(days=days - 1)
+    day_index = {first_day + timedelta(days=i): i for i in range(days)}
+    cursor.execute("""
+        SELECT r.ID_Entidade, r.InicioPeriodo, r.Total, r.Online, d.NomeHost
+        FROM DisponibilidadeRollup r
+        JOIN Dispositivo d ON d.ID_Dispositivo = r.ID_Entidade
+        WHERE r.Resolucao = %s AND r.TipoEntidade = %s AND r.InicioPeriodo >= %s
+    """, (RES_DIA, TIPO_DISPOSITIVO, first_day))
+    devices = {}
+    for row in cursor.fetchall():
+        entry = devices.setdefault(row['ID_Entidade'], {"id": row['ID_Entidade'], "nome": row['NomeHost'],
+                                                        "uptime": [None] * days, "total": 0, "online": 0})
+        index = day_index.get(row['InicioPeriodo'])
+        if index is None or not row['Total']:
+            continue
+        entry["uptime"][index] = round(100.0 * int(row['Online']) / int(row['Total']), 2)
+        entry["total"] += int(row['Total'])
+        entry["online"] += int(row['Online'])
+    result = []
+    for entry in devices.values():
+        entry["uptime_percent"] = round(100.0 * entry.pop("online") / entry["total"], 3) if entry["total"] else None
+        entry.pop("total")
+        result.append(entry)
+    result.sort(key=lambda e: (e["uptime_percent"] is None, e["uptime_percent"] or 0))
+    return {"dias": [day.date().isoformat() for day in sorted(day_index)], "dispositivos": result}
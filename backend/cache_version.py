@@ -0,0 +1,57 @@
+import logging
+
+import mysql.connector
+
+log = logging.getLogger(__name__)
+
+# Chaves de VersaoCache usadas pela aplicação
+VERSAO_DASHBOARD = 'dashboard'
+VERSAO_FABRICANTE = 'Fabricante'
+VERSAO_USUARIO = 'Usuario'   # incrementada por trigger em Usuario (migração 013)
+
+_missing_table_logged = False
+
+
+def _table_missing(err):
+    global _missing_table_logged
+    if getattr(err, 'errno', None) != 1146:
+        return False
+    if not _missing_table_logged:
+        _missing_table_logged = True
+        log.warning("CACHE_VERSION: Tabela VersaoCache não encontrada (aplique a migração 011_versao_cache.sql); "
+                    "os caches em memória dependem apenas da expiração.")
+    return True
+
+
+def bump_cache_version(cursor, name):
+    """
+    Incrementa a versão `name` em VersaoCache. Deve rodar na mesma transação da escrita que muda os dados
+    (de preferência no fim, antes do commit, para segurar o lock da linha pelo menor tempo): os processos
+    que guardam esses dados em memória comparam a versão e descartam a cópia quando ela muda.
+    """
+    try:
+        cursor.execute("""
+            INSERT INTO VersaoCache (Nome, Versao) VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE Versao = Versao + 1
+        """, (name,))
+    except mysql.connector.Error as err:
+        # Sem a tabela (migração pendente) a escrita segue; no MySQL o erro desfaz só este comando.
+        if not _table_missing(err):
+            raise
+
+
+def read_cache_versions(cursor, names):
+    """Retorna {nome: versão} (0 para as que ainda não existem), ou None se a tabela não existir."""
+    placeholders = ", ".join(["%s"] * len(names))
+    try:
+        cursor.execute(f"SELECT Nome, Versao FROM VersaoCache WHERE Nome IN ({placeholders})", tuple(names))
+        rows = cursor.fetchall()
+    except mysql.connector.Error as err:
+        if _table_missing(err):
+            return None
+        raise
+    versions = dict.fromkeys(names, 0)
+    for row in rows:
+        name, version = (row['Nome'], row['Versao']) if isinstance(row, dict) else row
+        versions[name] = int(version)
+    return versions
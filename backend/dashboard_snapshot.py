@@ -0,0 +1,151 @@
+import hashlib
+import json
+import threading
+import time
+import logging
+
+from device_counters import read_status_distribution, read_os_distribution
+
+log = logging.getLogger(__name__)
+
+RECENT_ALERTS_LIMIT = 5
+
+
+def load_dashboard_snapshot(conn):
+    """
+    Calcula todos os agregados do dashboard: totais e distribuições por status e SO a partir dos
+    contadores materializados, e uma consulta em Alerta (alertas novos recentes + total de novos).
+    """
+    cursor = conn.cursor(dictionary=True)
+    # Distribuições lidas dos contadores materializados (algumas dezenas de linhas).
+    status_distribution = read_status_distribution(cursor)
+    os_distribution = read_os_distribution(cursor)
+    status_counts = {row['status_name']: int(row['device_count']) for row in status_distribution}
+    total_devices = sum(status_counts.values())
+
+    # COUNT(*) OVER () é calculado antes do LIMIT: traz o total de alertas novos junto com os recentes.
+    cursor.execute(f"""
+        SELECT
+            a.ID_Alerta,
+            a.DescricaoCustomizada,
+            a.DataHoraCriacao,
+            a.Severidade,
+            ta.Nome AS TipoAlertaNome,
+            d.NomeHost AS DispositivoNomeHost,
+            ipd.EnderecoIP AS IPDescobertoEndereco,
+            COUNT(*) OVER () AS total_novos
+        FROM Alerta a
+        JOIN TipoAlerta ta ON a.ID_TipoAlerta = ta.ID_TipoAlerta
+        LEFT JOIN Dispositivo d ON a.ID_Dispositivo = d.ID_Dispositivo
+        LEFT JOIN IPsDescobertos ipd ON a.ID_IPDescoberto_FK = ipd.ID_IPDescoberto
+        WHERE a.StatusAlerta = 'Novo'
+        ORDER BY a.DataHoraCriacao DESC, a.ID_Alerta DESC
+        LIMIT {RECENT_ALERTS_LIMIT}
+    """)
+    recent_alerts = cursor.fetchall()
+    new_alerts = int(recent_alerts[0]['total_novos']) if recent_alerts else 0
+    for alert in recent_alerts:
+        alert.pop('total_novos', None)
+
+    return {
+        "summary": {
+            "total_devices": total_devices,
+            "online_devices": status_counts.get('Online', 0),
+            "offline_devices": status_counts.get('Offline', 0),
+            "new_alerts": new_alerts,
+        },
+        "os_distribution": os_distribution,
+        "status_distribution": status_distribution,
+        "recent_alerts": recent_alerts,
+    }
+
+
+class DashboardSnapshotCache:
+    """
+    Cache em memória do snapshot do dashboard. O snapshot é recalculado quando a versão `dashboard`
+    em VersaoCache mudou (as escritas em dispositivos e alertas a incrementam na própria transação, em
+    qualquer processo), quando foi invalidado neste processo ou quando passou de `max_age` segundos.
+    Requisições concorrentes num cache inválido esperam um único recálculo.
+
+    `loader()` deve devolver o dict do snapshot (ou levantar exceção em caso de falha);
+    `version_reader()`, se informado, devolve a versão atual (ou None se não for possível lê-la, caso
+    em que vale só `max_age`). A versão é consultada no máximo a cada `version_check_seconds`: entre
+    uma consulta e outra o snapshot e o ETag são servidos sem ir ao banco, então uma escrita feita em
+    outro processo aparece com até esse atraso.
+    """
+
+    def __init__(self, loader, max_age=300.0, version_reader=None, version_check_seconds=3.0):
+        self.loader = loader
+        self.max_age = float(max_age)
+        self.version_reader = version_reader
+        self.version_check_seconds = max(0.0, float(version_check_seconds))
+        self._version = None
+        self._version_checked_at = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._generation = 0
+        self._entry = None   # (snapshot, etag, generation, built_at, versão)
+        self.hits = 0
+        self.misses = 0
+
+    def _read_version(self):
+        if not self.version_reader:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if self._version_checked_at is not None and now - self._version_checked_at < self.version_check_seconds:
+                return self._version
+            # Marca antes de ler: as requisições concorrentes usam a versão anterior em vez de consultar também.
+            self._version_checked_at = now
+        try:
+            version = self.version_reader()
+        except Exception:
+            log.exception("DASHBOARD: Erro ao ler a versão do snapshot; usando apenas a expiração.")
+            version = None
+        with self._lock:
+            self._version = version
+        return version
+
+    def _fresh_entry(self, version):
+        entry = self._entry
+        if entry and entry[2] == self._generation and time.monotonic() - entry[3] < self.max_age \
+                and (version is None or entry[4] == version):
+            return entry
+        return None
+
+    def get(self):
+        """Retorna (snapshot, etag), recalculando se necessário."""
+        version = self._read_version()
+        with self._lock:
+            entry = self._fresh_entry(version)
+            if entry:
+                self.hits += 1
+                return entry[0], entry[1]
+
+        with self._build_lock:
+            with self._lock:
+                entry = self._fresh_entry(version)
+                if entry:
+                    self.hits += 1
+                    return entry[0], entry[1]
+                generation = self._generation
+                self.misses += 1
+
+            # A versão lida antes do cálculo: uma escrita confirmada durante o cálculo força outro na próxima requisição.
+            started = time.perf_counter()
+            snapshot = self.loader()
+            body = json.dumps(snapshot, sort_keys=True, default=str).encode('utf-8')
+            etag = hashlib.sha1(body).hexdigest()
+            log.info(f"DASHBOARD: Snapshot recalculado em {(time.perf_counter() - started) * 1000:.1f} ms.")
+
+            with self._lock:
+                # Se houve invalidação durante o cálculo, o snapshot é servido mas não fica no cache.
+                if generation == self._generation:
+                    self._entry = (snapshot, etag, generation, time.monotonic(), version)
+            return snapshot, etag
+
+    def invalidate(self, reason=None):
+        """Marca o snapshot atual como desatualizado neste processo (os demais seguem a versão no banco)."""
+        with self._lock:
+            self._generation += 1
+        log.debug(f"DASHBOARD: Snapshot invalidado ({reason or 'sem motivo informado'}).")
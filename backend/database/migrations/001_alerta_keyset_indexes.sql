@@ -0,0 +1,5 @@
+-- Índices para a listagem paginada de alertas (GET /api/alerts).
+-- A paginação por cursor ordena por (DataHoraCriacao, ID_Alerta) e os filtros mais comuns são por status.
+ALTER TABLE `Alerta`
+  ADD INDEX `IX_Alerta_Criacao` (`DataHoraCriacao` DESC, `ID_Alerta` DESC),
+  ADD INDEX `IX_Alerta_Status_Criacao` (`StatusAlerta`, `DataHoraCriacao` DESC, `ID_Alerta` DESC);
@@ -0,0 +1,29 @@
+-- Índice de busca de dispositivos (GET /devices?search=...).
+-- Tabela desnormalizada mantida pelo backend nas escritas em Dispositivo; a remoção é feita pela FK.
+CREATE TABLE IF NOT EXISTS `DispositivoBusca` (
+  `ID_Dispositivo` INT NOT NULL,
+  `NomeHost` VARCHAR(255) NULL DEFAULT NULL,
+  `IPPrincipal` VARCHAR(45) NULL DEFAULT NULL,
+  `IPNumerico` INT UNSIGNED NULL DEFAULT NULL COMMENT 'INET_ATON do IPv4 principal, para busca por faixa/CIDR',
+  `MACPrincipal` VARCHAR(17) NULL DEFAULT NULL,
+  `MACNormalizado` CHAR(12) NULL DEFAULT NULL COMMENT 'MAC em hexadecimal maiúsculo sem separadores, para busca por prefixo/OUI',
+  `SistemaOperacionalNome` VARCHAR(100) NULL DEFAULT NULL,
+  `FabricanteNome` VARCHAR(100) NULL DEFAULT NULL,
+  `TipoDispositivoNome` VARCHAR(100) NULL DEFAULT NULL,
+  `TextoBusca` TEXT NULL DEFAULT NULL COMMENT 'Hostname, IP, MAC, SO, fabricante, tipo, descrição, modelo e localização',
+  PRIMARY KEY (`ID_Dispositivo`),
+  INDEX `IX_Busca_NomeHost` (`NomeHost` ASC),
+  INDEX `IX_Busca_IPNumerico` (`IPNumerico` ASC),
+  INDEX `IX_Busca_MACNormalizado` (`MACNormalizado` ASC),
+  FULLTEXT INDEX `FT_Busca_Texto` (`TextoBusca`),
+  CONSTRAINT `FK_Busca_Dispositivo`
+    FOREIGN KEY (`ID_Dispositivo`)
+    REFERENCES `Dispositivo` (`ID_Dispositivo`)
+    ON DELETE CASCADE
+    ON UPDATE CASCADE)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Índice de busca desnormalizado dos dispositivos.';
+
+-- Depois de aplicar, popule a tabela com: flask rebuild-device-search
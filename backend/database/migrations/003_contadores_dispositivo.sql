@@ -0,0 +1,28 @@
+-- Contadores materializados de dispositivos por status e por SO (dashboard e relatório por SO).
+-- Mantidos pelo backend na mesma transação das escritas em Dispositivo.
+CREATE TABLE IF NOT EXISTS `ContadorStatusDispositivo` (
+  `StatusAtual` VARCHAR(50) NOT NULL,
+  `Total` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`StatusAtual`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Quantidade de dispositivos por StatusAtual.';
+
+CREATE TABLE IF NOT EXISTS `ContadorSODispositivo` (
+  `ID_SistemaOperacional` INT NOT NULL COMMENT '0 = dispositivos sem SO definido',
+  `Total` INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (`ID_SistemaOperacional`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Quantidade de dispositivos por sistema operacional.';
+
+-- Carga inicial (equivalente a: flask rebuild-device-counters)
+INSERT INTO `ContadorStatusDispositivo` (`StatusAtual`, `Total`)
+SELECT `StatusAtual`, COUNT(*) FROM `Dispositivo` GROUP BY `StatusAtual`
+ON DUPLICATE KEY UPDATE `Total` = VALUES(`Total`);
+
+INSERT INTO `ContadorSODispositivo` (`ID_SistemaOperacional`, `Total`)
+SELECT COALESCE(`ID_SistemaOperacional`, 0), COUNT(*) FROM `Dispositivo` GROUP BY 1
+ON DUPLICATE KEY UPDATE `Total` = VALUES(`Total`);
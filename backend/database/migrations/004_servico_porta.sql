@@ -0,0 +1,31 @@
+-- Serviços expostos por IP descoberto, uma linha por porta (varredura detalhada Nmap).
+-- Consultados por GET /api/services (ex: quais hosts expõem a porta 3389).
+CREATE TABLE IF NOT EXISTS `ServicoPorta` (
+  `ID_ServicoPorta` BIGINT NOT NULL AUTO_INCREMENT,
+  `ID_IPDescoberto` INT NOT NULL,
+  `EnderecoIP` VARCHAR(45) NOT NULL,
+  `Porta` SMALLINT UNSIGNED NOT NULL,
+  `Protocolo` VARCHAR(3) NOT NULL COMMENT 'tcp ou udp',
+  `Servico` VARCHAR(100) NULL DEFAULT NULL,
+  `Produto` VARCHAR(255) NULL DEFAULT NULL,
+  `Versao` VARCHAR(100) NULL DEFAULT NULL,
+  `Aberta` TINYINT(1) NOT NULL DEFAULT 1 COMMENT '0 = não apareceu na última varredura do IP',
+  `DataPrimeiraDeteccao` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `DataUltimaDeteccao` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`ID_ServicoPorta`),
+  UNIQUE INDEX `UQ_ServicoPorta_IP_Porta` (`ID_IPDescoberto` ASC, `Porta` ASC, `Protocolo` ASC),
+  INDEX `IX_ServicoPorta_Porta` (`Porta` ASC, `Protocolo` ASC, `Aberta` ASC),
+  INDEX `IX_ServicoPorta_Servico` (`Servico` ASC),
+  INDEX `IX_ServicoPorta_Produto` (`Produto` ASC),
+  CONSTRAINT `FK_ServicoPorta_IPDescoberto`
+    FOREIGN KEY (`ID_IPDescoberto`)
+    REFERENCES `IPsDescobertos` (`ID_IPDescoberto`)
+    ON DELETE CASCADE
+    ON UPDATE CASCADE)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Portas abertas e serviços identificados por IP descoberto.';
+
+-- A tabela é preenchida a cada varredura detalhada ("Analisar Detalhes"); o texto antigo de
+-- IPsDescobertos.Portas_Abertas não é convertido. Reanalise os IPs para popular o histórico.
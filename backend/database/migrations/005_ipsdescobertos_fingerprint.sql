@@ -0,0 +1,8 @@
+-- Reanálise diferencial (Nmap): impressão digital das portas TCP abertas na última varredura
+-- completa e a data dessa varredura, usadas para pular hosts inalterados.
+ALTER TABLE `IPsDescobertos`
+  ADD COLUMN `FingerprintServicos` CHAR(40) NULL DEFAULT NULL COMMENT 'SHA-1 das portas TCP abertas na última análise completa',
+  ADD COLUMN `DataUltimaAnaliseCompleta` TIMESTAMP NULL DEFAULT NULL;
+
+-- IPs analisados antes desta migração não têm impressão digital e passam por uma varredura
+-- completa na primeira reanálise diferencial.
@@ -0,0 +1,36 @@
+-- Histórico de disponibilidade (online/offline + RTT) de dispositivos e IPs descobertos.
+-- Amostras brutas ficam em blocos horários compactados; as consultas leem apenas os rollups.
+CREATE TABLE IF NOT EXISTS `AmostraDisponibilidade` (
+  `TipoEntidade` CHAR(1) NOT NULL COMMENT 'D = Dispositivo, I = IPsDescobertos',
+  `ID_Entidade` INT NOT NULL,
+  `InicioBloco` DATETIME NOT NULL COMMENT 'Início da hora do bloco',
+  `Amostras` MEDIUMBLOB NOT NULL COMMENT 'Pares (uint16 segundos na hora, float32 RTT ms; -1 = offline), little-endian',
+  `Consolidado` TINYINT(1) NOT NULL DEFAULT 0 COMMENT '1 = já agregado em DisponibilidadeRollup',
+  PRIMARY KEY (`TipoEntidade`, `ID_Entidade`, `InicioBloco`),
+  INDEX `IX_AmostraDisponibilidade_Pendentes` (`Consolidado` ASC, `InicioBloco` ASC))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Amostras brutas de disponibilidade em blocos horários.';
+
+CREATE TABLE IF NOT EXISTS `DisponibilidadeRollup` (
+  `TipoEntidade` CHAR(1) NOT NULL COMMENT 'D = Dispositivo, I = IPsDescobertos',
+  `ID_Entidade` INT NOT NULL,
+  `Resolucao` INT NOT NULL COMMENT 'Segundos: 60, 3600 ou 86400',
+  `InicioPeriodo` DATETIME NOT NULL,
+  `Total` INT UNSIGNED NOT NULL,
+  `Online` INT UNSIGNED NOT NULL,
+  `RTTContagem` INT UNSIGNED NOT NULL,
+  `RTTSoma` DOUBLE NOT NULL DEFAULT 0,
+  `RTTMin` FLOAT NULL DEFAULT NULL,
+  `RTTMax` FLOAT NULL DEFAULT NULL,
+  `Histograma` VARBINARY(255) NOT NULL COMMENT 'Buckets logarítmicos de RTT: pares (uint8 bucket, uint32 contagem)',
+  PRIMARY KEY (`TipoEntidade`, `ID_Entidade`, `Resolucao`, `InicioPeriodo`),
+  INDEX `IX_DisponibilidadeRollup_Periodo` (`Resolucao` ASC, `TipoEntidade` ASC, `InicioPeriodo` ASC))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Disponibilidade agregada por minuto, hora e dia.';
+
+-- Sem chave estrangeira: a mesma tabela guarda dispositivos e IPs descobertos. Linhas de entidades
+-- excluídas saem pela política de retenção (AVAILABILITY_*_RETENTION_DAYS).
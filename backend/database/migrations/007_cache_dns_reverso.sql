@@ -0,0 +1,13 @@
+-- Cache persistido do DNS reverso (rdns_cache.py): respostas positivas e negativas com validade,
+-- recarregadas na inicialização para que varreduras repetidas não consultem o DNS de novo.
+CREATE TABLE IF NOT EXISTS `CacheDNSReverso` (
+  `EnderecoIP` VARCHAR(45) NOT NULL,
+  `NomeHost` VARCHAR(255) NULL DEFAULT NULL,
+  `Status` VARCHAR(10) NOT NULL COMMENT 'ok, nxdomain, timeout ou erro',
+  `Expira` DATETIME NOT NULL,
+  PRIMARY KEY (`EnderecoIP`),
+  INDEX `IX_CacheDNSReverso_Expira` (`Expira` ASC))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Cache de DNS reverso (PTR) com validade por entrada.';
@@ -0,0 +1,10 @@
+-- Fabricante identificado pelo OUI do MAC de cada IP descoberto (oui_index.py), preenchido na
+-- descoberta ARP e na varredura detalhada. Linhas antigas: flask backfill-oui.
+ALTER TABLE `IPsDescobertos`
+  ADD COLUMN `ID_Fabricante_Estimado` INT NULL DEFAULT NULL COMMENT 'Derivado do OUI do MAC' AFTER `MAC_Address_Estimado`,
+  ADD INDEX `FK_IPDescoberto_Fabricante_idx` (`ID_Fabricante_Estimado` ASC),
+  ADD CONSTRAINT `FK_IPDescoberto_Fabricante`
+    FOREIGN KEY (`ID_Fabricante_Estimado`)
+    REFERENCES `Fabricante` (`ID_Fabricante`)
+    ON DELETE SET NULL
+    ON UPDATE CASCADE;
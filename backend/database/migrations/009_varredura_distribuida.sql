@@ -0,0 +1,43 @@
+-- Varreduras distribuídas (scan_coordinator.py / scan_worker.py): cada rodada divide FaixasIP em shards
+-- que os workers arrendam (lease) pelo banco, com expiração do lease e novas tentativas.
+CREATE TABLE IF NOT EXISTS `VarreduraDistribuida` (
+  `ID_Varredura` BIGINT NOT NULL AUTO_INCREMENT,
+  `Origem` VARCHAR(50) NOT NULL DEFAULT 'Manual',
+  `FaixasIP` TEXT NOT NULL,
+  `Status` VARCHAR(20) NOT NULL DEFAULT 'pendente' COMMENT 'pendente, executando, concluida ou falhou',
+  `TotalShards` INT NOT NULL DEFAULT 0,
+  `TotalAlvos` BIGINT NOT NULL DEFAULT 0,
+  `DataCriacao` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `DataConclusao` TIMESTAMP NULL DEFAULT NULL,
+  PRIMARY KEY (`ID_Varredura`),
+  INDEX `IX_VarreduraDistribuida_Status` (`Status` ASC))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Rodadas de varredura de descoberta distribuídas entre workers.';
+
+CREATE TABLE IF NOT EXISTS `ShardVarredura` (
+  `ID_Shard` BIGINT NOT NULL AUTO_INCREMENT,
+  `ID_Varredura` BIGINT NOT NULL,
+  `Faixa` VARCHAR(100) NOT NULL COMMENT 'Intervalo inicio-fim no formato de FaixasIP',
+  `TotalAlvos` INT NOT NULL,
+  `Status` VARCHAR(20) NOT NULL DEFAULT 'pendente' COMMENT 'pendente, executando, concluida ou falhou',
+  `Tentativas` INT NOT NULL DEFAULT 0,
+  `Trabalhador` VARCHAR(100) NULL DEFAULT NULL,
+  `LeaseAte` DATETIME NULL DEFAULT NULL,
+  `DataInicio` DATETIME NULL DEFAULT NULL,
+  `DataConclusao` DATETIME NULL DEFAULT NULL,
+  `HostsAtivos` INT NULL DEFAULT NULL,
+  `UltimoErro` VARCHAR(500) NULL DEFAULT NULL,
+  PRIMARY KEY (`ID_Shard`),
+  INDEX `IX_ShardVarredura_Status_Lease` (`Status` ASC, `LeaseAte` ASC),
+  INDEX `fk_ShardVarredura_Varredura_idx` (`ID_Varredura` ASC),
+  CONSTRAINT `fk_ShardVarredura_Varredura`
+    FOREIGN KEY (`ID_Varredura`)
+    REFERENCES `VarreduraDistribuida` (`ID_Varredura`)
+    ON DELETE CASCADE
+    ON UPDATE NO ACTION)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Fila de shards de varredura arrendados aos workers.';
@@ -0,0 +1,5 @@
+-- Tipos de alerta usados pelo monitor de disponibilidade (liveness_monitor.py) nas transições
+-- Online/Offline. Sem eles o monitor apenas registra um aviso no log e não gera alertas.
+INSERT IGNORE INTO `TipoAlerta` (`Nome`, `Descricao`, `SeveridadePadrao`) VALUES
+  ('Dispositivo Offline', 'Um dispositivo do inventário ficou offline.', 'Alta'),
+  ('Dispositivo Online', 'Um dispositivo que estava offline voltou a ficar online.', 'Informativo');
@@ -0,0 +1,12 @@
+-- Versões dos dados mantidos em cache na memória dos processos (cache_version.py). As escritas
+-- incrementam a versão na própria transação; os caches (snapshot do dashboard, lista de fabricantes)
+-- comparam a versão e se descartam quando ela muda, inclusive quando a escrita veio de outro processo.
+CREATE TABLE IF NOT EXISTS `VersaoCache` (
+  `Nome` VARCHAR(50) NOT NULL,
+  `Versao` BIGINT NOT NULL DEFAULT 0,
+  `DataAtualizacao` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`Nome`))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Versões dos dados em cache, incrementadas a cada escrita que os altera.';
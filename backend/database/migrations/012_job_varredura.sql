@@ -0,0 +1,36 @@
+-- Estado dos jobs de varredura em segundo plano (job_store.py): descobertas manuais e varreduras
+-- detalhadas. O worker que executa o job grava o progresso e os eventos do stream SSE aqui, para que
+-- os outros workers web respondam ao status e ao /events do mesmo job.
+CREATE TABLE IF NOT EXISTS `JobVarredura` (
+  `ID_Job` CHAR(32) NOT NULL,
+  `Tipo` VARCHAR(20) NOT NULL COMMENT 'descoberta ou detalhada',
+  `Origem` VARCHAR(50) NOT NULL DEFAULT 'Manual',
+  `Status` VARCHAR(20) NOT NULL DEFAULT 'pendente' COMMENT 'pendente, executando, concluida ou falhou',
+  `Estado` MEDIUMTEXT NULL COMMENT 'JSON: progresso (descoberta) ou estado de cada alvo (detalhada)',
+  `SeqEstado` INT NOT NULL DEFAULT 0 COMMENT 'Número do evento de progresso no stream SSE',
+  `Erro` VARCHAR(500) NULL DEFAULT NULL,
+  `DataCriacao` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `DataAtualizacao` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `DataConclusao` TIMESTAMP NULL DEFAULT NULL,
+  PRIMARY KEY (`ID_Job`),
+  INDEX `IX_JobVarredura_Conclusao` (`DataConclusao` ASC))
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Jobs de varredura em segundo plano, consultáveis a partir de qualquer worker.';
+
+CREATE TABLE IF NOT EXISTS `EventoJobVarredura` (
+  `ID_Job` CHAR(32) NOT NULL,
+  `Seq` INT NOT NULL,
+  `Tipo` VARCHAR(20) NOT NULL COMMENT 'host ou done',
+  `Dados` TEXT NOT NULL COMMENT 'JSON do evento SSE',
+  PRIMARY KEY (`ID_Job`, `Seq`),
+  CONSTRAINT `fk_EventoJobVarredura_Job`
+    FOREIGN KEY (`ID_Job`)
+    REFERENCES `JobVarredura` (`ID_Job`)
+    ON DELETE CASCADE
+    ON UPDATE NO ACTION)
+ENGINE = InnoDB
+DEFAULT CHARACTER SET = utf8mb4
+COLLATE = utf8mb4_unicode_ci
+COMMENT = 'Eventos do stream SSE dos jobs de descoberta (hosts encontrados e fim).';
@@ -0,0 +1,13 @@
+-- Versão 'Usuario' em VersaoCache (cache_version.py), incrementada por trigger a cada alteração ou
+-- remoção em Usuario — inclusive edições feitas direto no banco. Cada worker web compara essa versão
+-- (a cada AUTH_USER_VERSION_CHECK_SECONDS) e esvazia o cache de autenticação quando ela muda, então um
+-- usuário desativado deixa de ser aceito em todos os processos. Requer a migração 011_versao_cache.sql.
+DROP TRIGGER IF EXISTS `TRG_Usuario_Versao_Update`;
+CREATE TRIGGER `TRG_Usuario_Versao_Update` AFTER UPDATE ON `Usuario` FOR EACH ROW
+  INSERT INTO `VersaoCache` (`Nome`, `Versao`) VALUES ('Usuario', 1)
+  ON DUPLICATE KEY UPDATE `Versao` = `Versao` + 1;
+
+DROP TRIGGER IF EXISTS `TRG_Usuario_Versao_Delete`;
+CREATE TRIGGER `TRG_Usuario_Versao_Delete` AFTER DELETE ON `Usuario` FOR EACH ROW
+  INSERT INTO `VersaoCache` (`Nome`, `Versao`) VALUES ('Usuario', 1)
+  ON DUPLICATE KEY UPDATE `Versao` = `Versao` + 1;
@@ -0,0 +1,241 @@
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+import mysql.connector
+
+log = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(mysql.connector.Error):
+    """Nenhuma conexão ficou livre dentro do tempo de espera do pool."""
+
+
+# Lock wait timeout e deadlock: a transação foi desfeita e pode ser repetida.
+_RETRYABLE_ERRNOS = (1205, 1213)
+
+
+def is_transient_db_error(err):
+    """
+    True se a falha é do acesso ao banco (conexão perdida/recusada, pool esgotado, deadlock) e a mesma
+    escrita pode dar certo depois; False para erros dos próprios dados (FK, coluna longa demais etc.).
+    """
+    if isinstance(err, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError,
+                        PoolTimeoutError)):
+        return True
+    return getattr(err, 'errno', None) in _RETRYABLE_ERRNOS
+
+
+class PooledConnection:
+    """
+    Conexão emprestada do pool. Repassa tudo para a conexão MySQL real; `close()` devolve a
+    conexão ao pool (fechando os cursores abertos e desfazendo transações pendentes).
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._cursors = []
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        self._cursors.append(cursor)
+        return cursor
+
+    def is_connected(self):
+        return self._raw is not None and self._raw.is_connected()
+
+    def close(self):
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self._cursors = []
+        self._pool._release(raw, self._created_at)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise mysql.connector.errors.OperationalError(msg="Conexão já devolvida ao pool.")
+        return getattr(self._raw, name)
+
+
+class ConnectionPool:
+    """
+    Pool de conexões MySQL compartilhado pelo processo (rotas Flask, scheduler e workers de varredura).
+    - `size`: número máximo de conexões abertas;
+    - `wait_timeout`: tempo máximo (s) esperando uma conexão livre antes de `PoolTimeoutError`;
+    - `recycle_seconds`: idade máxima de uma conexão antes de ser descartada e recriada;
+    - `health_check_idle`: conexões paradas há mais que isso (s) são testadas com ping no checkout.
+    """
+
+    def __init__(self, connect_kwargs, size=10, wait_timeout=5.0, recycle_seconds=1800, health_check_idle=30.0):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.size = max(1, int(size))
+        self.wait_timeout = float(wait_timeout)
+        self.recycle_seconds = float(recycle_seconds)
+        self.health_check_idle = float(health_check_idle)
+        self._idle = []   # [(raw, created_at, released_at)]
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._counters = {
+            "created": 0, "checkouts": 0, "timeouts": 0,
+            "recycled": 0, "health_check_failures": 0, "dedicated": 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Cria o pool com as credenciais DB_* e os parâmetros DB_POOL_* do ambiente."""
+        return cls(
+            connect_kwargs={
+                "host": os.getenv('DB_HOST'),
+                "user": os.getenv('DB_USER'),
+                "password": os.getenv('DB_PASSWORD'),
+                "database": os.getenv('DB_NAME'),
+            },
+            size=os.getenv('DB_POOL_SIZE', '10'),
+            wait_timeout=os.getenv('DB_POOL_WAIT_TIMEOUT', '5'),
+            recycle_seconds=os.getenv('DB_POOL_RECYCLE_SECONDS', '1800'),
+            health_check_idle=os.getenv('DB_POOL_HEALTH_CHECK_IDLE', '30'),
+        )
+
+    def acquire(self):
+        """Empresta uma conexão saudável do pool, criando uma nova se houver vaga."""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            candidate = None
+            with self._cond:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeoutError(msg=f"Timeout de {self.wait_timeout}s aguardando conexão do pool (tamanho {self.size}).")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    candidate = self._idle.pop()
+                else:
+                    self._open += 1
+                self._in_use += 1
+
+            if candidate is None:
+                return self._create()
+            # O health check (ping) é feito fora do lock para não travar os outros checkouts.
+            raw, created_at, released_at = candidate
+            if self._is_usable(raw, created_at, released_at):
+                with self._cond:
+                    self._counters["checkouts"] += 1
+                return PooledConnection(self, raw, created_at)
+            with self._cond:
+                self._in_use -= 1
+                self._discard(raw)
+                self._cond.notify()
+
+    def _create(self):
+        try:
+            raw = mysql.connector.connect(**self.connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters["created"] += 1
+            self._counters["checkouts"] += 1
+        log.debug('DB_POOL: Nova conexão com o MySQL criada.')
+        return PooledConnection(self, raw, time.monotonic())
+
+    def _is_usable(self, raw, created_at, released_at):
+        now = time.monotonic()
+        if now - created_at > self.recycle_seconds:
+            with self._cond:
+                self._counters["recycled"] += 1
+            return False
+        if now - released_at > self.health_check_idle:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                with self._cond:
+                    self._counters["health_check_failures"] += 1
+                log.warning("DB_POOL: Conexão ociosa falhou no health check; descartando.")
+                return False
+        return True
+
+    def _discard(self, raw):
+        self._open -= 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _release(self, raw, created_at):
+        healthy = True
+        try:
+            # Desfaz a transação pendente para a próxima requisição não herdar locks nem um snapshot antigo.
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            healthy = False
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, created_at, time.monotonic()))
+            else:
+                self._discard(raw)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager que empresta uma conexão e a devolve ao pool ao sair (com rollback em caso de erro)."""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            conn.close()
+
+    def connect_dedicated(self):
+        """
+        Abre uma conexão própria, fora do pool (não conta em `size`), para quem a segura por muito tempo,
+        como o envio em fluxo de listas grandes. Quem chama a fecha.
+        """
+        raw = mysql.connector.connect(**self.connect_kwargs)
+        with self._cond:
+            self._counters["dedicated"] += 1
+        return raw
+
+    def stats(self):
+        """Retorna as estatísticas atuais do pool."""
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                **self._counters,
+            }
+
+    def close_all(self):
+        """Fecha as conexões ociosas (usado no encerramento do processo)."""
+        with self._cond:
+            while self._idle:
+                raw, _created_at, _released_at = self._idle.pop()
+                self._discard(raw)
@@ -0,0 +1,132 @@
+import logging
+
+from cache_version import bump_cache_version, VERSAO_DASHBOARD
+
+log = logging.getLogger(__name__)
+
+# Dispositivos sem SO são contados na linha de ID 0 (a chave primária não aceita NULL).
+SEM_SO = 0
+
+
+def _os_key(id_sistema_operacional):
+    return id_sistema_operacional if id_sistema_operacional is not None else SEM_SO
+
+
+_STATUS_SQL = """
+    INSERT INTO ContadorStatusDispositivo (StatusAtual, Total) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE Total = Total + VALUES(Total)
+"""
+_OS_SQL = """
+    INSERT INTO ContadorSODispositivo (ID_SistemaOperacional, Total) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE Total = Total + VALUES(Total)
+"""
+
+
+def update_device_counters(cursor, old=None, new=None):
+    """
+    Ajusta os contadores materializados na mesma transação da escrita em Dispositivo.
+    `old`/`new` são dicts com StatusAtual e ID_SistemaOperacional do dispositivo antes e depois
+    da escrita (None para inserção/remoção). Para evitar corrida, `old` deve ter sido lido com
+    SELECT ... FOR UPDATE.
+    """
+    for sql, key in ((_STATUS_SQL, lambda row: row.get('StatusAtual')),
+                     (_OS_SQL, lambda row: _os_key(row.get('ID_SistemaOperacional')))):
+        old_key = key(old) if old else None
+        new_key = key(new) if new else None
+        if old and new and old_key == new_key:
+            continue
+        if old:
+            cursor.execute(sql, (old_key, -1))
+        if new:
+            cursor.execute(sql, (new_key, 1))
+
+
+def _expected_counts(cursor):
+    cursor.execute("SELECT StatusAtual, COUNT(*) FROM Dispositivo GROUP BY StatusAtual")
+    status = {row[0]: int(row[1]) for row in cursor.fetchall()}
+    cursor.execute("SELECT COALESCE(ID_SistemaOperacional, %s), COUNT(*) FROM Dispositivo GROUP BY 1", (SEM_SO,))
+    os_counts = {int(row[0]): int(row[1]) for row in cursor.fetchall()}
+    return status, os_counts
+
+
+def _stored_counts(cursor):
+    cursor.execute("SELECT StatusAtual, Total FROM ContadorStatusDispositivo")
+    status = {row[0]: int(row[1]) for row in cursor.fetchall() if int(row[1]) != 0}
+    cursor.execute("SELECT ID_SistemaOperacional, Total FROM ContadorSODispositivo")
+    os_counts = {int(row[0]): int(row[1]) for row in cursor.fetchall() if int(row[1]) != 0}
+    return status, os_counts
+
+
+def verify_device_counters(conn):
+    """Compara os contadores com a tabela Dispositivo. Retorna a lista de divergências (vazia se ok)."""
+    cursor = conn.cursor()
+    expected_status, expected_os = _expected_counts(cursor)
+    stored_status, stored_os = _stored_counts(cursor)
+    divergences = []
+    for tabela, expected, stored in (("status", expected_status, stored_status), ("so", expected_os, stored_os)):
+        for key in sorted(set(expected) | set(stored), key=str):
+            if expected.get(key, 0) != stored.get(key, 0):
+                divergences.append({"contador": tabela, "chave": key,
+                                    "esperado": expected.get(key, 0), "armazenado": stored.get(key, 0)})
+    return divergences
+
+
+def rebuild_device_counters(conn):
+    """Recalcula os contadores a partir de Dispositivo, numa única transação."""
+    cursor = conn.cursor()
+    # Trava as linhas de Dispositivo para nenhuma escrita concorrente ficar de fora da contagem.
+    cursor.execute("SELECT ID_Dispositivo FROM Dispositivo FOR UPDATE")
+    cursor.fetchall()
+    cursor.execute("DELETE FROM ContadorStatusDispositivo")
+    cursor.execute("DELETE FROM ContadorSODispositivo")
+    cursor.execute("""
+        INSERT INTO ContadorStatusDispositivo (StatusAtual, Total)
+        SELECT StatusAtual, COUNT(*) FROM Dispositivo GROUP BY StatusAtual
+    """)
+    cursor.execute("""
+        INSERT INTO ContadorSODispositivo (ID_SistemaOperacional, Total)
+        SELECT COALESCE(ID_SistemaOperacional, %s), COUNT(*) FROM Dispositivo GROUP BY 1
+    """, (SEM_SO,))
+    bump_cache_version(cursor, VERSAO_DASHBOARD)
+    conn.commit()
+    log.info("DEVICE_COUNTERS: Contadores de status e SO reconstruídos.")
+
+
+def read_status_distribution(cursor):
+    """Distribuição de dispositivos por status, lida dos contadores (dicts status_name/device_count)."""
+    cursor.execute("""
+        SELECT StatusAtual AS status_name, Total AS device_count
+        FROM ContadorStatusDispositivo
+        WHERE Total > 0
+        ORDER BY Total DESC
+    """)
+    return cursor.fetchall()
+
+
+def read_os_distribution(cursor, with_family=False):
+    """
+    Distribuição de dispositivos por SO, lida dos contadores.
+    Sem `with_family`: dicts os_name/device_count (dashboard); com: o formato do relatório por SO.
+    """
+    if with_family:
+        cursor.execute("""
+            SELECT COALESCE(so.Nome, 'Não Especificado') AS SistemaOperacionalNome,
+                   COALESCE(so.Familia, 'Desconhecida') AS SistemaOperacionalFamilia,
+                   CAST(SUM(c.Total) AS SIGNED) AS TotalDispositivos
+            FROM ContadorSODispositivo c
+            LEFT JOIN SistemaOperacional so ON c.ID_SistemaOperacional = so.ID_SistemaOperacional
+            WHERE c.Total > 0
+            GROUP BY so.Nome, so.Familia
+            ORDER BY TotalDispositivos DESC, SistemaOperacionalNome ASC
+        """)
+    else:
+        cursor.execute("""
+            SELECT COALESCE(so.Nome, 'Não Especificado') AS os_name,
+                   CAST(SUM(c.Total) AS SIGNED) AS device_count
+            FROM ContadorSODispositivo c
+            LEFT JOIN SistemaOperacional so ON c.ID_SistemaOperacional = so.ID_SistemaOperacional
+            WHERE c.Total > 0
+            GROUP BY so.Nome
+            ORDER BY device_count DESC
+        """)
+    return cursor.fetchall()
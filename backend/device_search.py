@@ -0,0 +1,170 @@
+import ipaddress
+import re
+import logging
+
+log = logging.getLogger(__name__)
+
+# Tamanho mínimo de token indexado pelo FULLTEXT do InnoDB (innodb_ft_min_token_size).
+FT_MIN_TOKEN_SIZE = 3
+# Caracteres com significado especial no modo BOOLEAN do MATCH ... AGAINST.
+_FT_OPERATORS = re.compile(r'[+\-<>()~*"@]+')
+_IP_PREFIX = re.compile(r'^\d{1,3}(\.\d{1,3}){0,3}\.?$')
+# Com ':' bastam dois octetos; com '-' são exigidos três, para hostnames como 'ad-dc' continuarem sendo texto.
+_MAC_PREFIX = re.compile(r'^[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){1,5}:?$'
+                         r'|^[0-9A-Fa-f]{2}(-[0-9A-Fa-f]{2}){2,5}-?$'
+                         r'|^[0-9A-Fa-f]{12}$')
+
+# Monta (ou atualiza) a linha de busca de dispositivos a partir das tabelas normalizadas.
+# {interface_filter}/{device_filter} restringem a um dispositivo; ficam vazios na reconstrução completa.
+_REFRESH_SQL = """
+    INSERT INTO DispositivoBusca (ID_Dispositivo, NomeHost, IPPrincipal, IPNumerico, MACPrincipal, MACNormalizado,
+                                  SistemaOperacionalNome, FabricanteNome, TipoDispositivoNome, TextoBusca)
+    SELECT d.ID_Dispositivo, d.NomeHost, rede.IPPrincipal, INET_ATON(rede.IPPrincipal),
+           rede.MACPrincipal, REPLACE(REPLACE(UPPER(rede.MACPrincipal), ':', ''), '-', ''),
+           so.Nome, fab.Nome, td.Nome,
+           CONCAT_WS(' ', d.NomeHost, rede.IPPrincipal, rede.MACPrincipal, so.Nome, fab.Nome, td.Nome,
+                     d.Descricao, d.Modelo, d.LocalizacaoFisica)
+    FROM Dispositivo d
+    LEFT JOIN (
+        SELECT ifr.ID_Dispositivo,
+               MIN(ifr.EnderecoMAC) AS MACPrincipal,
+               MIN(CASE WHEN ip.Principal = TRUE THEN ip.EnderecoIPValor END) AS IPPrincipal
+        FROM InterfaceRede ifr
+        LEFT JOIN EnderecoIP ip ON ifr.ID_Interface = ip.ID_Interface
+        {interface_filter}
+        GROUP BY ifr.ID_Dispositivo
+    ) rede ON rede.ID_Dispositivo = d.ID_Dispositivo
+    LEFT JOIN SistemaOperacional so ON d.ID_SistemaOperacional = so.ID_SistemaOperacional
+    LEFT JOIN Fabricante fab ON d.ID_Fabricante = fab.ID_Fabricante
+    LEFT JOIN TipoDispositivo td ON d.ID_TipoDispositivo = td.ID_TipoDispositivo
+    {device_filter}
+    ON DUPLICATE KEY UPDATE
+        NomeHost = VALUES(NomeHost), IPPrincipal = VALUES(IPPrincipal), IPNumerico = VALUES(IPNumerico),
+        MACPrincipal = VALUES(MACPrincipal), MACNormalizado = VALUES(MACNormalizado),
+        SistemaOperacionalNome = VALUES(SistemaOperacionalNome), FabricanteNome = VALUES(FabricanteNome),
+        TipoDispositivoNome = VALUES(TipoDispositivoNome), TextoBusca = VALUES(TextoBusca)
+"""
+
+
+def refresh_device_search(cursor, device_id):
+    """
+    Atualiza o índice de busca de um dispositivo. Deve ser chamada na mesma transação da escrita
+    em Dispositivo/InterfaceRede/EnderecoIP (a remoção é propagada pela FK com ON DELETE CASCADE).
+    """
+    cursor.execute(_REFRESH_SQL.format(
+        interface_filter="WHERE ifr.ID_Dispositivo = %s",
+        device_filter="WHERE d.ID_Dispositivo = %s",
+    ), (device_id, device_id))
+
+
+def rebuild_device_search(conn):
+    """Reconstrói todo o índice de busca a partir das tabelas normalizadas. Retorna o total de linhas."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM DispositivoBusca")
+    cursor.execute(_REFRESH_SQL.format(interface_filter="", device_filter=""))
+    conn.commit()
+    cursor.execute("SELECT COUNT(*) FROM DispositivoBusca")
+    total = cursor.fetchone()[0]
+    log.info(f"DEVICE_SEARCH: Índice de busca reconstruído com {total} dispositivos.")
+    return total
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _ip_prefix_range(term):
+    """Converte um prefixo de IPv4 ('192.168.1' ou '10.') no intervalo numérico que ele cobre."""
+    octets = [int(o) for o in term.rstrip('.').split('.')]
+    if any(o > 255 for o in octets):
+        return None
+    low = octets + [0] * (4 - len(octets))
+    high = octets + [255] * (4 - len(octets))
+    return (int(ipaddress.IPv4Address('.'.join(map(str, low)))),
+            int(ipaddress.IPv4Address('.'.join(map(str, high)))))
+
+
+def parse_search_term(term):
+    """
+    Classifica o termo de busca:
+    - ('ipv4_range', (inicio, fim)) para IPv4 exato, prefixo com ponto ('192.168.') ou CIDR;
+    - ('ip_exact', ip) para IPv6 (ou CIDR IPv6, buscado pelo endereço de rede);
+    - ('mac_prefix', 'AABBCC') para MAC completo ou prefixo ('aa:bb', 'aa-bb-cc', 'aabbccddeeff');
+    - ('text', [tokens]) para o restante (hostname, SO, fabricante, modelo etc.).
+    """
+    term = term.strip()
+    if '/' in term:
+        try:
+            network = ipaddress.ip_network(term, strict=False)
+            if network.version == 4:
+                return 'ipv4_range', (int(network.network_address), int(network.broadcast_address))
+            return 'ip_exact', str(network.network_address)
+        except ValueError:
+            pass
+    if '.' in term and _IP_PREFIX.match(term):
+        ip_range = _ip_prefix_range(term)
+        if ip_range:
+            return 'ipv4_range', ip_range
+    if ':' in term:
+        try:
+            return 'ip_exact', str(ipaddress.IPv6Address(term))
+        except ValueError:
+            pass
+    if _MAC_PREFIX.match(term):
+        return 'mac_prefix', re.sub(r'[:\-]', '', term).upper()
+    tokens = [t for t in _FT_OPERATORS.sub(' ', term).split() if t]
+    return 'text', tokens
+
+
+def build_search_query(term, limit, offset):
+    """Monta (sql, params) da busca ranqueada no índice DispositivoBusca."""
+    kind, value = parse_search_term(term)
+    select_cols = """
+        b.ID_Dispositivo, d.NomeHost, d.StatusAtual, d.DataUltimaVarredura,
+        b.IPPrincipal, b.MACPrincipal, b.SistemaOperacionalNome, b.FabricanteNome, b.TipoDispositivoNome
+    """
+    params = []
+    if kind == 'ipv4_range':
+        where = "b.IPNumerico BETWEEN %s AND %s"
+        order = "b.IPNumerico ASC"
+        params.extend(value)
+    elif kind == 'ip_exact':
+        where = "b.IPPrincipal = %s"
+        order = "b.NomeHost ASC"
+        params.append(value)
+    elif kind == 'mac_prefix':
+        where = "b.MACNormalizado LIKE %s"
+        order = "b.MACNormalizado ASC"
+        params.append(value + '%')
+        if '-' in term:
+            # 'ad-dc-01' pode ser um hostname: casa também pelo prefixo de NomeHost.
+            where = f"({where} OR b.NomeHost LIKE %s)"
+            params.append(_escape_like(term.strip()) + '%')
+    else:
+        ft_tokens = [t for t in value if len(t) >= FT_MIN_TOKEN_SIZE]
+        host_prefix = _escape_like(term.strip()) + '%'
+        if ft_tokens:
+            # Todos os termos obrigatórios e com casamento por prefixo: "srv web" -> "+srv* +web*".
+            ft_query = ' '.join(f'+{t}*' for t in ft_tokens)
+            select_cols += ", MATCH(b.TextoBusca) AGAINST (%s IN BOOLEAN MODE) AS Relevancia"
+            where = "MATCH(b.TextoBusca) AGAINST (%s IN BOOLEAN MODE)"
+            params.extend([ft_query, ft_query])
+            # Hostname exato ou com o mesmo prefixo sobe no ranking.
+            order = "(b.NomeHost = %s) DESC, (b.NomeHost LIKE %s) DESC, Relevancia DESC, b.NomeHost ASC"
+            params.extend([term.strip(), host_prefix])
+        else:
+            # Termos curtos demais para o FULLTEXT: usa o índice de NomeHost por prefixo.
+            where = "b.NomeHost LIKE %s"
+            order = "b.NomeHost ASC"
+            params.append(host_prefix)
+
+    sql = f"""
+        SELECT {select_cols}
+        FROM DispositivoBusca b
+        JOIN Dispositivo d ON d.ID_Dispositivo = b.ID_Dispositivo
+        WHERE {where}
+        ORDER BY {order}
+        LIMIT %s OFFSET %s
+    """
+    params.extend([limit, offset])
+    return sql, tuple(params)
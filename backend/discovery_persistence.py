@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+import logging
+
+from cache_version import bump_cache_version, VERSAO_DASHBOARD
+from db_pool import is_transient_db_error
+from oui_index import fabricante_ids
+
+log = logging.getLogger(__name__)
+
+TIPO_ALERTA_NOVO_IP = 'Novo IP Descoberto'
+
+
+class DiscoveredIpBatchWriter:
+    """
+    Camada de persistência em lote para os IPs encontrados na descoberta.
+    Acumula os resultados e grava cada lote com um único INSERT ... ON DUPLICATE KEY UPDATE
+    em IPsDescobertos, criando na mesma transação os alertas dos IPs que são realmente novos.
+    Um lote é gravado quando chega a `batch_size` IPs ou quando o mais antigo espera `flush_seconds`
+    (verificado também por uma thread, para que um lote parcial não fique parado quando a varredura
+    deixa de encontrar hosts). `close()` encerra essa thread e grava o que estiver pendente.
+
+    `connection_factory()` deve ser um context manager que entrega uma conexão do pool
+    (ou None em caso de falha) e a devolve ao sair. Após o commit de cada lote são chamados
+    `on_host_written(ip, hostname, rtt_ms)` para cada IP do lote e `on_batch_written(total, novos)`.
+    Com `oui` (OuiIndex), o fabricante dos IPs que chegam com MAC (varredura ARP) é gravado em
+    ID_Fabricante_Estimado.
+
+    Um lote que falha por indisponibilidade do banco é repetido uma vez após `retry_seconds`; se falhar
+    de novo (ou por erro nos dados) é descartado e contado em `total_lost`.
+    """
+
+    def __init__(self, connection_factory, batch_size=500, flush_seconds=2.0, scan_source="Desconhecida",
+                 on_batch_written=None, on_host_written=None, oui=None, retry_seconds=1.0):
+        self.connection_factory = connection_factory
+        self.oui = oui
+        self.on_batch_written = on_batch_written
+        self.on_host_written = on_host_written
+        self.retry_seconds = float(retry_seconds)
+        self.batch_size = max(1, int(batch_size))
+        self.flush_seconds = float(flush_seconds)
+        self.scan_source = scan_source
+        self._buffer = {}
+        self._buffer_started = None
+        self._lock = threading.Lock()
+        self._tipo_alerta = None
+        self._stop = threading.Event()
+        self._timer = None
+        self.total_written = 0
+        self.total_new = 0
+        self.total_lost = 0
+
+    @classmethod
+    def from_env(cls, connection_factory, **kwargs):
+        """Cria o writer lendo DISCOVERY_DB_BATCH_SIZE e DISCOVERY_DB_FLUSH_SECONDS."""
+        return cls(
+            connection_factory,
+            batch_size=os.getenv('DISCOVERY_DB_BATCH_SIZE', '500'),
+            flush_seconds=os.getenv('DISCOVERY_DB_FLUSH_SECONDS', '2'),
+            **kwargs
+        )
+
+    def add(self, ip_str, hostname=None, rtt_ms=None, mac=None):
+        """Enfileira um IP ativo (com o MAC, se veio da varredura ARP); grava o lote quando ele enche ou fica velho demais."""
+        batch = None
+        with self._lock:
+            self._buffer[ip_str] = (hostname, mac, rtt_ms)
+            if self._buffer_started is None:
+                self._buffer_started = time.monotonic()
+            if self._timer is None and not self._stop.is_set():
+                self._timer = threading.Thread(target=self._run, name=f'persist-flush-{self.scan_source}', daemon=True)
+                self._timer.start()
+            if len(self._buffer) >= self.batch_size or time.monotonic() - self._buffer_started >= self.flush_seconds:
+                batch = self._take_buffer()
+        if batch:
+            self._write_batch(*batch)
+
+    def flush(self):
+        """Grava o que estiver pendente no buffer."""
+        with self._lock:
+            batch = self._take_buffer() if self._buffer else None
+        if batch:
+            self._write_batch(*batch)
+
+    def close(self):
+        """Encerra a thread de gravação por tempo e grava o que estiver pendente (fim da varredura)."""
+        self._stop.set()
+        if self._timer:
+            self._timer.join(timeout=self.retry_seconds + 30)
+        self.flush()
+
+    def _run(self):
+        # Confere a idade do lote em frações de flush_seconds: o atraso além do prazo fica pequeno.
+        interval = min(max(self.flush_seconds / 4, 0.05), 1.0)
+        while not self._stop.wait(interval):
+            with self._lock:
+                due = self._buffer_started is not None and time.monotonic() - self._buffer_started >= self.flush_seconds
+                batch = self._take_buffer() if due else None
+            if batch:
+                try:
+                    self._write_batch(*batch)
+                except Exception:
+                    log.exception(f"PERSIST_BATCH ({self.scan_source}): Erro na gravação do lote por tempo.")
+
+    def _take_buffer(self):
+        batch = [(ip_str, hostname, mac) for ip_str, (hostname, mac, _rtt) in self._buffer.items()]
+        rtts = {ip_str: rtt_ms for ip_str, (_hostname, _mac, rtt_ms) in self._buffer.items()}
+        self._buffer = {}
+        self._buffer_started = None
+        return batch, rtts
+
+    def _get_tipo_alerta(self, cursor):
+        if self._tipo_alerta is None:
+            cursor.execute("SELECT ID_TipoAlerta, SeveridadePadrao FROM TipoAlerta WHERE Nome = %s", (TIPO_ALERTA_NOVO_IP,))
+            self._tipo_alerta = cursor.fetchone() or {}
+        return self._tipo_alerta
+
+    def _write_batch(self, batch, rtts):
+        for attempt in (1, 2):
+            try:
+                new_ips = self._insert_batch(batch)
+                break
+            except Exception as e_batch:
+                transient = isinstance(e_batch, ConnectionError) or is_transient_db_error(e_batch)
+                if transient and attempt == 1:
+                    log.warning(f"PERSIST_BATCH ({self.scan_source}): Falha transitória ao gravar lote de {len(batch)} IPs "
+                                f"({e_batch}); nova tentativa em {self.retry_seconds:.0f}s.")
+                    time.sleep(self.retry_seconds)
+                    continue
+                if isinstance(e_batch, ConnectionError):
+                    log.critical(f"PERSIST_BATCH ({self.scan_source}): FALHA - Não foi possível conectar ao DB. {len(batch)} IPs não gravados.")
+                else:
+                    log.exception(f"PERSIST_BATCH ({self.scan_source}): Erro ao gravar lote de {len(batch)} IPs; lote descartado.")
+                with self._lock:
+                    self.total_lost += len(batch)
+                return
+        with self._lock:
+            self.total_written += len(batch)
+            self.total_new += len(new_ips)
+        log.info(f"PERSIST_BATCH ({self.scan_source}): Lote de {len(batch)} IPs gravado ({len(new_ips)} novos).")
+        # Os callbacks só rodam após o commit: quem recebe o host (ex: eventos SSE) pode contar que ele está no banco.
+        try:
+            if self.on_host_written:
+                for ip_str, hostname, _mac in batch:
+                    self.on_host_written(ip_str, hostname, rtts.get(ip_str))
+            if self.on_batch_written:
+                self.on_batch_written(len(batch), len(new_ips))
+        except Exception:
+            log.exception(f"PERSIST_BATCH ({self.scan_source}): Erro nos callbacks do lote gravado.")
+
+    def _insert_batch(self, batch):
+        """
+        Grava o lote numa transação e retorna os IPs que ainda não existiam. Levanta ConnectionError sem conexão.
+
+        O SELECT inicial só descarta os IPs já gravados. Os candidatos a novos são inseridos um a um com
+        INSERT IGNORE e só contam como novos se esta transação criou a linha (rowcount 1): um lote concorrente
+        (outro worker de gravação ou de varredura) com o mesmo IP espera o commit na chave única e não insere
+        nada, então cada IP novo gera um único alerta.
+        """
+        ips = [ip_str for ip_str, _hostname, _mac in batch]
+        placeholders = ", ".join(["%s"] * len(ips))
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco.")
+            cursor = conn.cursor(dictionary=True)
+
+            cursor.execute(f"SELECT EnderecoIP FROM IPsDescobertos WHERE EnderecoIP IN ({placeholders})", tuple(ips))
+            existing = {row['EnderecoIP'] for row in cursor.fetchall()}
+
+            vendors = {mac: self.oui.lookup(mac) for _ip, _hostname, mac in batch if mac and self.oui}
+            fabricantes = fabricante_ids(cursor, vendors.values())
+            rows = [(ip_str, hostname, mac, fabricantes.get((vendors.get(mac) or '')[:100])) for ip_str, hostname, mac in batch]
+
+            # Em ordem de IP: dois lotes que disputam os mesmos IPs travam as chaves na mesma ordem.
+            new_ips = []
+            for row in sorted((row for row in rows if row[0] not in existing), key=lambda row: row[0]):
+                cursor.execute("""
+                    INSERT IGNORE INTO IPsDescobertos (EnderecoIP, NomeHostResolvido, MAC_Address_Estimado, ID_Fabricante_Estimado, StatusResolucao)
+                    VALUES (%s, %s, %s, %s, 'Novo')
+                """, row)
+                if cursor.rowcount == 1:
+                    new_ips.append(row[0])
+
+            values_sql = ", ".join(["(%s, %s, %s, %s, 'Novo')"] * len(rows))
+            params = [value for row in rows for value in row]
+            cursor.execute(f"""
+                INSERT INTO IPsDescobertos (EnderecoIP, NomeHostResolvido, MAC_Address_Estimado, ID_Fabricante_Estimado, StatusResolucao)
+                VALUES {values_sql}
+                ON DUPLICATE KEY UPDATE
+                    NomeHostResolvido = COALESCE(VALUES(NomeHostResolvido), NomeHostResolvido),
+                    MAC_Address_Estimado = COALESCE(VALUES(MAC_Address_Estimado), MAC_Address_Estimado),
+                    ID_Fabricante_Estimado = COALESCE(VALUES(ID_Fabricante_Estimado), ID_Fabricante_Estimado),
+                    DataUltimaDeteccao = CURRENT_TIMESTAMP
+            """, tuple(params))
+
+            if new_ips:
+                tipo_alerta = self._get_tipo_alerta(cursor)
+                if tipo_alerta.get('ID_TipoAlerta'):
+                    new_placeholders = ", ".join(["%s"] * len(new_ips))
+                    cursor.execute(f"""
+                        INSERT INTO Alerta (ID_TipoAlerta, ID_IPDescoberto_FK, DescricaoCustomizada, StatusAlerta, Severidade)
+                        SELECT %s, ipd.ID_IPDescoberto,
+                               CASE WHEN ipd.NomeHostResolvido IS NULL
+                                    THEN CONCAT('Novo IP detectado na rede: ', ipd.EnderecoIP)
+                                    ELSE CONCAT('Novo IP detectado na rede: ', ipd.EnderecoIP, ' (Hostname provável: ', ipd.NomeHostResolvido, ')')
+                               END,
+                               'Novo', %s
+                        FROM IPsDescobertos ipd
+                        WHERE ipd.EnderecoIP IN ({new_placeholders})
+                    """, (tipo_alerta['ID_TipoAlerta'], tipo_alerta.get('SeveridadePadrao') or 'Media', *new_ips))
+                    # Os alertas novos aparecem no dashboard de todos os processos.
+                    bump_cache_version(cursor, VERSAO_DASHBOARD)
+                else:
+                    log.warning(f"PERSIST_BATCH ({self.scan_source}): Tipo de Alerta '{TIPO_ALERTA_NOVO_IP}' não encontrado. Alertas não gerados.")
+
+            conn.commit()
+        return new_ips
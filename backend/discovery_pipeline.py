@@ -0,0 +1,157 @@
+import asyncio
+import ipaddress
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from icmp_sweep import AsyncIcmpProber
+
+log = logging.getLogger(__name__)
+
+
+class DiscoveryPipeline:
+    """
+    Pipeline asyncio de descoberta: sondagem -> DNS reverso -> persistência no DB.
+    Cada estágio tem seu próprio limite de concorrência e os estágios são ligados por filas
+    limitadas, de modo que cada host segue adiante assim que responde.
+
+    `fallback_probe(ip_str) -> bool` é usado (em thread) quando o socket ICMP não está disponível
+    ou o alvo é IPv6; `resolve_hostname(ip_str)` e `persist_host(ip_str, hostname, rtt_ms, mac)` são
+    funções bloqueantes executadas em pools de threads próprios. `on_probed(ip_str)`, se informado,
+    é chamado (no event loop) ao fim da sondagem de cada alvo, para acompanhamento de progresso;
+    `on_probe_result(ip_str, alive, rtt_ms)` recebe o resultado de cada sondagem (histórico de disponibilidade).
+    Alvos cobertos por `neighbor_scan` (NeighborScanResult da varredura ARP) não são sondados: o
+    resultado ARP decide se estão ativos e fornece o MAC. Com `rate_controller` (ProbeRateController),
+    as sondas ICMP e os pings de fallback seguem o ritmo adaptativo por sub-rede e global.
+    """
+
+    def __init__(self, fallback_probe, resolve_hostname, persist_host,
+                 probe_concurrency=256, dns_concurrency=32, persist_concurrency=4,
+                 queue_size=1024, on_host=None, on_probed=None, on_probe_result=None,
+                 neighbor_scan=None, rate_controller=None, scan_source="Desconhecida"):
+        self.fallback_probe = fallback_probe
+        self.resolve_hostname = resolve_hostname
+        self.persist_host = persist_host
+        self.probe_concurrency = max(1, int(probe_concurrency))
+        self.dns_concurrency = max(1, int(dns_concurrency))
+        self.persist_concurrency = max(1, int(persist_concurrency))
+        self.queue_size = max(1, int(queue_size))
+        self.on_host = on_host
+        self.on_probed = on_probed
+        self.on_probe_result = on_probe_result
+        self.neighbor_scan = neighbor_scan
+        self.rate_controller = rate_controller
+        self.scan_source = scan_source
+
+    @classmethod
+    def from_env(cls, fallback_probe, resolve_hostname, persist_host, **kwargs):
+        """Cria o pipeline lendo os limites das variáveis DISCOVERY_*_CONCURRENCY e DISCOVERY_QUEUE_SIZE."""
+        return cls(
+            fallback_probe, resolve_hostname, persist_host,
+            probe_concurrency=os.getenv('DISCOVERY_PROBE_CONCURRENCY', '256'),
+            dns_concurrency=os.getenv('DISCOVERY_DNS_CONCURRENCY', '32'),
+            persist_concurrency=os.getenv('DISCOVERY_DB_CONCURRENCY', '4'),
+            queue_size=os.getenv('DISCOVERY_QUEUE_SIZE', '1024'),
+            **kwargs
+        )
+
+    def run(self, targets):
+        """Executa o pipeline de forma síncrona (para o scheduler e rotas Flask). Retorna os IPs ativos."""
+        return asyncio.run(self.run_async(targets))
+
+    async def run_async(self, targets):
+        loop = asyncio.get_running_loop()
+        probe_queue = asyncio.Queue(maxsize=self.queue_size)
+        dns_queue = asyncio.Queue(maxsize=self.queue_size)
+        persist_queue = asyncio.Queue(maxsize=self.queue_size)
+        active_ips = []
+
+        prober = AsyncIcmpProber.from_env(rate_controller=self.rate_controller)
+        use_icmp = prober.open(loop)
+        if not use_icmp:
+            log.warning(f"PIPELINE ({self.scan_source}): Sem permissão para socket ICMP (RAW/DGRAM). Usando ping via subprocess.")
+
+        probe_pool = ThreadPoolExecutor(max_workers=self.probe_concurrency, thread_name_prefix='probe')
+        dns_pool = ThreadPoolExecutor(max_workers=self.dns_concurrency, thread_name_prefix='rdns')
+        persist_pool = ThreadPoolExecutor(max_workers=self.persist_concurrency, thread_name_prefix='persist')
+
+        async def probe_worker():
+            while True:
+                ip_str = await probe_queue.get()
+                try:
+                    rtt_ms = None
+                    mac = None
+                    alive = False
+                    if self.neighbor_scan and self.neighbor_scan.covers(ip_str):
+                        mac = self.neighbor_scan.macs.get(ip_str)
+                        alive = mac is not None
+                    elif use_icmp and ipaddress.ip_address(ip_str).version == 4:
+                        rtt_ms = await prober.probe(ip_str)
+                        alive = rtt_ms is not None
+                    else:
+                        if self.rate_controller:
+                            await self.rate_controller.wait(ip_str)
+                        alive = await loop.run_in_executor(probe_pool, self.fallback_probe, ip_str)
+                        if self.rate_controller:
+                            self.rate_controller.record(ip_str, alive)
+                    if self.on_probe_result:
+                        self.on_probe_result(ip_str, alive, rtt_ms)
+                    if alive:
+                        await dns_queue.put((ip_str, rtt_ms, mac))
+                except Exception:
+                    log.exception(f"PIPELINE ({self.scan_source}): Erro ao sondar {ip_str}")
+                finally:
+                    probe_queue.task_done()
+                    if self.on_probed:
+                        self.on_probed(ip_str)
+
+        async def dns_worker():
+            while True:
+                ip_str, rtt_ms, mac = await dns_queue.get()
+                try:
+                    hostname = await loop.run_in_executor(dns_pool, self.resolve_hostname, ip_str)
+                    await persist_queue.put((ip_str, hostname, rtt_ms, mac))
+                except Exception:
+                    log.exception(f"PIPELINE ({self.scan_source}): Erro no DNS reverso de {ip_str}")
+                finally:
+                    dns_queue.task_done()
+
+        async def persist_worker():
+            while True:
+                ip_str, hostname, rtt_ms, mac = await persist_queue.get()
+                try:
+                    await loop.run_in_executor(persist_pool, self.persist_host, ip_str, hostname, rtt_ms, mac)
+                    active_ips.append(ip_str)
+                    if self.on_host:
+                        self.on_host(ip_str, hostname, rtt_ms)
+                except Exception:
+                    log.exception(f"PIPELINE ({self.scan_source}): Erro ao persistir {ip_str}")
+                finally:
+                    persist_queue.task_done()
+
+        stages = [
+            (probe_queue, [asyncio.create_task(probe_worker()) for _ in range(self.probe_concurrency)]),
+            (dns_queue, [asyncio.create_task(dns_worker()) for _ in range(self.dns_concurrency)]),
+            (persist_queue, [asyncio.create_task(persist_worker()) for _ in range(self.persist_concurrency)]),
+        ]
+        try:
+            total = 0
+            for target in targets:
+                await probe_queue.put(str(target))
+                total += 1
+            # Drena estágio por estágio: quando a fila de um estágio esvazia, nada mais entra no seguinte.
+            for queue, workers in stages:
+                await queue.join()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            for _queue, workers in stages:
+                for worker in workers:
+                    worker.cancel()
+            prober.close()
+            for pool in (probe_pool, dns_pool, persist_pool):
+                pool.shutdown(wait=False)
+
+        log.info(f"PIPELINE ({self.scan_source}): {len(active_ips)} de {total} alvos ativos.")
+        return active_ips
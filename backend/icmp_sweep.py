@@ -0,0 +1,397 @@
+import asyncio
+import os
+import platform
+import random
+import select
+import socket
+import struct
+import subprocess
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+# Reenvios imediatos ao mesmo alvo quando o buffer de envio do socket está cheio
+SEND_BUFFER_RETRIES = 3
+
+
+def _checksum(data):
+    """Calcula o checksum da internet (RFC 1071) de um pacote ICMP."""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _build_echo_request(ident, seq, payload):
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    chksum = _checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, chksum, ident, seq) + payload
+
+
+def open_icmp_socket():
+    """
+    Abre um socket ICMPv4 para envio de echo requests.
+    Tenta primeiro um socket RAW (requer root/CAP_NET_RAW) e depois um socket
+    DATAGRAM (ping sem privilégios do Linux, net.ipv4.ping_group_range).
+    Retorna (socket, is_raw) ou (None, None) se o processo não tiver permissão.
+    """
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+    except (PermissionError, OSError) as e_raw:
+        log.debug(f"ICMP_SWEEP: Socket RAW indisponível: {e_raw}")
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+    except (PermissionError, OSError) as e_dgram:
+        log.debug(f"ICMP_SWEEP: Socket DGRAM ICMP indisponível: {e_dgram}")
+    return None, None
+
+
+def parse_echo_reply(packet, is_raw):
+    """
+    Extrai (ident, seq) de um echo reply recebido.
+    Em sockets RAW o pacote vem com o cabeçalho IP na frente; em DGRAM, não.
+    Retorna None se o pacote não for um echo reply.
+    """
+    offset = 0
+    if is_raw:
+        if len(packet) < 20:
+            return None
+        offset = (packet[0] & 0x0F) * 4
+    if len(packet) < offset + 8:
+        return None
+    icmp_type, _code, _chk, ident, seq = struct.unpack('!BBHHH', packet[offset:offset + 8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return ident, seq
+
+
+def ping_ip(ip_str):
+    """Tenta pingar um IP (via comando `ping`) e retorna True se bem-sucedido, False caso contrário.
+    Usado como fallback quando o motor ICMP nativo não está disponível."""
+    try:
+        if platform.system().lower() == 'windows':
+            command = ['ping', '-n', '2', '-w', '500', ip_str] 
+        else:
+            command = ['ping', '-c', '2', '-W', '1', ip_str]
+
+        startupinfo = None
+        if platform.system().lower() == 'windows':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            startupinfo.wShowWindow = subprocess.SW_HIDE
+        
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=startupinfo)
+        stdout, stderr = process.communicate(timeout=3) 
+
+        stdout_decoded = stdout.decode(errors='ignore').strip()
+        stderr_decoded = stderr.decode(errors='ignore').strip()
+        log.debug(f"Ping para {ip_str}: RC={process.returncode}")
+        if stdout_decoded:
+            log.debug(f"  STDOUT: {stdout_decoded}")
+        if stderr_decoded:
+            log.debug(f"  STDERR: {stderr_decoded}")
+
+        return process.returncode == 0
+    except subprocess.TimeoutExpired:
+        log.warning(f"Timeout GERAL ao executar comando ping para {ip_str}")
+        if 'process' in locals() and process: process.kill() 
+        return False
+    except Exception as e:
+        log.error(f"Exceção ao pingar {ip_str}: {e}")
+        return False
+
+
+class IcmpSweeper:
+    """
+    Motor de varredura ICMP: envia echo requests para toda a lista de alvos por um único
+    socket e casa as respostas pelo par (identificador, sequência) e pelo IP de origem.
+    Com `rate_controller` (ProbeRateController) o ritmo de envio é adaptativo, por sub-rede e global;
+    sem ele, fixo em `max_pps`.
+    """
+
+    def __init__(self, timeout=1.0, retries=1, max_pps=500, payload_size=16, rate_controller=None):
+        self.timeout = float(timeout)
+        self.retries = max(0, int(retries))
+        self.max_pps = max(1, int(max_pps))
+        self.payload_size = max(8, int(payload_size))
+        self.rate_controller = rate_controller
+
+    @classmethod
+    def from_env(cls, rate_controller=None):
+        """Cria o motor a partir das variáveis ICMP_TIMEOUT, ICMP_RETRIES e ICMP_MAX_PPS."""
+        return cls(
+            timeout=os.getenv('ICMP_TIMEOUT', '1.0'),
+            retries=os.getenv('ICMP_RETRIES', '1'),
+            max_pps=os.getenv('ICMP_MAX_PPS', '500'),
+            rate_controller=rate_controller,
+        )
+
+    def sweep(self, ip_list):
+        """
+        Varre os IPv4 informados e retorna um dict {ip_str: rtt_ms} dos que responderam.
+        Retorna None se não for possível abrir um socket ICMP (falta de capacidade);
+        nesse caso o chamador deve usar o caminho via subprocess.
+        """
+        sock, is_raw = open_icmp_socket()
+        if sock is None:
+            return None
+
+        ident = random.randint(1, 0xFFFF)
+        seq_counter = random.randint(0, 0xFFFF)
+        padding = b'\x00' * (self.payload_size - 8)
+        pending = {}   # ip_str -> (seq, instante_envio)
+        alive = {}
+        targets = [str(ip) for ip in ip_list]
+        send_interval = 1.0 / self.max_pps
+
+        try:
+            sock.setblocking(False)
+            if not is_raw:
+                # Em sockets DGRAM o kernel substitui o identificador pela porta local.
+                sock.bind(('', 0))
+                ident = sock.getsockname()[1]
+
+            for attempt in range(self.retries + 1):
+                round_targets = [ip for ip in targets if ip not in alive]
+                if not round_targets:
+                    break
+                log.debug(f"ICMP_SWEEP: Rodada {attempt + 1}/{self.retries + 1} com {len(round_targets)} alvos.")
+                next_send = time.monotonic()
+                for ip_str in round_targets:
+                    # Respeita o limite de pacotes por segundo e aproveita a espera para ler respostas.
+                    if self.rate_controller:
+                        self._drain(sock, is_raw, ident, pending, alive, self.rate_controller.reserve_subnet(ip_str))
+                        self._drain(sock, is_raw, ident, pending, alive, self.rate_controller.reserve_global())
+                    else:
+                        self._drain(sock, is_raw, ident, pending, alive, next_send - time.monotonic())
+                    for send_try in range(SEND_BUFFER_RETRIES + 1):
+                        seq_counter = (seq_counter + 1) & 0xFFFF
+                        sent_at = time.monotonic()
+                        packet = _build_echo_request(ident, seq_counter, struct.pack('!d', sent_at) + padding)
+                        try:
+                            sock.sendto(packet, (ip_str, 0))
+                            pending[ip_str] = (seq_counter, sent_at)
+                            break
+                        except BlockingIOError:
+                            # Buffer de envio cheio: conta como perda, espera esvaziar e reenvia o mesmo alvo.
+                            if self.rate_controller:
+                                self.rate_controller.record_send_error(ip_str, buffer_full=True)
+                            self._drain(sock, is_raw, ident, pending, alive, send_interval * (send_try + 1))
+                        except OSError as e_send:
+                            log.debug(f"ICMP_SWEEP: Falha ao enviar para {ip_str}: {e_send}")
+                            if self.rate_controller:
+                                self.rate_controller.record_send_error(ip_str)
+                            break
+                    else:
+                        log.debug(f"ICMP_SWEEP: Buffer de envio cheio; {ip_str} não foi sondado nesta rodada.")
+                    next_send = max(next_send + send_interval, sent_at)
+
+                deadline = time.monotonic() + self.timeout
+                while time.monotonic() < deadline and len(alive) < len(pending):
+                    self._drain(sock, is_raw, ident, pending, alive, deadline - time.monotonic())
+                if self.rate_controller:
+                    for ip_str in round_targets:
+                        if ip_str in alive:
+                            self.rate_controller.record(ip_str, True, retried=attempt > 0, rtt_ms=alive[ip_str])
+            if self.rate_controller:
+                for ip_str in targets:
+                    if ip_str not in alive:
+                        self.rate_controller.record(ip_str, False)
+        finally:
+            sock.close()
+
+        log.info(f"ICMP_SWEEP: {len(alive)} de {len(targets)} hosts responderam (socket {'RAW' if is_raw else 'DGRAM'}).")
+        return alive
+
+    def _drain(self, sock, is_raw, ident, pending, alive, wait):
+        """Lê as respostas disponíveis por até `wait` segundos e registra os hosts vivos."""
+        end = time.monotonic() + max(0.0, wait)
+        while True:
+            remaining = end - time.monotonic()
+            readable, _, _ = select.select([sock], [], [], max(0.0, remaining))
+            if not readable:
+                return
+            while True:
+                try:
+                    packet, addr = sock.recvfrom(2048)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError as e_recv:
+                    log.debug(f"ICMP_SWEEP: Erro ao receber resposta: {e_recv}")
+                    break
+                parsed = parse_echo_reply(packet, is_raw)
+                if not parsed:
+                    continue
+                reply_ident, reply_seq = parsed
+                src = addr[0]
+                sent = pending.get(src)
+                if reply_ident != ident or not sent or sent[0] != reply_seq or src in alive:
+                    continue
+                alive[src] = round((time.monotonic() - sent[1]) * 1000, 3)
+            if time.monotonic() >= end:
+                return
+
+
+class AsyncIcmpProber:
+    """
+    Versão asyncio do motor ICMP para o pipeline de descoberta: um único socket compartilhado
+    por todas as sondas, com cada `probe()` aguardando apenas a resposta do seu próprio alvo.
+    Com `rate_controller` (ProbeRateController) o ritmo é adaptativo, por sub-rede e global.
+    """
+
+    def __init__(self, timeout=1.0, retries=1, max_pps=500, payload_size=16, rate_controller=None):
+        self.timeout = float(timeout)
+        self.retries = max(0, int(retries))
+        self.max_pps = max(1, int(max_pps))
+        self.payload_size = max(8, int(payload_size))
+        self.rate_controller = rate_controller
+        self._sock = None
+        self._is_raw = None
+        self._ident = None
+        self._seq = random.randint(0, 0xFFFF)
+        self._waiting = {}   # seq -> (ip_str, future, instante_envio)
+        self.buffer_full_waits = 0   # envios adiados até o buffer do socket esvaziar
+        self.send_errors = 0
+        self._send_lock = None
+        self._next_send = 0.0
+        self._loop = None
+
+    @classmethod
+    def from_env(cls, rate_controller=None):
+        """Cria o prober a partir das variáveis ICMP_TIMEOUT, ICMP_RETRIES e ICMP_MAX_PPS."""
+        return cls(
+            timeout=os.getenv('ICMP_TIMEOUT', '1.0'),
+            retries=os.getenv('ICMP_RETRIES', '1'),
+            max_pps=os.getenv('ICMP_MAX_PPS', '500'),
+            rate_controller=rate_controller,
+        )
+
+    def open(self, loop):
+        """Abre o socket e registra o leitor no event loop. Retorna False se faltar permissão."""
+        self._sock, self._is_raw = open_icmp_socket()
+        if self._sock is None:
+            return False
+        self._loop = loop
+        self._send_lock = asyncio.Lock()
+        self._sock.setblocking(False)
+        if self._is_raw:
+            self._ident = random.randint(1, 0xFFFF)
+        else:
+            self._sock.bind(('', 0))
+            self._ident = self._sock.getsockname()[1]
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+        return True
+
+    def close(self):
+        if self._sock is None:
+            return
+        if self.buffer_full_waits or self.send_errors:
+            log.info(f"ICMP_PROBE: {self.buffer_full_waits} envios esperaram o buffer do socket esvaziar; "
+                     f"{self.send_errors} falhas de envio.")
+        try:
+            self._loop.remove_reader(self._sock.fileno())
+        finally:
+            self._sock.close()
+            self._sock = None
+        for _ip, future, _sent in self._waiting.values():
+            if not future.done():
+                future.cancel()
+        self._waiting.clear()
+
+    async def probe(self, ip_str):
+        """Envia echo requests para um IPv4 e retorna o RTT em ms, ou None se não responder."""
+        for attempt in range(self.retries + 1):
+            if self.rate_controller:
+                # A espera pelo orçamento da sub-rede não segura o lock: alvos de outras sub-redes seguem enviando.
+                await self.rate_controller.wait(ip_str)
+            async with self._send_lock:
+                if not self.rate_controller:
+                    delay = self._next_send - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                self._seq = (self._seq + 1) & 0xFFFF
+                while self._seq in self._waiting:
+                    self._seq = (self._seq + 1) & 0xFFFF
+                seq = self._seq
+                self._next_send = max(self._next_send + 1.0 / self.max_pps, time.monotonic())
+                future = self._loop.create_future()
+                if not await self._send(ip_str, seq, future):
+                    self._waiting.pop(seq, None)
+                    continue
+            try:
+                rtt_ms = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self._waiting.pop(seq, None)
+            if self.rate_controller:
+                self.rate_controller.record(ip_str, True, retried=attempt > 0, rtt_ms=rtt_ms)
+            return rtt_ms
+        if self.rate_controller:
+            self.rate_controller.record(ip_str, False)
+        return None
+
+    async def _send(self, ip_str, seq, future):
+        """
+        Envia o echo request (com o lock de envio). Com o buffer do socket cheio, espera até `timeout` ele
+        ficar gravável e reenvia, sem gastar uma tentativa do alvo. Retorna False se o envio falhou.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            sent_at = time.monotonic()
+            self._waiting[seq] = (ip_str, future, sent_at)
+            packet = _build_echo_request(self._ident, seq, struct.pack('!d', sent_at) + b'\x00' * (self.payload_size - 8))
+            try:
+                self._sock.sendto(packet, (ip_str, 0))
+                return True
+            except BlockingIOError:
+                self.buffer_full_waits += 1
+                if self.rate_controller:
+                    self.rate_controller.record_send_error(ip_str, buffer_full=True)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not await self._wait_writable(remaining):
+                    log.debug(f"ICMP_PROBE: Buffer de envio continuou cheio; tentativa para {ip_str} perdida.")
+                    return False
+            except OSError as e_send:
+                log.debug(f"ICMP_PROBE: Falha ao enviar para {ip_str}: {e_send}")
+                self.send_errors += 1
+                if self.rate_controller:
+                    self.rate_controller.record_send_error(ip_str)
+                return False
+
+    async def _wait_writable(self, timeout):
+        """Aguarda até `timeout` segundos o socket voltar a aceitar envios. Retorna False se o tempo esgotar."""
+        writable = self._loop.create_future()
+        fd = self._sock.fileno()
+        self._loop.add_writer(fd, lambda: writable.done() or writable.set_result(None))
+        try:
+            await asyncio.wait_for(writable, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._loop.remove_writer(fd)
+
+    def _on_readable(self):
+        while True:
+            try:
+                packet, addr = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e_recv:
+                log.debug(f"ICMP_PROBE: Erro ao receber resposta: {e_recv}")
+                return
+            parsed = parse_echo_reply(packet, self._is_raw)
+            if not parsed or parsed[0] != self._ident:
+                continue
+            waiting = self._waiting.get(parsed[1])
+            if not waiting:
+                continue
+            ip_str, future, sent_at = waiting
+            if addr[0] == ip_str and not future.done():
+                future.set_result(round((time.monotonic() - sent_at) * 1000, 3))
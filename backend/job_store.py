@@ -0,0 +1,185 @@
+import json
+import os
+import time
+import logging
+import threading
+
+import mysql.connector
+
+log = logging.getLogger(__name__)
+
+TIPO_DESCOBERTA = 'descoberta'
+TIPO_DETALHADA = 'detalhada'
+
+
+class JobStore:
+    """
+    Estado dos jobs de varredura em segundo plano (descoberta manual e detalhada) replicado em
+    JobVarredura/EventoJobVarredura, para que qualquer worker web responda por qualquer job: o
+    processo que recebeu o POST executa o job e guarda o estado em memória, e uma thread grava as
+    mudanças no banco a cada `sync_seconds`. Os demais workers leem o estado (e os eventos do stream
+    SSE) do banco.
+
+    Jobs concluídos são apagados do banco `retention_seconds` após o término. Sem a tabela (migração
+    012 pendente) o store se desativa e os jobs só podem ser consultados no worker que os criou.
+    """
+
+    def __init__(self, connection_factory, sync_seconds=1.0, poll_seconds=1.0, retention_seconds=3600):
+        self.connection_factory = connection_factory
+        self.sync_seconds = max(0.1, float(sync_seconds))
+        self.poll_seconds = max(0.1, float(poll_seconds))
+        self.retention_seconds = max(0, int(float(retention_seconds)))
+        self.enabled = True
+        self._jobs = {}          # jobs locais ainda com mudanças a gravar
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()   # uma gravação por vez: um estado antigo não sobrescreve um mais novo
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_purge = 0.0
+
+    @classmethod
+    def from_env(cls, connection_factory):
+        """Cria o store lendo JOB_STORE_SYNC_SECONDS, JOB_STORE_POLL_SECONDS e SCAN_JOBS_RETENTION_SECONDS."""
+        return cls(
+            connection_factory,
+            sync_seconds=os.getenv('JOB_STORE_SYNC_SECONDS', '1'),
+            poll_seconds=os.getenv('JOB_STORE_POLL_SECONDS', '1'),
+            retention_seconds=os.getenv('SCAN_JOBS_RETENTION_SECONDS', '3600'),
+        )
+
+    def _disable_if_missing(self, err):
+        if getattr(err, 'errno', None) != 1146:
+            return False
+        if self.enabled:
+            self.enabled = False
+            log.warning("JOB_STORE: Tabela JobVarredura não encontrada (aplique a migração 012_job_varredura.sql); "
+                        "o status dos jobs só fica disponível no worker que os criou.")
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='job-store', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.sync_all()
+
+    def track(self, job):
+        """Passa a replicar `job` (ScanJob ou DetailScanJob) no banco; grava o estado inicial na hora."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._jobs[job.id] = job
+        self.sync(job)
+
+    def _run(self):
+        while not self._stop.wait(self.sync_seconds):
+            try:
+                self.sync_all()
+                if time.monotonic() - self._last_purge > 60:
+                    self._last_purge = time.monotonic()
+                    self.purge()
+            except Exception:
+                log.exception("JOB_STORE: Erro ao gravar o estado dos jobs.")
+
+    def sync_all(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            self.sync(job)
+
+    def sync(self, job):
+        """
+        Grava as mudanças de `job` desde a última gravação (estado e eventos novos) numa transação.
+        Em caso de falha elas continuam pendentes e são regravadas na próxima rodada.
+        """
+        if not self.enabled:
+            return
+        with self._sync_lock:
+            self._sync(job)
+
+    def _sync(self, job):
+        changes = job.store_changes()
+        if changes is None:
+            if job.finished:
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+            return
+        try:
+            with self.connection_factory() as conn:
+                if not conn:
+                    log.warning(f"JOB_STORE: Sem conexão com o banco; estado do job {job.id} fica para a próxima rodada.")
+                    return
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO JobVarredura (ID_Job, Tipo, Origem, Status, Estado, SeqEstado, Erro, DataConclusao)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, IF(%s, NOW(), NULL))
+                    ON DUPLICATE KEY UPDATE Status = VALUES(Status), Estado = VALUES(Estado), SeqEstado = VALUES(SeqEstado),
+                                            Erro = VALUES(Erro), DataConclusao = VALUES(DataConclusao)
+                """, (job.id, changes["tipo"], changes["origem"], changes["status"], json.dumps(changes["estado"], default=str),
+                      changes["seq"], (changes["erro"] or '')[:500] or None, changes["finished"]))
+                events = changes["events"]
+                for start in range(0, len(events), 500):
+                    chunk = events[start:start + 500]
+                    cursor.execute(f"""
+                        INSERT IGNORE INTO EventoJobVarredura (ID_Job, Seq, Tipo, Dados)
+                        VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))}
+                    """, tuple(v for seq, tipo, dados in chunk for v in (job.id, seq, tipo, json.dumps(dados, default=str))))
+                conn.commit()
+        except mysql.connector.Error as err:
+            if not self._disable_if_missing(err):
+                log.warning(f"JOB_STORE: Falha ao gravar o estado do job {job.id} ({err}); nova tentativa na próxima rodada.")
+            return
+        job.store_synced(changes)
+
+    def purge(self):
+        """Apaga do banco os jobs concluídos há mais de `retention_seconds` (e os abandonados há mais que isso)."""
+        if not self.enabled:
+            return
+        with self.connection_factory() as conn:
+            if not conn:
+                return
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM JobVarredura
+                WHERE COALESCE(DataConclusao, DataAtualizacao) < NOW() - INTERVAL %s SECOND
+            """, (self.retention_seconds,))
+            conn.commit()
+
+    def load(self, job_id, tipo):
+        """Linha de JobVarredura do job (com Estado já decodificado), ou None se não existir."""
+        if not self.enabled:
+            return None
+        try:
+            with self.connection_factory() as conn:
+                if not conn:
+                    raise ConnectionError("Sem conexão com o banco para consultar o job.")
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute("""
+                    SELECT ID_Job, Origem, Status, Estado, SeqEstado, Erro FROM JobVarredura
+                    WHERE ID_Job = %s AND Tipo = %s
+                """, (job_id, tipo))
+                row = cursor.fetchone()
+        except mysql.connector.Error as err:
+            if self._disable_if_missing(err):
+                return None
+            raise
+        if row:
+            row["Estado"] = json.loads(row["Estado"]) if row["Estado"] else {}
+        return row
+
+    def events_after(self, job_id, after_seq, tipo=None):
+        """Eventos gravados do job com número maior que `after_seq`: [(seq, tipo, dados)] em ordem."""
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco para consultar os eventos do job.")
+            cursor = conn.cursor()
+            query = "SELECT Seq, Tipo, Dados FROM EventoJobVarredura WHERE ID_Job = %s AND Seq > %s"
+            params = [job_id, after_seq]
+            if tipo:
+                query += " AND Tipo = %s"
+                params.append(tipo)
+            cursor.execute(query + " ORDER BY Seq", tuple(params))
+            return [(int(seq), event_type, json.loads(dados)) for seq, event_type, dados in cursor.fetchall()]
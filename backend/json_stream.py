@@ -0,0 +1,150 @@
+import json
+import os
+import logging
+import threading
+from contextlib import ExitStack
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from flask import Response, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # Sem orjson: mesmo formato de saída pelo json da biblioteca padrão (mais lento)
+    orjson = None
+
+log = logging.getLogger(__name__)
+
+
+def _default(value):
+    """Tipos que o encoder não serializa sozinho, no mesmo formato do jsonify do Flask."""
+    if isinstance(value, (datetime, date)):
+        # Flask serializa datas no formato HTTP (RFC 822); o frontend faz `new Date(...)` sobre ele.
+        return http_date(value)
+    if isinstance(value, time):
+        return value.isoformat()
+    if isinstance(value, (Decimal, timedelta)):
+        # Decimal como texto, para não perder precisão; TIME do MySQL chega como timedelta.
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode('utf-8', errors='replace')
+    raise TypeError(f"Objeto do tipo {type(value).__name__} não é serializável em JSON")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, sort_keys=True):
+        """Serializa `obj` em JSON compacto (bytes UTF-8)."""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS | (orjson.OPT_SORT_KEYS if sort_keys else 0))
+else:
+    def dumps(obj, sort_keys=True):
+        """Serializa `obj` em JSON compacto (bytes UTF-8)."""
+        return json.dumps(obj, default=_default, sort_keys=sort_keys, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Provider JSON da aplicação (`app.json`): `jsonify` passa a usar o orjson, mantendo o formato do
+    provider padrão (chaves ordenadas, datas RFC 822, Decimal como texto). Sem orjson, ou com saída
+    indentada (modo debug), delega ao provider padrão.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent'):
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys)).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        # Bytes direto no corpo, sem passar por str.
+        return self._app.response_class(dumps(obj, sort_keys=self.sort_keys), mimetype=self.mimetype)
+
+
+class RowStreamer:
+    """
+    Resposta JSON em fluxo para listas grandes: as linhas são lidas do cursor (sem buffer) em blocos de
+    `fetch_size` com `fetchmany` e cada bloco vira um pedaço do array JSON assim que chega. A memória
+    por requisição fica limitada a um bloco, e o download começa antes da consulta terminar de ser lida.
+
+    A conexão fica presa até o fim do envio, que dura o que o cliente levar para baixar; por isso
+    `db_connection` deve entregar uma conexão própria, fora do pool (`ConnectionPool.connect_dedicated`),
+    para que downloads lentos não esgotem as conexões das demais rotas. No máximo `max_concurrent`
+    envios rodam ao mesmo tempo no processo; acima disso a resposta é 503 com Retry-After.
+
+    A consulta é executada (e o primeiro bloco lido) antes de a resposta começar, então erros de
+    conexão ou de SQL ainda viram um 500 normal.
+    """
+
+    def __init__(self, db_connection, fetch_size=500, max_concurrent=8):
+        self.db_connection = db_connection
+        self.fetch_size = max(1, int(fetch_size))
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+
+    @classmethod
+    def from_env(cls, db_connection):
+        """Cria o streamer lendo JSON_STREAM_FETCH_SIZE e JSON_STREAM_MAX_CONCURRENT."""
+        return cls(db_connection, fetch_size=os.getenv('JSON_STREAM_FETCH_SIZE', '500'),
+                   max_concurrent=os.getenv('JSON_STREAM_MAX_CONCURRENT', '8'))
+
+    def response(self, query, params=(), headers=None, log_label='JSON_STREAM'):
+        """
+        Executa `query` e devolve a Response com o array das linhas (ou 503 se já houver `max_concurrent`
+        envios em andamento), ou None se não houver conexão com o banco.
+        """
+        if not self._slots.acquire(blocking=False):
+            log.warning(f"{log_label}: {self.max_concurrent} envios em fluxo já em andamento; requisição recusada.")
+            response = jsonify({"message": "Muitos downloads simultâneos; tente novamente em instantes."})
+            response.status_code = 503
+            response.headers['Retry-After'] = '5'
+            return response
+        stack = ExitStack()
+        stack.callback(self._slots.release)
+        try:
+            conn = stack.enter_context(self.db_connection())
+            if not conn:
+                stack.close()
+                return None
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params)
+            first = cursor.fetchmany(self.fetch_size)
+        except BaseException:
+            stack.close()
+            raise
+        response = Response(stream_with_context(self._generate(stack, cursor, first, log_label)),
+                            mimetype='application/json', headers=headers)
+        # Se o corpo nunca for iterado (cliente saiu antes), o servidor ainda fecha a resposta.
+        response.call_on_close(stack.close)
+        return response
+
+    def _generate(self, stack, cursor, rows, log_label):
+        total = 0
+        exhausted = False
+        try:
+            yield b'['
+            while rows:
+                # Um dumps por bloco: a lista serializada sem os colchetes é o trecho do array.
+                chunk = dumps(rows)[1:-1]
+                yield chunk if not total else b',' + chunk
+                total += len(rows)
+                if len(rows) < self.fetch_size:
+                    break
+                rows = cursor.fetchmany(self.fetch_size)
+            exhausted = True
+            yield b']'
+        finally:
+            if not exhausted:
+                # Cliente desconectou no meio: lê o restante em blocos antes de fechar a conexão.
+                log.info(f"{log_label}: Envio interrompido após {total} linhas.")
+                try:
+                    while cursor.fetchmany(self.fetch_size):
+                        pass
+                except Exception:
+                    pass
+            stack.close()
@@ -0,0 +1,126 @@
+import os
+import threading
+import logging
+
+import mysql.connector
+
+log = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """
+    Eleição de líder entre processos pelo lock nomeado do MySQL (`GET_LOCK`). O lock pertence à sessão,
+    por isso fica numa conexão dedicada (fora do pool): se o processo morrer ou perder a conexão, o
+    MySQL o libera e outra instância assume na próxima verificação.
+
+    Uma thread tenta obter o lock a cada `check_seconds`; o líder confere no mesmo intervalo se ainda
+    o detém (`IS_USED_LOCK() = CONNECTION_ID()`). `on_acquired()` e `on_lost()` são chamados na
+    própria thread ao ganhar e ao perder a liderança.
+    """
+
+    def __init__(self, connect_kwargs, name='nilds_scheduler', check_seconds=10.0, on_acquired=None, on_lost=None):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.name = name
+        self.check_seconds = float(check_seconds)
+        self.on_acquired = on_acquired
+        self.on_lost = on_lost
+        self._conn = None
+        self._is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, connect_kwargs, **kwargs):
+        """Cria o lock lendo SCHEDULER_LOCK_NAME e SCHEDULER_LOCK_CHECK_SECONDS."""
+        return cls(
+            connect_kwargs,
+            name=os.getenv('SCHEDULER_LOCK_NAME', 'nilds_scheduler'),
+            check_seconds=os.getenv('SCHEDULER_LOCK_CHECK_SECONDS', '10'),
+            **kwargs
+        )
+
+    @property
+    def is_leader(self):
+        return self._is_leader
+
+    def _query(self, sql, params):
+        if self._conn is None:
+            self._conn = mysql.connector.connect(**self.connect_kwargs)
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+            return row[0] if row else None
+        finally:
+            cursor.close()
+
+    def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def try_acquire(self):
+        """Tenta obter o lock sem esperar. Retorna True se este processo é (ou passou a ser) o líder."""
+        if self._is_leader:
+            return self.check()
+        try:
+            acquired = self._query("SELECT GET_LOCK(%s, 0)", (self.name,)) == 1
+        except mysql.connector.Error as err:
+            log.error(f"LEADER_LOCK ({self.name}): Erro ao tentar obter o lock: {err}")
+            self._close()
+            return False
+        if acquired:
+            self._set_leader(True)
+        return acquired
+
+    def check(self):
+        """Confirma que o lock continua com esta sessão; se a conexão caiu ou o lock foi perdido, deixa de ser líder."""
+        try:
+            held = self._query("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.name,)) == 1
+        except mysql.connector.Error as err:
+            log.error(f"LEADER_LOCK ({self.name}): Conexão do lock perdida: {err}")
+            self._close()
+            held = False
+        if not held:
+            self._set_leader(False)
+        return held
+
+    def release(self):
+        if self._is_leader and self._conn is not None:
+            try:
+                self._query("SELECT RELEASE_LOCK(%s)", (self.name,))
+            except mysql.connector.Error:
+                pass
+        self._set_leader(False)
+        self._close()
+
+    def _set_leader(self, leader):
+        if leader == self._is_leader:
+            return
+        self._is_leader = leader
+        callback = self.on_acquired if leader else self.on_lost
+        log.warning(f"LEADER_LOCK ({self.name}): Liderança {'obtida' if leader else 'perdida'} (PID {os.getpid()}).")
+        if callback:
+            try:
+                callback()
+            except Exception:
+                log.exception(f"LEADER_LOCK ({self.name}): Erro no callback de mudança de liderança.")
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='leader-lock', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.check_seconds + 5)
+        self.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.try_acquire()
+            self._stop.wait(self.check_seconds)
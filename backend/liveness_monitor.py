@@ -0,0 +1,339 @@
+import heapq
+import os
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from availability import TIPO_DISPOSITIVO
+from device_counters import update_device_counters
+from cache_version import bump_cache_version, VERSAO_DASHBOARD
+
+log = logging.getLogger(__name__)
+
+STATUS_ONLINE = 'Online'
+STATUS_OFFLINE = 'Offline'
+TIPO_ALERTA_OFFLINE = 'Dispositivo Offline'
+TIPO_ALERTA_ONLINE = 'Dispositivo Online'
+FONTE_MUDANCA = 'Monitor de Disponibilidade'
+
+# IP principal de cada dispositivo (o mesmo critério da busca de dispositivos).
+_DEVICES_SQL = """
+    SELECT d.ID_Dispositivo, d.StatusAtual, td.Nome AS TipoDispositivoNome, rede.IPPrincipal
+    FROM Dispositivo d
+    JOIN (
+        SELECT ifr.ID_Dispositivo, MIN(ip.EnderecoIPValor) AS IPPrincipal
+        FROM InterfaceRede ifr
+        JOIN EnderecoIP ip ON ifr.ID_Interface = ip.ID_Interface AND ip.Principal = TRUE
+        GROUP BY ifr.ID_Dispositivo
+    ) rede ON rede.ID_Dispositivo = d.ID_Dispositivo
+    LEFT JOIN TipoDispositivo td ON d.ID_TipoDispositivo = td.ID_TipoDispositivo
+"""
+
+
+class _DeviceState:
+    __slots__ = ('id', 'ip', 'status', 'critical', 'interval', 'next_due', 'failures')
+
+    def __init__(self, device_id, ip, status, critical, interval):
+        self.id = device_id
+        self.ip = ip
+        self.status = status
+        self.critical = critical
+        self.interval = interval
+        self.next_due = 0.0
+        self.failures = 0
+
+
+class LivenessMonitor:
+    """
+    Monitor de disponibilidade dos dispositivos inventariados. Sonda o IP principal de cada
+    dispositivo por ICMP (todos os dispositivos vencidos numa única varredura por ciclo) e
+    mantém Dispositivo.StatusAtual e DataUltimaVarredura atualizados.
+
+    Intervalos adaptativos: um dispositivo estável tem o intervalo multiplicado por `backoff`
+    a cada sonda sem mudança, até `max_interval` (`critical_interval` para os tipos críticos);
+    mudança de estado ou falha ainda não confirmada volta o intervalo para `min_interval`.
+    Offline só é confirmado após `fail_threshold` falhas seguidas.
+
+    As escritas são feitas em lote por ciclo: uma transação com as mudanças de status
+    (LogStatusDispositivo, contadores e alertas apenas quando o estado muda de fato) e
+    atualizações agrupadas de DataUltimaVarredura para os demais. Se `recorder`
+    (AvailabilityRecorder) for informado, cada sondagem vira uma amostra de disponibilidade.
+    """
+
+    def __init__(self, connection_factory, sweeper, fallback_probe, on_status_changed=None,
+                 min_interval=30, max_interval=1800, critical_interval=60, backoff=1.5,
+                 fail_threshold=2, tick_seconds=5, max_batch=5000, reload_seconds=300,
+                 critical_types=('Servidor', 'Roteador', 'Switch', 'Firewall'), fallback_workers=32,
+                 recorder=None):
+        self.connection_factory = connection_factory
+        self.sweeper = sweeper
+        self.fallback_probe = fallback_probe
+        self.on_status_changed = on_status_changed
+        self.min_interval = float(min_interval)
+        self.max_interval = max(self.min_interval, float(max_interval))
+        self.critical_interval = max(self.min_interval, float(critical_interval))
+        self.backoff = max(1.0, float(backoff))
+        self.fail_threshold = max(1, int(fail_threshold))
+        self.tick_seconds = float(tick_seconds)
+        self.max_batch = max(1, int(max_batch))
+        self.reload_seconds = float(reload_seconds)
+        self.critical_types = {t.strip().lower() for t in critical_types if t.strip()}
+        self.fallback_workers = max(1, int(fallback_workers))
+        self.recorder = recorder
+        self._devices = {}
+        self._heap = []   # (next_due, id_dispositivo)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._tipos_alerta = None
+        self._last_reload = None
+        self.stats = {"ciclos": 0, "sondados": 0, "mudancas": 0, "ultimo_ciclo_ms": None, "ultimo_lote": 0}
+
+    @classmethod
+    def from_env(cls, connection_factory, sweeper, fallback_probe, **kwargs):
+        return cls(
+            connection_factory, sweeper, fallback_probe,
+            min_interval=os.getenv('LIVENESS_MIN_INTERVAL', '30'),
+            max_interval=os.getenv('LIVENESS_MAX_INTERVAL', '1800'),
+            critical_interval=os.getenv('LIVENESS_CRITICAL_INTERVAL', '60'),
+            fail_threshold=os.getenv('LIVENESS_FAIL_THRESHOLD', '2'),
+            tick_seconds=os.getenv('LIVENESS_TICK_SECONDS', '5'),
+            max_batch=os.getenv('LIVENESS_MAX_BATCH', '5000'),
+            reload_seconds=os.getenv('LIVENESS_RELOAD_SECONDS', '300'),
+            critical_types=os.getenv('LIVENESS_CRITICAL_TYPES', 'Servidor,Roteador,Switch,Firewall').split(','),
+            **kwargs
+        )
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='liveness-monitor', daemon=True)
+        self._thread.start()
+        log.info("LIVENESS: Monitor de disponibilidade iniciado.")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._last_reload is None or time.monotonic() - self._last_reload >= self.reload_seconds:
+                    self.reload_devices()
+                self.run_cycle()
+            except Exception:
+                log.exception("LIVENESS: Erro no ciclo do monitor de disponibilidade.")
+            self._stop.wait(self.tick_seconds)
+
+    def _cap(self, state):
+        return self.critical_interval if state.critical else self.max_interval
+
+    def _schedule(self, state, interval, now):
+        state.interval = interval
+        # Variação de ±10% para os dispositivos não vencerem todos no mesmo ciclo.
+        state.next_due = now + interval * random.uniform(0.9, 1.1)
+        heapq.heappush(self._heap, (state.next_due, state.id))
+
+    def reload_devices(self):
+        """Relê do banco os dispositivos com IP principal (novos entram vencidos; removidos saem)."""
+        self._last_reload = time.monotonic()
+        with self.connection_factory() as conn:
+            if not conn:
+                log.warning("LIVENESS: Sem conexão com o banco; lista de dispositivos não recarregada.")
+                return
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(_DEVICES_SQL)
+            rows = cursor.fetchall()
+
+        now = time.monotonic()
+        with self._lock:
+            seen = set()
+            for row in rows:
+                device_id = row['ID_Dispositivo']
+                seen.add(device_id)
+                critical = (row.get('TipoDispositivoNome') or '').lower() in self.critical_types
+                state = self._devices.get(device_id)
+                if state is None:
+                    state = _DeviceState(device_id, row['IPPrincipal'], row['StatusAtual'], critical, self.min_interval)
+                    self._devices[device_id] = state
+                    state.next_due = now
+                    heapq.heappush(self._heap, (now, device_id))
+                else:
+                    # Edições manuais (IP, status, tipo) prevalecem sobre o estado em memória.
+                    state.ip = row['IPPrincipal']
+                    state.status = row['StatusAtual']
+                    state.critical = critical
+            for device_id in set(self._devices) - seen:
+                del self._devices[device_id]
+            # Entradas do heap de dispositivos removidos são descartadas ao sair do heap.
+        log.info(f"LIVENESS: {len(self._devices)} dispositivos monitorados.")
+
+    def _take_due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < self.max_batch:
+                next_due, device_id = heapq.heappop(self._heap)
+                state = self._devices.get(device_id)
+                if state is None or state.next_due != next_due:
+                    continue  # removido ou reagendado
+                due.append(state)
+        return due
+
+    def _probe(self, states):
+        """Sonda os IPs e retorna um dict {ip: rtt_ms} dos que responderam (rtt None pela sonda via subprocess)."""
+        ipv4 = [s.ip for s in states if ':' not in s.ip]
+        others = [s.ip for s in states if ':' in s.ip]
+        alive = self.sweeper.sweep(ipv4) if ipv4 else {}
+        if alive is None:
+            # Sem socket ICMP: usa a sonda por subprocess, em paralelo.
+            others = ipv4 + others
+            alive = {}
+        alive = dict(alive)
+        if others:
+            with ThreadPoolExecutor(max_workers=min(self.fallback_workers, len(others))) as pool:
+                for ip, ok in zip(others, pool.map(self.fallback_probe, others)):
+                    if ok:
+                        alive[ip] = None
+        return alive
+
+    def run_cycle(self):
+        """Sonda os dispositivos vencidos e grava o resultado. Retorna o número de sondados."""
+        started = time.perf_counter()
+        due = self._take_due(time.monotonic())
+        if not due:
+            return 0
+        alive = self._probe(due)
+
+        now = time.monotonic()
+        changes = {}   # id -> novo status
+        touched = []
+        with self._lock:
+            for state in due:
+                if state.id not in self._devices:
+                    continue
+                touched.append(state.id)
+                if self.recorder:
+                    self.recorder.record(TIPO_DISPOSITIVO, state.id, state.ip in alive, alive.get(state.ip))
+                if state.ip in alive:
+                    state.failures = 0
+                    observed = STATUS_ONLINE
+                else:
+                    state.failures += 1
+                    # Falha ainda não confirmada: mantém o status e reavalia logo.
+                    observed = STATUS_OFFLINE if state.failures >= self.fail_threshold else state.status
+                if observed != state.status:
+                    changes[state.id] = observed
+                    state.status = observed
+                    self._schedule(state, self.min_interval, now)
+                elif state.failures:
+                    self._schedule(state, self.min_interval, now)
+                else:
+                    self._schedule(state, min(self._cap(state), state.interval * self.backoff), now)
+
+        changed = self._write_results(touched, changes)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats.update(ciclos=self.stats["ciclos"] + 1, sondados=self.stats["sondados"] + len(due),
+                          mudancas=self.stats["mudancas"] + changed, ultimo_ciclo_ms=round(elapsed_ms, 1),
+                          ultimo_lote=len(due))
+        log.info(f"LIVENESS: {len(due)} dispositivos sondados ({len(alive)} responderam, {changed} mudanças de status) em {elapsed_ms:.0f} ms.")
+        if changed and self.on_status_changed:
+            self.on_status_changed(changed)
+        return len(due)
+
+    def _get_tipos_alerta(self, cursor):
+        if self._tipos_alerta is None:
+            cursor.execute("SELECT Nome, ID_TipoAlerta, SeveridadePadrao FROM TipoAlerta WHERE Nome IN (%s, %s)",
+                           (TIPO_ALERTA_OFFLINE, TIPO_ALERTA_ONLINE))
+            self._tipos_alerta = {row['Nome']: row for row in cursor.fetchall()}
+        return self._tipos_alerta
+
+    def _write_results(self, touched, changes):
+        """Grava o ciclo numa transação. Retorna quantos dispositivos mudaram de status no banco."""
+        seen_at = datetime.now().replace(microsecond=0)
+        with self.connection_factory() as conn:
+            if not conn:
+                log.error(f"LIVENESS: Sem conexão com o banco; resultado de {len(touched)} sondas descartado.")
+                return 0
+            cursor = conn.cursor(dictionary=True)
+            applied = []
+            if changes:
+                ids = list(changes)
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(f"""
+                    SELECT ID_Dispositivo, StatusAtual, ID_SistemaOperacional, NomeHost
+                    FROM Dispositivo WHERE ID_Dispositivo IN ({placeholders}) FOR UPDATE
+                """, tuple(ids))
+                for old in cursor.fetchall():
+                    new_status = changes[old['ID_Dispositivo']]
+                    if old['StatusAtual'] == new_status:
+                        continue
+                    applied.append(old)
+                    update_device_counters(cursor, old, dict(old, StatusAtual=new_status))
+
+                for status in (STATUS_ONLINE, STATUS_OFFLINE):
+                    ids_status = [old['ID_Dispositivo'] for old in applied if changes[old['ID_Dispositivo']] == status]
+                    if ids_status:
+                        cursor.execute(f"""
+                            UPDATE Dispositivo SET StatusAtual = %s, DataUltimaVarredura = %s
+                            WHERE ID_Dispositivo IN ({', '.join(['%s'] * len(ids_status))})
+                        """, (status, seen_at, *ids_status))
+
+                if applied:
+                    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(applied))
+                    cursor.execute(f"""
+                        INSERT INTO LogStatusDispositivo (ID_Dispositivo, StatusAnterior, StatusNovo, DataHoraMudanca, FonteMudanca)
+                        VALUES {values}
+                    """, tuple(v for old in applied for v in (old['ID_Dispositivo'], old['StatusAtual'],
+                                                               changes[old['ID_Dispositivo']], seen_at, FONTE_MUDANCA)))
+                    self._insert_alerts(cursor, applied, changes)
+                    bump_cache_version(cursor, VERSAO_DASHBOARD)
+
+            applied_ids = {old['ID_Dispositivo'] for old in applied}
+            unchanged = [device_id for device_id in touched if device_id not in applied_ids]
+            for start in range(0, len(unchanged), 1000):
+                chunk = unchanged[start:start + 1000]
+                cursor.execute(f"""
+                    UPDATE Dispositivo SET DataUltimaVarredura = %s
+                    WHERE ID_Dispositivo IN ({', '.join(['%s'] * len(chunk))})
+                """, (seen_at, *chunk))
+            conn.commit()
+        return len(applied)
+
+    def _insert_alerts(self, cursor, applied, changes):
+        """Alerta apenas transições Online -> Offline e Offline -> Online (não a primeira sonda)."""
+        tipos = self._get_tipos_alerta(cursor)
+        rows = []
+        for old in applied:
+            new_status = changes[old['ID_Dispositivo']]
+            if {old['StatusAtual'], new_status} != {STATUS_ONLINE, STATUS_OFFLINE}:
+                continue
+            nome_tipo = TIPO_ALERTA_OFFLINE if new_status == STATUS_OFFLINE else TIPO_ALERTA_ONLINE
+            tipo = tipos.get(nome_tipo)
+            if not tipo:
+                log.warning(f"LIVENESS: Tipo de Alerta '{nome_tipo}' não encontrado. Alerta não gerado.")
+                continue
+            nome = old.get('NomeHost') or f"ID {old['ID_Dispositivo']}"
+            descricao = f"Dispositivo {nome} ficou offline." if new_status == STATUS_OFFLINE else f"Dispositivo {nome} voltou a ficar online."
+            rows.append((tipo['ID_TipoAlerta'], old['ID_Dispositivo'], descricao, tipo.get('SeveridadePadrao') or 'Media'))
+        if rows:
+            cursor.execute(f"""
+                INSERT INTO Alerta (ID_TipoAlerta, ID_Dispositivo, DescricaoCustomizada, StatusAlerta, Severidade)
+                VALUES {', '.join(["(%s, %s, %s, 'Novo', %s)"] * len(rows))}
+            """, tuple(v for row in rows for v in row))
+
+    def snapshot(self):
+        """Estado resumido do monitor (para o endpoint administrativo)."""
+        with self._lock:
+            intervals = {}
+            for state in self._devices.values():
+                key = 'curto' if state.interval <= self.min_interval else ('longo' if state.interval >= self.max_interval else 'medio')
+                intervals[key] = intervals.get(key, 0) + 1
+            now = time.monotonic()
+            due = sum(1 for state in self._devices.values() if state.next_due <= now)
+            return dict(self.stats, monitorados=len(self._devices), vencidos=due, intervalos=intervals,
+                        rodando=bool(self._thread and self._thread.is_alive()))
@@ -0,0 +1,468 @@
+import os
+import hashlib
+import threading
+import time
+import uuid
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import nmap
+
+from scan_jobs import STATUS_PENDENTE, STATUS_EXECUTANDO, STATUS_CONCLUIDA, STATUS_FALHOU
+from job_store import TIPO_DETALHADA
+from port_services import save_port_services
+from oui_index import fabricante_ids
+
+log = logging.getLogger(__name__)
+
+NO_RESPONSE_OUTPUT = "Nenhum host encontrado por Nmap ou IP não respondeu à varredura detalhada."
+
+# Portas TCP sondadas na checagem rápida do modo diferencial, além das já conhecidas do host.
+DEFAULT_QUICK_PORTS = "21,22,23,25,53,80,110,135,139,143,443,445,993,995,1433,1723,3306,3389,5900,8080"
+
+_UPDATE_SQL = """
+    UPDATE IPsDescobertos
+    SET NomeHostResolvido = COALESCE(%s, NomeHostResolvido),
+        MAC_Address_Estimado = COALESCE(%s, MAC_Address_Estimado),
+        ID_Fabricante_Estimado = COALESCE(%s, ID_Fabricante_Estimado),
+        OS_Estimado = %s,
+        Portas_Abertas = %s,
+        DetalhesVarreduraExtra = %s,
+        StatusResolucao = %s,
+        FingerprintServicos = %s,
+        DataUltimaAnaliseCompleta = %s,
+        DataUltimaDeteccao = CURRENT_TIMESTAMP
+    WHERE ID_IPDescoberto = %s
+"""
+
+
+def nmap_arguments():
+    """Argumentos do Nmap para a varredura detalhada (com detecção de SO se NMAP_USE_OS_DETECTION=true)."""
+    nmap_args = '-sV -T4 -Pn'
+    if os.getenv('NMAP_USE_OS_DETECTION', 'false').lower() == 'true':
+        nmap_args += ' -O --version-intensity 5'
+    return nmap_args
+
+
+def service_fingerprint(tcp_ports):
+    """
+    Impressão digital dos serviços de um host: hash do conjunto de portas TCP abertas. Produto e
+    versão de cada porta são comparados à parte, com ServicoPorta (ver `_services_changed`).
+    """
+    return hashlib.sha1(','.join(str(p) for p in sorted(set(tcp_ports))).encode('ascii')).hexdigest()
+
+
+def _open_tcp_services(nm, ip_address):
+    """{porta: (produto, versão)} das portas TCP abertas do host no resultado do Nmap."""
+    if ip_address not in nm.all_hosts() or 'tcp' not in nm[ip_address].all_protocols():
+        return {}
+    tcp = nm[ip_address]['tcp']
+    return {int(port): ((info.get('product') or '').strip(), (info.get('version') or '').strip())
+            for port, info in tcp.items() if info['state'] == 'open'}
+
+
+def _services_changed(probed, known):
+    """
+    True se a checagem rápida identificou, em alguma porta, produto ou versão diferente do gravado na
+    última análise completa. Campos que a checagem não identificou (vazios) não contam como mudança.
+    """
+    for port, (product, version) in probed.items():
+        known_product, known_version = known.get(port, ('', ''))
+        if (product and product != known_product) or (version and version != known_version):
+            return True
+    return False
+
+
+def _host_csv(nm, host_key):
+    """Saída CSV do Nmap restrita às linhas de um host (a invocação pode ter vários alvos)."""
+    lines = nm.csv().splitlines()
+    if not lines:
+        return NO_RESPONSE_OUTPUT
+    rows = [line for line in lines[1:] if line.split(';', 1)[0] == host_key]
+    return '\n'.join([lines[0]] + rows)
+
+
+def parse_nmap_host(nm, ip_address):
+    """
+    Extrai do resultado do Nmap os detalhes de um IP: hostname, MAC, SO mais provável,
+    portas abertas (lista de "porta/proto - serviço", para IPsDescobertos.Portas_Abertas),
+    os mesmos serviços estruturados (para ServicoPorta) e a saída bruta em CSV.
+    """
+    result = {
+        "hostname_nmap": ip_address,
+        "mac_address_estimado": None,
+        "os_estimado": None,
+        "portas_abertas": [],
+        "servicos": [],
+        "raw_output": NO_RESPONSE_OUTPUT,
+    }
+    if ip_address not in nm.all_hosts():
+        log.warning(f"NMAP_SCAN: Nenhum resultado do Nmap para o IP {ip_address}.")
+        return result
+
+    host_data = nm[ip_address]
+    result["raw_output"] = _host_csv(nm, ip_address)
+    log.debug(f"NMAP_SCAN: Resultado Nmap para {ip_address}: {host_data.state()}")
+
+    if host_data.hostnames():
+        for h_entry in host_data.hostnames():
+            if h_entry.get('name') and h_entry.get('type') in ['PTR', 'user']:
+                result["hostname_nmap"] = h_entry['name']
+                break
+        if result["hostname_nmap"] == ip_address and host_data.hostnames()[0].get('name'):
+            result["hostname_nmap"] = host_data.hostnames()[0]['name']
+
+    if 'mac' in host_data.get('addresses', {}):
+        result["mac_address_estimado"] = host_data['addresses']['mac'].upper()
+
+    if 'osmatch' in host_data and host_data['osmatch']:
+        best_os_match = sorted(host_data['osmatch'], key=lambda x: int(x['accuracy']), reverse=True)[0]
+        result["os_estimado"] = best_os_match.get('name', 'N/D')
+
+    for proto in host_data.all_protocols():
+        if proto in ['tcp', 'udp']:
+            for port in sorted(host_data[proto].keys(), key=int):
+                port_info = host_data[proto][port]
+                if port_info['state'] == 'open':
+                    service_name = port_info.get('name', '')
+                    product = port_info.get('product', '')
+                    version = port_info.get('version', '')
+                    service_details = f"{service_name} ({product} {version})".replace("()", "").replace("( )", "").strip()
+                    result["portas_abertas"].append(f"{port}/{proto} - {service_details if service_details else 'Serviço Desconhecido'}")
+                    result["servicos"].append({"porta": int(port), "protocolo": proto, "servico": service_name,
+                                               "produto": product, "versao": version})
+    return result
+
+
+def save_detail_result(cursor, id_ip_descoberto, ip_address, result, seen_at=None, oui=None):
+    """
+    Grava o resultado da varredura detalhada de um IP: o resumo em IPsDescobertos (status 'Analisado')
+    e uma linha por porta aberta em ServicoPorta. Com `oui` (OuiIndex), o fabricante do MAC também é
+    identificado e gravado em ID_Fabricante_Estimado.
+    """
+    hostname = result["hostname_nmap"]
+    os_estimado = result["os_estimado"]
+    seen_at = (seen_at or datetime.now()).replace(microsecond=0)
+    tcp_ports = [s["porta"] for s in result["servicos"] if s["protocolo"] == 'tcp']
+    mac = result["mac_address_estimado"]
+    vendor = oui.lookup(mac) if oui and mac else None
+    result["fabricante_estimado"] = vendor
+    id_fabricante = fabricante_ids(cursor, [vendor]).get(vendor[:100]) if vendor else None
+    cursor.execute(_UPDATE_SQL, (
+        hostname if hostname and hostname != ip_address else None,
+        mac,
+        id_fabricante,
+        os_estimado if os_estimado and os_estimado != 'N/D' else None,
+        "\n".join(result["portas_abertas"]) if result["portas_abertas"] else None,
+        result["raw_output"],
+        'Analisado',
+        service_fingerprint(tcp_ports),
+        seen_at,
+        id_ip_descoberto,
+    ))
+    save_port_services(cursor, id_ip_descoberto, ip_address, result["servicos"], seen_at)
+
+
+class DetailScanJob:
+    """Lote de IPs descobertos enviados para varredura detalhada, com o estado de cada alvo."""
+
+    def __init__(self, targets, differential=False):
+        self.id = uuid.uuid4().hex
+        self.differential = differential
+        self.status = STATUS_PENDENTE
+        self.created_at = time.time()
+        self.finished_at = None
+        # id_ip_descoberto -> {"ip_address", "status", "result"/"error"}
+        self.targets = {id_ip: {"ip_address": ip, "status": STATUS_PENDENTE} for id_ip, ip in targets}
+        self._version = 0
+        self._synced_version = -1   # última versão gravada no JobStore
+        self._lock = threading.Lock()
+
+    def _update_status(self):
+        states = [t["status"] for t in self.targets.values()]
+        if all(s in (STATUS_CONCLUIDA, STATUS_FALHOU) for s in states):
+            self.status = STATUS_FALHOU if all(s == STATUS_FALHOU for s in states) else STATUS_CONCLUIDA
+            self.finished_at = time.monotonic()
+        elif any(s != STATUS_PENDENTE for s in states):
+            self.status = STATUS_EXECUTANDO
+
+    def mark(self, id_ip, status, result=None, error=None):
+        with self._lock:
+            target = self.targets[id_ip]
+            target["status"] = status
+            if result is not None:
+                target["result"] = result
+            if error is not None:
+                target["error"] = error
+            self._update_status()
+            self._version += 1
+
+    @property
+    def finished(self):
+        return self.status in (STATUS_CONCLUIDA, STATUS_FALHOU)
+
+    def store_changes(self):
+        """Estado completo do job para o JobStore, ou None se nada mudou desde a última gravação."""
+        if self._version == self._synced_version:
+            return None
+        version = self._version
+        data = self.to_dict()
+        return {"tipo": TIPO_DETALHADA, "origem": "Manual", "status": data["status"],
+                "finished": data["status"] in (STATUS_CONCLUIDA, STATUS_FALHOU), "erro": None,
+                "estado": data, "seq": 0, "events": [], "version": version}
+
+    def store_synced(self, changes):
+        with self._lock:
+            self._synced_version = max(self._synced_version, changes["version"])
+
+    def to_dict(self):
+        with self._lock:
+            counts = {}
+            for target in self.targets.values():
+                counts[target["status"]] = counts.get(target["status"], 0) + 1
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "differential": self.differential,
+                "total": len(self.targets),
+                "counts": counts,
+                "targets": [dict(id_ip_descoberto=id_ip, **target) for id_ip, target in self.targets.items()],
+            }
+
+
+class StoredDetailScanJob:
+    """Job de varredura detalhada executado por outro worker, lido do JobStore."""
+
+    def __init__(self, row):
+        self.id = row["ID_Job"]
+        self.status = row["Status"]
+        self._estado = row["Estado"]
+
+    @property
+    def finished(self):
+        return self.status in (STATUS_CONCLUIDA, STATUS_FALHOU)
+
+    def to_dict(self):
+        return self._estado
+
+
+class DetailScanQueue:
+    """
+    Fila de varreduras detalhadas (Nmap). Os alvos de cada lote são agrupados em invocações do
+    Nmap de até `group_size` IPs, executadas por `workers` threads em paralelo; o resultado de
+    cada IP é gravado em IPsDescobertos assim que o seu grupo termina.
+
+    No modo diferencial, cada grupo passa antes por uma checagem rápida (sem -O, e com -sV em intensidade
+    leve se `quick_version`) das portas TCP já conhecidas de cada host mais `quick_ports`; a varredura
+    completa só roda para os hosts cuja impressão digital mudou, com produto ou versão de serviço diferente, que nunca tiveram análise completa ou cuja análise tem mais de
+    `max_age_hours`. Os demais só têm a data de detecção atualizada.
+
+    Com um `store` (JobStore), o estado dos jobs também é gravado no banco, e `get` encontra os jobs
+    criados em outros workers. A checagem de IPs já na fila continua valendo só dentro do processo.
+    """
+
+    def __init__(self, connection_factory, workers=4, group_size=8, retention_seconds=3600, arguments_factory=nmap_arguments,
+                 differential=False, quick_ports=DEFAULT_QUICK_PORTS, quick_version=True, max_age_hours=168, oui=None,
+                 store=None):
+        self.connection_factory = connection_factory
+        self.oui = oui
+        self.store = store
+        self.workers = max(1, int(workers))
+        self.group_size = max(1, int(group_size))
+        self.retention_seconds = float(retention_seconds)
+        self.arguments_factory = arguments_factory
+        self.differential = differential
+        self.quick_ports = {int(p) for p in str(quick_ports).split(',') if p.strip()}
+        self.quick_version = quick_version
+        self.max_age = timedelta(hours=float(max_age_hours))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='nmap-detail')
+        self._jobs = {}
+        self._in_flight = set()   # IDs de IPs já na fila ou em varredura
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, connection_factory, **kwargs):
+        return cls(
+            connection_factory,
+            workers=os.getenv('NMAP_DETAIL_WORKERS', '4'),
+            group_size=os.getenv('NMAP_DETAIL_GROUP_SIZE', '8'),
+            retention_seconds=os.getenv('NMAP_DETAIL_RETENTION_SECONDS', '3600'),
+            differential=os.getenv('NMAP_DETAIL_DIFFERENTIAL', 'false').lower() == 'true',
+            quick_ports=os.getenv('NMAP_QUICK_PORTS', DEFAULT_QUICK_PORTS),
+            quick_version=os.getenv('NMAP_QUICK_VERSION_DETECTION', 'true').lower() == 'true',
+            max_age_hours=os.getenv('NMAP_DETAIL_MAX_AGE_HOURS', '168'),
+            **kwargs
+        )
+
+    def submit(self, targets, differential=None):
+        """
+        Enfileira [(id_ip_descoberto, ip)] para varredura. IPs que já estão na fila são ignorados.
+        `differential` (padrão: NMAP_DETAIL_DIFFERENTIAL) ativa a checagem rápida antes da completa.
+        Retorna (job, ids_ignorados); job é None se nenhum alvo foi enfileirado.
+        """
+        if differential is None:
+            differential = self.differential
+        with self._lock:
+            self._purge()
+            skipped = [id_ip for id_ip, _ip in targets if id_ip in self._in_flight]
+            accepted = [(id_ip, ip) for id_ip, ip in targets if id_ip not in self._in_flight]
+            if not accepted:
+                return None, skipped
+            job = DetailScanJob(accepted, differential)
+            self._jobs[job.id] = job
+            self._in_flight.update(id_ip for id_ip, _ip in accepted)
+        if self.store:
+            self.store.track(job)
+
+        for start in range(0, len(accepted), self.group_size):
+            self._executor.submit(self._run_group, job, accepted[start:start + self.group_size])
+        log.info(f"NMAP_SCAN: Job {job.id} criado para {len(accepted)} IPs em grupos de até {self.group_size}.")
+        return job, skipped
+
+    def get(self, job_id):
+        """Job local ou, com `store`, o job gravado por outro worker; None se não existir (ou já expirou)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job or not self.store:
+            return job
+        row = self.store.load(job_id, TIPO_DETALHADA)
+        return StoredDetailScanJob(row) if row else None
+
+    def _run_group(self, job, group):
+        for id_ip, _ip in group:
+            job.mark(id_ip, STATUS_EXECUTANDO)
+        if job.differential:
+            try:
+                group = self._skip_unchanged(job, group)
+            except Exception as e:
+                # Sem a checagem rápida, segue com a varredura completa do grupo todo.
+                log.warning(f"NMAP_SCAN: Checagem diferencial falhou ({e}); executando varredura completa.")
+                group = [(id_ip, ip) for id_ip, ip in group if job.targets[id_ip]["status"] == STATUS_EXECUTANDO]
+            if not group:
+                return
+        self._full_scan(job, group)
+
+    def _load_fingerprints(self, cursor, ids):
+        """
+        Impressão digital, data da última análise completa e portas TCP abertas conhecidas de cada IP,
+        com o produto e a versão gravados para cada porta.
+        """
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            SELECT ID_IPDescoberto, FingerprintServicos, DataUltimaAnaliseCompleta
+            FROM IPsDescobertos WHERE ID_IPDescoberto IN ({placeholders})
+        """, tuple(ids))
+        state = {row[0]: {"fingerprint": row[1], "analisado_em": row[2], "portas": set(), "servicos": {}}
+                 for row in cursor.fetchall()}
+        cursor.execute(f"""
+            SELECT ID_IPDescoberto, Porta, Produto, Versao FROM ServicoPorta
+            WHERE ID_IPDescoberto IN ({placeholders}) AND Protocolo = 'tcp' AND Aberta = TRUE
+        """, tuple(ids))
+        for id_ip, porta, produto, versao in cursor.fetchall():
+            if id_ip in state:
+                state[id_ip]["portas"].add(int(porta))
+                state[id_ip]["servicos"][int(porta)] = ((produto or '').strip(), (versao or '').strip())
+        return state
+
+    def _skip_unchanged(self, job, group):
+        """
+        Checagem rápida do modo diferencial. Grava os hosts inalterados e retorna os que ainda
+        precisam de varredura completa.
+        """
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("sem conexão com o banco de dados")
+            cursor = conn.cursor()
+            state = self._load_fingerprints(cursor, [id_ip for id_ip, _ip in group])
+            now = datetime.now()
+            candidates = [(id_ip, ip) for id_ip, ip in group
+                          if state.get(id_ip, {}).get("fingerprint") and state[id_ip]["analisado_em"]
+                          and now - state[id_ip]["analisado_em"] < self.max_age]
+            if not candidates:
+                return group
+
+            probe_ports = {id_ip: state[id_ip]["portas"] | self.quick_ports for id_ip, _ip in candidates}
+            all_ports = sorted(set().union(*probe_ports.values()))
+            hosts = ' '.join(ip for _id_ip, ip in candidates)
+            nm = nmap.PortScanner()
+            nmap_args = f"-Pn -T4 -p {','.join(str(p) for p in all_ports)}"
+            if self.quick_version:
+                # Detecção de versão leve: acha troca de produto/versão sem o custo da varredura completa.
+                nmap_args += " -sV --version-light"
+            log.info(f"NMAP_SCAN: Checagem rápida ({len(all_ports)} portas) nos IPs: {hosts}")
+            nm.scan(hosts=hosts, arguments=nmap_args)
+
+            seen_at = now.replace(microsecond=0)
+            unchanged = set()
+            for id_ip, ip in candidates:
+                # Só as portas sondadas para este host entram na comparação.
+                services = {port: info for port, info in _open_tcp_services(nm, ip).items() if port in probe_ports[id_ip]}
+                open_ports = set(services)
+                if service_fingerprint(open_ports) != state[id_ip]["fingerprint"]:
+                    continue
+                if _services_changed(services, state[id_ip]["servicos"]):
+                    log.info(f"NMAP_SCAN: Produto/versão de serviço mudou em {ip}; segue para varredura completa.")
+                    continue
+                cursor.execute("UPDATE IPsDescobertos SET DataUltimaDeteccao = CURRENT_TIMESTAMP WHERE ID_IPDescoberto = %s", (id_ip,))
+                cursor.execute("UPDATE ServicoPorta SET DataUltimaDeteccao = %s WHERE ID_IPDescoberto = %s AND Aberta = TRUE",
+                               (seen_at, id_ip))
+                conn.commit()
+                unchanged.add(id_ip)
+                job.mark(id_ip, STATUS_CONCLUIDA, result={"inalterado": True, "portas_tcp_abertas": sorted(open_ports)})
+                self._release([id_ip])
+            log.info(f"NMAP_SCAN: {len(unchanged)} de {len(group)} IPs inalterados; {len(group) - len(unchanged)} seguem para varredura completa.")
+            return [(id_ip, ip) for id_ip, ip in group if id_ip not in unchanged]
+
+    def _full_scan(self, job, group):
+        hosts = ' '.join(ip for _id_ip, ip in group)
+        try:
+            nm = nmap.PortScanner()
+            nmap_args = self.arguments_factory()
+            log.info(f"NMAP_SCAN: Executando Nmap com argumentos: '{nmap_args}' nos IPs: {hosts}")
+            nm.scan(hosts=hosts, arguments=nmap_args)
+        except Exception as e:
+            if isinstance(e, nmap.PortScannerError):
+                log.error(f"NMAP_SCAN: Erro do Nmap ao escanear {hosts}: {e}. Verifique a instalação e permissões (para -O).")
+            else:
+                log.exception(f"NMAP_SCAN: Erro ao escanear {hosts}")
+            self._finish_group(job, group, error=f"Erro ao executar Nmap: {e}")
+            return
+
+        try:
+            with self.connection_factory() as conn:
+                if not conn:
+                    raise ConnectionError("sem conexão com o banco de dados")
+                cursor = conn.cursor()
+                seen_at = datetime.now()
+                for id_ip, ip in group:
+                    result = parse_nmap_host(nm, ip)
+                    save_detail_result(cursor, id_ip, ip, result, seen_at, oui=self.oui)
+                    conn.commit()
+                    result.pop("raw_output", None)
+                    job.mark(id_ip, STATUS_CONCLUIDA, result=result)
+                    self._release([id_ip])
+                    log.info(f"NMAP_SCAN: Varredura detalhada para {ip} concluída e salva.")
+        except Exception as e:
+            log.exception(f"NMAP_SCAN: Erro ao salvar detalhes Nmap de {hosts}")
+            pending = [(id_ip, ip) for id_ip, ip in group if job.targets[id_ip]["status"] == STATUS_EXECUTANDO]
+            self._finish_group(job, pending, error=f"Erro ao salvar resultado: {e}")
+
+    def _finish_group(self, job, group, error):
+        for id_ip, _ip in group:
+            job.mark(id_ip, STATUS_FALHOU, error=error)
+        self._release([id_ip for id_ip, _ip in group])
+
+    def _release(self, ids):
+        with self._lock:
+            self._in_flight.difference_update(ids)
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > self.retention_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
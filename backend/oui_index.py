@@ -0,0 +1,285 @@
+import bisect
+import csv
+import mmap
+import os
+import re
+import struct
+import sys
+import logging
+from array import array
+
+from cache_version import bump_cache_version, VERSAO_FABRICANTE
+
+log = logging.getLogger(__name__)
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_INDEX_PATH = os.path.join(_DATA_DIR, 'oui_index.bin')
+# Arquivos de fabricantes procurados quando OUI_VENDOR_FILE não é informado: os colocados em backend/data
+# (IEEE oui.csv/oui.txt ou manuf do Wireshark) e os instalados junto com o Nmap/Wireshark.
+DEFAULT_VENDOR_FILES = [os.path.join(_DATA_DIR, name) for name in ('oui.csv', 'oui.txt', 'manuf')] + [
+    '/usr/share/nmap/nmap-mac-prefixes',
+    '/usr/local/share/nmap/nmap-mac-prefixes',
+    r'C:\Program Files (x86)\Nmap\nmap-mac-prefixes',
+    r'C:\Program Files\Nmap\nmap-mac-prefixes',
+    '/usr/share/wireshark/manuf',
+    '/usr/share/ieee-data/oui.txt',
+]
+
+# Blocos IEEE: MA-L (/24), MA-M (/28) e MA-S (/36); a busca vai do prefixo mais longo ao mais curto.
+PREFIX_BITS = (36, 28, 24)
+_MAGIC = b'OUI' + (b'L' if sys.byteorder == 'little' else b'B')
+_HEADER = struct.Struct('<4sIII')      # magic, tabelas, nomes, deslocamento do índice de nomes
+_TABLE = struct.Struct('<IIII')        # bits, quantidade, deslocamento das chaves, deslocamento dos valores
+_REGISTRY_BITS = {'MA-L': 24, 'MA-M': 28, 'MA-S': 36}
+_NON_HEX = re.compile(r'[^0-9A-Fa-f]')
+
+
+def mac_to_int(mac):
+    """Converte um MAC (com ':', '-', '.' ou sem separador) em inteiro de 48 bits; None se inválido."""
+    digits = _NON_HEX.sub('', mac or '')
+    if len(digits) != 12:
+        return None
+    return int(digits, 16)
+
+
+def _prefix(text, bits=None):
+    digits = _NON_HEX.sub('', text)
+    if bits is None:
+        bits = len(digits) * 4
+    nibbles = (bits + 3) // 4
+    if bits not in PREFIX_BITS or len(digits) < nibbles:
+        return None
+    return int(digits[:nibbles], 16) >> (nibbles * 4 - bits), bits
+
+
+def parse_vendor_file(path):
+    """
+    Lê um arquivo de prefixos de fabricantes e gera (prefixo, bits, nome). Formatos aceitos:
+    IEEE oui.csv (MA-L/MA-M/MA-S), IEEE oui.txt ("00-00-0C (hex) Nome"), manuf do Wireshark
+    ("00:00:0C<TAB>Curto<TAB>Nome", com "/28" ou "/36" opcionais) e nmap-mac-prefixes ("00000C Nome").
+    """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        head = f.read(65536)
+        f.seek(0)
+        # No oui.txt do IEEE só as linhas "(hex)" interessam; as de endereço são descartadas.
+        ieee_txt = '(hex)' in head
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or (ieee_txt and '(hex)' not in line):
+                continue
+            if line[:5] in ('MA-L,', 'MA-M,', 'MA-S,'):
+                row = next(csv.reader([line]))
+                if len(row) < 3:
+                    continue
+                parsed, name = _prefix(row[1], _REGISTRY_BITS[row[0]]), row[2]
+            elif '(hex)' in line:
+                prefix_text, name = line.split('(hex)', 1)
+                parsed = _prefix(prefix_text, 24)
+            elif '\t' in line:
+                fields = [field.strip() for field in line.split('\t')]
+                prefix_text, _sep, bits_text = fields[0].partition('/')
+                parsed = _prefix(prefix_text, int(bits_text) if bits_text.isdigit() else None)
+                name = fields[2] if len(fields) > 2 and fields[2] else fields[1] if len(fields) > 1 else ''
+            else:
+                prefix_text, _sep, name = line.partition(' ')
+                parsed = _prefix(prefix_text)
+            name = name.split('#', 1)[0].strip().strip('"')
+            if parsed and name:
+                yield parsed[0], parsed[1], name
+
+
+def build_index(vendor_path, index_path=DEFAULT_INDEX_PATH):
+    """
+    Gera o índice binário a partir do arquivo de fabricantes: para cada tamanho de prefixo, um array
+    ordenado de chaves (uint64) e outro com o índice do nome (uint32), seguidos da tabela de nomes.
+    A gravação é atômica (arquivo temporário + rename). Retorna o número de prefixos.
+    """
+    tables = {bits: {} for bits in PREFIX_BITS}
+    names = {}
+    for prefix, bits, name in parse_vendor_file(vendor_path):
+        tables[bits].setdefault(prefix, names.setdefault(name, len(names)))
+
+    name_blob = bytearray()
+    name_offsets = array('I', [0])
+    for name in names:
+        name_blob += name.encode('utf-8')
+        name_offsets.append(len(name_blob))
+
+    offset = _HEADER.size + _TABLE.size * len(PREFIX_BITS)
+    table_headers = []
+    chunks = []
+    for bits in PREFIX_BITS:
+        prefixes = sorted(tables[bits])
+        keys = array('Q', prefixes)
+        values = array('I', (tables[bits][prefix] for prefix in prefixes))
+        padding = (-offset) % 8   # chaves alinhadas em 8 bytes para o memoryview.cast('Q')
+        offset += padding
+        table_headers.append(_TABLE.pack(bits, len(prefixes), offset, offset + len(keys) * 8))
+        chunks.append(b'\x00' * padding + keys.tobytes() + values.tobytes())
+        offset += len(keys) * 8 + len(values) * 4
+    padding = (-offset) % 4
+    names_offset = offset + padding
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(PREFIX_BITS), len(names), names_offset))
+        for header in table_headers:
+            f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+        f.write(b'\x00' * padding + name_offsets.tobytes() + bytes(name_blob))
+    os.replace(tmp_path, index_path)
+    total = sum(len(table) for table in tables.values())
+    log.info(f"OUI_INDEX: Índice gerado com {total} prefixos e {len(names)} fabricantes a partir de {vendor_path}.")
+    return total
+
+
+class OuiIndex:
+    """
+    Índice OUI (prefixo do MAC -> fabricante) mapeado em memória. A busca é uma bisseção sobre os
+    arrays ordenados do arquivo, sem carregá-lo em objetos Python: do prefixo /36 ao /24.
+    Um índice vazio (sem arquivo de fabricantes) responde None para qualquer MAC.
+    """
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self._mm = None
+        self._tables = []
+        self._name_offsets = None
+        self._names_base = 0
+        self._name_cache = {}
+        if index_path:
+            self._open(index_path)
+
+    def _open(self, index_path):
+        with open(index_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, table_count, names_count, names_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"arquivo de índice OUI inválido ou de outra arquitetura: {index_path}")
+        view = memoryview(self._mm)
+        for i in range(table_count):
+            bits, count, keys_offset, values_offset = _TABLE.unpack_from(self._mm, _HEADER.size + i * _TABLE.size)
+            self._tables.append((bits, view[keys_offset:keys_offset + count * 8].cast('Q'),
+                                 view[values_offset:values_offset + count * 4].cast('I')))
+        self._name_offsets = view[names_offset:names_offset + (names_count + 1) * 4].cast('I')
+        self._names_base = names_offset + (names_count + 1) * 4
+
+    @classmethod
+    def from_env(cls):
+        """
+        Abre o índice de OUI_INDEX_PATH, gerando-o antes se não existir ou se o arquivo de fabricantes
+        (OUI_VENDOR_FILE ou o primeiro encontrado em DEFAULT_VENDOR_FILES) for mais novo.
+        """
+        index_path = os.getenv('OUI_INDEX_PATH', DEFAULT_INDEX_PATH)
+        candidates = [os.getenv('OUI_VENDOR_FILE')] if os.getenv('OUI_VENDOR_FILE') else DEFAULT_VENDOR_FILES
+        vendor_path = next((path for path in candidates if os.path.isfile(path)), None)
+        try:
+            if vendor_path and (not os.path.isfile(index_path) or os.path.getmtime(vendor_path) > os.path.getmtime(index_path)):
+                build_index(vendor_path, index_path)
+            if os.path.isfile(index_path):
+                return cls(index_path)
+        except (OSError, ValueError):
+            log.exception("OUI_INDEX: Erro ao gerar/abrir o índice OUI; fabricantes não serão identificados pelo MAC.")
+            return cls()
+        log.warning("OUI_INDEX: Nenhum arquivo de fabricantes encontrado (defina OUI_VENDOR_FILE); fabricantes não serão identificados pelo MAC.")
+        return cls()
+
+    def __len__(self):
+        return sum(len(keys) for _bits, keys, _values in self._tables)
+
+    def _name(self, name_index):
+        name = self._name_cache.get(name_index)
+        if name is None:
+            start = self._names_base + self._name_offsets[name_index]
+            end = self._names_base + self._name_offsets[name_index + 1]
+            name = self._mm[start:end].decode('utf-8')
+            self._name_cache[name_index] = name
+        return name
+
+    def lookup(self, mac):
+        """Nome do fabricante do MAC, ou None se o prefixo não estiver no índice (ou o MAC for inválido)."""
+        value = mac_to_int(mac)
+        if value is None:
+            return None
+        for bits, keys, values in self._tables:
+            key = value >> (48 - bits)
+            position = bisect.bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                return self._name(values[position])
+        return None
+
+
+def fabricante_ids(cursor, vendor_names):
+    """
+    Garante uma linha em Fabricante para cada nome (truncado a 100 caracteres) e retorna {nome: ID_Fabricante}.
+    `cursor` pode ser de tuplas ou de dicionários.
+    """
+    names = sorted({name[:100] for name in vendor_names if name})
+    if not names:
+        return {}
+    placeholders = ', '.join(['(%s)'] * len(names))
+    cursor.execute(f"INSERT IGNORE INTO Fabricante (Nome) VALUES {placeholders}", tuple(names))
+    if cursor.rowcount > 0:
+        # Quem chama costuma ser outro processo (workers de varredura, scheduler): o cache de /fabricantes
+        # dos workers web percebe a mudança pela versão, que só passa a valer com o commit de quem chamou.
+        bump_cache_version(cursor, VERSAO_FABRICANTE)
+    cursor.execute(f"SELECT ID_Fabricante, Nome FROM Fabricante WHERE Nome IN ({', '.join(['%s'] * len(names))})", tuple(names))
+    ids = {}
+    for row in cursor.fetchall():
+        id_fabricante, nome = (row['ID_Fabricante'], row['Nome']) if isinstance(row, dict) else row
+        ids[nome] = id_fabricante
+    # A collation da coluna ignora maiúsculas/acentos: mapeia pelo nome pedido, não pelo gravado.
+    lowered = {nome.lower(): id_fabricante for nome, id_fabricante in ids.items()}
+    return {name: ids.get(name, lowered.get(name.lower())) for name in names}
+
+
+def fabricante_id_for_mac(cursor, index, mac):
+    """ID_Fabricante do fabricante do MAC (criando o fabricante se preciso), ou None."""
+    vendor = index.lookup(mac) if index else None
+    if not vendor:
+        return None
+    return fabricante_ids(cursor, [vendor]).get(vendor[:100])
+
+
+def backfill_vendors(conn, index, overwrite=False, page_size=5000):
+    """
+    Preenche InterfaceRede.ID_Fabricante_MAC e IPsDescobertos.ID_Fabricante_Estimado a partir do MAC,
+    percorrendo as tabelas por chave em páginas e gravando cada página com um único UPDATE.
+    Com `overwrite`, recalcula também as linhas que já têm fabricante. Retorna {tabela: linhas atualizadas}.
+    """
+    targets = [
+        ('InterfaceRede', 'ID_Interface', 'EnderecoMAC', 'ID_Fabricante_MAC'),
+        ('IPsDescobertos', 'ID_IPDescoberto', 'MAC_Address_Estimado', 'ID_Fabricante_Estimado'),
+    ]
+    cursor = conn.cursor()
+    updated = {}
+    for table, key_column, mac_column, fab_column in targets:
+        last_id = 0
+        total = 0
+        while True:
+            cursor.execute(f"""
+                SELECT {key_column}, {mac_column} FROM {table}
+                WHERE {key_column} > %s AND {mac_column} IS NOT NULL {'' if overwrite else f'AND {fab_column} IS NULL'}
+                ORDER BY {key_column} LIMIT %s
+            """, (last_id, page_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            vendors = {row_id: index.lookup(mac) for row_id, mac in rows}
+            ids = fabricante_ids(cursor, vendors.values())
+            changes = [(row_id, ids[vendor[:100]]) for row_id, vendor in vendors.items() if vendor]
+            if changes:
+                cursor.execute(f"""
+                    UPDATE {table} SET {fab_column} = CASE {key_column} {' '.join(['WHEN %s THEN %s'] * len(changes))} END
+                    WHERE {key_column} IN ({', '.join(['%s'] * len(changes))})
+                """, tuple(v for change in changes for v in change) + tuple(row_id for row_id, _id in changes))
+                total += len(changes)
+            conn.commit()
+            if len(rows) < page_size:
+                break
+        updated[table] = total
+        log.info(f"OUI_BACKFILL: {total} linhas de {table} com fabricante identificado pelo MAC.")
+    return updated
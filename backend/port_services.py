@@ -0,0 +1,82 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+PROTOCOLOS = ('tcp', 'udp')
+
+_UPSERT_SQL = """
+    INSERT INTO ServicoPorta (ID_IPDescoberto, EnderecoIP, Porta, Protocolo, Servico, Produto, Versao, Aberta,
+                              DataPrimeiraDeteccao, DataUltimaDeteccao)
+    VALUES {values}
+    ON DUPLICATE KEY UPDATE
+        EnderecoIP = VALUES(EnderecoIP), Servico = VALUES(Servico), Produto = VALUES(Produto),
+        Versao = VALUES(Versao), Aberta = TRUE, DataUltimaDeteccao = VALUES(DataUltimaDeteccao)
+"""
+
+
+def _clean(value, max_length):
+    value = (value or '').strip()
+    return value[:max_length] if value else None
+
+
+def save_port_services(cursor, id_ip_descoberto, ip_address, services, seen_at):
+    """
+    Grava os serviços abertos de um IP numa única instrução (INSERT multi-linha com upsert) e marca
+    como fechadas (Aberta = FALSE) as portas do IP que não apareceram nesta varredura.
+    `services` é a lista de dicts porta/protocolo/servico/produto/versao de `parse_nmap_host`;
+    `seen_at` é o instante da varredura (o mesmo para todas as portas do IP).
+    """
+    seen_at = seen_at.replace(microsecond=0)  # precisão da coluna TIMESTAMP
+    rows = []
+    for service in services:
+        rows.append((id_ip_descoberto, ip_address, int(service['porta']), service['protocolo'],
+                     _clean(service.get('servico'), 100), _clean(service.get('produto'), 255),
+                     _clean(service.get('versao'), 100), seen_at, seen_at))
+    if rows:
+        values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, TRUE, %s, %s)'] * len(rows))
+        cursor.execute(_UPSERT_SQL.format(values=values), tuple(v for row in rows for v in row))
+    cursor.execute("""
+        UPDATE ServicoPorta SET Aberta = FALSE
+        WHERE ID_IPDescoberto = %s AND Aberta = TRUE AND DataUltimaDeteccao < %s
+    """, (id_ip_descoberto, seen_at))
+
+
+def build_port_service_query(port=None, protocol=None, service=None, product=None, include_closed=False,
+                             limit=100, offset=0):
+    """
+    Monta (sql, params) da consulta de serviços expostos. `port` e `protocol` são exatos;
+    `service` e `product` casam por prefixo (sem diferenciar maiúsculas), usando os índices da tabela.
+    """
+    where = []
+    params = []
+    if port is not None:
+        where.append("sp.Porta = %s")
+        params.append(port)
+    if protocol:
+        where.append("sp.Protocolo = %s")
+        params.append(protocol)
+    if service:
+        where.append("sp.Servico LIKE %s")
+        params.append(_escape_like(service) + '%')
+    if product:
+        where.append("sp.Produto LIKE %s")
+        params.append(_escape_like(product) + '%')
+    if not include_closed:
+        where.append("sp.Aberta = TRUE")
+
+    sql = f"""
+        SELECT sp.ID_IPDescoberto, sp.EnderecoIP, ipd.NomeHostResolvido, ipd.StatusResolucao,
+               sp.Porta, sp.Protocolo, sp.Servico, sp.Produto, sp.Versao, sp.Aberta,
+               sp.DataPrimeiraDeteccao, sp.DataUltimaDeteccao
+        FROM ServicoPorta sp
+        JOIN IPsDescobertos ipd ON ipd.ID_IPDescoberto = sp.ID_IPDescoberto
+        {('WHERE ' + ' AND '.join(where)) if where else ''}
+        ORDER BY sp.Porta ASC, sp.Protocolo ASC, sp.ID_IPDescoberto ASC
+        LIMIT %s OFFSET %s
+    """
+    params.extend([limit, offset])
+    return sql, tuple(params)
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
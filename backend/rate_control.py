@@ -0,0 +1,223 @@
+import asyncio
+import ipaddress
+import os
+import threading
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class _AimdState:
+    """Ritmo (pps) de um orçamento — global ou de uma sub-rede — com os contadores da janela atual e totais."""
+
+    __slots__ = ('rate', 'max_rate', 'next_send', 'last_used', 'window_probes', 'window_replies', 'window_retried',
+                 'window_errors', 'sent', 'replies', 'retried', 'timeouts', 'errors', 'buffer_full', 'last_loss',
+                 'increases', 'decreases', 'srtt')
+
+    def __init__(self, rate, max_rate):
+        self.rate = float(rate)
+        self.max_rate = float(max_rate)
+        self.next_send = 0.0
+        self.last_used = time.monotonic()
+        self.window_probes = self.window_replies = self.window_retried = self.window_errors = 0
+        self.sent = self.replies = self.retried = self.timeouts = self.errors = self.buffer_full = 0
+        self.last_loss = None
+        self.increases = self.decreases = 0
+        self.srtt = None
+
+    def reserve(self, now):
+        """Reserva o próximo horário de envio e retorna quanto esperar (s) até ele."""
+        slot = max(now, self.next_send)
+        self.next_send = slot + 1.0 / self.rate
+        self.last_used = now
+        return slot - now
+
+    def to_dict(self):
+        samples = self.replies + self.errors
+        return {
+            "pps": round(self.rate, 1),
+            "maximo_pps": round(self.max_rate, 1),
+            "enviados": self.sent,
+            "respostas": self.replies,
+            "respostas_retransmitidas": self.retried,
+            "sem_resposta": self.timeouts,
+            "erros_envio": self.errors,
+            "envios_com_buffer_cheio": self.buffer_full,
+            "perda": round((self.retried + self.errors) / samples, 4) if samples else None,
+            "perda_janela": round(self.last_loss, 4) if self.last_loss is not None else None,
+            "rtt_medio_ms": round(self.srtt, 3) if self.srtt is not None else None,
+            "aumentos": self.increases,
+            "reducoes": self.decreases,
+        }
+
+
+class ProbeRateController:
+    """
+    Controle de taxa adaptativo (AIMD) para as sondas de descoberta e monitoramento. Cada envio passa
+    por dois orçamentos: o da sub-rede do alvo (/24 no IPv4, /64 no IPv6) e o global do processo,
+    limitado a `global_max_pps`.
+
+    A perda é estimada pelas respostas que só chegaram numa retransmissão (a primeira sonda se perdeu)
+    e pelos erros de envio (buffer do socket cheio); alvos sem resposta nenhuma não contam, pois numa
+    varredura a maioria dos endereços simplesmente não existe. A janela fecha a cada `window` respostas
+    (ou `window * 10` sondas, em faixas quase vazias): se a perda passou de `loss_threshold` o ritmo é
+    multiplicado por `decrease_factor`; caso contrário sobe `increase_pps`. Assim cada sub-rede converge
+    para o maior ritmo que não perde respostas, e esse ritmo é mantido entre varreduras (as sub-redes
+    ociosas são descartadas acima de `max_subnets`).
+    A estimativa de perda depende de retransmissões (ICMP_RETRIES >= 1).
+
+    É thread-safe: o mesmo controlador atende o pipeline asyncio e o varredor síncrono do monitor.
+    """
+
+    def __init__(self, global_max_pps=500, subnet_initial_pps=100, subnet_max_pps=200, min_pps=5, increase_pps=5,
+                 decrease_factor=0.5, loss_threshold=0.05, window=20, ipv4_prefix=24, ipv6_prefix=64,
+                 max_subnets=65536):
+        self.global_max_pps = max(1.0, float(global_max_pps))
+        self.subnet_initial_pps = max(1.0, float(subnet_initial_pps))
+        self.subnet_max_pps = max(1.0, float(subnet_max_pps))
+        self.min_pps = max(0.1, float(min_pps))
+        self.increase_pps = max(0.0, float(increase_pps))
+        self.decrease_factor = min(0.99, max(0.05, float(decrease_factor)))
+        self.loss_threshold = max(0.0, float(loss_threshold))
+        self.window = max(1, int(window))
+        self.ipv4_prefix = int(ipv4_prefix)
+        self.ipv6_prefix = int(ipv6_prefix)
+        self.max_subnets = max(1, int(max_subnets))
+        # O global começa no orçamento e só cai se a perda agregada subir.
+        self._global = _AimdState(self.global_max_pps, self.global_max_pps)
+        self._subnets = {}   # (versão, rede) -> _AimdState
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Cria o controlador a partir das variáveis RATE_* (orçamento global padrão: ICMP_MAX_PPS)."""
+        return cls(
+            global_max_pps=os.getenv('RATE_GLOBAL_MAX_PPS', os.getenv('ICMP_MAX_PPS', '500')),
+            subnet_initial_pps=os.getenv('RATE_SUBNET_INITIAL_PPS', '100'),
+            subnet_max_pps=os.getenv('RATE_SUBNET_MAX_PPS', '200'),
+            min_pps=os.getenv('RATE_MIN_PPS', '5'),
+            increase_pps=os.getenv('RATE_INCREASE_PPS', '5'),
+            decrease_factor=os.getenv('RATE_DECREASE_FACTOR', '0.5'),
+            loss_threshold=os.getenv('RATE_LOSS_THRESHOLD', '0.05'),
+            window=os.getenv('RATE_WINDOW', '20'),
+            ipv4_prefix=os.getenv('RATE_SUBNET_PREFIX_V4', '24'),
+            ipv6_prefix=os.getenv('RATE_SUBNET_PREFIX_V6', '64'),
+            max_subnets=os.getenv('RATE_MAX_SUBNETS', '65536'),
+        )
+
+    def _subnet_key(self, ip_str):
+        ip = ipaddress.ip_address(ip_str)
+        if ip.version == 4:
+            return 4, int(ip) >> (32 - self.ipv4_prefix)
+        return 6, int(ip) >> (128 - self.ipv6_prefix)
+
+    def _subnet(self, ip_str):
+        key = self._subnet_key(ip_str)
+        state = self._subnets.get(key)
+        if state is None:
+            if len(self._subnets) >= self.max_subnets:
+                self._evict_idle()
+            state = _AimdState(min(self.subnet_initial_pps, self.subnet_max_pps), self.subnet_max_pps)
+            self._subnets[key] = state
+        return state
+
+    def _evict_idle(self):
+        # Descarta a metade menos usada recentemente; chamado raramente (só quando o limite é atingido).
+        by_use = sorted(self._subnets.items(), key=lambda item: item[1].last_used)
+        for key, _state in by_use[:max(1, len(by_use) // 2)]:
+            del self._subnets[key]
+
+    def reserve_subnet(self, ip_str):
+        """Reserva um envio no orçamento da sub-rede do alvo. Retorna quanto esperar (s) antes de reservar o global."""
+        with self._lock:
+            state = self._subnet(ip_str)
+            state.sent += 1
+            return state.reserve(time.monotonic())
+
+    def reserve_global(self):
+        """Reserva um envio no orçamento global. Retorna quanto esperar (s) antes de enviar."""
+        with self._lock:
+            self._global.sent += 1
+            return self._global.reserve(time.monotonic())
+
+    async def wait(self, ip_str):
+        """Aguarda (sem bloquear o event loop) a vez de enviar uma sonda para o alvo."""
+        delay = self.reserve_subnet(ip_str)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        delay = self.reserve_global()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record(self, ip_str, replied, retried=False, rtt_ms=None):
+        """Registra o resultado final da sonda de um alvo (`retried`: a resposta só veio numa retransmissão)."""
+        with self._lock:
+            for state in (self._subnet(ip_str), self._global):
+                state.window_probes += 1
+                if replied:
+                    state.replies += 1
+                    state.window_replies += 1
+                    if retried:
+                        state.retried += 1
+                        state.window_retried += 1
+                    if rtt_ms is not None:
+                        state.srtt = rtt_ms if state.srtt is None else 0.875 * state.srtt + 0.125 * rtt_ms
+                else:
+                    state.timeouts += 1
+                if state.window_replies + state.window_errors >= self.window or state.window_probes >= self.window * 10:
+                    self._adjust(state, ip_str if state is not self._global else None)
+
+    def record_send_error(self, ip_str, buffer_full=False):
+        """
+        Registra uma falha de envio, tratada como perda na janela. `buffer_full`: o buffer do socket encheu
+        (o envio é refeito depois que ele esvazia); contado à parte dos erros de envio propriamente ditos.
+        """
+        with self._lock:
+            for state in (self._subnet(ip_str), self._global):
+                if buffer_full:
+                    state.buffer_full += 1
+                else:
+                    state.errors += 1
+                state.window_errors += 1
+                state.window_probes += 1
+                if state.window_replies + state.window_errors >= self.window or state.window_probes >= self.window * 10:
+                    self._adjust(state, ip_str if state is not self._global else None)
+
+    def _adjust(self, state, ip_str):
+        samples = state.window_replies + state.window_errors
+        loss = (state.window_retried + state.window_errors) / samples if samples >= self.window else None
+        previous = state.rate
+        if loss is not None and loss > self.loss_threshold:
+            state.rate = max(self.min_pps, state.rate * self.decrease_factor)
+            state.decreases += 1
+            log.info(f"RATE_CONTROL ({ip_str or 'global'}): Perda de {loss:.1%} na janela; ritmo reduzido de "
+                     f"{previous:.0f} para {state.rate:.0f} pps.")
+        elif state.rate < state.max_rate:
+            # Janela limpa (ou sem respostas suficientes para medir perda): aumento aditivo.
+            state.rate = min(state.max_rate, state.rate + self.increase_pps)
+            state.increases += 1
+        state.last_loss = loss
+        state.window_probes = state.window_replies = state.window_retried = state.window_errors = 0
+
+    def _subnet_label(self, key):
+        version, network = key
+        prefix = self.ipv4_prefix if version == 4 else self.ipv6_prefix
+        bits = 32 if version == 4 else 128
+        return str(ipaddress.ip_network((network << (bits - prefix), prefix)))
+
+    def snapshot(self, limit=50):
+        """Ritmo e perda atuais: global e das sub-redes mais limitadas (menor ritmo primeiro)."""
+        with self._lock:
+            subnets = sorted(self._subnets.items(), key=lambda item: (item[1].rate, -item[1].sent))
+            data = {
+                "global": dict(self._global.to_dict(), minimo_pps=self.min_pps),
+                "total_sub_redes": len(self._subnets),
+                "sub_redes": [dict(state.to_dict(), sub_rede=self._subnet_label(key)) for key, state in subnets[:limit]],
+            }
+        data["parametros"] = {
+            "sub_rede_inicial_pps": self.subnet_initial_pps, "sub_rede_maximo_pps": self.subnet_max_pps,
+            "aumento_pps": self.increase_pps, "fator_reducao": self.decrease_factor,
+            "limiar_perda": self.loss_threshold, "janela": self.window,
+        }
+        return data
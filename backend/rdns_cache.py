@@ -0,0 +1,215 @@
+import os
+import socket
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+STATUS_OK = 'ok'
+STATUS_NXDOMAIN = 'nxdomain'
+STATUS_TIMEOUT = 'timeout'
+STATUS_ERRO = 'erro'
+
+
+class ReverseDnsResolver:
+    """
+    DNS reverso (PTR) com cache. Cada consulta roda no pool próprio do resolvedor e o chamador espera
+    no máximo `timeout` segundos; consultas simultâneas ao mesmo IP compartilham a mesma resolução.
+
+    O cache guarda respostas positivas por `ttl` segundos e negativas (sem PTR, timeout ou erro) por
+    `negative_ttl`/`timeout_ttl`, com descarte LRU acima de `max_entries`. As entradas alteradas são
+    gravadas em CacheDNSReverso a cada `flush_seconds` e recarregadas na inicialização, de modo que
+    varreduras repetidas das mesmas sub-redes quase não consultam o DNS.
+    """
+
+    def __init__(self, connection_factory, resolve_func=None, timeout=2.0, ttl=86400, negative_ttl=3600,
+                 timeout_ttl=600, max_entries=100000, workers=32, flush_seconds=60):
+        self.connection_factory = connection_factory
+        self.resolve_func = resolve_func or (lambda ip_str: socket.gethostbyaddr(ip_str)[0])
+        self.timeout = float(timeout)
+        self.ttl = float(ttl)
+        self.negative_ttl = float(negative_ttl)
+        self.timeout_ttl = float(timeout_ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.flush_seconds = float(flush_seconds)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='rdns-lookup')
+        self._cache = OrderedDict()   # ip -> (hostname, status, expira_em epoch)
+        self._dirty = set()
+        self._in_flight = {}          # ip -> Future
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.metrics = {"hits": 0, "hits_negativos": 0, "misses": 0, "consultas": 0,
+                        "timeouts": 0, "nxdomain": 0, "erros": 0}
+
+    @classmethod
+    def from_env(cls, connection_factory, **kwargs):
+        return cls(
+            connection_factory,
+            timeout=os.getenv('RDNS_TIMEOUT_SECONDS', '2'),
+            ttl=os.getenv('RDNS_TTL_SECONDS', '86400'),
+            negative_ttl=os.getenv('RDNS_NEGATIVE_TTL_SECONDS', '3600'),
+            timeout_ttl=os.getenv('RDNS_TIMEOUT_TTL_SECONDS', '600'),
+            max_entries=os.getenv('RDNS_CACHE_MAX_ENTRIES', '100000'),
+            workers=os.getenv('RDNS_WORKERS', '32'),
+            flush_seconds=os.getenv('RDNS_FLUSH_SECONDS', '60'),
+            **kwargs
+        )
+
+    def resolve(self, ip_str):
+        """Retorna o hostname do IP (ou None se não houver PTR, a consulta expirar ou falhar)."""
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(ip_str)
+            if entry and entry[2] > now:
+                self._cache.move_to_end(ip_str)
+                self.metrics["hits" if entry[1] == STATUS_OK else "hits_negativos"] += 1
+                return entry[0]
+            self.metrics["misses"] += 1
+            future = self._in_flight.get(ip_str)
+            if future is None:
+                future = self._executor.submit(self._lookup, ip_str)
+                self._in_flight[ip_str] = future
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.metrics["timeouts"] += 1
+                # A consulta continua no pool; se responder depois, sobrescreve esta entrada.
+                if ip_str in self._in_flight:
+                    self._store(ip_str, None, STATUS_TIMEOUT, time.time() + self.timeout_ttl)
+            log.warning(f"RDNS ({ip_str}): Timeout de {self.timeout:.1f}s na resolução.")
+            return None
+
+    def _lookup(self, ip_str):
+        hostname = None
+        try:
+            hostname = self.resolve_func(ip_str)
+            status, ttl = STATUS_OK, self.ttl
+            log.info(f"RDNS ({ip_str}): Hostname resolvido: {hostname}")
+        except (socket.herror, socket.gaierror):
+            status, ttl = STATUS_NXDOMAIN, self.negative_ttl
+            log.debug(f"RDNS ({ip_str}): Sem registro PTR.")
+        except Exception as e_dns:
+            status, ttl = STATUS_ERRO, self.timeout_ttl
+            log.error(f"RDNS ({ip_str}): Erro genérico na resolução DNS: {e_dns}")
+        with self._lock:
+            self.metrics["consultas"] += 1
+            if status == STATUS_NXDOMAIN:
+                self.metrics["nxdomain"] += 1
+            elif status == STATUS_ERRO:
+                self.metrics["erros"] += 1
+            self._store(ip_str, hostname, status, time.time() + ttl)
+            self._in_flight.pop(ip_str, None)
+        return hostname
+
+    def _store(self, ip_str, hostname, status, expires_at):
+        self._cache[ip_str] = (hostname[:255] if hostname else None, status, expires_at)
+        self._cache.move_to_end(ip_str)
+        self._dirty.add(ip_str)
+        while len(self._cache) > self.max_entries:
+            evicted, _entry = self._cache.popitem(last=False)
+            self._dirty.discard(evicted)
+
+    def invalidate(self, ip_str=None):
+        """Remove um IP (ou todos) do cache, em memória e no banco; a próxima varredura consulta o DNS novamente."""
+        with self._lock:
+            if ip_str is None:
+                self._cache.clear()
+                self._dirty.clear()
+            else:
+                self._cache.pop(ip_str, None)
+                self._dirty.discard(ip_str)
+        with self.connection_factory() as conn:
+            if not conn:
+                log.error("RDNS: Sem conexão com o banco; cache persistido não foi invalidado.")
+                return
+            cursor = conn.cursor()
+            if ip_str is None:
+                cursor.execute("DELETE FROM CacheDNSReverso")
+            else:
+                cursor.execute("DELETE FROM CacheDNSReverso WHERE EnderecoIP = %s", (ip_str,))
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.metrics, entradas=len(self._cache), pendentes_gravacao=len(self._dirty),
+                        em_andamento=len(self._in_flight))
+        lookups = data["hits"] + data["hits_negativos"] + data["misses"]
+        data["taxa_acerto"] = round((data["hits"] + data["hits_negativos"]) / lookups, 4) if lookups else None
+        return data
+
+    def load(self):
+        """Carrega do banco as entradas ainda válidas (as mais recentes primeiro, até `max_entries`)."""
+        with self.connection_factory() as conn:
+            if not conn:
+                log.error("RDNS: Sem conexão com o banco; cache de DNS reverso iniciado vazio.")
+                return 0
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT EnderecoIP, NomeHost, Status, Expira FROM CacheDNSReverso
+                WHERE Expira > NOW() ORDER BY Expira DESC LIMIT %s
+            """, (self.max_entries,))
+            rows = cursor.fetchall()
+        with self._lock:
+            for ip_str, hostname, status, expira in reversed(rows):
+                if ip_str not in self._cache:
+                    self._cache[ip_str] = (hostname, status, expira.timestamp())
+        log.info(f"RDNS: {len(rows)} entradas de DNS reverso carregadas do banco.")
+        return len(rows)
+
+    def flush(self):
+        """Grava as entradas alteradas em CacheDNSReverso e remove as já expiradas."""
+        with self._lock:
+            rows = [(ip_str,) + self._cache[ip_str] for ip_str in self._dirty if ip_str in self._cache]
+            self._dirty.clear()
+        with self.connection_factory() as conn:
+            if not conn:
+                log.error(f"RDNS: Sem conexão com o banco; {len(rows)} entradas de cache não gravadas.")
+                with self._lock:
+                    self._dirty.update(row[0] for row in rows)
+                return 0
+            cursor = conn.cursor()
+            for start in range(0, len(rows), 1000):
+                chunk = rows[start:start + 1000]
+                cursor.execute(f"""
+                    INSERT INTO CacheDNSReverso (EnderecoIP, NomeHost, Status, Expira)
+                    VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))}
+                    ON DUPLICATE KEY UPDATE NomeHost = VALUES(NomeHost), Status = VALUES(Status), Expira = VALUES(Expira)
+                """, tuple(v for ip_str, hostname, status, expires_at in chunk
+                           for v in (ip_str, hostname, status, datetime.fromtimestamp(expires_at).replace(microsecond=0))))
+            cursor.execute("DELETE FROM CacheDNSReverso WHERE Expira < NOW() LIMIT 10000")
+            conn.commit()
+        if rows:
+            log.debug(f"RDNS: {len(rows)} entradas de cache gravadas.")
+        return len(rows)
+
+    def start(self):
+        """Carrega o cache persistido e inicia a thread de gravação periódica."""
+        try:
+            self.load()
+        except Exception:
+            log.exception("RDNS: Erro ao carregar o cache de DNS reverso.")
+        self._thread = threading.Thread(target=self._run, name='rdns-cache-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        try:
+            self.flush()
+        except Exception:
+            log.exception("RDNS: Erro ao gravar o cache de DNS reverso no encerramento.")
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception:
+                log.exception("RDNS: Erro ao gravar o cache de DNS reverso.")
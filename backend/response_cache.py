@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+import time
+import weakref
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, current_app, request
+
+log = logging.getLogger(__name__)
+
+# Caches do processo, para que `notify_tables_changed` alcance todos sem que o código que grava
+# nas tabelas precise conhecer a aplicação Flask.
+_caches = weakref.WeakSet()
+
+
+def notify_tables_changed(*tables):
+    """Gancho de invalidação: chamado após escritas em tabelas de referência (ex: 'Fabricante')."""
+    for cache in list(_caches):
+        cache.invalidate(*tables)
+
+
+class _Entry:
+    __slots__ = ('body', 'mimetype', 'etag', 'last_modified', 'expires_at', 'tables', 'versions')
+
+    def __init__(self, body, mimetype, etag, last_modified, expires_at, tables, versions=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.tables = tables
+        self.versions = versions
+
+
+class ResponseCache:
+    """
+    Cache read-through em memória para rotas GET de dados públicos que mudam pouco. O decorator
+    `cached(ttl, tables)` guarda o corpo das respostas 200 por rota e query string, com descarte LRU
+    acima de `max_entries` e validade de `ttl` segundos (padrão `default_ttl`).
+
+    `invalidate(*tabelas)` descarta as respostas que dependem das tabelas (ou todas, sem argumentos);
+    uma resposta calculada enquanto uma invalidação acontecia não é guardada. As respostas levam
+    ETag (SHA-1 do corpo) e Last-Modified (mantido enquanto o corpo não muda), e requisições
+    condicionais recebem 304 sem corpo.
+
+    `invalidate` só alcança este processo. Para tabelas gravadas também por outros processos (scheduler,
+    workers de varredura), a rota declara `versions` (chaves de VersaoCache): a cada requisição
+    `version_reader(nomes)` lê as versões atuais ({nome: versão}, ou None se indisponíveis) e uma
+    resposta guardada com outras versões é descartada.
+    """
+
+    def __init__(self, max_entries=256, default_ttl=300.0, version_reader=None):
+        self.max_entries = max(1, int(max_entries))
+        self.default_ttl = float(default_ttl)
+        self.version_reader = version_reader
+        self._entries = OrderedDict()    # chave -> _Entry
+        self._generations = {}           # tabela -> contador de invalidações
+        self._generation_all = 0
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "invalidacoes": 0, "descartes_lru": 0, "respostas_304": 0}
+        _caches.add(self)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Cria o cache lendo RESPONSE_CACHE_MAX_ENTRIES e RESPONSE_CACHE_TTL_SECONDS."""
+        return cls(
+            max_entries=os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '256'),
+            default_ttl=os.getenv('RESPONSE_CACHE_TTL_SECONDS', '300'),
+            **kwargs
+        )
+
+    def _generation(self, tables):
+        return (self._generation_all,) + tuple(self._generations.get(table, 0) for table in tables)
+
+    def _read_versions(self, names):
+        if not names or not self.version_reader:
+            return None
+        try:
+            versions = self.version_reader(names)
+        except Exception as e:
+            # Sem as versões, vale só a expiração por ttl.
+            log.warning(f"RESPONSE_CACHE: Falha ao ler as versões de {', '.join(names)} ({e}).")
+            return None
+        return tuple(versions[name] for name in names) if versions else None
+
+    def cached(self, ttl=None, tables=(), versions=()):
+        """Decorator de rota Flask (aplicado abaixo de @app.route)."""
+        ttl = self.default_ttl if ttl is None else float(ttl)
+        tables = tuple(tables)
+        versions = tuple(versions)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = (view.__name__, request.full_path)
+                # Lidas antes da consulta: uma escrita confirmada no meio dela muda a versão e a próxima requisição refaz.
+                current = self._read_versions(versions)
+                now = time.monotonic()
+                with self._lock:
+                    entry = self._entries.get(key)
+                    hit = entry is not None and entry.expires_at > now and (current is None or entry.versions == current)
+                    if hit:
+                        self._entries.move_to_end(key)
+                        self.metrics["hits"] += 1
+                    else:
+                        self.metrics["misses"] += 1
+                        generation = self._generation(tables)
+                if not hit:
+                    fresh = current_app.make_response(view(*args, **kwargs))
+                    if fresh.status_code != 200 or fresh.direct_passthrough:
+                        return fresh
+                    entry = self._store(key, fresh, ttl, tables, generation, entry, current)
+                return self._respond(entry, hit)
+            return wrapper
+        return decorator
+
+    def _store(self, key, response, ttl, tables, generation, previous, versions=None):
+        body = response.get_data()
+        etag = hashlib.sha1(body).hexdigest()
+        if previous is not None and previous.etag == etag:
+            last_modified = previous.last_modified
+        else:
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        entry = _Entry(body, response.mimetype, etag, last_modified, time.monotonic() + ttl, tables, versions)
+        with self._lock:
+            # Invalidada durante a consulta: responde com o resultado, mas não guarda (pode estar desatualizado).
+            if self._generation(tables) == generation:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.metrics["descartes_lru"] += 1
+        return entry
+
+    def _respond(self, entry, hit):
+        response = Response(entry.body, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        # O navegador sempre revalida; com o mesmo ETag (ou sem mudança desde Last-Modified) a resposta é 304.
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self.metrics["respostas_304"] += 1
+        return response
+
+    def invalidate(self, *tables):
+        """Descarta as respostas que dependem das tabelas indicadas (ou todas, se nenhuma for informada)."""
+        with self._lock:
+            if tables:
+                for table in tables:
+                    self._generations[table] = self._generations.get(table, 0) + 1
+                stale = [key for key, entry in self._entries.items() if set(entry.tables) & set(tables)]
+            else:
+                self._generation_all += 1
+                stale = list(self._entries)
+            for key in stale:
+                del self._entries[key]
+            self.metrics["invalidacoes"] += 1
+        log.info(f"RESPONSE_CACHE: {len(stale)} respostas invalidadas ({', '.join(tables) if tables else 'todas'}).")
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.metrics, entradas=len(self._entries), max_entradas=self.max_entries)
+        requests_total = data["hits"] + data["misses"]
+        data["taxa_acerto"] = round(data["hits"] / requests_total, 4) if requests_total else None
+        return data
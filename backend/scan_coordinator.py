@@ -0,0 +1,271 @@
+import ipaddress
+import os
+import logging
+
+from scan_jobs import STATUS_PENDENTE, STATUS_EXECUTANDO, STATUS_CONCLUIDA, STATUS_FALHOU
+from target_spec import TargetSpec
+
+log = logging.getLogger(__name__)
+
+
+def _format_address(version, value):
+    return str(ipaddress.IPv4Address(value) if version == 4 else ipaddress.IPv6Address(value))
+
+
+def split_into_shards(targets, shard_size=1024, max_shards=100000):
+    """
+    Divide os alvos (TargetSpec) em shards de até `shard_size` endereços, alinhados a múltiplos de
+    `shard_size` (com 1024, cada shard fica dentro de um /22), para que um shard não misture sub-redes.
+    Retorna [(faixa 'inicio-fim', total)]; levanta ValueError se a divisão passar de `max_shards`.
+    """
+    shard_size = max(1, int(shard_size))
+    shards = []
+    for version in sorted(targets.intervals):
+        for start, end in targets.intervals[version]:
+            current = start
+            while current <= end:
+                shard_end = min(end, (current // shard_size + 1) * shard_size - 1)
+                shards.append((f"{_format_address(version, current)}-{_format_address(version, shard_end)}",
+                               shard_end - current + 1))
+                if len(shards) > max_shards:
+                    raise ValueError(f"As faixas resultam em mais de {max_shards} shards de {shard_size} alvos.")
+                current = shard_end + 1
+    return shards
+
+
+class ScanCoordinator:
+    """
+    Coordenador das varreduras distribuídas. Cada rodada (VarreduraDistribuida) divide as faixas em
+    shards (ShardVarredura) que funcionam como uma fila no banco: os workers arrendam shards com
+    `SELECT ... FOR UPDATE SKIP LOCKED` (vários workers não disputam o mesmo shard), renovam o lease
+    enquanto varrem e informam a conclusão ou a falha.
+
+    Um shard cujo lease expira (worker morto ou travado) volta a ser arrendável; após `max_attempts`
+    tentativas ele é marcado como falho. Os horários de lease usam o relógio do banco, não o dos workers.
+    A rodada termina quando não restam shards pendentes ou em execução.
+    """
+
+    def __init__(self, connection_factory, shard_size=1024, lease_seconds=120, max_attempts=3, max_shards=100000):
+        self.connection_factory = connection_factory
+        self.shard_size = max(1, int(shard_size))
+        self.lease_seconds = max(1, int(lease_seconds))
+        self.max_attempts = max(1, int(max_attempts))
+        self.max_shards = max(1, int(max_shards))
+
+    @classmethod
+    def from_env(cls, connection_factory, **kwargs):
+        """Cria o coordenador lendo SCAN_SHARD_SIZE, SCAN_LEASE_SECONDS, SCAN_MAX_ATTEMPTS e SCAN_MAX_SHARDS."""
+        return cls(
+            connection_factory,
+            shard_size=os.getenv('SCAN_SHARD_SIZE', '1024'),
+            lease_seconds=os.getenv('SCAN_LEASE_SECONDS', '120'),
+            max_attempts=os.getenv('SCAN_MAX_ATTEMPTS', '3'),
+            max_shards=os.getenv('SCAN_MAX_SHARDS', '100000'),
+            **kwargs
+        )
+
+    def create_scan(self, faixas_ip, scan_source="Manual"):
+        """
+        Cria uma rodada para as faixas (formato de FaixasIP) e enfileira seus shards.
+        Retorna {"id_varredura", "shards", "alvos"} ou None se não houver alvos válidos;
+        levanta ValueError se as faixas gerarem shards demais e ConnectionError sem banco.
+        """
+        targets = TargetSpec.parse(faixas_ip or '', log_prefix=f"SCAN_COORD ({scan_source})")
+        if not targets:
+            return None
+        shards = split_into_shards(targets, self.shard_size, self.max_shards)
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco para criar a varredura distribuída.")
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO VarreduraDistribuida (Origem, FaixasIP, Status, TotalShards, TotalAlvos)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (scan_source, faixas_ip, STATUS_PENDENTE, len(shards), targets.total))
+            id_varredura = cursor.lastrowid
+            for start in range(0, len(shards), 1000):
+                chunk = shards[start:start + 1000]
+                cursor.execute(f"""
+                    INSERT INTO ShardVarredura (ID_Varredura, Faixa, TotalAlvos, Status)
+                    VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))}
+                """, tuple(v for faixa, total in chunk for v in (id_varredura, faixa, total, STATUS_PENDENTE)))
+            conn.commit()
+        log.info(f"SCAN_COORD ({scan_source}): Varredura distribuída {id_varredura} criada com {len(shards)} shards "
+                 f"({targets.total} alvos).")
+        return {"id_varredura": id_varredura, "shards": len(shards), "alvos": targets.total}
+
+    def has_active_scan(self, scan_source=None):
+        """True se houver uma rodada (da origem indicada, ou qualquer uma) ainda pendente ou em execução."""
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco para consultar as varreduras distribuídas.")
+            cursor = conn.cursor()
+            query = "SELECT 1 FROM VarreduraDistribuida WHERE Status IN (%s, %s)"
+            params = [STATUS_PENDENTE, STATUS_EXECUTANDO]
+            if scan_source:
+                query += " AND Origem = %s"
+                params.append(scan_source)
+            cursor.execute(query + " LIMIT 1", tuple(params))
+            return cursor.fetchone() is not None
+
+    def lease(self, worker_id, limit=1):
+        """
+        Arrenda até `limit` shards para o worker: pendentes ou com lease expirado. Shards expirados que
+        já esgotaram as tentativas são marcados como falhos em vez de arrendados.
+        Retorna [{"ID_Shard", "ID_Varredura", "Faixa", "TotalAlvos", "Tentativas"}].
+        """
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco para arrendar shards.")
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT ID_Shard, ID_Varredura, Faixa, TotalAlvos, Tentativas, Status FROM ShardVarredura
+                WHERE Status = %s OR (Status = %s AND LeaseAte < NOW())
+                ORDER BY ID_Shard LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (STATUS_PENDENTE, STATUS_EXECUTANDO, max(1, int(limit))))
+            candidates = cursor.fetchall()
+            if not candidates:
+                conn.commit()
+                return []
+
+            exhausted = [row for row in candidates if row["Tentativas"] >= self.max_attempts]
+            leased = [row for row in candidates if row["Tentativas"] < self.max_attempts]
+            for row in candidates:
+                if row["Status"] == STATUS_EXECUTANDO:
+                    log.warning(f"SCAN_COORD: Lease do shard {row['ID_Shard']} ({row['Faixa']}) expirou "
+                                f"após a tentativa {row['Tentativas']}.")
+            if exhausted:
+                ids = [row["ID_Shard"] for row in exhausted]
+                cursor.execute(f"""
+                    UPDATE ShardVarredura SET Status = %s, Trabalhador = NULL, LeaseAte = NULL, DataConclusao = NOW(),
+                           UltimoErro = 'Lease expirado na última tentativa'
+                    WHERE ID_Shard IN ({', '.join(['%s'] * len(ids))})
+                """, (STATUS_FALHOU, *ids))
+            if leased:
+                ids = [row["ID_Shard"] for row in leased]
+                cursor.execute(f"""
+                    UPDATE ShardVarredura SET Status = %s, Trabalhador = %s, LeaseAte = NOW() + INTERVAL %s SECOND,
+                           Tentativas = Tentativas + 1, DataInicio = NOW()
+                    WHERE ID_Shard IN ({', '.join(['%s'] * len(ids))})
+                """, (STATUS_EXECUTANDO, worker_id, self.lease_seconds, *ids))
+                scan_ids = sorted({row["ID_Varredura"] for row in leased})
+                cursor.execute(f"""
+                    UPDATE VarreduraDistribuida SET Status = %s
+                    WHERE Status = %s AND ID_Varredura IN ({', '.join(['%s'] * len(scan_ids))})
+                """, (STATUS_EXECUTANDO, STATUS_PENDENTE, *scan_ids))
+            for id_varredura in {row["ID_Varredura"] for row in exhausted}:
+                self._close_scan_if_done(cursor, id_varredura)
+            conn.commit()
+
+        for row in leased:
+            row.pop("Status")
+            row["Tentativas"] += 1
+        if leased:
+            log.info(f"SCAN_COORD: {len(leased)} shard(s) arrendado(s) para '{worker_id}' por {self.lease_seconds}s.")
+        return leased
+
+    def heartbeat(self, worker_id, shard_ids):
+        """Renova o lease dos shards ainda em posse do worker. Retorna quantos continuam arrendados a ele."""
+        if not shard_ids:
+            return 0
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco para renovar o lease.")
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE ShardVarredura SET LeaseAte = NOW() + INTERVAL %s SECOND
+                WHERE Trabalhador = %s AND Status = %s AND ID_Shard IN ({', '.join(['%s'] * len(shard_ids))})
+            """, (self.lease_seconds, worker_id, STATUS_EXECUTANDO, *shard_ids))
+            conn.commit()
+            return cursor.rowcount
+
+    def complete(self, worker_id, shard, active_hosts):
+        """
+        Marca o shard como concluído. Retorna False se o lease já não era do worker (expirou e outro
+        worker o assumiu); os resultados gravados continuam válidos, pois a gravação é idempotente.
+        """
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco para concluir o shard.")
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE ShardVarredura SET Status = %s, HostsAtivos = %s, DataConclusao = NOW(), LeaseAte = NULL,
+                       UltimoErro = NULL
+                WHERE ID_Shard = %s AND Trabalhador = %s AND Status = %s
+            """, (STATUS_CONCLUIDA, active_hosts, shard["ID_Shard"], worker_id, STATUS_EXECUTANDO))
+            owned = cursor.rowcount > 0
+            self._close_scan_if_done(cursor, shard["ID_Varredura"])
+            conn.commit()
+        if not owned:
+            log.warning(f"SCAN_COORD: Shard {shard['ID_Shard']} concluído por '{worker_id}' após perder o lease.")
+        return owned
+
+    def fail(self, worker_id, shard, error):
+        """Devolve o shard à fila (ou o marca como falho, se esgotou as tentativas) com o erro ocorrido."""
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco para registrar a falha do shard.")
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE ShardVarredura
+                SET Status = IF(Tentativas >= %s, %s, %s),
+                    DataConclusao = IF(Tentativas >= %s, NOW(), NULL),
+                    Trabalhador = NULL, LeaseAte = NULL, UltimoErro = %s
+                WHERE ID_Shard = %s AND Trabalhador = %s AND Status = %s
+            """, (self.max_attempts, STATUS_FALHOU, STATUS_PENDENTE, self.max_attempts, str(error)[:500],
+                  shard["ID_Shard"], worker_id, STATUS_EXECUTANDO))
+            self._close_scan_if_done(cursor, shard["ID_Varredura"])
+            conn.commit()
+        log.warning(f"SCAN_COORD: Shard {shard['ID_Shard']} ({shard['Faixa']}) falhou em '{worker_id}' "
+                    f"(tentativa {shard['Tentativas']}/{self.max_attempts}): {error}")
+
+    @staticmethod
+    def _close_scan_if_done(cursor, id_varredura):
+        # A rodada termina quando nenhum shard está pendente ou em execução; falha se algum shard falhou.
+        cursor.execute("""
+            UPDATE VarreduraDistribuida v
+            SET v.Status = IF(EXISTS (SELECT 1 FROM ShardVarredura f WHERE f.ID_Varredura = v.ID_Varredura
+                                      AND f.Status = %s), %s, %s),
+                v.DataConclusao = NOW()
+            WHERE v.ID_Varredura = %s AND v.Status IN (%s, %s)
+              AND NOT EXISTS (SELECT 1 FROM ShardVarredura s WHERE s.ID_Varredura = v.ID_Varredura
+                              AND s.Status IN (%s, %s))
+        """, (STATUS_FALHOU, STATUS_FALHOU, STATUS_CONCLUIDA, id_varredura, STATUS_PENDENTE, STATUS_EXECUTANDO,
+              STATUS_PENDENTE, STATUS_EXECUTANDO))
+        if cursor.rowcount:
+            log.info(f"SCAN_COORD: Varredura distribuída {id_varredura} finalizada.")
+
+    def scan_status(self, id_varredura):
+        """Resumo da rodada: dados gerais, contagem de shards por status, progresso e shards com erro."""
+        with self.connection_factory() as conn:
+            if not conn:
+                raise ConnectionError("Sem conexão com o banco para consultar a varredura distribuída.")
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT ID_Varredura, Origem, FaixasIP, Status, TotalShards, TotalAlvos, DataCriacao, DataConclusao
+                FROM VarreduraDistribuida WHERE ID_Varredura = %s
+            """, (id_varredura,))
+            scan = cursor.fetchone()
+            if not scan:
+                return None
+            cursor.execute("""
+                SELECT Status, COUNT(*) AS Shards, SUM(TotalAlvos) AS Alvos, SUM(COALESCE(HostsAtivos, 0)) AS HostsAtivos,
+                       COUNT(DISTINCT Trabalhador) AS Trabalhadores
+                FROM ShardVarredura WHERE ID_Varredura = %s GROUP BY Status
+            """, (id_varredura,))
+            by_status = {row["Status"]: row for row in cursor.fetchall()}
+            cursor.execute("""
+                SELECT ID_Shard, Faixa, Status, Tentativas, Trabalhador, UltimoErro FROM ShardVarredura
+                WHERE ID_Varredura = %s AND UltimoErro IS NOT NULL ORDER BY ID_Shard LIMIT 50
+            """, (id_varredura,))
+            errors = cursor.fetchall()
+
+        done = by_status.get(STATUS_CONCLUIDA, {})
+        scan["shards"] = {status: int(row["Shards"]) for status, row in by_status.items()}
+        scan["alvos_varridos"] = int(done.get("Alvos") or 0)
+        scan["hosts_ativos"] = int(done.get("HostsAtivos") or 0)
+        scan["trabalhadores_ativos"] = int(by_status.get(STATUS_EXECUTANDO, {}).get("Trabalhadores") or 0)
+        scan["progresso"] = round(scan["alvos_varridos"] / scan["TotalAlvos"], 4) if scan["TotalAlvos"] else None
+        scan["shards_com_erro"] = errors
+        return scan
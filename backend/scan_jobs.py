@@ -0,0 +1,287 @@
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from job_store import TIPO_DESCOBERTA
+
+log = logging.getLogger(__name__)
+
+STATUS_PENDENTE = 'pendente'
+STATUS_EXECUTANDO = 'executando'
+STATUS_CONCLUIDA = 'concluida'
+STATUS_FALHOU = 'falhou'
+
+
+class ScanJob:
+    """
+    Estado de uma varredura de descoberta executada em segundo plano. Guarda os hosts encontrados
+    (como eventos numerados, para reenvio a quem se conectar depois) e o progresso mais recente,
+    e acorda os assinantes do stream SSE a cada mudança.
+    """
+
+    def __init__(self, total, scan_source, progress_interval=0.5):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.scan_source = scan_source
+        self.progress_interval = progress_interval
+        self.status = STATUS_PENDENTE
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.processed = 0
+        self.lost_hosts = 0      # IPs ativos cujo lote não pôde ser gravado
+        self.hosts = []          # [(ip, hostname, rtt_ms)]
+        self._events = []        # [(seq, tipo, dados)] — hosts encontrados e evento final
+        self._progress = None    # (seq, dados)
+        self._seq = 0
+        self._synced_seq = -1    # último número já gravado no JobStore (-1: nada gravado ainda)
+        self._synced_events = 0
+        self._last_progress_at = 0.0
+        self._cond = threading.Condition()
+
+    def _next_seq(self):
+        self._seq += 1
+        return self._seq
+
+    def _progress_data(self):
+        elapsed = max(1e-6, (time.monotonic() - self.started_at) if self.started_at else 0.0)
+        rate = self.processed / elapsed if self.started_at else 0.0
+        remaining = self.total - self.processed
+        return {
+            "processed": self.processed,
+            "total": self.total,
+            "percent": round(100.0 * self.processed / self.total, 1) if self.total else 100.0,
+            "found": len(self.hosts),
+            "hosts_per_second": round(rate, 1),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+        }
+
+    def _publish_progress(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_progress_at < self.progress_interval:
+            return
+        self._last_progress_at = now
+        self._progress = (self._next_seq(), self._progress_data())
+        self._cond.notify_all()
+
+    def mark_running(self):
+        with self._cond:
+            self.status = STATUS_EXECUTANDO
+            self.started_at = time.monotonic()
+            self._publish_progress(force=True)
+
+    def probe_done(self, ip_str=None):
+        """Callback do pipeline: um alvo terminou de ser sondado (ativo ou não)."""
+        with self._cond:
+            self.processed += 1
+            self._publish_progress(force=self.processed == self.total)
+
+    def add_host(self, ip_str, hostname, rtt_ms):
+        """Callback do pipeline: host ativo gravado no banco."""
+        with self._cond:
+            self.hosts.append((ip_str, hostname, rtt_ms))
+            self._events.append((self._next_seq(), 'host', {"ip": ip_str, "hostname": hostname, "rtt_ms": rtt_ms}))
+            self._cond.notify_all()
+
+    def persist_failed(self, lost):
+        """Callback da varredura: `lost` IPs ativos não foram gravados no banco (o job termina como falha)."""
+        with self._cond:
+            self.lost_hosts += lost
+
+    def finish(self, error=None):
+        with self._cond:
+            if not error and self.lost_hosts:
+                error = f"{self.lost_hosts} IPs ativos não puderam ser gravados no banco de dados."
+            self.finished_at = time.monotonic()
+            self.status = STATUS_FALHOU if error else STATUS_CONCLUIDA
+            self.error = error
+            self._publish_progress(force=True)
+            data = {"status": self.status, "found": len(self.hosts), "processed": self.processed, "total": self.total,
+                    "duration_seconds": round(self.finished_at - (self.started_at or self.finished_at), 1)}
+            if error:
+                data["error"] = error
+            self._events.append((self._next_seq(), 'done', data))
+            self._cond.notify_all()
+
+    @property
+    def finished(self):
+        return self.status in (STATUS_CONCLUIDA, STATUS_FALHOU)
+
+    def store_changes(self):
+        """Mudanças ainda não gravadas no JobStore (progresso, status e eventos novos), ou None."""
+        with self._cond:
+            if self._seq == self._synced_seq:
+                return None
+            return {
+                "tipo": TIPO_DESCOBERTA,
+                "origem": self.scan_source,
+                "status": self.status,
+                "finished": self.finished,
+                "erro": self.error,
+                "estado": self._progress[1] if self._progress else self._progress_data(),
+                "seq": self._progress[0] if self._progress else 0,
+                "events": self._events[self._synced_events:],
+                "version": self._seq,
+                "events_end": len(self._events),
+            }
+
+    def store_synced(self, changes):
+        with self._cond:
+            self._synced_seq = max(self._synced_seq, changes["version"])
+            self._synced_events = max(self._synced_events, changes["events_end"])
+
+    def to_dict(self):
+        with self._cond:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "scan_source": self.scan_source,
+                "progress": self._progress_data(),
+                "active_ips": [ip for ip, _hostname, _rtt in self.hosts],
+                "error": self.error,
+            }
+
+    def wait_events(self, after_seq, timeout):
+        """
+        Aguarda até `timeout` segundos por eventos com número maior que `after_seq`.
+        Retorna (eventos, terminou): a lista traz os hosts novos, o progresso atual (se mudou) e,
+        no fim, o evento 'done'.
+        """
+        with self._cond:
+            def pending():
+                return (self._events and self._events[-1][0] > after_seq) or \
+                       (self._progress and self._progress[0] > after_seq)
+            if not pending():
+                self._cond.wait(timeout)
+            events = [ev for ev in self._events if ev[0] > after_seq and ev[1] != 'done']
+            if self._progress and self._progress[0] > after_seq:
+                events.append((self._progress[0], 'progress', self._progress[1]))
+            done = [ev for ev in self._events if ev[0] > after_seq and ev[1] == 'done']
+            events.sort(key=lambda ev: ev[0])
+            return events + done, bool(done) or (self.finished and not events)
+
+
+class StoredScanJob:
+    """
+    Job de descoberta executado por outro worker, lido do JobStore. Tem a mesma interface de leitura
+    de ScanJob (`to_dict` e `wait_events`); o stream consulta o banco a cada `store.poll_seconds`.
+    """
+
+    def __init__(self, store, row):
+        self.store = store
+        self.id = row["ID_Job"]
+        self._row = row
+
+    @property
+    def status(self):
+        return self._row["Status"]
+
+    @property
+    def finished(self):
+        return self.status in (STATUS_CONCLUIDA, STATUS_FALHOU)
+
+    def to_dict(self):
+        hosts = self.store.events_after(self.id, 0, tipo='host')
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "scan_source": self._row["Origem"],
+            "progress": self._row["Estado"],
+            "active_ips": [data["ip"] for _seq, _tipo, data in hosts],
+            "error": self._row["Erro"],
+        }
+
+    def wait_events(self, after_seq, timeout):
+        """Como ScanJob.wait_events, consultando o banco até haver eventos novos ou passar `timeout`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                row = self.store.load(self.id, TIPO_DESCOBERTA)
+                if not row:
+                    # Job expirou (ou foi apagado) no banco: encerra o stream.
+                    return [], True
+                self._row = row
+                events = self.store.events_after(self.id, after_seq)
+            except Exception as e:
+                log.warning(f"SCAN_JOB: Falha ao consultar o job {self.id} no banco ({e}).")
+                events = []
+            progress_seq = self._row["SeqEstado"] or 0
+            remaining = deadline - time.monotonic()
+            if events or progress_seq > after_seq or self.finished or remaining <= 0:
+                break
+            time.sleep(min(self.store.poll_seconds, remaining))
+        done = [ev for ev in events if ev[1] == 'done']
+        events = [ev for ev in events if ev[1] != 'done']
+        if progress_seq > after_seq:
+            events.append((progress_seq, 'progress', self._row["Estado"]))
+        events.sort(key=lambda ev: ev[0])
+        return events + done, bool(done) or (self.finished and not events)
+
+
+class ScanJobManager:
+    """
+    Executa as varreduras de descoberta em threads de fundo e mantém os jobs recentes em memória
+    (por `retention_seconds` após o término) para consulta de status e stream de eventos.
+
+    Com um `store` (JobStore), o estado dos jobs também é gravado no banco, e `get` encontra os jobs
+    criados em outros workers (gunicorn com vários processos) como StoredScanJob.
+    """
+
+    def __init__(self, max_concurrent=2, retention_seconds=3600, store=None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.retention_seconds = float(retention_seconds)
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix='scan-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, total, scan_source, run):
+        """
+        Cria um job e agenda `run(job)` em segundo plano. `run` deve executar a varredura usando
+        os callbacks `job.probe_done` e `job.add_host`. Retorna o job criado.
+        """
+        job = ScanJob(total, scan_source)
+        with self._lock:
+            self._purge()
+            self._jobs[job.id] = job
+        if self.store:
+            self.store.track(job)
+
+        def execute():
+            job.mark_running()
+            try:
+                run(job)
+                job.finish()
+            except Exception as e:
+                log.exception(f"SCAN_JOB ({scan_source}): Erro na varredura {job.id}.")
+                job.finish(error=str(e))
+            if self.store:
+                # O fim vai para o banco na hora, sem esperar a próxima rodada do JobStore.
+                self.store.sync(job)
+            log.info(f"SCAN_JOB ({scan_source}): Job {job.id} finalizado com status '{job.status}' ({len(job.hosts)} hosts ativos).")
+
+        self._executor.submit(execute)
+        log.info(f"SCAN_JOB ({scan_source}): Job {job.id} criado para {total} alvos.")
+        return job
+
+    def get(self, job_id):
+        """Job local ou, com `store`, o job gravado por outro worker; None se não existir (ou já expirou)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job or not self.store:
+            return job
+        row = self.store.load(job_id, TIPO_DESCOBERTA)
+        return StoredScanJob(self.store, row) if row else None
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > self.retention_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
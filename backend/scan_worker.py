@@ -0,0 +1,223 @@
+"""
+Worker de varredura distribuída. Arrenda shards da fila ShardVarredura (ver scan_coordinator.py),
+varre cada um pelo mesmo pipeline de descoberta da aplicação (ARP -> ICMP -> rDNS -> gravação em lote)
+e informa a conclusão. Pode rodar em qualquer máquina com acesso ao banco:
+
+    python scan_worker.py                  # um worker, até ser interrompido
+    python scan_worker.py --processes 4    # quatro workers locais (processos separados)
+    python scan_worker.py --once           # processa a fila até esvaziar e sai
+"""
+import os
+import socket
+import threading
+import time
+import logging
+import multiprocessing
+from contextlib import contextmanager
+
+import click
+import mysql.connector
+from dotenv import load_dotenv
+
+from db_pool import ConnectionPool
+from scan_coordinator import ScanCoordinator
+from target_spec import TargetSpec
+from discovery_pipeline import DiscoveryPipeline
+from discovery_persistence import DiscoveredIpBatchWriter
+from icmp_sweep import ping_ip
+from rate_control import ProbeRateController
+from arp_discovery import NeighborDiscovery
+from rdns_cache import ReverseDnsResolver
+from oui_index import OuiIndex
+from availability import AvailabilityRecorder
+
+log = logging.getLogger(__name__)
+
+
+class ScanWorker:
+    """
+    Laço do worker: arrenda um shard por vez, renova o lease numa thread enquanto `run_shard(faixa)`
+    executa e registra o resultado (quantidade de hosts ativos) ou a falha no coordenador.
+    Sem shards disponíveis, espera `poll_seconds` antes de consultar a fila de novo.
+    """
+
+    def __init__(self, coordinator, run_shard, worker_id=None, poll_seconds=5.0, heartbeat_seconds=None):
+        self.coordinator = coordinator
+        self.run_shard = run_shard
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_seconds = float(poll_seconds)
+        self.heartbeat_seconds = float(heartbeat_seconds or max(1.0, coordinator.lease_seconds / 3))
+        self._stop = threading.Event()
+        self.shards_done = 0
+
+    def run(self, once=False):
+        """Processa shards até `stop()` (ou, com `once`, até a fila ficar vazia)."""
+        log.info(f"SCAN_WORKER ({self.worker_id}): Iniciado.")
+        while not self._stop.is_set():
+            try:
+                shards = self.coordinator.lease(self.worker_id)
+            except Exception:
+                log.exception(f"SCAN_WORKER ({self.worker_id}): Erro ao arrendar shards.")
+                shards = []
+            if not shards:
+                if once:
+                    break
+                self._stop.wait(self.poll_seconds)
+                continue
+            for shard in shards:
+                self._process(shard)
+        log.info(f"SCAN_WORKER ({self.worker_id}): Encerrado após {self.shards_done} shards.")
+
+    def stop(self):
+        self._stop.set()
+
+    def _process(self, shard):
+        started = time.perf_counter()
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(shard, finished),
+                                     name=f"scan-lease-{shard['ID_Shard']}", daemon=True)
+        heartbeat.start()
+        try:
+            active_hosts = self.run_shard(shard["Faixa"])
+        except Exception as e_shard:
+            log.exception(f"SCAN_WORKER ({self.worker_id}): Erro ao varrer o shard {shard['ID_Shard']} ({shard['Faixa']}).")
+            self._report(self.coordinator.fail, shard, e_shard)
+            return
+        finally:
+            finished.set()
+            heartbeat.join()
+        self._report(self.coordinator.complete, shard, active_hosts)
+        self.shards_done += 1
+        log.info(f"SCAN_WORKER ({self.worker_id}): Shard {shard['ID_Shard']} ({shard['Faixa']}, {shard['TotalAlvos']} alvos) "
+                 f"concluído em {time.perf_counter() - started:.1f}s com {active_hosts} hosts ativos.")
+
+    def _report(self, func, shard, value):
+        try:
+            func(self.worker_id, shard, value)
+        except Exception:
+            # Sem o registro, o lease expira e o shard volta para a fila.
+            log.exception(f"SCAN_WORKER ({self.worker_id}): Erro ao registrar o resultado do shard {shard['ID_Shard']}.")
+
+    def _heartbeat(self, shard, finished):
+        while not finished.wait(self.heartbeat_seconds):
+            try:
+                if not self.coordinator.heartbeat(self.worker_id, [shard["ID_Shard"]]):
+                    log.warning(f"SCAN_WORKER ({self.worker_id}): Lease do shard {shard['ID_Shard']} perdido.")
+                    return
+            except Exception:
+                log.exception(f"SCAN_WORKER ({self.worker_id}): Erro ao renovar o lease do shard {shard['ID_Shard']}.")
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def run_worker(worker_id=None, once=False):
+    """Monta os componentes de descoberta com o pool de conexões do processo e executa um ScanWorker."""
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)-8s [%(processName)s %(name)s:%(funcName)s:%(lineno)d] - %(message)s')
+    logging.getLogger('mysql.connector').setLevel(logging.WARNING)
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    db_pool = ConnectionPool.from_env()
+
+    @contextmanager
+    def db_connection():
+        # Mesmo contrato do db_connection() da aplicação: None se não conectar, rollback em exceção.
+        try:
+            conn = db_pool.acquire()
+        except mysql.connector.Error as err:
+            log.error(f"SCAN_WORKER ({worker_id}): Erro ao obter conexão do pool MySQL: {err}")
+            conn = None
+        try:
+            yield conn
+        except Exception:
+            if conn:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+    scan_source = f"Distribuida:{worker_id}"
+    arp_enabled = _env_flag('DISCOVERY_ARP_ENABLED', 'true')
+    randomize = _env_flag('DISCOVERY_RANDOMIZE_TARGETS', 'false')
+    neighbor_discovery = NeighborDiscovery.from_env()
+    # O orçamento global é por processo: com vários workers na mesma máquina, RATE_GLOBAL_MAX_PPS vale para cada um.
+    rate_controller = ProbeRateController.from_env() if _env_flag('RATE_CONTROL_ENABLED', 'true') else None
+    oui_index = OuiIndex.from_env()
+    rdns_resolver = ReverseDnsResolver.from_env(db_connection)
+    rdns_resolver.start()
+    availability_recorder = AvailabilityRecorder.from_env(db_connection)
+    availability_recorder.start()
+
+    def run_shard(faixa):
+        targets = TargetSpec.parse(faixa, log_prefix=f"SCAN_WORKER ({worker_id})")
+        neighbor_scan = None
+        if arp_enabled:
+            try:
+                neighbor_scan = neighbor_discovery.scan(targets, log_prefix=f"ARP_SCAN ({scan_source})")
+            except Exception:
+                log.exception(f"ARP_SCAN ({scan_source}): Erro na varredura ARP; o shard segue por ICMP.")
+        # Os hosts ativos são gravados em lotes (DISCOVERY_DB_BATCH_SIZE) direto em IPsDescobertos.
+        batch_writer = DiscoveredIpBatchWriter.from_env(db_connection, scan_source=scan_source, oui=oui_index)
+        pipeline = DiscoveryPipeline.from_env(
+            fallback_probe=ping_ip,
+            resolve_hostname=rdns_resolver.resolve,
+            persist_host=batch_writer.add,
+            on_probe_result=availability_recorder.record_ip,
+            neighbor_scan=neighbor_scan,
+            rate_controller=rate_controller,
+            scan_source=scan_source,
+        )
+        try:
+            active_hosts = len(pipeline.run(targets.iter_targets(randomize=randomize)))
+        finally:
+            batch_writer.close()
+        if batch_writer.total_lost:
+            # Falha o shard (que volta para a fila) em vez de concluí-lo sem os hosts que não foram gravados.
+            raise RuntimeError(f"{batch_writer.total_lost} IPs ativos não puderam ser gravados.")
+        return active_hosts
+
+    coordinator = ScanCoordinator.from_env(db_connection)
+    worker = ScanWorker(coordinator, run_shard, worker_id=worker_id,
+                        poll_seconds=os.getenv('SCAN_WORKER_POLL_SECONDS', '5'))
+    try:
+        worker.run(once=once)
+    except KeyboardInterrupt:
+        worker.stop()
+    finally:
+        availability_recorder.stop()
+        rdns_resolver.stop()
+        db_pool.close_all()
+    return worker.shards_done
+
+
+@click.command()
+@click.option('--id', 'worker_id', default=None, help='Identificador do worker (padrão: host:pid).')
+@click.option('--processes', default=1, show_default=True, help='Quantidade de workers locais (um processo cada).')
+@click.option('--once', is_flag=True, help='Sai quando a fila de shards estiver vazia.')
+def main(worker_id, processes, once):
+    """Executa worker(s) de varredura distribuída."""
+    if processes <= 1:
+        run_worker(worker_id, once)
+        return
+    # Um processo por worker: cada um tem seu pool de conexões, seu socket ICMP e seu laço asyncio.
+    base_id = worker_id or socket.gethostname()
+    workers = [multiprocessing.Process(target=run_worker, args=(f"{base_id}:{n}", once), name=f"scan-worker-{n}")
+               for n in range(1, processes + 1)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.join(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
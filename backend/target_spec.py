@@ -0,0 +1,203 @@
+import bisect
+import ipaddress
+import random
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def _host_interval(network):
+    """Intervalo inteiro dos hosts de uma rede, com a mesma regra de `ip_network().hosts()`."""
+    first, last = int(network.network_address), int(network.broadcast_address)
+    if network.version == 4 and network.prefixlen < 31:
+        return first + 1, last - 1
+    if network.version == 6 and network.prefixlen < 127:
+        return first + 1, last
+    return first, last
+
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def _subtract(intervals, exclusions):
+    result = []
+    exclusions = _merge(exclusions)
+    for start, end in intervals:
+        current = start
+        for ex_start, ex_end in exclusions:
+            if ex_end < current or ex_start > end:
+                continue
+            if ex_start > current:
+                result.append((current, ex_start - 1))
+            current = max(current, ex_end + 1)
+            if current > end:
+                break
+        if current <= end:
+            result.append((current, end))
+    return result
+
+
+class TargetSpec:
+    """
+    Especificação de alvos de varredura representada como intervalos inteiros (por versão de IP),
+    já mesclados e com as exclusões aplicadas. Nada é expandido em memória: os endereços são
+    gerados sob demanda, em ordem crescente ou numa permutação pseudoaleatória.
+
+    Formato aceito (separado por vírgulas), o mesmo de `FaixasIP`/DISCOVERY_IP_RANGES:
+    - IP único: 192.168.1.10
+    - Faixa: 192.168.1.1-192.168.1.254 ou 192.168.1.1-254 (último octeto)
+    - CIDR: 10.0.0.0/16 (apenas hosts, sem rede e broadcast)
+    - Exclusão: qualquer um dos formatos acima com prefixo '!' (ex: !10.0.5.0/24)
+    """
+
+    def __init__(self, intervals_by_version=None, invalid_segments=None):
+        self.intervals = {version: list(intervals) for version, intervals in (intervals_by_version or {}).items() if intervals}
+        self.invalid_segments = list(invalid_segments or [])
+        # Índice acumulado para mapear a posição n (0..len-1) ao endereço correspondente.
+        self._blocks = []    # [(version, start, end)]
+        self._offsets = []   # posição inicial de cada bloco
+        total = 0
+        for version in sorted(self.intervals):
+            for start, end in self.intervals[version]:
+                self._blocks.append((version, start, end))
+                self._offsets.append(total)
+                total += end - start + 1
+        self._total = total
+
+    @staticmethod
+    def _parse_segment(segment):
+        """Converte um segmento em (versão, início, fim). Levanta ValueError se for inválido."""
+        if '/' in segment:
+            network = ipaddress.ip_network(segment, strict=False)
+            start, end = _host_interval(network)
+            return network.version, start, end
+        if '-' in segment:
+            start_str, end_str = (part.strip() for part in segment.split('-', 1))
+            start_ip = ipaddress.ip_address(start_str)
+            if '.' in end_str or ':' in end_str:
+                end_ip = ipaddress.ip_address(end_str)
+            else:
+                if start_ip.version != 4:
+                    raise ValueError("formato X.X.X.X-Z só suportado para IPv4")
+                end_octet = int(end_str)
+                if not 0 <= end_octet <= 255:
+                    raise ValueError("octeto final inválido")
+                end_ip = ipaddress.ip_address(bytes(list(start_ip.packed[:3]) + [end_octet]))
+            if start_ip.version != end_ip.version:
+                raise ValueError("IPs de versões diferentes")
+            if start_ip > end_ip:
+                raise ValueError("IP inicial maior que IP final")
+            return start_ip.version, int(start_ip), int(end_ip)
+        ip = ipaddress.ip_address(segment)
+        return ip.version, int(ip), int(ip)
+
+    @classmethod
+    def parse(cls, spec_str, log_prefix="TARGET_SPEC"):
+        """Interpreta a especificação; segmentos inválidos são registrados no log e ignorados."""
+        includes = {}
+        excludes = {}
+        invalid = []
+        for segment in (spec_str or '').split(','):
+            segment = segment.strip()
+            if not segment:
+                continue
+            exclude = segment.startswith('!')
+            raw = segment[1:].strip() if exclude else segment
+            try:
+                version, start, end = cls._parse_segment(raw)
+            except ValueError as e:
+                log.warning(f"{log_prefix}: Faixa de IP inválida '{segment}': {e}")
+                invalid.append(segment)
+                continue
+            (excludes if exclude else includes).setdefault(version, []).append((start, end))
+
+        intervals = {}
+        for version, version_intervals in includes.items():
+            intervals[version] = _subtract(_merge(version_intervals), excludes.get(version, []))
+        return cls(intervals, invalid)
+
+    @property
+    def total(self):
+        """Número de alvos. Use no lugar de len(): faixas IPv6 grandes (ex: uma /64) passam do limite de __len__."""
+        return self._total
+
+    def __len__(self):
+        return self._total
+
+    def __bool__(self):
+        return self._total > 0
+
+    def _address_at(self, position):
+        index = bisect.bisect_right(self._offsets, position) - 1
+        version, start, _end = self._blocks[index]
+        value = start + (position - self._offsets[index])
+        return str(ipaddress.IPv4Address(value) if version == 4 else ipaddress.IPv6Address(value))
+
+    def __iter__(self):
+        """Gera os endereços (str) em ordem crescente, sem materializar a lista."""
+        for version, start, end in self._blocks:
+            address_cls = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+            for value in range(start, end + 1):
+                yield str(address_cls(value))
+
+    def iter_random(self, seed=None):
+        """
+        Gera todos os endereços exatamente uma vez numa ordem pseudoaleatória, com memória constante:
+        um gerador congruencial linear de período completo sobre a próxima potência de 2, descartando
+        as posições fora do total (cycle walking).
+        """
+        total = self._total
+        if total == 0:
+            return
+        rng = random.Random(seed)
+        modulus = 1
+        while modulus < total:
+            modulus <<= 1
+        if modulus < 4:
+            # Poucos alvos: o LCG não tem período completo; embaralha diretamente.
+            positions = list(range(total))
+            rng.shuffle(positions)
+            for position in positions:
+                yield self._address_at(position)
+            return
+        # Hull-Dobell: c ímpar e a ≡ 1 (mod 4) garantem período igual ao módulo (potência de 2).
+        multiplier = (rng.randrange(modulus // 4) * 4 + 1) % modulus or 5
+        increment = rng.randrange(modulus) | 1
+        position = rng.randrange(modulus)
+        for _ in range(modulus):
+            position = (multiplier * position + increment) % modulus
+            if position < total:
+                yield self._address_at(position)
+
+    def iter_targets(self, randomize=False, seed=None):
+        """Iterador dos alvos, em ordem crescente ou aleatória."""
+        return self.iter_random(seed) if randomize else iter(self)
+
+    def restrict(self, version, intervals):
+        """Nova especificação só com os alvos desta que caem em `intervals` [(início, fim)] da versão indicada."""
+        result = []
+        bounds = _merge(intervals)
+        for start, end in self.intervals.get(version, []):
+            for bound_start, bound_end in bounds:
+                if bound_end < start or bound_start > end:
+                    continue
+                result.append((max(start, bound_start), min(end, bound_end)))
+        return TargetSpec({version: _merge(result)})
+
+    def __contains__(self, ip):
+        ip = ipaddress.ip_address(ip) if isinstance(ip, str) else ip
+        for start, end in self.intervals.get(ip.version, []):
+            if start <= int(ip) <= end:
+                return True
+        return False
+
+    def __repr__(self):
+        return f"TargetSpec({self._total} alvos em {len(self._blocks)} intervalos)"